@@ -0,0 +1,211 @@
+"""
+Entrada ASGI da API (uvicorn / hypercorn)
+
+GET /api/query e GET /api/query/aggregate em JSON rodam no caminho
+assíncrono (AsyncQueryService: psycopg 3 + httpx), sem uma thread por
+request. O resto - POST, stream, Arrow, paginação, debug e estáticos -
+vai para o app Flask de create_app() via WsgiToAsgi.
+
+Execute com: uvicorn api.asgi:app --host 0.0.0.0 --port 3500 --workers 2
+Dependências opcionais: asgiref, psycopg[binary], psycopg-pool, httpx, uvicorn
+"""
+
+import io
+import sys
+import os
+from typing import Dict
+
+from werkzeug.wrappers import Request, Response
+
+# Adiciona o diretório raiz ao path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from asgiref.wsgi import WsgiToAsgi
+
+from config.settings import TRACE_CONFIG
+from api.server import create_app, EXPOSE_HEADERS
+from api.routes.query_routes import negociar_formato, filter_processor
+from api.routes.query_routes import query_service as flask_query_service
+from api.services.async_query_service import AsyncQueryService, PoolTimeout, psycopg
+from api.utils import serializer, tracing, metrics
+
+# Rotas atendidas pelo caminho assíncrono (GET, JSON completo)
+ROTA_QUERY = '/api/query'
+ROTA_AGREGADA = '/api/query/aggregate'
+
+flask_app = WsgiToAsgi(create_app())
+query_service = AsyncQueryService()
+# Um cache por processo: warm-up e rotas Flask abastecem também o caminho assíncrono
+query_service.cache_service = flask_query_service.cache_service
+query_service.warmup = flask_query_service.warmup
+query_service.slow_queries = flask_query_service.slow_queries
+metrics.watch_async_pool(query_service.pool)
+
+
+async def app(scope, receive, send):
+    """Aplicação ASGI: despacha para o caminho assíncrono ou para o Flask"""
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+
+    if scope['type'] == 'http' and scope['method'] == 'GET':
+        path = _route_path(scope)
+        if path in (ROTA_QUERY, ROTA_AGREGADA):
+            request = Request(_environ(scope))
+            if path == ROTA_AGREGADA or _json_completo(request):
+                response = await _handle(path, request)
+                return await _send(send, response)
+
+    await flask_app(scope, receive, send)
+
+
+async def _lifespan(receive, send):
+    """Abre o pool assíncrono no startup e fecha no shutdown"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await query_service.open()
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            # Cards dos dashboards em cache antes do primeiro request (falha não impede o startup)
+            try:
+                await query_service.metabase_service.refresh_dashboards()
+            except Exception as e:
+                print(f"⚠️ Prefetch dos dashboards falhou: {e}")
+            flask_query_service.metabase_service.start_refresher()
+            if flask_query_service.warmup is not None:
+                flask_query_service.warmup.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await query_service.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def _json_completo(request: Request) -> bool:
+    """Só o modo JSON sem stream nem paginação tem versão assíncrona"""
+    args = request.args
+    if args.get('stream', '').lower() in ('1', 'true'):
+        return False
+    if any(args.get(key) not in (None, '') for key in ('limit', 'offset', 'cursor')):
+        return False
+    try:
+        return negociar_formato(args.get('format'), request) == 'json'
+    except ValueError:
+        # Formato inválido: o Flask responde o 400 de sempre
+        return False
+
+
+async def _handle(path: str, request: Request) -> Response:
+    """Executa com trace (Server-Timing / TRACE_LOG_FILE), como as rotas Flask"""
+    if not TRACE_CONFIG['enabled']:
+        return await _executar(path, request)
+
+    trace, token = tracing.start(path, request.headers.get('X-Request-ID'))
+    try:
+        response = await _executar(path, request)
+    finally:
+        tracing.finish(token)
+    tracing.apply_headers(response, trace)
+    trace.attrs['method'] = request.method
+    tracing.trace_log.write(trace)
+    metrics.observe_trace(trace)
+    return response
+
+
+async def _executar(path: str, request: Request) -> Response:
+    """Mesmo contrato de erros das rotas Flask (400 / 503 / 500)"""
+    question_id = request.args.get('question_id', '51')
+    try:
+        question_id = int(question_id)
+        filters = filter_processor.capture_from_request(request)
+        headers = {
+            'if_none_match': request.headers.get('If-None-Match'),
+            'accept_encoding': request.headers.get('Accept-Encoding')
+        }
+
+        if path == ROTA_AGREGADA:
+            print(f"\n📊 [ASGI] Query agregada {question_id} ({len(filters)} filtros)")
+            response = await query_service.execute_aggregate(
+                question_id, filters,
+                request.args.getlist('group_by'), request.args.getlist('measures'),
+                **headers
+            )
+        else:
+            print(f"\n🚀 [ASGI] Query {question_id} ({len(filters)} filtros)")
+            response = await query_service.execute_query(question_id, filters, **headers)
+            response.headers.add('Vary', 'Accept')
+        return response
+
+    except ValueError as e:
+        return _erro(str(e), 'parametro_invalido', 400)
+
+    except (psycopg.errors.UndefinedColumn, psycopg.errors.UndefinedFunction) as e:
+        return _erro(str(e).strip(), 'agregacao_invalida', 400)
+
+    except PoolTimeout as e:
+        print(f"\n⏳ [ASGI] {str(e)}")
+        return _erro(str(e), 'pool_esgotado', 503)
+
+    except Exception as e:
+        import traceback
+        print(f"\n❌ [ASGI] Erro: {str(e)}")
+        print(traceback.format_exc())
+        return _erro(str(e), 'erro_interno', 500, question_id=question_id)
+
+
+def _erro(mensagem: str, tipo: str, status: int, **extra) -> Response:
+    return Response(serializer.dumps({'error': mensagem, 'tipo': tipo, **extra}),
+                    status=status, mimetype='application/json')
+
+
+async def _send(send, response: Response):
+    """Envia a Response do werkzeug pelo protocolo ASGI (pedaços sem cópia)"""
+    # O Flask-CORS não passa por aqui: mesmos headers que ele aplicaria
+    response.headers.setdefault('Access-Control-Allow-Origin', '*')
+    response.headers.setdefault('Access-Control-Expose-Headers', ', '.join(EXPOSE_HEADERS))
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [
+            (key.lower().encode('latin-1'), value.encode('latin-1'))
+            for key, value in response.headers.items()
+        ]
+    })
+    chunks = [] if response.status_code == 304 else list(response.iter_encoded())
+    for chunk in chunks[:-1]:
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    await send({'type': 'http.response.body', 'body': chunks[-1] if chunks else b''})
+
+
+def _route_path(scope) -> str:
+    """Caminho sem o root_path (proxy montado em /metabase_customizacoes)"""
+    path, root = scope['path'], scope.get('root_path', '')
+    if root and path.startswith(root):
+        path = path[len(root):]
+    return path
+
+
+def _environ(scope) -> Dict:
+    """Environ WSGI mínimo para montar o Request do werkzeug (GET, sem corpo)"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': _route_path(scope),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+    }
+    for name, value in scope.get('headers', []):
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = 'HTTP_' + key
+        value = value.decode('latin-1')
+        # Header repetido: junta com vírgula, como os servidores WSGI
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
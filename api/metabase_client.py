@@ -3,9 +3,9 @@
 Cliente para comunicação com a API do Metabase
 """
 
-import requests
 import json
 from typing import Dict, List, Optional
+from .utils.metabase_session import MetabaseSession
 from .config import (
     METABASE_BASE_URL,
     METABASE_USERNAME,
@@ -18,22 +18,15 @@ class MetabaseClient:
     """Cliente para interagir com a API do Metabase"""
     
     def __init__(self):
-        self._session_token = None
         self.base_url = METABASE_BASE_URL
+        # Conexões keep-alive, retentativas e renovação do token em 401
+        self.session = MetabaseSession(
+            self.base_url, METABASE_USERNAME, METABASE_PASSWORD, max_retries=API_MAX_RETRIES
+        )
         
     def get_session_token(self) -> str:
         """Obtém ou reutiliza token de sessão"""
-        if self._session_token:
-            return self._session_token
-            
-        response = requests.post(
-            f"{self.base_url}/api/session",
-            json={"username": METABASE_USERNAME, "password": METABASE_PASSWORD},
-            timeout=30
-        )
-        response.raise_for_status()
-        self._session_token = response.json()["id"]
-        return self._session_token
+        return self.session.token()
     
     def execute_question(self, question_id: int, parameters: List[Dict]) -> List[Dict]:
         """
@@ -46,8 +39,6 @@ class MetabaseClient:
         Returns:
             Lista de resultados (linhas)
         """
-        token = self.get_session_token()
-        
         # Remove parâmetros vazios
         clean_parameters = [
             p for p in parameters
@@ -58,12 +49,9 @@ class MetabaseClient:
         
         payload = {"parameters": clean_parameters}
         
-        response = requests.post(
-            f"{self.base_url}/api/card/{question_id}/query/json",
-            headers={
-                "X-Metabase-Session": token,
-                "Content-Type": "application/json"
-            },
+        response = self.session.post(
+            f"/api/card/{question_id}/query/json",
+            headers={"Content-Type": "application/json"},
             json=payload,
             timeout=API_TIMEOUT
         )
@@ -82,26 +70,14 @@ class MetabaseClient:
     
     def get_question_info(self, question_id: int) -> Dict:
         """Obtém informações sobre uma questão"""
-        token = self.get_session_token()
-        
-        response = requests.get(
-            f"{self.base_url}/api/card/{question_id}",
-            headers={"X-Metabase-Session": token},
-            timeout=30
-        )
+        response = self.session.get(f"/api/card/{question_id}")
         response.raise_for_status()
         
         return response.json()
     
     def get_database_metadata(self, database_id: int) -> Dict:
         """Obtém metadata do banco de dados"""
-        token = self.get_session_token()
-        
-        response = requests.get(
-            f"{self.base_url}/api/database/{database_id}/metadata",
-            headers={"X-Metabase-Session": token},
-            timeout=30
-        )
+        response = self.session.get(f"/api/database/{database_id}/metadata")
         response.raise_for_status()
         
         return response.json()
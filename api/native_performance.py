@@ -11,19 +11,35 @@ import gzip
 import time
 from typing import Dict, List, Any, Tuple
 from contextlib import contextmanager
-from decimal import Decimal
-from datetime import datetime, date
 import redis
 import hashlib
 from flask import Response, request
 
+from api.services.connection_pool import ConnectionPool
+from api.utils import compression, pg_types, serializer
+
 class NativePerformanceAPI:
     """API que replica a performance do Metabase nativo"""
     
     def __init__(self):
-        # Pool de conexões PERSISTENTE (como Metabase)
-        self.connection_pool = []
-        self.max_pool_size = 20
+        # Pool de conexões PERSISTENTE (como Metabase), limitado e thread-safe
+        self.pool = ConnectionPool(
+            {
+                'host': 'localhost',
+                'port': 5432,
+                'database': 'agencias',
+                'user': 'cazouvilela',
+                'password': '$Riprip001',
+                # Otimizações de conexão
+                'options': '-c statement_timeout=600000 -c work_mem=256MB',
+                'connect_timeout': 5
+            },
+            min_size=5,
+            max_size=20,
+            # IMPORTANTE: Usar cursor padrão, não RealDictCursor
+            configure=self._configure_connection,
+            name='native_performance'
+        )
         self.prepared_statements = {}
         
         # Cache Redis (como Metabase usa)
@@ -44,66 +60,22 @@ class NativePerformanceAPI:
         # Inicializa pool
         self._init_connection_pool()
     
+    @staticmethod
+    def _configure_connection(conn):
+        """Autocommit + typecasters (NUMERIC -> float, datas -> ISO) em cada conexão nova"""
+        conn.set_session(autocommit=True)
+        pg_types.register_json_casts(conn)
+    
     def _init_connection_pool(self):
         """Cria pool de conexões persistentes"""
         print("🔌 Inicializando pool de conexões...")
-        
-        for i in range(5):  # Começa com 5 conexões
-            try:
-                conn = psycopg2.connect(
-                    host='localhost',
-                    port=5432,
-                    database='agencias',
-                    user='cazouvilela',
-                    password='$Riprip001',
-                    # Otimizações de conexão
-                    options='-c statement_timeout=600000 -c work_mem=256MB',
-                    connect_timeout=5
-                )
-                # IMPORTANTE: Usar cursor padrão, não RealDictCursor
-                conn.set_session(autocommit=True)
-                self.connection_pool.append(conn)
-            except Exception as e:
-                print(f"⚠️ Erro ao criar conexão {i}: {e}")
+        self.pool.warm()
     
     @contextmanager
     def get_connection(self):
-        """Pega conexão do pool (sem criar nova!)"""
-        conn = None
-        try:
-            # Tenta pegar do pool
-            while self.connection_pool and not conn:
-                candidate = self.connection_pool.pop()
-                try:
-                    # Testa se ainda está viva
-                    candidate.isolation_level
-                    conn = candidate
-                except:
-                    # Conexão morta, descarta
-                    pass
-            
-            # Se não tem no pool, cria nova
-            if not conn:
-                conn = psycopg2.connect(
-                    host='localhost',
-                    port=5432,
-                    database='agencias',
-                    user='cazouvilela',
-                    password='$Riprip001',
-                    options='-c statement_timeout=600000 -c work_mem=256MB'
-                )
-                conn.set_session(autocommit=True)
-            
+        """Pega conexão do pool (espera na fila se todas estiverem em uso)"""
+        with self.pool.connection() as conn:
             yield conn
-            
-            # Retorna ao pool
-            if len(self.connection_pool) < self.max_pool_size:
-                self.connection_pool.append(conn)
-                conn = None
-                
-        finally:
-            if conn:
-                conn.close()
     
     def executar_query_nativa(self, question_id: int, query_sql: str, cache_key: str) -> Tuple[List, List, float]:
         """
@@ -140,49 +112,22 @@ class NativePerformanceAPI:
                 ]
                 
                 # Pega TODOS os dados de uma vez (como Metabase!)
+                # Os typecasters da conexão já entregam valores prontos para JSON
                 rows = cursor.fetchall()
                 
                 execution_time = time.time() - start_time
                 print(f"✅ {len(rows):,} linhas em {execution_time:.2f}s")
                 
-                # 3. Processa dados para formato otimizado
-                processed_rows = self._process_rows_native(rows)
-                
-                # 4. Salva no cache
+                # 3. Salva no cache
                 if self.cache_enabled and len(rows) > 0:
                     self._save_to_cache(cache_key, {
                         'cols': cols,
-                        'rows': processed_rows,
+                        'rows': rows,
                         'row_count': len(rows),
                         'cached_at': time.time()
                     })
                 
-                return cols, processed_rows, execution_time
-    
-    def _process_rows_native(self, rows: List[tuple]) -> List[List]:
-        """
-        Processa linhas para formato nativo do Metabase
-        Converte tuplas em listas, serializa tipos especiais
-        """
-        processed = []
-        
-        for row in rows:
-            processed_row = []
-            for value in row:
-                if isinstance(value, Decimal):
-                    processed_row.append(float(value))
-                elif isinstance(value, (datetime, date)):
-                    processed_row.append(value.isoformat())
-                elif isinstance(value, dict):
-                    # JSONB fields - mantém como dict
-                    processed_row.append(value)
-                elif value is None:
-                    processed_row.append(None)
-                else:
-                    processed_row.append(value)
-            processed.append(processed_row)
-        
-        return processed
+                return cols, rows, execution_time
     
     def _get_pg_type(self, type_code: int) -> str:
         """Mapeia tipo PostgreSQL para tipo Metabase"""
@@ -209,7 +154,7 @@ class NativePerformanceAPI:
             data = self.redis_client.get(f"metabase:query:{key}")
             if data:
                 # Descomprime e deserializa
-                return json.loads(gzip.decompress(data).decode('utf-8'))
+                return serializer.loads(gzip.decompress(data))
         except Exception as e:
             print(f"⚠️ Erro ao ler cache: {e}")
         return None
@@ -218,8 +163,8 @@ class NativePerformanceAPI:
         """Salva no cache Redis comprimido"""
         try:
             # Serializa e comprime
-            json_data = json.dumps(data, separators=(',', ':'))
-            compressed = gzip.compress(json_data.encode('utf-8'))
+            json_data = serializer.dumps(data)
+            compressed, _ = compression.compress(json_data, 'gzip')
             
             # Salva com TTL
             self.redis_client.setex(
@@ -243,7 +188,7 @@ class NativePerformanceAPI:
     def criar_response_nativa(self, cols: List, rows: List, metadata: Dict) -> Response:
         """
         Cria response EXATAMENTE como Metabase
-        Com compressão gzip e formato otimizado
+        Com compressão negociada pelo Accept-Encoding e formato otimizado
         """
         # Formato nativo do Metabase
         response_data = {
@@ -266,18 +211,23 @@ class NativePerformanceAPI:
         }
         
         # Serializa para JSON compacto
-        json_data = json.dumps(response_data, separators=(',', ':'))
+        json_data = serializer.dumps(response_data)
         
-        # Comprime com gzip
-        compressed = gzip.compress(json_data.encode('utf-8'))
+        # Comprime no algoritmo aceito pelo cliente (nível configurável, nada abaixo do mínimo)
+        encoding = compression.negotiate(request.headers.get('Accept-Encoding'), len(json_data))
+        compressed, compression_time = compression.compress(json_data, encoding)
         
         print(f"📦 Response: {len(json_data)} → {len(compressed)} bytes "
-              f"({100 - len(compressed)/len(json_data)*100:.1f}% compressão)")
+              f"({100 - len(compressed)/len(json_data)*100:.1f}% compressão {encoding} "
+              f"em {compression_time * 1000:.0f}ms)")
         
         # Retorna com headers corretos
         response = Response(compressed)
         response.headers['Content-Type'] = 'application/json'
-        response.headers['Content-Encoding'] = 'gzip'
+        if encoding != compression.IDENTITY:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['X-Compression-Time'] = compression.timing_header(compression_time)
         response.headers['X-Metabase-Client'] = 'native-performance'
         
         return response
@@ -11,6 +11,8 @@ import time
 import json
 from decimal import Decimal
 
+from api.services.connection_pool import ConnectionPool
+
 class PostgresClient:
     """Cliente para executar queries diretamente no PostgreSQL"""
     
@@ -22,43 +24,27 @@ class PostgresClient:
             'user': 'cazouvilela',
             'password': '$Riprip001'
         }
-        self._connection_pool = []
-        self.max_pool_size = 5
+        self.pool = ConnectionPool(
+            self.connection_params,
+            min_size=0,
+            max_size=5,
+            configure=self._configurar_conexao,
+            name='postgres_client'
+        )
         
     @contextmanager
     def get_connection(self):
         """Context manager para obter conexão do pool"""
-        conn = None
-        try:
-            # Tenta obter do pool
-            if self._connection_pool:
-                conn = self._connection_pool.pop()
-                # Verifica se conexão ainda está viva
-                try:
-                    conn.isolation_level
-                except:
-                    conn = None
-            
-            # Cria nova conexão se necessário
-            if not conn:
-                conn = psycopg2.connect(**self.connection_params)
-                # Configura para retornar dicts
-                conn.cursor_factory = psycopg2.extras.RealDictCursor
-                
-                # Registra adaptadores para tipos especiais
-                self._registrar_adaptadores(conn)
-            
+        with self.pool.connection() as conn:
             yield conn
-            
-            # Retorna ao pool se não estiver cheio
-            if len(self._connection_pool) < self.max_pool_size:
-                self._connection_pool.append(conn)
-                conn = None
-                
-        finally:
-            # Fecha conexão se não foi para o pool
-            if conn:
-                conn.close()
+    
+    def _configurar_conexao(self, conn):
+        """Configura cada conexão nova do pool"""
+        # Configura para retornar dicts
+        conn.cursor_factory = psycopg2.extras.RealDictCursor
+        
+        # Registra adaptadores para tipos especiais
+        self._registrar_adaptadores(conn)
     
     def _registrar_adaptadores(self, conn):
         """Registra adaptadores para tipos PostgreSQL especiais"""
@@ -238,9 +224,7 @@ class PostgresClient:
     
     def fechar_pool(self):
         """Fecha todas as conexões do pool"""
-        while self._connection_pool:
-            conn = self._connection_pool.pop()
-            conn.close()
+        self.pool.close_all()
         
         print("🔌 Pool de conexões fechado")
 
@@ -2,14 +2,17 @@
 Rotas de debug e diagnóstico
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
+from config.settings import METRICS_CONFIG
 from api.utils.filters import FilterProcessor
-from api.services.cache_service import CacheService
+from api.utils import metrics
+from api.routes.query_routes import query_service, warmup_service
 import urllib.parse
 
 bp = Blueprint('debug', __name__)
 filter_processor = FilterProcessor()
-cache_service = CacheService()
+# Mesma instância do QueryService: o L1 em memória é por instância
+cache_service = query_service.cache_service
 
 @bp.route('/filters', methods=['GET'])
 def debug_filters():
@@ -78,14 +81,52 @@ def cache_stats():
 def clear_cache():
     """Limpa o cache"""
     cache_service.clear_all()
+    query_service.metabase_service.clear_cache()
     return jsonify({'message': 'Cache limpo com sucesso'})
 
+@bp.route('/warmup', methods=['GET'])
+def warmup_stats():
+    """Combinações mais acessadas e resultado da última rodada de warm-up"""
+    return jsonify(warmup_service.get_stats())
+
+@bp.route('/warmup', methods=['POST'])
+def warmup_trigger():
+    """Dispara uma rodada de warm-up (ex: chamado pelo ETL depois da carga)"""
+    force = request.args.get('force', 'true').lower() in ('1', 'true')
+    warmup_service.trigger(force=force)
+    return jsonify({'message': 'Warm-up agendado', 'force': force}), 202
+
+@bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Métricas no formato texto do Prometheus (somadas entre workers com METRICS_DIR)"""
+    if not METRICS_CONFIG['enabled']:
+        return jsonify({'error': 'Métricas desabilitadas (METRICS_ENABLED=false)'}), 404
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@bp.route('/slow-queries', methods=['GET'])
+def slow_queries():
+    """Queries lentas agrupadas por fingerprint (?fingerprint=X inclui os planos completos)"""
+    fingerprint = request.args.get('fingerprint') or None
+    return jsonify({
+        'stats': query_service.slow_queries.get_stats(),
+        'queries': query_service.slow_queries.grouped(fingerprint)
+    })
+
+@bp.route('/pool/stats', methods=['GET'])
+def pool_stats():
+    """Estatísticas do pool de conexões PostgreSQL"""
+    return jsonify(query_service.get_pool_stats())
+
 @bp.route('/health', methods=['GET'])
 def health_check():
     """Health check detalhado"""
     health_status = {
         'status': 'healthy',
         'cache': cache_service.get_stats(),
+        'pool': query_service.get_pool_stats(),
+        'metabase_cards': query_service.metabase_service.get_cache_stats(),
+        'incremental': query_service.incremental.get_stats(),
+        'slow_queries': query_service.slow_queries.get_stats(),
         'config': {
             'debug_mode': True,
             'cache_enabled': cache_service.enabled
@@ -2,13 +2,77 @@
 Rotas relacionadas a queries
 """
 
-from flask import Blueprint, request, jsonify
+import psycopg2.errors
+from flask import Blueprint, request, jsonify, g
+from config.settings import TRACE_CONFIG
 from api.services.query_service import QueryService
+from api.services.warmup_service import WarmupService
+from api.services.connection_pool import PoolTimeoutError
 from api.utils.filters import FilterProcessor
+from api.utils.arrow_format import ARROW_AVAILABLE, ARROW_MIME
+from api.utils import tracing, metrics
 
 bp = Blueprint('query', __name__)
 query_service = QueryService()
+# Warm-up: registra as combinações acessadas e renova o cache (WARMUP_ENABLED)
+warmup_service = WarmupService(query_service)
+if warmup_service.config['enabled']:
+    query_service.warmup = warmup_service
 filter_processor = FilterProcessor()
+# Pool e cache entram nas métricas pelos próprios contadores, lidos no scrape
+metrics.watch_pool(query_service.pool)
+metrics.watch_cache(query_service.cache_service)
+
+FORMATOS = {'json': 'application/json', 'arrow': ARROW_MIME}
+
+# Rotas com trace por request (Server-Timing / TRACE_LOG_FILE)
+ROTAS_TRACE = ('query.execute_query', 'query.execute_aggregate')
+
+
+@bp.before_request
+def abrir_trace():
+    if TRACE_CONFIG['enabled'] and request.endpoint in ROTAS_TRACE:
+        g.trace, g.trace_token = tracing.start(request.path, request.headers.get('X-Request-ID'))
+
+
+@bp.after_request
+def fechar_trace(response):
+    """Headers com os tempos; a linha do trace é gravada quando o corpo termina (streaming)"""
+    trace = g.pop('trace', None)
+    if trace is None:
+        return response
+    token = g.pop('trace_token')
+    tracing.apply_headers(response, trace)
+    trace.attrs['method'] = request.method
+
+    def concluir():
+        tracing.trace_log.write(trace)
+        metrics.observe_trace(trace)
+        try:
+            tracing.finish(token)
+        except ValueError:
+            # Corpo consumido em outro contexto: o próximo request sobrescreve o trace
+            pass
+
+    response.call_on_close(concluir)
+    return response
+
+
+def negociar_formato(formato_param, req=None) -> str:
+    """
+    Define o formato da resposta: parâmetro format tem prioridade,
+    senão usa o header Accept (JSON continua sendo o padrão)
+    req: request a usar no lugar do request atual do Flask (entrada ASGI)
+    """
+    if formato_param:
+        formato = str(formato_param).lower()
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato '{formato_param}' não suportado (use json ou arrow)")
+        return formato
+
+    melhor = (req or request).accept_mimetypes.best_match(list(FORMATOS.values()), default='application/json')
+    return 'arrow' if melhor == ARROW_MIME else 'json'
+
 
 @bp.route('/query', methods=['GET', 'POST'])
 def execute_query():
@@ -22,19 +86,61 @@ def execute_query():
             data = request.get_json() or {}
             question_id = data.get('question_id', '51')
             filters = data.get('filters', {})
+            stream = str(data.get('stream', '')).lower() in ('1', 'true')
+            formato = negociar_formato(data.get('format'))
+            paginacao = {key: data.get(key) for key in ('limit', 'offset', 'cursor', 'sort')}
         else:
             question_id = request.args.get('question_id', '51')
             filters = filter_processor.capture_from_request(request)
+            stream = request.args.get('stream', '').lower() in ('1', 'true')
+            formato = negociar_formato(request.args.get('format'))
+            paginacao = {key: request.args.get(key) for key in ('limit', 'offset', 'cursor', 'sort')}
+        
+        if formato == 'arrow' and not ARROW_AVAILABLE:
+            return jsonify({
+                'error': 'Formato arrow indisponível: pyarrow não está instalado',
+                'tipo': 'formato_indisponivel'
+            }), 406
         
         # Converte para int
         question_id = int(question_id)
         
+        # Modo paginado (janela da tabela virtual): limit, offset ou cursor
+        if any(paginacao[key] not in (None, '') for key in ('limit', 'offset', 'cursor')):
+            if stream or formato != 'json':
+                raise ValueError("Paginação só é suportada em JSON sem streaming")
+            
+            print(f"\n📄 [API] Executando query paginada")
+            print(f"   Question ID: {question_id}")
+            print(f"   Filtros: {len(filters)}")
+            
+            response = query_service.execute_page(
+                question_id, filters,
+                limit=int(paginacao['limit']) if paginacao['limit'] not in (None, '') else None,
+                offset=int(paginacao['offset']) if paginacao['offset'] not in (None, '') else 0,
+                cursor=paginacao['cursor'] or None,
+                sort=paginacao['sort'] or None,
+                accept_encoding=request.headers.get('Accept-Encoding')
+            )
+            response.headers.add('Vary', 'Accept')
+            return response
+        
         print(f"\n🚀 [API] Executando query")
         print(f"   Question ID: {question_id}")
         print(f"   Filtros: {len(filters)}")
+        if stream:
+            print(f"   Modo: streaming")
+        if formato != 'json':
+            print(f"   Formato: {formato}")
         
         # Executa query
-        response = query_service.execute_query(question_id, filters)
+        response = query_service.execute_query(
+            question_id, filters, stream=stream, output_format=formato,
+            if_none_match=request.headers.get('If-None-Match'),
+            accept_encoding=request.headers.get('Accept-Encoding')
+        )
+        # A resposta depende do Accept: caches intermediários precisam saber
+        response.headers.add('Vary', 'Accept')
         
         return response
         
@@ -44,6 +150,76 @@ def execute_query():
             'tipo': 'parametro_invalido'
         }), 400
         
+    except PoolTimeoutError as e:
+        print(f"\n⏳ [API] {str(e)}")
+        return jsonify({
+            'error': str(e),
+            'tipo': 'pool_esgotado'
+        }), 503
+        
+    except Exception as e:
+        import traceback
+        print(f"\n❌ [API] Erro: {str(e)}")
+        print(traceback.format_exc())
+        
+        return jsonify({
+            'error': str(e),
+            'tipo': 'erro_interno',
+            'question_id': question_id
+        }), 500
+
+@bp.route('/query/aggregate', methods=['GET', 'POST'])
+def execute_aggregate():
+    """
+    Executa a pergunta já agregada no PostgreSQL
+    group_by: 'date:month,account_name' | measures: 'sum:impressions,sum:spend,count'
+    """
+    question_id = None
+    try:
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            question_id = data.get('question_id', '51')
+            filters = data.get('filters', {})
+            group_by = data.get('group_by', [])
+            measures = data.get('measures', [])
+        else:
+            question_id = request.args.get('question_id', '51')
+            filters = filter_processor.capture_from_request(request)
+            group_by = request.args.getlist('group_by')
+            measures = request.args.getlist('measures')
+        
+        question_id = int(question_id)
+        
+        print(f"\n📊 [API] Executando query agregada")
+        print(f"   Question ID: {question_id}")
+        print(f"   Filtros: {len(filters)}")
+        
+        return query_service.execute_aggregate(
+            question_id, filters, group_by, measures,
+            if_none_match=request.headers.get('If-None-Match'),
+            accept_encoding=request.headers.get('Accept-Encoding')
+        )
+        
+    except ValueError as e:
+        return jsonify({
+            'error': str(e),
+            'tipo': 'parametro_invalido'
+        }), 400
+        
+    except (psycopg2.errors.UndefinedColumn, psycopg2.errors.UndefinedFunction) as e:
+        # Coluna inexistente na pergunta ou agregação incompatível com o tipo (ex: sum de texto)
+        return jsonify({
+            'error': str(e).strip(),
+            'tipo': 'agregacao_invalida'
+        }), 400
+        
+    except PoolTimeoutError as e:
+        print(f"\n⏳ [API] {str(e)}")
+        return jsonify({
+            'error': str(e),
+            'tipo': 'pool_esgotado'
+        }), 503
+        
     except Exception as e:
         import traceback
         print(f"\n❌ [API] Erro: {str(e)}")
@@ -13,6 +13,9 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 from config.settings import API_CONFIG, DEBUG, LOG_LEVEL
 from api.routes import query_routes, debug_routes, static_routes
 
+# Headers legíveis pelo fetch() dos componentes (tempos por etapa, request id, cache)
+EXPOSE_HEADERS = ["Server-Timing", "X-Request-ID", "X-Cache"]
+
 def create_app():
     """Cria e configura a aplicação Flask"""
     app = Flask(__name__)
@@ -27,7 +30,8 @@ def create_app():
         r"/*": {
             "origins": "*",
             "methods": ["GET", "POST", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"]
+            "allow_headers": ["Content-Type", "Authorization", "X-Request-ID"],
+            "expose_headers": EXPOSE_HEADERS
         }
     })
     
@@ -65,12 +69,19 @@ def main():
     """Função principal para executar o servidor"""
     app = create_app()
     
+    # Prefetch dos cards dos dashboards e revalidação em segundo plano
+    from api.routes.query_routes import query_service
+    query_service.metabase_service.start_refresher()
+    if query_service.warmup is not None:
+        query_service.warmup.start()
+    
     print(f"\n🚀 Servidor API iniciando na porta {API_CONFIG['port']}")
     print(f"   Modo: {'Desenvolvimento' if DEBUG else 'Produção'}")
     print(f"   URL: http://localhost:{API_CONFIG['port']}")
     print(f"\n📍 Endpoints principais:")
     print(f"   POST /api/query - Executa queries")
     print(f"   GET  /api/debug/filters - Debug de filtros")
+    print(f"   GET  /api/debug/metrics - Métricas Prometheus")
     print(f"   GET  /componentes/<path> - Serve componentes")
     print(f"\n✨ Servidor pronto!\n")
     
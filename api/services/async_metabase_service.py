@@ -0,0 +1,141 @@
+"""
+Cliente assíncrono da API do Metabase (httpx, opcional)
+Usado pelo caminho ASGI: a busca do card não prende uma thread do worker
+"""
+
+import time
+import asyncio
+from typing import Dict, List, Optional
+
+from config.settings import METABASE_CONFIG, API_CONFIG, CARD_CACHE_CONFIG
+from api.services.metabase_service import dashboard_questions, store_question
+from api.utils.card_cache import CardCache
+from api.utils import metrics
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    httpx = None
+    HTTPX_AVAILABLE = False
+
+
+class AsyncMetabaseService:
+    """Versão assíncrona do MetabaseService (só o que o caminho de query usa)"""
+
+    def __init__(self):
+        if not HTTPX_AVAILABLE:
+            raise RuntimeError("httpx não instalado: caminho assíncrono indisponível")
+        self.base_url = METABASE_CONFIG['url']
+        self._client: Optional['httpx.AsyncClient'] = None
+        self._session_token = None
+        self._login_lock = asyncio.Lock()
+        # Cache de queries por question_id (mesma política do MetabaseService)
+        self._query_cache = CardCache(CARD_CACHE_CONFIG['max_entries'], CARD_CACHE_CONFIG['ttl'])
+        self._revalidating = set()
+
+    @property
+    def client(self) -> 'httpx.AsyncClient':
+        # Criado sob demanda dentro do event loop do servidor
+        if self._client is None:
+            # Retentativas só em erro de conexão (o httpx não repete request já enviado)
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url, timeout=30,
+                transport=httpx.AsyncHTTPTransport(retries=API_CONFIG['max_retries']),
+                limits=httpx.Limits(max_keepalive_connections=METABASE_CONFIG['pool_size'])
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_session_token(self, expired: Optional[str] = None) -> str:
+        """Obtém ou reutiliza token de sessão (um único login por vez)"""
+        if self._session_token and self._session_token != expired:
+            return self._session_token
+
+        async with self._login_lock:
+            if not self._session_token or self._session_token == expired:
+                response = await self.client.post('/api/session', json={
+                    "username": METABASE_CONFIG['username'],
+                    "password": METABASE_CONFIG['password']
+                })
+                response.raise_for_status()
+                self._session_token = response.json()["id"]
+        return self._session_token
+
+    async def _get(self, path: str):
+        """GET autenticado; um 401 (sessão expirada) renova o token e repete uma vez"""
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            token = await self.get_session_token()
+            response = await self.client.get(path, headers={"X-Metabase-Session": token})
+            if response.status_code == 401:
+                print("🔑 Sessão do Metabase expirada: novo login")
+                token = await self.get_session_token(expired=token)
+                response = await self.client.get(path, headers={"X-Metabase-Session": token})
+            status = response.status_code
+        finally:
+            metrics.observe_metabase('GET', path, status, time.perf_counter() - start)
+        response.raise_for_status()
+        return response
+
+    async def get_question_info(self, question_id: int) -> Dict:
+        """Obtém informações completas sobre uma questão"""
+        return (await self._get(f"/api/card/{question_id}")).json()
+
+    async def get_question_query(self, question_id: int) -> Dict:
+        """Query SQL nativa da pergunta (mesmo formato do MetabaseService)"""
+        result, stale = self._query_cache.get(question_id)
+        if result is not None:
+            # Card velho: responde com ele e revalida numa task do event loop
+            if stale and question_id not in self._revalidating:
+                self._revalidating.add(question_id)
+                asyncio.get_running_loop().create_task(self._revalidate(question_id))
+            return result
+
+        try:
+            result = await self._fetch_question(question_id)
+        except Exception as e:
+            print(f"❌ Erro ao extrair query: {str(e)}")
+            raise
+
+        print(f"✅ Query extraída: {len(result['query'])} caracteres, "
+              f"{len(result['template_tags'])} tags")
+        return result
+
+    async def _fetch_question(self, question_id: int) -> Dict:
+        return store_question(self._query_cache, question_id, await self.get_question_info(question_id))
+
+    async def _revalidate(self, question_id: int):
+        try:
+            await self._fetch_question(question_id)
+        except Exception as e:
+            print(f"⚠️ Revalidação da pergunta {question_id} falhou, mantendo versão em cache: {e}")
+        finally:
+            self._revalidating.discard(question_id)
+
+    async def refresh_dashboards(self) -> List[int]:
+        """Pré-carrega os cards dos dashboards configurados (chamado no startup)"""
+        loaded = []
+        for dashboard_id in CARD_CACHE_CONFIG['dashboard_ids']:
+            try:
+                questions = dashboard_questions((await self._get(f"/api/dashboard/{dashboard_id}")).json())
+            except Exception as e:
+                print(f"⚠️ Dashboard {dashboard_id} indisponível: {e}")
+                continue
+            for question_id, info in questions.items():
+                try:
+                    store_question(self._query_cache, question_id, info)
+                    loaded.append(question_id)
+                except Exception as e:
+                    print(f"⚠️ Card {question_id} do dashboard {dashboard_id} ignorado: {e}")
+        return loaded
+
+    def clear_cache(self):
+        """Limpa o cache de queries"""
+        self._query_cache.clear()
+        print("🗑️ Cache de queries do Metabase limpo")
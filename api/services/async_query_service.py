@@ -0,0 +1,390 @@
+"""
+Caminho assíncrono do serviço de queries (entrada ASGI)
+
+Mesmo resultado do QueryService para /api/query e /api/query/aggregate em
+JSON, mas sem prender uma thread por request: PostgreSQL via psycopg 3
+(AsyncConnectionPool) e Metabase via httpx. Centenas de iframes esperando
+o banco ficam em um punhado de workers.
+
+O que é CPU (renderizar filtros, montar e comprimir o corpo) é o mesmo
+código do QueryService; a montagem de corpos grandes roda em thread para
+não travar o event loop. O cache incremental por dia também vale aqui (mesmos
+blocos no Redis que o caminho síncrono). Streaming, Arrow e paginação continuam no app
+Flask (ver api/asgi.py).
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from flask import Response
+
+from config.settings import DATABASE_CONFIG, PERFORMANCE_CONFIG, FRESHNESS_CONFIG, SESSION_SETTINGS
+from api.services.async_metabase_service import AsyncMetabaseService
+from api.services.cache_service import CacheService, HIT_LOCAL, HIT_WAIT, MISS, BYPASS
+from api.services.incremental_cache import IncrementalCache, delta_runs, split_by_day
+from api.services.query_service import QueryService, session_config
+from api.services.slow_query_log import SlowQueryLog
+from api.utils import pg_types, tracing
+from api.utils.aggregation import QueryAggregator
+from api.utils.freshness import FreshnessTracker, build_etag, content_etag, data_version, etag_matches
+from api.utils.gzip_envelope import CachedBody
+from api.utils.query_parser import QueryParser
+
+try:
+    import psycopg
+    from psycopg_pool import AsyncConnectionPool, PoolTimeout
+    ASYNC_PG_AVAILABLE = True
+except ImportError:
+    psycopg = None
+    AsyncConnectionPool = None
+    PoolTimeout = None
+    ASYNC_PG_AVAILABLE = False
+
+
+class AsyncQueryService(QueryService):
+    """
+    Variante assíncrona do QueryService (só o modo JSON completo)
+    Reaproveita a montagem do corpo, ETag, cache e compressão da classe base
+    """
+
+    def __init__(self):
+        if not ASYNC_PG_AVAILABLE:
+            raise RuntimeError("psycopg 3 / psycopg_pool não instalados: caminho assíncrono indisponível")
+
+        # Não chama QueryService.__init__: não abre o pool psycopg2
+        self.metabase_service = AsyncMetabaseService()
+        self.cache_service = CacheService()
+        self.query_parser = QueryParser()
+        self.aggregator = QueryAggregator()
+        self.freshness = FreshnessTracker(
+            FRESHNESS_CONFIG['bucket_seconds'],
+            FRESHNESS_CONFIG['check_interval'],
+            FRESHNESS_CONFIG['queries'],
+            FRESHNESS_CONFIG['default_query']
+        )
+
+        self.warmup = None
+        self.incremental = IncrementalCache(self.cache_service, self.query_parser)
+        self.slow_queries = SlowQueryLog(self._explain_connection, self._configure_session)
+
+        # Misses em andamento no event loop: cache_key -> Future do corpo
+        self._flights: Dict[str, asyncio.Future] = {}
+
+        # psycopg 3 usa dbname; o resto do DATABASE_CONFIG vale igual
+        kwargs = {('dbname' if key == 'database' else key): value for key, value in DATABASE_CONFIG.items()}
+        # Prepared statements automáticos do psycopg 3 (no lugar do PREPARE manual)
+        kwargs['prepare_threshold'] = 0 if PERFORMANCE_CONFIG['prepared_statements'] else None
+        kwargs['autocommit'] = True
+
+        self.pool = AsyncConnectionPool(
+            kwargs=kwargs,
+            min_size=PERFORMANCE_CONFIG['min_pool_size'],
+            max_size=PERFORMANCE_CONFIG['max_pool_size'],
+            timeout=PERFORMANCE_CONFIG['pool_timeout'],
+            max_lifetime=PERFORMANCE_CONFIG['pool_max_age'],
+            max_idle=PERFORMANCE_CONFIG['pool_max_idle'],
+            configure=self._configure_async_connection,
+            name='async_query_service',
+            open=False
+        )
+
+    async def open(self):
+        """Abre o pool (chamado no startup do servidor ASGI)"""
+        print("🔌 Inicializando pool assíncrono de conexões...")
+        await self.pool.open(wait=True)
+
+    async def close(self):
+        await self.pool.close()
+        await self.metabase_service.close()
+        print("🔌 Pool assíncrono fechado")
+
+    @staticmethod
+    async def _configure_async_connection(conn):
+        """
+        Configura cada conexão nova do pool (mesmo papel do _configure_connection)
+        Um comando por execute: com prepare_threshold=0 o psycopg 3 prepara tudo,
+        e PREPARE não aceita vários comandos
+        """
+        pg_types.register_psycopg3_loaders(conn)
+        await conn.execute("SET DateStyle TO ISO, YMD", prepare=False)
+        # Mesmos parâmetros do caminho síncrono, uma vez por conexão (não por request)
+        query_sql, params = session_config(SESSION_SETTINGS)
+        await conn.execute(query_sql, params, prepare=False)
+        if PERFORMANCE_CONFIG['plan_cache_mode']:
+            await conn.execute("SELECT set_config('plan_cache_mode', %s, false)",
+                               (PERFORMANCE_CONFIG['plan_cache_mode'],), prepare=False)
+
+    # ------------------------------------------------------------------
+    # Endpoints
+    # ------------------------------------------------------------------
+
+    async def execute_query(self, question_id: int, filters: Dict,
+                            if_none_match: Optional[str] = None,
+                            accept_encoding: Optional[str] = None) -> Response:
+        """Executa a pergunta e retorna Response no formato do Metabase (JSON)"""
+        query_sql, params = await self._render_question(question_id, filters)
+        etag, version = await self._question_validator(question_id, query_sql, params, 'json')
+        cache_key = self._generate_cache_key(query_sql, params, version)
+        current = await self._current_etag_async(etag, version, cache_key) if if_none_match else None
+        if etag_matches(current, if_none_match):
+            print(f"♻️ ETag {current} confere: 304 Not Modified")
+            return self._not_modified(current)
+
+        if self.warmup is not None:
+            self.warmup.record(question_id, filters)
+
+        fill = (await self._incremental_fill(question_id, filters, version)
+                or self._question_fill(query_sql, params, question_id, filters))
+        response = await self._cached_response(cache_key, fill, accept_encoding, self._cache_ttl(filters))
+        return self._with_validator(response, etag, version)
+
+    async def execute_aggregate(self, question_id: int, filters: Dict, group_by, measures,
+                                if_none_match: Optional[str] = None,
+                                accept_encoding: Optional[str] = None) -> Response:
+        """Pergunta agregada no PostgreSQL (mesmo SQL do QueryService.execute_aggregate)"""
+        dimensions = self.aggregator.parse_group_by(group_by)
+        measures = self.aggregator.parse_measures(measures)
+        dims_desc, measures_desc = self.aggregator.describe(dimensions, measures)
+        print(f"📊 Agregação: group_by={dims_desc} measures={measures_desc}")
+
+        query_sql, params = await self._render_question(question_id, filters)
+        query_sql = self.aggregator.build(query_sql, dimensions, measures)
+
+        etag, version = await self._question_validator(
+            question_id, query_sql, params, f"aggregate:{dims_desc}:{measures_desc}"
+        )
+        cache_key = self._generate_cache_key(query_sql, params, version)
+        current = await self._current_etag_async(etag, version, cache_key) if if_none_match else None
+        if etag_matches(current, if_none_match):
+            print(f"♻️ ETag {current} confere: 304 Not Modified")
+            return self._not_modified(current)
+
+        fill = self._question_fill(query_sql, params, question_id, filters)
+        response = await self._cached_response(cache_key, fill, accept_encoding, self._cache_ttl(filters))
+        return self._with_validator(response, etag, version)
+
+    # ------------------------------------------------------------------
+    # Etapas (versões assíncronas das do QueryService)
+    # ------------------------------------------------------------------
+
+    async def _question_validator(self, question_id: int, query_sql: str, params: List,
+                                  variant: str) -> Tuple[Optional[str], str]:
+        if not FRESHNESS_CONFIG['etag_enabled']:
+            return None, ''
+
+        with tracing.span('metabase'):
+            query_info = await self.metabase_service.get_question_query(question_id)
+        with tracing.span('freshness'):
+            freshness = await self.freshness.token_async(question_id, self._execute_scalar)
+        version = data_version(freshness)
+        etag = build_etag(question_id, {'query': self._resolved_digest(query_sql, params)},
+                          query_info.get('revision'), version, variant)
+        return etag, version
+
+    async def _current_etag_async(self, etag: Optional[str], version: str,
+                                  cache_key: str) -> Optional[str]:
+        """Como _current_etag: L1 direto, o Redis numa thread"""
+        if not etag or version:
+            return etag
+        if not self.cache_service.enabled:
+            return None
+        body = self.cache_service.local.get(cache_key)
+        if body is None and self.cache_service.redis_client:
+            body, _ = await asyncio.to_thread(self.cache_service.get, cache_key)
+        return content_etag(etag, body.etag) if body is not None else None
+
+    async def _render_question(self, question_id: int, filters: Dict) -> Tuple[str, List]:
+        tracing.annotate(question_id=question_id, filters=filters)
+        with tracing.span('metabase'):
+            query_info = await self.metabase_service.get_question_query(question_id)
+        # Pergunta existe: pode virar série própria nas métricas
+        tracing.annotate(question_loaded=True)
+        with tracing.span('render'):
+            query_sql, params = self.query_parser.render_query(
+                question_id, query_info['query'], filters, query_info.get('revision')
+            )
+            return self.query_parser.clean_problematic_fields(query_sql), params
+
+    def _question_fill(self, query_sql: str, params: List, question_id: Optional[int] = None,
+                       filters: Optional[Dict] = None):
+        """fill() assíncrono do cache para a pergunta inteira"""
+        async def fill():
+            return await self._fill_body(query_sql, params, question_id, filters)
+        return fill
+
+    async def _incremental_fill(self, question_id: int, filters: Dict, version: str):
+        """
+        Versão assíncrona do QueryService._incremental_fill: blocos diários do
+        cache (Redis em thread) + queries só dos dias que faltam
+        """
+        query_info = await self.metabase_service.get_question_query(question_id)
+        plan = self.incremental.plan(question_id, query_info, filters)
+        if plan is None:
+            return None
+
+        async def fill():
+            started_at = time.time()
+            blocks = await asyncio.to_thread(self.incremental.load, plan, version)
+            missing = [day for day in plan.days if day not in blocks]
+            runs = delta_runs(missing)
+            execution_time = 0.0
+
+            for start, end in runs:
+                run_filters = dict(filters, data=f"{start.isoformat()}~{end.isoformat()}")
+                query_sql, params = await self._render_question(question_id, run_filters)
+                cols, rows, elapsed = await self._execute_native_query(query_sql, params, question_id, run_filters)
+                execution_time += elapsed
+
+                by_day = split_by_day(cols, rows, self.incremental.config['date_column'],
+                                      [day for day in plan.days if start <= day <= end])
+                if by_day is None:
+                    # Resultado não se decompõe por data: pergunta inteira daqui em diante
+                    self.incremental.mark_unsupported(
+                        question_id, plan.revision,
+                        f"resultado sem a coluna {self.incremental.config['date_column']} por dia"
+                    )
+                    self.incremental.record(fallbacks=1)
+                    query_sql, params = await self._render_question(question_id, filters)
+                    return await self._fill_body(query_sql, params, question_id, filters)
+
+                await asyncio.to_thread(self.incremental.store, plan, cols, by_day, version)
+                blocks.update({day: (cols, day_rows) for day, day_rows in by_day.items()})
+
+            days = list(reversed(plan.days)) if plan.descending else plan.days
+            cols = blocks[days[0]][0]
+            rows = [row for day in days for row in blocks[day][1]]
+            self.incremental.record(requests=1, days_cached=len(plan.days) - len(missing),
+                                    days_queried=len(missing), queries=len(runs))
+            print(f"🧩 Incremental: {len(plan.days) - len(missing)} dias do cache, "
+                  f"{len(missing)} consultados em {len(runs)} queries")
+
+            body = await asyncio.to_thread(self._build_body, cols, rows, {
+                'started_at': started_at,
+                'execution_time': execution_time,
+                'from_cache': False
+            })
+            return body, len(rows) > 0
+        return fill
+
+    async def _fill_body(self, query_sql: str, params: List, question_id: Optional[int] = None,
+                         filters: Optional[Dict] = None) -> Tuple[CachedBody, bool]:
+        started_at = time.time()
+        cols, rows, execution_time = await self._execute_native_query(query_sql, params, question_id, filters)
+        # JSON + gzip de resultados grandes levam segundos: fora do event loop
+        body = await asyncio.to_thread(self._build_body, cols, rows, {
+            'started_at': started_at,
+            'execution_time': execution_time,
+            'from_cache': False
+        })
+        return body, len(rows) > 0
+
+    async def _execute_native_query(self, query_sql: str, params: Optional[List] = None,
+                                    question_id: Optional[int] = None,
+                                    filters: Optional[Dict] = None) -> Tuple[List, List, float]:
+        start_time = time.time()
+        # getconn/putconn em vez de pool.connection(): a espera pelo pool vira o span 'pool'
+        with tracing.span('pool'):
+            conn = await self.pool.getconn()
+        try:
+            async with conn.cursor() as cursor:
+                await self._configure_async_session(cursor)
+
+                print(f"🚀 Executando query assíncrona ({len(params or [])} parâmetros)...")
+                query_start = time.time()
+                with tracing.span('db'):
+                    await self._execute(cursor, query_sql, params)
+                cols = self._build_cols(cursor.description)
+                with tracing.span('fetch'):
+                    rows = await cursor.fetchall()
+                query_time = time.time() - query_start
+        finally:
+            await self.pool.putconn(conn)
+
+        execution_time = time.time() - start_time
+        print(f"✅ {len(rows):,} linhas em {execution_time:.2f}s")
+        self.slow_queries.record(query_sql, params or [], query_time, len(rows), question_id, filters)
+        return cols, rows, execution_time
+
+    async def _execute_scalar(self, query_sql: str, params: Optional[List] = None) -> Any:
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cursor:
+                await self._configure_async_session(cursor)
+                await self._execute(cursor, query_sql, params)
+                row = await cursor.fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    async def _configure_async_session(cursor):
+        """
+        application_name com o request id (o resto da sessão fica na conexão)
+        prepare=False: o valor muda a cada request e não vale um prepared statement
+        """
+        await cursor.execute("SELECT set_config('application_name', %s, false)",
+                             (tracing.application_name(),), prepare=False)
+
+    @staticmethod
+    async def _execute(cursor, query_sql: str, params: Optional[List]):
+        """Como _execute_direct: sem parâmetros o %% do template precisa ser desfeito"""
+        if params:
+            await cursor.execute(query_sql, params)
+        else:
+            await cursor.execute(query_sql.replace('%%', '%'))
+
+    async def _cached_response(self, cache_key: str,
+                               fill: Callable[[], Awaitable[Tuple[CachedBody, bool]]],
+                               accept_encoding: Optional[str] = None,
+                               ttl: Optional[float] = None) -> Response:
+        """
+        Cache L1/L2 + single-flight dentro do event loop: misses simultâneos
+        da mesma chave aguardam o mesmo Future em vez de repetir a query
+        """
+        cache = self.cache_service
+        if not cache.enabled:
+            body, _ = await fill()
+            return self._body_response(body, BYPASS, accept_encoding)
+
+        # L1 é memória local: consulta direto; o Redis vai para uma thread
+        body = cache.local.get(cache_key)
+        status = HIT_LOCAL
+        if body is None and cache.redis_client:
+            body, status = await asyncio.to_thread(cache.get, cache_key)
+
+        if body is not None:
+            cache.record(status)
+        elif cache_key in self._flights:
+            body = await asyncio.shield(self._flights[cache_key])
+            status = HIT_WAIT
+            cache.record(status)
+        else:
+            body = await self._fill_once(cache_key, fill, ttl)
+            status = MISS
+
+        if status != MISS:
+            print(f"📦 Cache hit ({status})! Retornando instantaneamente")
+        return self._body_response(body, status, accept_encoding)
+
+    async def _fill_once(self, cache_key: str, fill, ttl: Optional[float] = None) -> CachedBody:
+        future = asyncio.get_running_loop().create_future()
+        # Sem ninguém esperando, a exceção já foi tratada pelo dono do miss
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._flights[cache_key] = future
+        try:
+            self.cache_service.record(MISS)
+            body, cacheable = await fill()
+            if cacheable:
+                await asyncio.to_thread(self.cache_service.set, cache_key, body, ttl)
+            future.set_result(body)
+            return body
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._flights[cache_key]
+
+    def get_pool_stats(self) -> Dict:
+        """Estatísticas do pool assíncrono"""
+        return self.pool.get_stats()
@@ -1,29 +1,141 @@
 """
-Serviço de cache usando Redis
+Serviço de cache em dois níveis
+L1: LRU em memória do processo (limitado em bytes)
+L2: Redis (compartilhado entre workers)
+
+As entradas são o corpo final da resposta, já comprimido (CachedBody):
+um hit não deserializa nem recomprime nada. Misses concorrentes da mesma
+chave são agrupados (single-flight): só um request executa a query.
 """
 
-import json
-import gzip
 import time
-from typing import Dict, Optional
+import uuid
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
 from config.settings import REDIS_CONFIG, CACHE_CONFIG
+from api.utils import tracing
+from api.utils.gzip_envelope import CachedBody
 
 try:
     import redis
     REDIS_AVAILABLE = True
 except ImportError:
     REDIS_AVAILABLE = False
-    print("⚠️ Redis não instalado, cache desabilitado")
+    print("⚠️ Redis não instalado, cache só em memória")
+
+# Prefixo das respostas prontas no Redis
+KEY_PREFIX = "metabase:body:"
+LOCK_PREFIX = "metabase:lock:"
+
+# Libera o lock só se ainda for o dono (o lock pode ter expirado e passado a outro worker)
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Status devolvidos por get_or_fill (vão para o header X-Cache)
+HIT_LOCAL = 'HIT-L1'
+HIT_REDIS = 'HIT-L2'
+HIT_WAIT = 'HIT-WAIT'
+MISS = 'MISS'
+BYPASS = 'BYPASS'
+
+
+class LocalLRU:
+    """LRU thread-safe limitado pelo total de bytes dos valores (len de cada valor)"""
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()   # key -> (body, expira_em)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                self._remove_locked(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, body, ttl: float) -> bool:
+        """Guarda o corpo; False se ele não cabe no L1"""
+        if len(body) > self.max_entry_bytes or ttl <= 0:
+            return False
+
+        with self._lock:
+            if key in self._entries:
+                self._remove_locked(key)
+            self._entries[key] = (body, time.time() + ttl)
+            self._bytes += len(body)
+
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove_locked(oldest)
+                self.evictions += 1
+        return True
+
+    def expires_in(self, key: str) -> Optional[float]:
+        """Segundos até a entrada expirar (None se não existe)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            return max(entry[1] - time.time(), 0.0)
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._remove_locked(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions
+            }
+
+    def _remove_locked(self, key: str):
+        body, _ = self._entries.pop(key)
+        self._bytes -= len(body)
+
 
 class CacheService:
-    """Gerencia cache com Redis"""
-    
-    def __init__(self):
-        self.enabled = CACHE_CONFIG['enabled'] and REDIS_CONFIG['enabled'] and REDIS_AVAILABLE
+    """Gerencia cache L1 (memória) + L2 (Redis)"""
+
+    def __init__(self, use_redis: Optional[bool] = None):
+        self.enabled = CACHE_CONFIG['enabled']
         self.ttl = CACHE_CONFIG['ttl']
+        self.local = LocalLRU(CACHE_CONFIG['local_max_bytes'], CACHE_CONFIG['local_max_entry_bytes'])
         self.redis_client = None
-        
-        if self.enabled:
+
+        # Locks por chave do single-flight: key -> [lock, requests usando]
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+
+        self._stats = {'hits_l1': 0, 'hits_l2': 0, 'hits_wait': 0, 'misses': 0}
+        self._stats_lock = threading.Lock()
+
+        if use_redis is None:
+            use_redis = REDIS_CONFIG['enabled']
+
+        if self.enabled and use_redis and REDIS_AVAILABLE:
             try:
                 self.redis_client = redis.Redis(
                     host=REDIS_CONFIG['host'],
@@ -32,91 +144,315 @@ class CacheService:
                 )
                 # Testa conexão
                 self.redis_client.ping()
-                print("✅ Cache Redis conectado")
+                print("✅ Cache Redis conectado (L2)")
             except Exception as e:
-                print(f"⚠️ Erro ao conectar Redis: {e}")
-                self.enabled = False
-    
-    def get(self, key: str) -> Optional[Dict]:
-        """Obtém valor do cache"""
-        if not self.enabled or not self.redis_client:
-            return None
-        
+                print(f"⚠️ Erro ao conectar Redis: {e} - cache só em memória")
+                self.redis_client = None
+
+    # ------------------------------------------------------------------
+    # Leitura / escrita
+    # ------------------------------------------------------------------
+
+    def get(self, key: str) -> Tuple[Optional[CachedBody], Optional[str]]:
+        """Obtém corpo do cache: (body, HIT_LOCAL | HIT_REDIS) ou (None, None)"""
+        if not self.enabled:
+            return None, None
+
+        body = self.local.get(key)
+        if body is not None:
+            return body, HIT_LOCAL
+
+        if not self.redis_client:
+            return None, None
+
         try:
-            data = self.redis_client.get(f"metabase:query:{key}")
-            if data:
-                # Descomprime e deserializa
-                decompressed = gzip.decompress(data)
-                return json.loads(decompressed.decode('utf-8'))
+            pipe = self.redis_client.pipeline()
+            pipe.get(KEY_PREFIX + key)
+            pipe.pttl(KEY_PREFIX + key)
+            data, pttl = pipe.execute()
+            if data is not None:
+                body = CachedBody.from_bytes(data)
+                # Promove para o L1 com o TTL que sobrou no Redis
+                self.local.set(key, body, (pttl if pttl and pttl > 0 else self.ttl * 1000) / 1000)
+                return body, HIT_REDIS
         except Exception as e:
             print(f"⚠️ Erro ao ler cache: {e}")
-        
-        return None
-    
-    def set(self, key: str, value: Dict):
-        """Salva valor no cache"""
-        if not self.enabled or not self.redis_client:
+
+        return None, None
+
+    def set(self, key: str, body: CachedBody, ttl: Optional[float] = None):
+        """Salva corpo pronto (comprimido) nos dois níveis (ttl menor que o padrão, se houver)"""
+        if not self.enabled:
             return
-        
+
+        ttl = min(ttl, self.ttl) if ttl else self.ttl
+        in_local = self.local.set(key, body, ttl)
+
+        if self.redis_client:
+            try:
+                self.redis_client.psetex(KEY_PREFIX + key, max(int(ttl * 1000), 1), body.to_bytes())
+            except Exception as e:
+                print(f"⚠️ Erro ao salvar cache: {e}")
+
+        print(f"💾 Cache salvo: {len(body):,} bytes "
+              f"(L1: {'sim' if in_local else 'não'}, L2: {'sim' if self.redis_client else 'não'})")
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        """
+        Valores brutos (bytes) de várias chaves: L1 primeiro, o resto num MGET
+        Usado pelos blocos diários do cache incremental
+        """
+        if not self.enabled:
+            return {}
+
+        found = {}
+        for key in keys:
+            data = self.local.get(key)
+            if data is not None:
+                found[key] = data
+
+        missing = [key for key in keys if key not in found]
+        if missing and self.redis_client:
+            try:
+                values = self.redis_client.mget([KEY_PREFIX + key for key in missing])
+                for key, data in zip(missing, values):
+                    if data is not None:
+                        found[key] = data
+                        # Promove para o L1 com o TTL padrão (o Redis continua com o TTL dele)
+                        self.local.set(key, data, self.ttl)
+            except Exception as e:
+                print(f"⚠️ Erro ao ler cache: {e}")
+
+        return found
+
+    def set_many(self, items: Dict[str, bytes], ttl: float):
+        """Salva valores brutos com TTL explícito (pode passar do CACHE_TTL)"""
+        if not self.enabled or not items:
+            return
+
+        for key, data in items.items():
+            self.local.set(key, data, min(ttl, self.ttl))
+
+        if self.redis_client:
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for key, data in items.items():
+                    pipe.psetex(KEY_PREFIX + key, max(int(ttl * 1000), 1), data)
+                pipe.execute()
+            except Exception as e:
+                print(f"⚠️ Erro ao salvar cache: {e}")
+
+    def get_or_fill(self, key: str, fill: Callable[[], Tuple[CachedBody, bool]],
+                    ttl: Optional[float] = None) -> Tuple[CachedBody, str]:
+        """
+        Retorna o corpo do cache ou executa fill() uma única vez por chave
+        fill devolve (body, cacheável). Requests concorrentes da mesma chave
+        esperam o primeiro terminar e reaproveitam o resultado.
+        Retorna (body, status) com status HIT-L1 | HIT-L2 | HIT-WAIT | MISS | BYPASS
+        """
+        if not self.enabled:
+            body, _ = fill()
+            return body, BYPASS
+
+        with tracing.span('cache'):
+            body, status = self.get(key)
+        if body is not None:
+            self._count('hits_l1' if status == HIT_LOCAL else 'hits_l2')
+            return body, status
+
+        with self._single_flight(key) as waited:
+            if waited:
+                # Outro request desta chave terminou enquanto esperávamos
+                body, _ = self.get(key)
+                if body is not None:
+                    self._count('hits_wait')
+                    return body, HIT_WAIT
+
+            with self._redis_fill_lock(key) as owner:
+                if not owner:
+                    # Outro worker está executando: espera o resultado aparecer no Redis
+                    body = self._wait_redis(key)
+                    if body is not None:
+                        self._count('hits_wait')
+                        return body, HIT_WAIT
+
+                self._count('misses')
+                body, cacheable = fill()
+                if cacheable:
+                    self.set(key, body, ttl)
+                return body, MISS
+
+    def refresh(self, key: str, fill: Callable[[], Tuple[CachedBody, bool]],
+                ttl: Optional[float] = None) -> bool:
+        """
+        Reexecuta fill() e sobrescreve a entrada com TTL novo (warm-up)
+        Enquanto isso os requests continuam recebendo a versão atual; se
+        outro fill da mesma chave já está rodando, não faz nada (False)
+        """
+        if not self.enabled:
+            return False
+
+        with self._single_flight(key) as waited:
+            if waited:
+                # Acabou de ser preenchida por um request
+                return False
+            with self._redis_fill_lock(key) as owner:
+                if not owner:
+                    return False
+                body, cacheable = fill()
+                if cacheable:
+                    self.set(key, body, ttl)
+                return cacheable
+
+    def remaining_ttl(self, key: str) -> Optional[float]:
+        """Segundos até a chave expirar no cache (L1 ou Redis); None se não está em cache"""
+        remaining = self.local.expires_in(key)
+        if remaining is not None or not self.redis_client:
+            return remaining
         try:
-            # Serializa e comprime
-            json_data = json.dumps(value, separators=(',', ':'))
-            compressed = gzip.compress(json_data.encode('utf-8'))
-            
-            # Salva com TTL
-            self.redis_client.setex(
-                f"metabase:query:{key}",
-                self.ttl,
-                compressed
-            )
-            
-            print(f"💾 Cache salvo: {len(json_data)} → {len(compressed)} bytes "
-                  f"({100 - len(compressed)/len(json_data)*100:.1f}% compressão)")
-            
-        except Exception as e:
-            print(f"⚠️ Erro ao salvar cache: {e}")
-    
+            pttl = self.redis_client.pttl(KEY_PREFIX + key)
+        except Exception:
+            return None
+        return pttl / 1000 if pttl and pttl > 0 else None
+
     def delete(self, key: str):
         """Remove valor do cache"""
-        if not self.enabled or not self.redis_client:
+        self.local.delete(key)
+        if not self.redis_client:
             return
-        
+
         try:
-            self.redis_client.delete(f"metabase:query:{key}")
+            self.redis_client.delete(KEY_PREFIX + key)
         except Exception as e:
             print(f"⚠️ Erro ao deletar cache: {e}")
-    
+
     def clear_all(self):
         """Limpa todo o cache"""
-        if not self.enabled or not self.redis_client:
+        self.local.clear()
+        print("🗑️ Cache em memória limpo")
+
+        if not self.redis_client:
             return
-        
+
         try:
             # Remove apenas chaves do metabase
-            pattern = "metabase:query:*"
+            pattern = KEY_PREFIX + "*"
             for key in self.redis_client.scan_iter(match=pattern):
                 self.redis_client.delete(key)
             print("🗑️ Cache Redis limpo")
         except Exception as e:
             print(f"⚠️ Erro ao limpar cache: {e}")
-    
+
+    def counters(self) -> Dict:
+        """Hits/misses por camada (sem consultar o Redis; usado pelas métricas)"""
+        with self._stats_lock:
+            return dict(self._stats)
+
     def get_stats(self) -> Dict:
         """Retorna estatísticas do cache"""
-        if not self.enabled or not self.redis_client:
+        if not self.enabled:
             return {'enabled': False}
-        
+
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update({'enabled': True, 'ttl': self.ttl, 'local': self.local.stats()})
+
+        if not self.redis_client:
+            stats['redis'] = {'enabled': False}
+            return stats
+
         try:
             info = self.redis_client.info()
-            pattern = "metabase:query:*"
-            keys_count = len(list(self.redis_client.scan_iter(match=pattern)))
-            
-            return {
+
+            stats['redis'] = {
                 'enabled': True,
-                'keys_count': keys_count,
+                # DBSIZE é O(1); SCAN nas chaves ficava mais lento conforme o cache crescia
+                'db_keys': self.redis_client.dbsize(),
                 'memory_used': info.get('used_memory_human', 'N/A'),
                 'hits': info.get('keyspace_hits', 0),
                 'misses': info.get('keyspace_misses', 0),
                 'uptime': info.get('uptime_in_seconds', 0)
             }
         except Exception as e:
-            return {'enabled': True, 'error': str(e)}
+            stats['redis'] = {'enabled': True, 'error': str(e)}
+        return stats
+
+    # ------------------------------------------------------------------
+    # Single-flight
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def _single_flight(self, key: str):
+        """Lock por chave dentro do processo; yield True se precisou esperar"""
+        with self._flights_lock:
+            flight = self._flights.setdefault(key, [threading.Lock(), 0])
+            flight[1] += 1
+
+        waited = not flight[0].acquire(blocking=False)
+        if waited:
+            flight[0].acquire()
+        try:
+            yield waited
+        finally:
+            flight[0].release()
+            with self._flights_lock:
+                flight[1] -= 1
+                if flight[1] == 0:
+                    del self._flights[key]
+
+    @contextmanager
+    def _redis_fill_lock(self, key: str):
+        """
+        Lock entre workers via SET NX no Redis; yield True se este processo
+        deve executar a query. Sem Redis, sempre executa.
+        O valor é um token aleatório: na saída só apaga o lock se ele ainda
+        for deste processo (compare-and-delete em Lua)
+        """
+        if not self.redis_client:
+            yield True
+            return
+
+        lock_key = LOCK_PREFIX + key
+        token = uuid.uuid4().hex.encode('ascii')
+        try:
+            owner = bool(self.redis_client.set(
+                lock_key, token, nx=True, px=int(CACHE_CONFIG['fill_lock_timeout'] * 1000)
+            ))
+        except Exception:
+            owner = True
+            lock_key = None
+
+        try:
+            yield owner
+        finally:
+            if owner and lock_key:
+                try:
+                    self.redis_client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+                except Exception:
+                    pass
+
+    def _wait_redis(self, key: str) -> Optional[CachedBody]:
+        """Espera outro worker preencher a chave (ou liberar o lock)"""
+        deadline = time.monotonic() + CACHE_CONFIG['fill_lock_timeout']
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            body, _ = self.get(key)
+            if body is not None:
+                return body
+            try:
+                if not self.redis_client.exists(LOCK_PREFIX + key):
+                    # Dono terminou sem cachear (erro ou resultado vazio)
+                    return None
+            except Exception:
+                return None
+        return None
+
+    def record(self, status: str):
+        """Contabiliza um resultado obtido fora do get_or_fill (caminho assíncrono)"""
+        name = {HIT_LOCAL: 'hits_l1', HIT_REDIS: 'hits_l2', HIT_WAIT: 'hits_wait', MISS: 'misses'}.get(status)
+        if name:
+            self._count(name)
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self._stats[name] += 1
@@ -0,0 +1,335 @@
+"""
+Pool de conexões PostgreSQL thread-safe
+Tamanho mínimo/máximo, fila de espera com timeout e validação no checkout
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+import psycopg2
+import psycopg2.extensions
+
+from api.utils import tracing
+
+
+class PoolTimeoutError(Exception):
+    """Nenhuma conexão ficou disponível dentro do timeout de checkout"""
+
+
+class ConnectionPool:
+    """
+    Pool limitado de conexões psycopg2
+
+    - Nunca passa de max_size conexões abertas; acima disso o checkout espera
+      na fila (Condition) até timeout segundos
+    - Conexões ociosas há mais de validate_after segundos são testadas com
+      SELECT 1 antes de serem entregues
+    - Conexões mais velhas que max_age são recicladas e ociosas há mais de
+      max_idle são fechadas (mantendo min_size)
+    """
+
+    def __init__(
+        self,
+        connect_kwargs: Dict,
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 30.0,
+        max_age: float = 1800.0,
+        max_idle: float = 300.0,
+        validate_after: float = 5.0,
+        configure: Optional[Callable] = None,
+        name: str = 'default'
+    ):
+        self.connect_kwargs = connect_kwargs
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.timeout = timeout
+        self.max_age = max_age
+        self.max_idle = max_idle
+        self.validate_after = validate_after
+        self.configure = configure
+        self.name = name
+
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = deque()        # (conn, last_used) - LIFO: reusa a mais recente
+        self._born = {}             # id(conn) -> (created_at, generation)
+        self._state = {}            # id(conn) -> dict livre por conexão (ex: prepared statements)
+        self._size = 0              # conexões abertas (ociosas + em uso + sendo criadas)
+        self._in_use = 0
+        self._generation = 0
+
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'timeouts': 0,
+            'created': 0,
+            'closed': 0,
+            'validation_failures': 0
+        }
+
+    # ------------------------------------------------------------------
+    # Checkout / checkin
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """Context manager: pega conexão do pool e devolve ao final"""
+        with tracing.span('pool'):
+            conn = self.getconn(timeout)
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # Socket morto ou servidor reiniciado: não volta para o pool
+            self.putconn(conn, discard=True)
+            raise
+        except BaseException:
+            self.putconn(conn)
+            raise
+        else:
+            self.putconn(conn)
+
+    def getconn(self, timeout: Optional[float] = None):
+        """Pega uma conexão válida, esperando até timeout segundos"""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        with self._cond:
+            self._stats['checkouts'] += 1
+
+        while True:
+            conn, last_used = self._reserve(deadline)
+
+            if conn is None:
+                # Vaga reservada: cria conexão nova fora do lock
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._in_use -= 1
+                        self._cond.notify()
+                    raise
+
+            if self._is_usable(conn, last_used):
+                return conn
+
+            with self._cond:
+                self._stats['validation_failures'] += 1
+            self._discard(conn)
+
+    def putconn(self, conn, discard: bool = False):
+        """Devolve conexão ao pool (ou fecha, se inválida/expirada)"""
+        if not discard:
+            discard = not self._reset(conn)
+
+        now = time.monotonic()
+        to_close = []
+
+        with self._cond:
+            self._in_use -= 1
+            created_at, generation = self._born.get(id(conn), (now, -1))
+
+            if (discard or conn.closed or generation != self._generation
+                    or now - created_at > self.max_age):
+                self._forget_locked(conn)
+                to_close.append(conn)
+            else:
+                self._idle.append((conn, now))
+
+            to_close.extend(self._reap_idle_locked(now))
+            self._cond.notify()
+
+        for old in to_close:
+            self._close(old)
+
+    # ------------------------------------------------------------------
+    # Gestão do pool
+    # ------------------------------------------------------------------
+
+    def warm(self) -> int:
+        """Abre conexões até ter min_size ociosas; retorna quantas criou"""
+        created = 0
+        while True:
+            with self._cond:
+                if len(self._idle) >= self.min_size or self._size >= self.max_size:
+                    break
+                self._size += 1
+
+            try:
+                conn = self._connect()
+            except Exception as e:
+                with self._cond:
+                    self._size -= 1
+                print(f"⚠️ [{self.name}] Erro ao criar conexão: {e}")
+                break
+
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+            created += 1
+
+        return created
+
+    def close_all(self):
+        """
+        Fecha as conexões ociosas; as que estão em uso são fechadas ao
+        voltar para o pool. O pool continua utilizável depois disso.
+        """
+        with self._cond:
+            self._generation += 1
+            to_close = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            for conn in to_close:
+                self._forget_locked(conn)
+
+        for conn in to_close:
+            self._close(conn)
+
+    def state(self, conn) -> Dict:
+        """
+        Dicionário associado à conexão enquanto ela viver no pool
+        Útil para estado por sessão do PostgreSQL (ex: prepared statements)
+        """
+        return self._state.setdefault(id(conn), {})
+
+    def stats(self) -> Dict:
+        """Retorna contadores e ocupação do pool"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'name': self.name,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'min_size': self.min_size,
+                'max_size': self.max_size
+            })
+        return stats
+
+    # ------------------------------------------------------------------
+    # Internos
+    # ------------------------------------------------------------------
+
+    def _reserve(self, deadline: float):
+        """
+        Reserva uma conexão ociosa ou uma vaga para criar nova
+        Retorna (conn, last_used) ou (None, None) quando deve criar
+        """
+        with self._cond:
+            wait_start = None
+            try:
+                while True:
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        self._in_use += 1
+                        return conn, last_used
+
+                    if self._size < self.max_size:
+                        self._size += 1
+                        self._in_use += 1
+                        return None, None
+
+                    if wait_start is None:
+                        wait_start = time.monotonic()
+                        self._stats['waits'] += 1
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeoutError(
+                            f"Pool '{self.name}' esgotado: {self.max_size} conexões em uso"
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                if wait_start is not None:
+                    self._stats['wait_time_total'] += time.monotonic() - wait_start
+
+    def _connect(self):
+        """Abre e configura uma conexão nova"""
+        conn = self._open()
+        try:
+            if self.configure:
+                self.configure(conn)
+        except Exception:
+            conn.close()
+            raise
+
+        with self._cond:
+            self._born[id(conn)] = (time.monotonic(), self._generation)
+            self._stats['created'] += 1
+        return conn
+
+    def _open(self):
+        return psycopg2.connect(**self.connect_kwargs)
+
+    def _is_usable(self, conn, last_used: float) -> bool:
+        """Valida conexão ociosa antes de entregar"""
+        if conn.closed:
+            return False
+
+        now = time.monotonic()
+        created_at, generation = self._born.get(id(conn), (now, -1))
+        if generation != self._generation or now - created_at > self.max_age:
+            return False
+
+        if now - last_used < self.validate_after:
+            return True
+
+        # isolation_level não detecta socket morto: faz round trip real
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            if not conn.autocommit:
+                conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _reset(self, conn) -> bool:
+        """Deixa a conexão limpa para o próximo uso; False se deve ser descartada"""
+        if conn.closed:
+            return False
+
+        try:
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                return False
+            if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _reap_idle_locked(self, now: float):
+        """Remove conexões ociosas demais (acima de min_size); chamar com lock"""
+        reaped = []
+        # As mais antigas ficam no início da deque
+        while len(self._idle) > self.min_size and now - self._idle[0][1] > self.max_idle:
+            conn, _ = self._idle.popleft()
+            self._forget_locked(conn)
+            reaped.append(conn)
+        return reaped
+
+    def _forget_locked(self, conn):
+        self._born.pop(id(conn), None)
+        self._state.pop(id(conn), None)
+        self._size -= 1
+        self._stats['closed'] += 1
+
+    def _discard(self, conn):
+        with self._cond:
+            self._in_use -= 1
+            self._forget_locked(conn)
+            self._cond.notify()
+        self._close(conn)
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
@@ -0,0 +1,284 @@
+"""
+Cache incremental por dia (opcional, por pergunta)
+
+As tabelas do schema road são métricas diárias: o resultado de uma
+pergunta que devolve uma linha por data (ou por data + dimensões) é a
+concatenação dos resultados de cada dia. Para as perguntas listadas em
+INCREMENTAL_QUESTION_IDS, cada dia do intervalo é guardado num bloco
+próprio, por conjunto de filtros sem a data. Quando o filtro de data
+muda (past30days -> past60days, ou a janela anda um dia), só os dias que
+faltam vão ao banco, em uma query por trecho contínuo.
+
+Dias fechados (antes de INCREMENTAL_RECENT_DAYS) ficam INCREMENTAL_DAY_TTL;
+os recentes ainda recebem carga e entram com o token de frescor na chave
+e o TTL normal do cache.
+
+Perguntas que não se decompõem por data ficam de fora: SQL sem o filtro
+{{date}}/{{data}}, com LIMIT/OFFSET, funções de janela, ORDER BY que
+não começa pela data, agregação ou DISTINCT no nível externo sem a data
+no GROUP BY, ou cujo resultado não traz a coluna de data.
+"""
+
+import re
+import zlib
+import hashlib
+import threading
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import INCREMENTAL_CACHE_CONFIG
+from api.utils import serializer
+from api.utils.freshness import normalize_filters
+
+# Prefixo dos blocos diários (dentro do KEY_PREFIX do CacheService: clear_all também limpa)
+DAY_PREFIX = "day:"
+
+# Trechos de dias faltando acima disso viram uma query só (do primeiro ao último dia)
+MAX_DELTA_QUERIES = 4
+
+# SQL que não pode ser recortado por dia
+_NOT_DECOMPOSABLE_RE = re.compile(r'\bOVER\s*\(|\bLIMIT\b|\bOFFSET\b|\bFETCH\s+(?:FIRST|NEXT)\b',
+                                  re.IGNORECASE)
+_ORDER_BY_RE = re.compile(r'\bORDER\s+BY\s+([^,\s]+)(?:\s+(ASC|DESC))?', re.IGNORECASE)
+_AGGREGATE_RE = re.compile(r'\b(?:count|sum|avg|min|max|\w+_agg|bool_and|bool_or|every|stddev\w*|'
+                           r'variance|var_pop|var_samp|percentile_\w+|mode)\s*\(|\bDISTINCT\b|\bHAVING\b',
+                           re.IGNORECASE)
+_GROUP_BY_RE = re.compile(r'\bGROUP\s+BY\s+(.*?)(?=\bHAVING\b|\bORDER\s+BY\b|\bWINDOW\b|$)',
+                          re.IGNORECASE | re.DOTALL)
+_SELECT_LIST_RE = re.compile(r'\bSELECT\s+(.*?)\bFROM\b', re.IGNORECASE | re.DOTALL)
+_SET_OPERATION_RE = re.compile(r'\b(?:UNION|INTERSECT|EXCEPT)\b(?:\s+ALL)?', re.IGNORECASE)
+
+
+def _outer_level(query: str) -> str:
+    """SQL só do nível externo: sem comentários, literais nem o conteúdo de parênteses"""
+    text = re.sub(r'--[^\n]*', ' ', query)
+    text = re.sub(r"'(?:[^']|'')*'", "''", text)
+    outer, depth = [], 0
+    for char in text:
+        if char == '(':
+            depth += 1
+            if depth == 1:
+                outer.append('()')
+        elif char == ')':
+            depth = max(depth - 1, 0)
+        elif depth == 0:
+            outer.append(char)
+    return ''.join(outer)
+
+
+def _column_name(expression: str) -> str:
+    """Nome simples de uma expressão (t."date"::date -> date)"""
+    return expression.strip().split('::')[0].split('.')[-1].strip('"').lower()
+
+
+def _groups_by_date(select: str, date_column: str) -> Optional[str]:
+    """Motivo pelo qual um SELECT externo agrega linhas de dias diferentes (None = não agrega)"""
+    group_by = _GROUP_BY_RE.search(select)
+    if not group_by:
+        # Sem GROUP BY, agregação ou DISTINCT juntam o intervalo inteiro
+        if _AGGREGATE_RE.search(select):
+            return 'agregação ou DISTINCT sem GROUP BY pela data'
+        return None
+
+    select_list = _SELECT_LIST_RE.search(select)
+    items = select_list.group(1).split(',') if select_list else []
+    for item in group_by.group(1).split(','):
+        item = item.strip()
+        if item.isdigit() and 0 < int(item) <= len(items):
+            # GROUP BY 1: a expressão da coluna, sem o alias
+            item = re.split(r'\s+AS\s+', items[int(item) - 1].strip(), flags=re.IGNORECASE)[0]
+        if _column_name(item) == date_column.lower():
+            return None
+    return 'GROUP BY não inclui a data'
+
+
+def check_decomposable(query: str, tags: List[str], date_column: str) -> Optional[str]:
+    """Motivo pelo qual a pergunta não pode usar o cache incremental (None = pode)"""
+    if 'data' not in tags and 'date' not in tags:
+        return 'sem filtro de data'
+    if _NOT_DECOMPOSABLE_RE.search(query):
+        return 'LIMIT/OFFSET ou função de janela'
+
+    # Cada dia só pode ser calculado sozinho se o nível externo não agrega dias diferentes
+    for select in _SET_OPERATION_RE.split(_outer_level(query)):
+        reason = _groups_by_date(select, date_column)
+        if reason:
+            return reason
+
+    orders = _ORDER_BY_RE.findall(query)
+    if orders:
+        # O último ORDER BY é o da query externa: precisa começar pela data
+        column = orders[-1][0].split('.')[-1].strip('"')
+        if column.lower() != date_column.lower():
+            return f'ORDER BY {orders[-1][0]} não começa pela data'
+    return None
+
+
+def order_descending(query: str) -> bool:
+    """Resultado ordenado por data decrescente (ORDER BY date DESC)"""
+    orders = _ORDER_BY_RE.findall(query)
+    return bool(orders) and orders[-1][1].upper() == 'DESC'
+
+
+def day_range(start: date, end: date) -> List[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def delta_runs(days: List[date], max_runs: int = MAX_DELTA_QUERIES) -> List[Tuple[date, date]]:
+    """Agrupa dias ordenados em trechos contínuos (início, fim)"""
+    runs = []
+    for day in days:
+        if runs and day == runs[-1][1] + timedelta(days=1):
+            runs[-1] = (runs[-1][0], day)
+        else:
+            runs.append((day, day))
+    if len(runs) > max_runs:
+        # Muitos buracos: uma query só cobrindo todos (reescreve os dias do meio)
+        return [(runs[0][0], runs[-1][1])]
+    return runs
+
+
+def split_by_day(cols: List[Dict], rows: List, date_column: str,
+                 days: List[date]) -> Optional[Dict[date, List]]:
+    """
+    Separa as linhas por dia (dias sem linhas ficam com lista vazia)
+    None se o resultado não tem a coluna de data ou traz linha fora dos dias
+    """
+    names = [col.get('name', '').lower() for col in cols]
+    if date_column.lower() not in names:
+        return None
+    index = names.index(date_column.lower())
+
+    by_day = {day: [] for day in days}
+    for row in rows:
+        value = row[index]
+        try:
+            day = date.fromisoformat(str(value)[:10])
+        except ValueError:
+            return None
+        if day not in by_day:
+            return None
+        by_day[day].append(row)
+    return by_day
+
+
+def encode_day(cols: List[Dict], rows: List) -> bytes:
+    return zlib.compress(serializer.dumps({'cols': cols, 'rows': rows}), 1)
+
+
+def decode_day(data: bytes) -> Tuple[List[Dict], List]:
+    value = serializer.loads(zlib.decompress(data))
+    return value['cols'], value['rows']
+
+
+class IncrementalPlan:
+    """Dias de uma requisição e a chave do conjunto de filtros sem a data"""
+
+    __slots__ = ('question_id', 'revision', 'scope', 'days', 'descending')
+
+    def __init__(self, question_id: int, revision: str, scope: str, days: List[date], descending: bool):
+        self.question_id = question_id
+        self.revision = revision
+        self.scope = scope
+        self.days = days
+        self.descending = descending
+
+
+class IncrementalCache:
+    """Blocos diários do resultado das perguntas habilitadas"""
+
+    def __init__(self, cache_service, query_parser, config: Optional[Dict] = None):
+        self.cache_service = cache_service
+        self.query_parser = query_parser
+        self.config = dict(INCREMENTAL_CACHE_CONFIG, **(config or {}))
+
+        # (question_id, revisão) que não se decompõem por data -> motivo
+        self._unsupported: Dict[Tuple[int, str], str] = {}
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'days_cached': 0, 'days_queried': 0, 'queries': 0, 'fallbacks': 0}
+
+    def plan(self, question_id: int, query_info: Dict, filters: Dict) -> Optional[IncrementalPlan]:
+        """Plano incremental da requisição, ou None para executar a pergunta inteira"""
+        if not self.cache_service.enabled or question_id not in self.config['questions']:
+            return None
+
+        date_range = self.query_parser.date_filter_range(filters)
+        if date_range is None:
+            return None
+        start, end = date_range
+        if end < start or (end - start).days + 1 > self.config['max_days']:
+            return None
+
+        query = query_info['query']
+        template = self.query_parser.get_template(question_id, query, query_info.get('revision'))
+        key = (question_id, template.revision)
+        with self._lock:
+            if key in self._unsupported:
+                return None
+        reason = check_decomposable(query, template.tags, self.config['date_column'])
+        if reason:
+            self.mark_unsupported(question_id, template.revision, reason)
+            return None
+
+        # Chave do conjunto: pergunta + revisão do SQL + filtros sem a data
+        other_filters = {k: v for k, v in filters.items() if k != 'data'}
+        scope = hashlib.sha256(
+            f"{question_id}|{template.revision}|{normalize_filters(other_filters)}".encode('utf-8')
+        ).hexdigest()[:16]
+        return IncrementalPlan(question_id, template.revision, scope, day_range(start, end), order_descending(query))
+
+    def mark_unsupported(self, question_id: int, revision: str, reason: str):
+        with self._lock:
+            if (question_id, revision) not in self._unsupported:
+                print(f"⚠️ Cache incremental desligado para a pergunta {question_id}: {reason}")
+            self._unsupported[(question_id, revision)] = reason
+
+    def _is_recent(self, day: date, today: date) -> bool:
+        return day > today - timedelta(days=self.config['recent_days'])
+
+    def _day_key(self, plan: IncrementalPlan, day: date, freshness: str, today: date) -> str:
+        key = f"{DAY_PREFIX}{plan.scope}:{day.isoformat()}"
+        # Dias recentes ainda mudam: o watermark (quando há) invalida o bloco
+        if freshness and self._is_recent(day, today):
+            key += f":{freshness}"
+        return key
+
+    def load(self, plan: IncrementalPlan, freshness: str,
+             today: Optional[date] = None) -> Dict[date, Tuple[List[Dict], List]]:
+        """Blocos já em cache: dia -> (cols, linhas)"""
+        today = today or date.today()
+        keys = {self._day_key(plan, day, freshness, today): day for day in plan.days}
+        found = self.cache_service.get_many(list(keys))
+
+        blocks = {}
+        for key, data in found.items():
+            try:
+                blocks[keys[key]] = decode_day(data)
+            except Exception as e:
+                print(f"⚠️ Bloco diário inválido no cache ({key}): {e}")
+        return blocks
+
+    def store(self, plan: IncrementalPlan, cols: List[Dict], by_day: Dict[date, List],
+              freshness: str, today: Optional[date] = None):
+        """Guarda os dias consultados (fechados com TTL longo, recentes com o TTL normal)"""
+        today = today or date.today()
+        closed, recent = {}, {}
+        for day, rows in by_day.items():
+            target = recent if self._is_recent(day, today) else closed
+            target[self._day_key(plan, day, freshness, today)] = encode_day(cols, rows)
+
+        self.cache_service.set_many(closed, self.config['day_ttl'])
+        self.cache_service.set_many(recent, self.cache_service.ttl)
+
+    def record(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                self._stats[name] += value
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'questions': self.config['questions'],
+                **self._stats,
+                'unsupported': {f"{qid}@{rev}": reason for (qid, rev), reason in self._unsupported.items()}
+            }
@@ -2,44 +2,98 @@
 Serviço para comunicação com a API do Metabase
 """
 
-import requests
+import hashlib
+import threading
+import time
 from typing import Dict, List, Optional
-from config.settings import METABASE_CONFIG, API_CONFIG
+from config.settings import METABASE_CONFIG, API_CONFIG, CARD_CACHE_CONFIG
+from api.utils.card_cache import CardCache
+from api.utils.metabase_session import MetabaseSession
+
+
+def parse_question(question_id: int, info: Dict) -> Dict:
+    """
+    Extrai do card do Metabase a query SQL nativa e as template tags
+    (compartilhado pelos clientes síncrono e assíncrono)
+    """
+    # Verifica se é uma query nativa
+    dataset_query = info.get('dataset_query', {})
+    if dataset_query.get('type') != 'native':
+        raise ValueError(f"Pergunta {question_id} não é uma query SQL nativa")
+    
+    # Extrai a query e template tags
+    native_query = dataset_query.get('native', {})
+    query_sql = native_query.get('query', '')
+    template_tags = native_query.get('template-tags', {})
+    
+    return {
+        'query': query_sql,
+        'template_tags': list(template_tags.keys()),
+        'question_name': info.get('name', ''),
+        'database_id': info.get('database_id'),
+        'updated_at': info.get('updated_at'),
+        # Revisão do card: muda sempre que o SQL é editado no Metabase
+        'revision': hashlib.sha256(query_sql.encode('utf-8')).hexdigest()[:16]
+    }
+
+
+def dashboard_questions(dashboard: Dict) -> Dict[int, Dict]:
+    """Cards SQL nativos de um dashboard (GET /api/dashboard/:id já traz o card completo)"""
+    questions = {}
+    for dashcard in dashboard.get('dashcards') or dashboard.get('ordered_cards') or []:
+        card = dashcard.get('card') or {}
+        if card.get('id') and card.get('dataset_query', {}).get('type') == 'native':
+            questions[card['id']] = card
+    return questions
+
+
+def store_question(cache: CardCache, question_id: int, info: Dict) -> Dict:
+    """
+    Guarda o card no cache (compartilhado pelos clientes síncrono e assíncrono)
+    updated_at igual ao da versão em cache dispensa reprocessar o card
+    """
+    cached, _ = cache.get(question_id)
+    if cached is not None and info.get('updated_at') and \
+            info.get('updated_at') == cached.get('updated_at'):
+        cache.touch(question_id)
+        return cached
+    
+    result = parse_question(question_id, info)
+    if cache.set(question_id, result):
+        print(f"🔄 Pergunta {question_id} alterada no Metabase: nova revisão {result['revision']}")
+    return result
+
 
 class MetabaseService:
     """Cliente para interagir com a API do Metabase"""
     
     def __init__(self):
-        self._session_token = None
         self.base_url = METABASE_CONFIG['url']
-        self._query_cache = {}  # Cache de queries por question_id
+        # Conexões keep-alive, retentativas e renovação do token em 401
+        self.session = MetabaseSession(
+            self.base_url,
+            METABASE_CONFIG['username'],
+            METABASE_CONFIG['password'],
+            max_retries=API_CONFIG['max_retries'],
+            pool_size=METABASE_CONFIG['pool_size'],
+            backoff=METABASE_CONFIG['retry_backoff']
+        )
+        # Cache de queries por question_id (TTL + revalidação em segundo plano)
+        self._query_cache = CardCache(CARD_CACHE_CONFIG['max_entries'], CARD_CACHE_CONFIG['ttl'])
+        
+        # Refresher: thread única que pré-carrega dashboards e revalida cards velhos
+        self._refresher = None
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._wakeup = threading.Event()
         
     def get_session_token(self) -> str:
         """Obtém ou reutiliza token de sessão"""
-        if self._session_token:
-            return self._session_token
-            
-        response = requests.post(
-            f"{self.base_url}/api/session",
-            json={
-                "username": METABASE_CONFIG['username'],
-                "password": METABASE_CONFIG['password']
-            },
-            timeout=30
-        )
-        response.raise_for_status()
-        self._session_token = response.json()["id"]
-        return self._session_token
+        return self.session.token()
     
     def get_question_info(self, question_id: int) -> Dict:
         """Obtém informações completas sobre uma questão"""
-        token = self.get_session_token()
-        
-        response = requests.get(
-            f"{self.base_url}/api/card/{question_id}",
-            headers={"X-Metabase-Session": token},
-            timeout=30
-        )
+        response = self.session.get(f"/api/card/{question_id}")
         response.raise_for_status()
         
         return response.json()
@@ -49,51 +103,115 @@ class MetabaseService:
         Extrai a query SQL nativa de uma pergunta do Metabase
         Retorna dict com query e template tags
         """
-        # Verifica cache
-        if question_id in self._query_cache:
-            print(f"📦 Query do cache para pergunta {question_id}")
-            return self._query_cache[question_id]
+        # Verifica cache: uma entrada velha é servida e revalidada em segundo plano
+        result, stale = self._query_cache.get(question_id)
+        if result is not None:
+            if stale:
+                result = self._schedule_refresh(question_id) or result
+            return result
         
         try:
-            # Obtém informações da pergunta
-            info = self.get_question_info(question_id)
-            
-            # Verifica se é uma query nativa
-            dataset_query = info.get('dataset_query', {})
-            if dataset_query.get('type') != 'native':
-                raise ValueError(f"Pergunta {question_id} não é uma query SQL nativa")
-            
-            # Extrai a query e template tags
-            native_query = dataset_query.get('native', {})
-            query_sql = native_query.get('query', '')
-            template_tags = native_query.get('template-tags', {})
-            
-            result = {
-                'query': query_sql,
-                'template_tags': list(template_tags.keys()),
-                'question_name': info.get('name', ''),
-                'database_id': info.get('database_id')
-            }
-            
-            # Adiciona ao cache
-            self._query_cache[question_id] = result
-            
-            print(f"✅ Query extraída: {len(query_sql)} caracteres, "
+            result = self._fetch_question(question_id)
+            print(f"✅ Query extraída: {len(result['query'])} caracteres, "
                   f"{len(result['template_tags'])} tags")
-            
             return result
             
         except Exception as e:
             print(f"❌ Erro ao extrair query: {str(e)}")
             raise
     
+    def _fetch_question(self, question_id: int) -> Dict:
+        """Busca o card no Metabase e atualiza o cache"""
+        return store_question(self._query_cache, question_id, self.get_question_info(question_id))
+    
+    # ------------------------------------------------------------------
+    # Refresher em segundo plano
+    # ------------------------------------------------------------------
+    
+    def start_refresher(self) -> bool:
+        """
+        Inicia a thread de prefetch/revalidação (uma por processo)
+        Chamar depois do fork (post_fork do gunicorn), nunca no master
+        """
+        if self._refresher is not None and self._refresher.is_alive():
+            return False
+        self._refresher = threading.Thread(target=self._refresh_loop, name='metabase-card-refresher',
+                                           daemon=True)
+        self._refresher.start()
+        return True
+    
+    def _schedule_refresh(self, question_id: int) -> Optional[Dict]:
+        """
+        Revalida o card sem bloquear o request
+        Sem refresher rodando revalida na hora e retorna a versão nova
+        """
+        if self._refresher is None or not self._refresher.is_alive():
+            try:
+                return self._fetch_question(question_id)
+            except Exception as e:
+                print(f"⚠️ Revalidação da pergunta {question_id} falhou, usando versão em cache: {e}")
+                return None
+        with self._pending_lock:
+            self._pending.add(question_id)
+        self._wakeup.set()
+        return None
+    
+    def _refresh_loop(self):
+        interval = CARD_CACHE_CONFIG['refresh_interval']
+        while True:
+            try:
+                self.refresh_dashboards()
+                self._revalidate(self._query_cache.stale_ids())
+            except Exception as e:
+                print(f"⚠️ Refresher de cards: {e}")
+            
+            # Acorda antes do intervalo quando um request encontra um card velho
+            deadline = time.monotonic() + interval
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._wakeup.wait(remaining):
+                    break
+                self._wakeup.clear()
+                with self._pending_lock:
+                    pending, self._pending = self._pending, set()
+                self._revalidate(pending)
+    
+    def _revalidate(self, question_ids):
+        for question_id in question_ids:
+            try:
+                self._fetch_question(question_id)
+            except Exception as e:
+                print(f"⚠️ Revalidação da pergunta {question_id} falhou, mantendo versão em cache: {e}")
+    
+    def refresh_dashboards(self, dashboard_ids: Optional[List[int]] = None) -> List[int]:
+        """Pré-carrega os cards dos dashboards (uma chamada por dashboard); retorna os ids"""
+        loaded = []
+        for dashboard_id in (CARD_CACHE_CONFIG['dashboard_ids'] if dashboard_ids is None else dashboard_ids):
+            try:
+                questions = dashboard_questions(self.get_dashboard(dashboard_id))
+            except Exception as e:
+                print(f"⚠️ Dashboard {dashboard_id} indisponível: {e}")
+                continue
+            for question_id, info in questions.items():
+                try:
+                    store_question(self._query_cache, question_id, info)
+                    loaded.append(question_id)
+                except Exception as e:
+                    print(f"⚠️ Card {question_id} do dashboard {dashboard_id} ignorado: {e}")
+        return loaded
+    
+    def get_dashboard(self, dashboard_id: int) -> Dict:
+        """Obtém o dashboard com os cards"""
+        response = self.session.get(f"/api/dashboard/{dashboard_id}")
+        response.raise_for_status()
+        
+        return response.json()
+    
     def execute_question(self, question_id: int, parameters: List[Dict]) -> List[Dict]:
         """
         Executa uma questão do Metabase com parâmetros
         (Mantido para compatibilidade, mas não é mais usado)
         """
-        token = self.get_session_token()
-        
         # Remove parâmetros vazios
         clean_parameters = [
             p for p in parameters
@@ -104,12 +222,9 @@ class MetabaseService:
         
         payload = {"parameters": clean_parameters}
         
-        response = requests.post(
-            f"{self.base_url}/api/card/{question_id}/query/json",
-            headers={
-                "X-Metabase-Session": token,
-                "Content-Type": "application/json"
-            },
+        response = self.session.post(
+            f"/api/card/{question_id}/query/json",
+            headers={"Content-Type": "application/json"},
             json=payload,
             timeout=API_CONFIG['timeout']
         )
@@ -124,13 +239,7 @@ class MetabaseService:
     
     def get_database_metadata(self, database_id: int) -> Dict:
         """Obtém metadata do banco de dados"""
-        token = self.get_session_token()
-        
-        response = requests.get(
-            f"{self.base_url}/api/database/{database_id}/metadata",
-            headers={"X-Metabase-Session": token},
-            timeout=30
-        )
+        response = self.session.get(f"/api/database/{database_id}/metadata")
         response.raise_for_status()
         
         return response.json()
@@ -139,3 +248,9 @@ class MetabaseService:
         """Limpa o cache de queries"""
         self._query_cache.clear()
         print("🗑️ Cache de queries do Metabase limpo")
+    
+    def get_cache_stats(self) -> Dict:
+        """Estatísticas do cache de cards"""
+        stats = self._query_cache.stats()
+        stats['refresher'] = self._refresher is not None and self._refresher.is_alive()
+        return stats
@@ -6,19 +6,42 @@ Concentra toda a lógica de Native Performance
 import psycopg2
 import psycopg2.extras
 import json
-import gzip
+import re
 import time
+import uuid
 import hashlib
-from typing import Dict, List, Any, Tuple
+import itertools
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Any, Tuple, Iterator, Optional
 from contextlib import contextmanager
-from decimal import Decimal
-from datetime import datetime, date
 from flask import Response
 
-from config.settings import DATABASE_CONFIG, PERFORMANCE_CONFIG, DB_SCHEMA
+from config.settings import (
+    DATABASE_CONFIG, PERFORMANCE_CONFIG, FRESHNESS_CONFIG, COMPRESSION_CONFIG, SESSION_SETTINGS
+)
 from api.services.metabase_service import MetabaseService
 from api.services.cache_service import CacheService
+from api.services.connection_pool import ConnectionPool
+from api.services.incremental_cache import IncrementalCache, delta_runs, split_by_day
+from api.services.slow_query_log import SlowQueryLog
 from api.utils.query_parser import QueryParser
+from api.utils import arrow_format, compression, gzip_envelope, pg_types, serializer, tracing
+from api.utils.gzip_envelope import CachedBody
+from api.utils.aggregation import QueryAggregator
+from api.utils.pagination import QueryPaginator
+from api.utils.freshness import FreshnessTracker, build_etag, content_etag, data_version, etag_matches
+
+
+def session_config(settings: Dict[str, str]) -> Tuple[str, List]:
+    """
+    Um único SELECT set_config(...) para vários parâmetros de sessão
+    (um round-trip e um só comando: serve também para prepared statements)
+    """
+    query_sql = "SELECT " + ", ".join("set_config(%s, %s, false)" for _ in settings)
+    return query_sql, [value for item in settings.items() for value in item]
+
 
 class QueryService:
     """Serviço de execução de queries com performance nativa"""
@@ -27,11 +50,41 @@ class QueryService:
         self.metabase_service = MetabaseService()
         self.cache_service = CacheService()
         self.query_parser = QueryParser()
+        self.aggregator = QueryAggregator()
+        self.paginator = QueryPaginator()
+        
+        # Token de frescor dos dados (ETag / 304)
+        self.freshness = FreshnessTracker(
+            FRESHNESS_CONFIG['bucket_seconds'],
+            FRESHNESS_CONFIG['check_interval'],
+            FRESHNESS_CONFIG['queries'],
+            FRESHNESS_CONFIG['default_query']
+        )
+        
+        # Registro das combinações mais acessadas (WarmupService, opcional)
+        self.warmup = None
+        
+        # Blocos diários das perguntas em INCREMENTAL_QUESTION_IDS
+        self.incremental = IncrementalCache(self.cache_service, self.query_parser)
         
-        # Pool de conexões PERSISTENTE
-        self.connection_pool = []
-        self.max_pool_size = PERFORMANCE_CONFIG['max_pool_size']
-        self.prepared_statements = {}
+        # Queries acima de SLOW_QUERY_THRESHOLD + plano capturado em segundo plano
+        self.slow_queries = SlowQueryLog(self._explain_connection, self._configure_session)
+        
+        # Totais de linhas do modo paginado: cache_key -> (total, expira_em)
+        self._count_cache = OrderedDict()
+        self._count_lock = threading.Lock()
+        
+        # Pool de conexões PERSISTENTE (limitado e thread-safe)
+        self.pool = ConnectionPool(
+            DATABASE_CONFIG,
+            min_size=PERFORMANCE_CONFIG['min_pool_size'],
+            max_size=PERFORMANCE_CONFIG['max_pool_size'],
+            timeout=PERFORMANCE_CONFIG['pool_timeout'],
+            max_age=PERFORMANCE_CONFIG['pool_max_age'],
+            max_idle=PERFORMANCE_CONFIG['pool_max_idle'],
+            configure=self._configure_connection,
+            name='query_service'
+        )
         
         # Inicializa pool
         self._init_connection_pool()
@@ -39,50 +92,43 @@ class QueryService:
     def _init_connection_pool(self):
         """Cria pool de conexões persistentes"""
         print("🔌 Inicializando pool de conexões...")
+        self.pool.warm()
+    
+    @staticmethod
+    def _configure_connection(conn):
+        """Configura cada conexão nova do pool"""
+        conn.set_session(autocommit=True)
+        # NUMERIC -> float e datas -> ISO já no psycopg2 (sem laço por célula)
+        pg_types.register_json_casts(conn)
         
-        for i in range(5):  # Começa com 5 conexões
-            try:
-                conn = psycopg2.connect(**DATABASE_CONFIG)
-                conn.set_session(autocommit=True)
-                self.connection_pool.append(conn)
-            except Exception as e:
-                print(f"⚠️ Erro ao criar conexão {i}: {e}")
+        if PERFORMANCE_CONFIG['plan_cache_mode']:
+            with conn.cursor() as cursor:
+                cursor.execute("SET plan_cache_mode = %s", (PERFORMANCE_CONFIG['plan_cache_mode'],))
+    
+    @staticmethod
+    def _explain_connection():
+        """Conexão própria do log de queries lentas (fora do pool, read-only, sem autocommit)"""
+        conn = psycopg2.connect(**DATABASE_CONFIG)
+        conn.set_session(readonly=True, autocommit=False)
+        return conn
     
     @contextmanager
     def get_connection(self):
         """Pega conexão do pool"""
-        conn = None
-        try:
-            # Tenta pegar do pool
-            while self.connection_pool and not conn:
-                candidate = self.connection_pool.pop()
-                try:
-                    candidate.isolation_level
-                    conn = candidate
-                except:
-                    pass
-            
-            # Se não tem no pool, cria nova
-            if not conn:
-                conn = psycopg2.connect(**DATABASE_CONFIG)
-                conn.set_session(autocommit=True)
-            
+        with self.pool.connection() as conn:
             yield conn
-            
-            # Retorna ao pool
-            if len(self.connection_pool) < self.max_pool_size:
-                self.connection_pool.append(conn)
-                conn = None
-                
-        finally:
-            if conn:
-                conn.close()
     
 
 
-    def execute_query(self, question_id: int, filters: Dict) -> Response:
+    def execute_query(self, question_id: int, filters: Dict, stream: bool = False,
+                      output_format: str = 'json', if_none_match: Optional[str] = None,
+                      accept_encoding: Optional[str] = None) -> Response:
         """
         Executa query e retorna Response no formato do Metabase
+        Com stream=True o resultado é enviado em lotes, sem materializar todas as linhas
+        output_format='arrow' gera Arrow IPC direto do cursor (sempre em lotes)
+        if_none_match: header do cliente; se o ETag bater, responde 304 sem executar nada
+        accept_encoding: header do cliente para negociar a compressão
         """
         # DEBUG: Log detalhado dos filtros
         print("\n" + "="*60)
@@ -91,105 +137,612 @@ class QueryService:
             print(f"   {key}: {value} (tipo: {type(value).__name__})")
         print("="*60 + "\n")
 
-        # Gera cache key
-        cache_key = self._generate_cache_key(question_id, filters)
-        
-        # Verifica cache
-        cached = self.cache_service.get(cache_key)
-        if cached:
-            print("📦 Cache hit! Retornando instantaneamente")
-            return self._create_response(cached['cols'], cached['rows'], {
-                'started_at': time.time(),
-                'execution_time': 0.001,
-                'from_cache': True
-            })
+        # Filtros relativos (past7days...) já resolvidos em datas: base do ETag e da chave
+        query_sql, params = self._render_question(question_id, filters)
+        
+        # Validador HTTP: calculado sem executar a query da pergunta
+        etag, version = self._question_validator(question_id, query_sql, params, output_format)
+        # Gera cache key (o watermark invalida o corpo quando os dados mudam)
+        cache_key = self._generate_cache_key(query_sql, params, version)
+        
+        # Modo streaming e Arrow: não passam pelo cache (o resultado nunca fica inteiro em memória)
+        if stream or output_format == 'arrow':
+            # Sem watermark o ETag vem do corpo em cache, que aqui não existe
+            etag = etag if version else None
+        current = self._current_etag(etag, version, cache_key) if if_none_match else None
+        if etag_matches(current, if_none_match):
+            print(f"♻️ ETag {current} confere: 304 Not Modified")
+            return self._not_modified(current)
+        
+        if stream or output_format == 'arrow':
+            return self._with_validator(
+                self._create_streaming_response(query_sql, params, output_format, accept_encoding),
+                etag, version
+            )
+        
+        if self.warmup is not None:
+            self.warmup.record(question_id, filters)
         
-        # Extrai e processa query
+        fill = (self._incremental_fill(question_id, filters, version)
+                or self._question_fill(query_sql, params, question_id, filters))
+        return self._with_validator(
+            self._cached_response(cache_key, fill, accept_encoding, self._cache_ttl(filters)), etag, version
+        )
+    
+    def _question_fill(self, query_sql: str, params: List, question_id: Optional[int] = None,
+                       filters: Optional[Dict] = None):
+        """fill() do cache para a pergunta inteira em JSON (request ou warm-up)"""
+        def fill():
+            started_at = time.time()
+            cols, rows, execution_time = self._execute_native_query(query_sql, params, question_id, filters)
+            body = self._build_body(cols, rows, {
+                'started_at': started_at,
+                'execution_time': execution_time,
+                'from_cache': False
+            })
+            # Salva no cache se houver dados
+            return body, len(rows) > 0
+        return fill
+    
+    def _incremental_fill(self, question_id: int, filters: Dict, version: str):
+        """
+        fill() que monta o resultado com os blocos diários em cache e só consulta
+        os dias que faltam; None se a pergunta/filtro não usa o cache incremental
+        """
         query_info = self.metabase_service.get_question_query(question_id)
-        query_sql = self.query_parser.apply_filters(query_info['query'], filters)
-        query_sql = self.query_parser.clean_problematic_fields(query_sql)
+        plan = self.incremental.plan(question_id, query_info, filters)
+        if plan is None:
+            return None
+        
+        def fill():
+            started_at = time.time()
+            blocks = self.incremental.load(plan, version)
+            missing = [day for day in plan.days if day not in blocks]
+            runs = delta_runs(missing)
+            execution_time = 0.0
+            
+            for start, end in runs:
+                run_filters = dict(filters, data=f"{start.isoformat()}~{end.isoformat()}")
+                query_sql, params = self._render_question(question_id, run_filters)
+                cols, rows, elapsed = self._execute_native_query(query_sql, params, question_id, run_filters)
+                execution_time += elapsed
+                
+                by_day = split_by_day(cols, rows, self.incremental.config['date_column'],
+                                      [day for day in plan.days if start <= day <= end])
+                if by_day is None:
+                    # Resultado não se decompõe por data: pergunta inteira daqui em diante
+                    self.incremental.mark_unsupported(
+                        question_id, plan.revision,
+                        f"resultado sem a coluna {self.incremental.config['date_column']} por dia"
+                    )
+                    self.incremental.record(fallbacks=1)
+                    return self._question_fill(*self._render_question(question_id, filters),
+                                               question_id, filters)()
+                
+                self.incremental.store(plan, cols, by_day, version)
+                blocks.update({day: (cols, day_rows) for day, day_rows in by_day.items()})
+            
+            days = list(reversed(plan.days)) if plan.descending else plan.days
+            cols = blocks[days[0]][0]
+            rows = [row for day in days for row in blocks[day][1]]
+            self.incremental.record(requests=1, days_cached=len(plan.days) - len(missing),
+                                    days_queried=len(missing), queries=len(runs))
+            print(f"🧩 Incremental: {len(plan.days) - len(missing)} dias do cache, "
+                  f"{len(missing)} consultados em {len(runs)} queries")
+            
+            body = self._build_body(cols, rows, {
+                'started_at': started_at,
+                'execution_time': execution_time,
+                'from_cache': False
+            })
+            return body, len(rows) > 0
+        return fill
+    
+    def warm_query(self, question_id: int, filters: Dict,
+                   min_remaining: Optional[float] = None) -> str:
+        """
+        Reexecuta a pergunta e renova o corpo em cache (warm-up)
+        Com min_remaining, entradas que ainda valem mais que isso não são tocadas
+        Retorna 'fresco', 'renovado' ou 'ignorado' (outro fill em andamento / sem dados)
+        """
+        query_sql, params = self._render_question(question_id, filters)
+        _, version = self._question_validator(question_id, query_sql, params, 'json')
+        cache_key = self._generate_cache_key(query_sql, params, version)
+        
+        if min_remaining is not None:
+            remaining = self.cache_service.remaining_ttl(cache_key)
+            if remaining is not None and remaining > min_remaining:
+                return 'fresco'
+        
+        fill = (self._incremental_fill(question_id, filters, version)
+                or self._question_fill(query_sql, params, question_id, filters))
+        refreshed = self.cache_service.refresh(cache_key, fill, self._cache_ttl(filters))
+        return 'renovado' if refreshed else 'ignorado'
+    
+    def execute_aggregate(self, question_id: int, filters: Dict, group_by, measures,
+                          if_none_match: Optional[str] = None,
+                          accept_encoding: Optional[str] = None) -> Response:
+        """
+        Executa a pergunta agregada no PostgreSQL (SQL da pergunta como subquery + GROUP BY)
+        Retorna o mesmo formato do Metabase, só com as linhas agregadas
+        """
+        dimensions = self.aggregator.parse_group_by(group_by)
+        measures = self.aggregator.parse_measures(measures)
+        dims_desc, measures_desc = self.aggregator.describe(dimensions, measures)
+        print(f"📊 Agregação: group_by={dims_desc} measures={measures_desc}")
+        
+        query_sql, params = self._render_question(question_id, filters)
+        query_sql = self.aggregator.build(query_sql, dimensions, measures)
+        
+        etag, version = self._question_validator(
+            question_id, query_sql, params, f"aggregate:{dims_desc}:{measures_desc}"
+        )
+        # O SQL agregado já distingue group_by/measures na chave
+        cache_key = self._generate_cache_key(query_sql, params, version)
+        current = self._current_etag(etag, version, cache_key) if if_none_match else None
+        if etag_matches(current, if_none_match):
+            print(f"♻️ ETag {current} confere: 304 Not Modified")
+            return self._not_modified(current)
+        
+        fill = self._question_fill(query_sql, params, question_id, filters)
+        return self._with_validator(
+            self._cached_response(cache_key, fill, accept_encoding, self._cache_ttl(filters)), etag, version
+        )
+    
+    def _question_validator(self, question_id: int, query_sql: str, params: List,
+                            variant: str) -> Tuple[Optional[str], str]:
+        """
+        ETag forte da pergunta + SQL resolvido + revisão do card + frescor dos dados
+        Retorna (etag, versão dos dados para a chave de cache: só o watermark,
+        nunca a janela de tempo); (None, '') com ETAG_ENABLED=false
+        Sem watermark (versão vazia) o etag é só a base: o validador final
+        vem do corpo em cache (_current_etag / _with_validator)
+        """
+        if not FRESHNESS_CONFIG['etag_enabled']:
+            return None, ''
+        
+        with tracing.span('metabase'):
+            query_info = self.metabase_service.get_question_query(question_id)
+        with tracing.span('freshness'):
+            freshness = self.freshness.token(question_id, self._execute_scalar)
+        version = data_version(freshness)
+        etag = build_etag(question_id, {'query': self._resolved_digest(query_sql, params)},
+                          query_info.get('revision'), version, variant)
+        return etag, version
+    
+    def _current_etag(self, etag: Optional[str], version: str, cache_key: str) -> Optional[str]:
+        """
+        ETag que a resposta teria agora, sem executar a pergunta
+        Sem watermark: o do corpo em cache (None se não há corpo, ou seja, sem 304)
+        """
+        if not etag or version:
+            return etag
+        body, _ = self.cache_service.get(cache_key)
+        return content_etag(etag, body.etag) if body is not None else None
+    
+    @staticmethod
+    def _not_modified(etag: str) -> Response:
+        """304 sem corpo: o cliente reaproveita a cópia que já tem"""
+        response = Response(status=304)
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.headers['X-Metabase-Client'] = 'native-performance'
+        return response
+    
+    @staticmethod
+    def _with_validator(response: Response, etag: Optional[str], version: str) -> Response:
+        """
+        Troca o ETag do corpo pelo da pergunta (revalidável via If-None-Match)
+        Sem watermark (version vazia) o ETag combina a base com o resumo do corpo enviado
+        """
+        if etag and not version:
+            body_etag, _ = response.get_etag()
+            etag = content_etag(etag, body_etag) if body_etag else None
+        if etag:
+            response.headers['ETag'] = etag
+            # no-cache: o navegador guarda, mas sempre revalida antes de usar
+            response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    
+    def _render_question(self, question_id: int, filters: Dict) -> Tuple[str, List]:
+        """Busca o SQL da pergunta e aplica os filtros (SQL com placeholders + parâmetros)"""
+        tracing.annotate(question_id=question_id, filters=filters)
+        with tracing.span('metabase'):
+            query_info = self.metabase_service.get_question_query(question_id)
+        # Pergunta existe: pode virar série própria nas métricas
+        tracing.annotate(question_loaded=True)
+        with tracing.span('render'):
+            query_sql, params = self.query_parser.render_query(
+                question_id, query_info['query'], filters, query_info.get('revision')
+            )
+            return self.query_parser.clean_problematic_fields(query_sql), params
+    
+    def _cached_response(self, cache_key: str, fill, accept_encoding: Optional[str] = None,
+                         ttl: Optional[float] = None) -> Response:
+        """
+        Resposta do cache (L1 memória / L2 Redis) ou de fill(), executado uma
+        única vez mesmo com vários requests iguais chegando juntos
+        """
+        body, cache_status = self.cache_service.get_or_fill(cache_key, fill, ttl)
+        if cache_status.startswith('HIT'):
+            print(f"📦 Cache hit ({cache_status})! Retornando instantaneamente")
+        return self._body_response(body, cache_status, accept_encoding)
+    
+    def execute_page(self, question_id: int, filters: Dict, limit: Optional[int] = None,
+                     offset: int = 0, cursor: Optional[str] = None,
+                     sort: Optional[str] = None, accept_encoding: Optional[str] = None) -> Response:
+        """
+        Executa a pergunta devolvendo só uma janela de linhas
+        Inclui o total (calculado uma vez por conjunto de filtros) e o cursor da próxima janela
+        """
+        max_limit = PERFORMANCE_CONFIG['page_max_limit']
+        limit = limit or PERFORMANCE_CONFIG['page_default_limit']
+        if limit < 1 or limit > max_limit:
+            raise ValueError(f"limit deve estar entre 1 e {max_limit}")
+        if offset < 0:
+            raise ValueError("offset não pode ser negativo")
+        
+        query_sql, params = self._render_question(question_id, filters)
+        
+        # Total e cursor valem para o SQL resolvido (past7days muda à meia-noite)
+        cache_key = self._generate_cache_key(query_sql, params)
+        page = self.paginator.new_page(limit, offset, cursor, sort, scope=cache_key)
+        
+        page_sql, page_params = self.paginator.build_page(query_sql, params, page)
         
-        # Executa query
         started_at = time.time()
-        cols, rows, execution_time = self._execute_native_query(query_sql)
+        cols, rows, execution_time = self._execute_native_query(page_sql, page_params, question_id, filters)
         
-        # Salva no cache se houver dados
-        if self.cache_service.enabled and len(rows) > 0:
-            self.cache_service.set(cache_key, {
-                'cols': cols,
-                'rows': rows,
-                'row_count': len(rows),
-                'cached_at': time.time()
-            })
+        # Veio uma linha a mais: existe próxima página
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        total = self._get_cached_count(cache_key)
+        if total is None:
+            if not has_more and page['offset'] == 0 and not page['keyset']:
+                # Primeira página já trouxe tudo: dispensa o COUNT
+                total = len(rows)
+            else:
+                total = self._execute_scalar(self.paginator.build_count(query_sql), params)
+                print(f"🔢 Total: {total:,} linhas")
+            self._set_cached_count(cache_key, total)
+        
+        next_cursor = self.paginator.next_cursor(page, cols, rows) if has_more else None
+        cols, rows = self.paginator.strip_cursor_column(cols, rows)
+        print(f"📄 Página: {len(rows):,} de {total:,} linhas (próxima: {'sim' if has_more else 'não'})")
         
-        # Cria response
         return self._create_response(cols, rows, {
             'started_at': started_at,
             'execution_time': execution_time,
             'from_cache': False
-        })
-
-
-
-
-
-
-    def _execute_native_query(self, query_sql: str) -> Tuple[List, List, float]:
-        """Executa query com cursor padrão para máxima performance"""
+        }, extra={
+            'page': {
+                'limit': limit,
+                'offset': None if page['keyset'] else page['offset'],
+                'sort': page['sort'],
+                'desc': page['desc'],
+                'total_count': total,
+                'has_more': has_more,
+                'next_cursor': next_cursor
+            }
+        }, accept_encoding=accept_encoding)
+    
+    def _execute_scalar(self, query_sql: str, params: Optional[List] = None) -> Any:
+        """Executa query de um único valor (COUNT(*) da paginação, watermark de frescor)"""
+        start_time = time.time()
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                self._configure_session(cursor)
+                with tracing.span('db'):
+                    self._execute_prepared(conn, cursor, query_sql, params or [])
+                    row = cursor.fetchone()
+        
+        print(f"🔢 Query escalar em {time.time() - start_time:.2f}s")
+        return row[0] if row else None
+    
+    def _get_cached_count(self, cache_key: str) -> Optional[int]:
+        with self._count_lock:
+            entry = self._count_cache.get(cache_key)
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del self._count_cache[cache_key]
+                return None
+            self._count_cache.move_to_end(cache_key)
+            return entry[0]
+    
+    def _set_cached_count(self, cache_key: str, total: int):
+        with self._count_lock:
+            self._count_cache[cache_key] = (total, time.time() + PERFORMANCE_CONFIG['page_count_ttl'])
+            self._count_cache.move_to_end(cache_key)
+            while len(self._count_cache) > PERFORMANCE_CONFIG['page_count_cache_size']:
+                self._count_cache.popitem(last=False)
+    
+    def _execute_native_query(self, query_sql: str, params: Optional[List] = None,
+                              question_id: Optional[int] = None,
+                              filters: Optional[Dict] = None) -> Tuple[List, List, float]:
+        """
+        Executa query com cursor padrão para máxima performance
+        question_id/filters identificam a query no log de queries lentas
+        """
         start_time = time.time()
         
         with self.get_connection() as conn:
             with conn.cursor() as cursor:
 
                 # Configura para melhor performance
-                cursor.execute(f"SET search_path TO {DB_SCHEMA}, public")
-                cursor.execute("SET work_mem = '256MB'")
-                cursor.execute("SET random_page_cost = 1.1")
+                self._configure_session(cursor)
                 
-                print(f"🚀 Executando query nativa...")
-                cursor.execute(query_sql)
+                print(f"🚀 Executando query nativa ({len(params or [])} parâmetros)...")
+                query_start = time.time()
+                with tracing.span('db'):
+                    self._execute_prepared(conn, cursor, query_sql, params or [])
                 
                 # Pega metadata das colunas
-                cols = [
-                    {
-                        'name': desc[0],
-                        'base_type': self._get_pg_type(desc[1]),
-                        'display_name': desc[0].replace('_', ' ').title()
-                    }
-                    for desc in cursor.description
-                ]
+                cols = self._build_cols(cursor.description)
                 
-                # Pega TODOS os dados de uma vez
-                rows = cursor.fetchall()
+                # Pega TODOS os dados de uma vez (já convertidos pelos typecasters)
+                with tracing.span('fetch'):
+                    rows = cursor.fetchall()
                 
                 execution_time = time.time() - start_time
                 print(f"✅ {len(rows):,} linhas em {execution_time:.2f}s")
+        
+        # Só execução + fetch: espera pelo pool não torna a query lenta
+        self.slow_queries.record(query_sql, params or [], time.time() - query_start, len(rows),
+                                 question_id, filters)
+        return cols, rows, execution_time
+    
+    @staticmethod
+    def _configure_session(cursor):
+        """
+        Ajustes da sessão antes da query, num único round-trip
+        application_name leva o request id: a query aparece em pg_stat_activity
+        """
+        cursor.execute(*session_config(dict(SESSION_SETTINGS, application_name=tracing.application_name())))
+    
+    def _execute_prepared(self, conn, cursor, query_sql: str, params: List):
+        """
+        Executa query parametrizada reaproveitando PREPARE da conexão
+        Cada conexão guarda um LRU (SQL com placeholders -> nome do statement):
+        dashboards repetidos pulam parse e planejamento no PostgreSQL
+        """
+        if not PERFORMANCE_CONFIG['prepared_statements']:
+            return self._execute_direct(cursor, query_sql, params)
+        
+        statements = self.pool.state(conn).setdefault('prepared', OrderedDict())
+        
+        if query_sql in statements:
+            statements.move_to_end(query_sql)
+            name = statements[query_sql]
+        else:
+            name = 'mbq_' + hashlib.sha1(query_sql.encode('utf-8')).hexdigest()[:16]
+            try:
+                cursor.execute(f"PREPARE {name} AS {self._to_dollar_params(query_sql)}")
+                print(f"📝 Prepared statement criado: {name}")
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                raise
+            except psycopg2.Error as e:
+                # Ex: tipo de parâmetro não inferível - segue sem PREPARE para este SQL
+                print(f"⚠️ PREPARE falhou, executando direto: {str(e).strip()}")
+                name = None
+            
+            statements[query_sql] = name
+            while len(statements) > PERFORMANCE_CONFIG['prepared_statements_per_conn']:
+                _, old_name = statements.popitem(last=False)
+                if old_name:
+                    cursor.execute(f"DEALLOCATE {old_name}")
+        
+        if name is None:
+            return self._execute_direct(cursor, query_sql, params)
+        
+        if params:
+            placeholders = ', '.join(['%s'] * len(params))
+            cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+    
+    @staticmethod
+    def _execute_direct(cursor, query_sql: str, params: List):
+        """Executa query parametrizada sem PREPARE"""
+        if params:
+            cursor.execute(query_sql, params)
+        else:
+            # Sem parâmetros o psycopg2 não interpreta %%: desfaz o escape
+            cursor.execute(query_sql.replace('%%', '%'))
+    
+    @staticmethod
+    def _to_dollar_params(query_sql: str) -> str:
+        """Converte placeholders %s do psycopg2 para $1, $2... do PREPARE"""
+        counter = itertools.count(1)
+        return re.sub(
+            r'%%|%s',
+            lambda m: '%' if m.group(0) == '%%' else f'${next(counter)}',
+            query_sql
+        )
+    
+    @contextmanager
+    def _server_side_cursor(self, query_sql: str, params: Optional[List] = None,
+                            native_types: bool = False):
+        """
+        Cursor nomeado (server-side) com a query já executada
+        As linhas ficam no PostgreSQL e chegam em lotes via fetchmany
+        native_types=True: Decimal/date/datetime em vez dos casts para JSON da conexão
+        """
+        with self.get_connection() as conn:
+            # Cursores nomeados só existem dentro de transação
+            conn.autocommit = False
+            try:
+                with conn.cursor() as cursor:
+                    self._configure_session(cursor)
                 
-                # Processa dados para formato otimizado
-                processed_rows = self._process_rows_native(rows)
-                
-                return cols, processed_rows, execution_time
-    
-    def _process_rows_native(self, rows: List[tuple]) -> List[List]:
-        """Processa linhas para formato nativo do Metabase"""
-        processed = []
-        
-        for row in rows:
-            processed_row = []
-            for value in row:
-                if isinstance(value, Decimal):
-                    processed_row.append(float(value))
-                elif isinstance(value, (datetime, date)):
-                    processed_row.append(value.isoformat())
-                elif isinstance(value, dict):
-                    processed_row.append(value)
-                elif value is None:
-                    processed_row.append(None)
-                else:
-                    processed_row.append(value)
-            processed.append(processed_row)
-        
-        return processed
+                with conn.cursor(name=f"stream_{uuid.uuid4().hex[:12]}") as cursor:
+                    cursor.itersize = PERFORMANCE_CONFIG['stream_batch_size']
+                    if native_types:
+                        pg_types.register_native_casts(cursor)
+                    # DECLARE CURSOR não aceita EXECUTE: cursor nomeado não usa PREPARE
+                    with tracing.span('db'):
+                        self._execute_direct(cursor, query_sql, params or [])
+                    yield cursor
+            finally:
+                # Encerra a transação do cursor e devolve a conexão como estava
+                if not conn.closed:
+                    conn.rollback()
+                    conn.autocommit = True
+    
+    def _stream_native_query(self, query_sql: str, params: Optional[List] = None) -> Iterator[bytes]:
+        """
+        Executa query com cursor server-side (nomeado) e gera o corpo JSON
+        no formato do Metabase, lote a lote (a compressão fica com a Response)
+        """
+        start_time = time.time()
+        batch_size = PERFORMANCE_CONFIG['stream_batch_size']
+        total_rows = 0
+        error = None
+        
+        print(f"🚀 Executando query nativa em streaming (lotes de {batch_size:,})...")
+        with self._server_side_cursor(query_sql, params) as cursor:
+            # Em cursor nomeado a metadata só existe após o primeiro fetch
+            # (erro aqui ainda sobe para a rota e vira HTTP 500)
+            batch = cursor.fetchmany(batch_size)
+            cols = self._build_cols(cursor.description)
+            execution_time = time.time() - start_time
+            
+            cols_json = serializer.dumps(cols)
+            yield b'{"data":{"cols":' + cols_json + b',"rows":['
+            
+            try:
+                while batch:
+                    rows_json = serializer.dumps(batch)
+                    # Remove os colchetes externos para concatenar com os lotes anteriores
+                    chunk = (b',' if total_rows else b'') + rows_json[1:-1]
+                    total_rows += len(batch)
+                    yield chunk
+                    
+                    batch = cursor.fetchmany(batch_size)
+            except Exception as e:
+                # O status 200 já foi enviado: fecha o JSON e marca a resposta como falha
+                error = str(e)
+                print(f"❌ Erro no meio do streaming após {total_rows:,} linhas: {error}")
+        
+        total_time = time.time() - start_time
+        if error is None:
+            print(f"✅ {total_rows:,} linhas enviadas em streaming em {total_time:.2f}s")
+        tracing.annotate(rows=total_rows)
+        
+        # Fecha o array de linhas e completa o restante do objeto
+        metadata = {
+            'database_id': 2,
+            'started_at': start_time,
+            'json_query': {},
+            'average_execution_time': execution_time * 1000,
+            'status': 'completed' if error is None else 'failed',
+            'context': 'question',
+            'row_count': total_rows,
+            'running_time': int(total_time * 1000),
+            'from_cache': False
+        }
+        if error is not None:
+            metadata['error'] = error
+        trailer = (
+            b'],"rows_truncated":' + str(total_rows).encode('ascii') +
+            b',"results_metadata":{"columns":' + cols_json + b'}},' +
+            serializer.dumps(metadata)[1:]
+        )
+        yield trailer
+    
+    def _stream_arrow_query(self, query_sql: str, params: Optional[List] = None) -> Iterator[bytes]:
+        """
+        Executa query com cursor server-side e gera um Arrow IPC stream
+        (um RecordBatch por lote do cursor)
+        """
+        start_time = time.time()
+        batch_size = PERFORMANCE_CONFIG['stream_batch_size']
+        total_rows = 0
+        
+        print(f"🚀 Executando query nativa em Arrow (lotes de {batch_size:,})...")
+        # Arrow tipa datas e timestamps: usa os tipos Python nativos neste cursor
+        with self._server_side_cursor(query_sql, params, native_types=True) as cursor:
+            first_batch = cursor.fetchmany(batch_size)
+            schema = arrow_format.build_schema(
+                cursor.description, self._build_cols(cursor.description)
+            )
+            
+            def batches():
+                nonlocal total_rows
+                batch = first_batch
+                while batch:
+                    total_rows += len(batch)
+                    yield batch
+                    batch = cursor.fetchmany(batch_size)
+            
+            yield from arrow_format.iter_ipc_stream(schema, batches())
+        
+        total_time = time.time() - start_time
+        print(f"✅ {total_rows:,} linhas enviadas em Arrow em {total_time:.2f}s")
+        tracing.annotate(rows=total_rows)
+    
+    def _create_streaming_response(self, query_sql: str, params: Optional[List] = None,
+                                   output_format: str = 'json',
+                                   accept_encoding: Optional[str] = None) -> Response:
+        """
+        Cria response em streaming (chunked): JSON no formato do Metabase ou Arrow IPC
+        Comprimida lote a lote no algoritmo negociado com o cliente
+        """
+        if output_format == 'arrow':
+            body = self._stream_arrow_query(query_sql, params)
+            content_type = arrow_format.ARROW_MIME
+        else:
+            body = self._stream_native_query(query_sql, params)
+            content_type = 'application/json'
+        
+        # Executa a query antes de montar a Response: erros de SQL
+        # ainda chegam à rota e viram HTTP 500 normalmente
+        first_chunk = next(body)
+        
+        encoding = compression.negotiate(accept_encoding)
+        compressor = compression.StreamCompressor(encoding)
+        
+        def generate():
+            raw_bytes = sent_bytes = 0
+            try:
+                for chunk in itertools.chain([first_chunk], body):
+                    raw_bytes += len(chunk)
+                    compressed = compressor.compress(chunk)
+                    if compressed:
+                        sent_bytes += len(compressed)
+                        yield compressed
+                tail = compressor.flush()
+                sent_bytes += len(tail)
+                yield tail
+                # Só se sabe o total no fim: vai para o log e o trace, não para os headers
+                print(f"🗜️ Compressão {encoding}: {compressor.elapsed * 1000:.0f}ms")
+                tracing.record('compress', compressor.elapsed)
+                tracing.annotate(raw_bytes=raw_bytes, bytes=sent_bytes)
+            finally:
+                # Cliente desconectou ou terminou: libera cursor e conexão
+                body.close()
+        
+        response = Response(generate())
+        response.headers['Content-Type'] = content_type
+        if encoding != compression.IDENTITY:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['X-Metabase-Client'] = 'native-performance'
+        response.headers['X-Streaming'] = 'true'
+        
+        return response
+    
+    def _build_cols(self, description) -> List[Dict]:
+        """Monta metadata das colunas a partir do cursor.description"""
+        return [
+            {
+                'name': desc[0],
+                'base_type': self._get_pg_type(desc[1]),
+                'display_name': desc[0].replace('_', ' ').title()
+            }
+            for desc in description
+        ]
     
     def _get_pg_type(self, type_code: int) -> str:
         """Mapeia tipo PostgreSQL para tipo Metabase"""
@@ -210,14 +763,47 @@ class QueryService:
         }
         return type_map.get(type_code, 'type/Text')
     
-    def _generate_cache_key(self, question_id: int, filters: Dict) -> str:
-        """Gera chave de cache única"""
-        filters_ordenados = json.dumps(filters, sort_keys=True)
-        key_string = f"{question_id}:{filters_ordenados}"
+    def _generate_cache_key(self, query_sql: str, params: List, version: str = '') -> str:
+        """
+        Gera chave de cache a partir do SQL resolvido (version: watermark dos dados, ver data_version)
+        past7days~ e o intervalo de datas equivalente caem na mesma entrada
+        """
+        key_string = self._resolved_digest(query_sql, params)
+        if version:
+            key_string += f":{version}"
         return hashlib.sha256(key_string.encode()).hexdigest()[:16]
     
-    def _create_response(self, cols: List, rows: List, metadata: Dict) -> Response:
-        """Cria response no formato exato do Metabase"""
+    @staticmethod
+    def _resolved_digest(query_sql: str, params: List) -> str:
+        """Resumo do SQL com os parâmetros (arrays do = ANY ordenados: IN não depende da ordem)"""
+        values = [sorted(map(str, p)) if isinstance(p, list) else p for p in params]
+        key_string = query_sql + '\x00' + json.dumps(values, default=str)
+        return hashlib.sha256(key_string.encode()).hexdigest()
+    
+    def _cache_ttl(self, filters: Dict) -> Optional[float]:
+        """TTL do corpo em cache: termina quando o filtro de data relativo vira de período"""
+        rollover = self.query_parser.filters_rollover(filters)
+        if rollover is None:
+            return None
+        remaining = (rollover - datetime.now()).total_seconds()
+        return max(min(self.cache_service.ttl, remaining), 1)
+    
+    # Campos que mudam a cada request: ficam fora do corpo comprimido em cache
+    PER_REQUEST_FIELDS = ['started_at', 'average_execution_time', 'running_time', 'from_cache']
+    
+    def _create_response(self, cols: List, rows: List, metadata: Dict,
+                         extra: Optional[Dict] = None,
+                         accept_encoding: Optional[str] = None) -> Response:
+        """Cria response no formato exato do Metabase (extra: chaves adicionais no topo)"""
+        return self._body_response(self._build_body(cols, rows, metadata, extra),
+                                   accept_encoding=accept_encoding)
+    
+    def _build_body(self, cols: List, rows: List, metadata: Dict,
+                    extra: Optional[Dict] = None) -> CachedBody:
+        """
+        Corpo JSON no formato do Metabase, comprimido uma única vez (é o que vai para o cache)
+        started_at/running_time/from_cache são anexados por request em _body_response
+        """
         response_data = {
             'data': {
                 'cols': cols,
@@ -228,40 +814,104 @@ class QueryService:
                 }
             },
             'database_id': 2,
-            'started_at': metadata.get('started_at'),
             'json_query': {},
-            'average_execution_time': metadata.get('execution_time', 0) * 1000,
             'status': 'completed',
             'context': 'question',
-            'row_count': len(rows),
-            'running_time': int(metadata.get('execution_time', 0) * 1000),
-            'from_cache': metadata.get('from_cache', False)
+            'row_count': len(rows)
         }
+        if extra:
+            response_data.update(extra)
         
-        # Serializa para JSON compacto
-        json_data = json.dumps(response_data, separators=(',', ':'))
+        # Serializa para JSON compacto (sem o '}' final)
+        with tracing.span('serialize'):
+            prefix = gzip_envelope.split_response(response_data, self.PER_REQUEST_FIELDS)
+        etag = hashlib.blake2b(prefix, digest_size=8).hexdigest()
         
         # Comprime com gzip
-        compressed = gzip.compress(json_data.encode('utf-8'))
+        body = CachedBody.compress(prefix, metadata.get('execution_time', 0), etag,
+                                   level=COMPRESSION_CONFIG['cache_gzip_level'], row_count=len(rows))
+        tracing.record('gzip', body.compress_time)
         
-        print(f"📦 Response: {len(json_data)} → {len(compressed)} bytes "
-              f"({100 - len(compressed)/len(json_data)*100:.1f}% compressão)")
+        print(f"📦 Response: {len(prefix)} → {len(body)} bytes "
+              f"({100 - len(body)/max(len(prefix), 1)*100:.1f}% compressão "
+              f"em {body.compress_time * 1000:.0f}ms)")
+        
+        return body
+    
+    def _body_response(self, body: CachedBody, cache_status: Optional[str] = None,
+                       accept_encoding: Optional[str] = None) -> Response:
+        """
+        Response com o corpo gzip pronto; só a metadata do request é comprimida aqui
+        (o prefixo do cache é enviado sem cópia nem recompressão)
+        Cliente sem gzip ou corpo abaixo de COMPRESSION_MIN_SIZE: descomprime e
+        envia no algoritmo negociado (br/zstd/identity)
+        """
+        from_cache = bool(cache_status and cache_status.startswith('HIT'))
+        suffix = gzip_envelope.render_suffix({
+            'started_at': time.time(),
+            'average_execution_time': body.execution_time * 1000,
+            'running_time': 0 if from_cache else int(body.execution_time * 1000),
+            'from_cache': from_cache
+        })
+        # Compressão feita para este request (no MISS inclui a do corpo em cache)
+        compression_time = 0.0 if from_cache else body.compress_time
+        
+        size = body.size + len(suffix)
+        if size >= COMPRESSION_CONFIG['min_size'] and compression.negotiate(accept_encoding, size, ['gzip']) == 'gzip':
+            # gzip aceito: o corpo em cache serve como está, mesmo que o cliente prefira br/zstd
+            encoding = 'gzip'
+            start = time.perf_counter()
+            chunks = body.render(suffix)
+            elapsed = time.perf_counter() - start
+        else:
+            encoding = compression.negotiate(accept_encoding, size)
+            data, elapsed = compression.compress(body.decompress(suffix), encoding)
+            chunks = [data]
+        compression_time += elapsed
+        tracing.record('compress', elapsed)
+        length = sum(len(chunk) for chunk in chunks)
+        tracing.annotate(rows=body.row_count, raw_bytes=size, bytes=length)
         
         # Retorna com headers corretos
-        response = Response(compressed)
+        response = Response(chunks)
         response.headers['Content-Type'] = 'application/json'
-        response.headers['Content-Encoding'] = 'gzip'
+        if encoding != compression.IDENTITY:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Content-Length'] = str(length)
+        response.headers['X-Compression-Time'] = compression.timing_header(compression_time)
+        response.headers['ETag'] = f'W/"{body.etag}"'
         response.headers['X-Metabase-Client'] = 'native-performance'
+        if cache_status:
+            response.headers['X-Cache'] = cache_status
         
         return response
     
+    def warm_templates(self, question_ids: List[int]) -> int:
+        """
+        Busca o card no Metabase e compila o template de cada pergunta
+        Chamado antes do fork no gunicorn: os workers herdam tudo pronto
+        """
+        warmed = 0
+        for question_id in question_ids:
+            try:
+                query_info = self.metabase_service.get_question_query(question_id)
+                self.query_parser.get_template(question_id, query_info['query'], query_info.get('revision'))
+                warmed += 1
+            except Exception as e:
+                print(f"⚠️ Warm-up da pergunta {question_id} falhou: {e}")
+        print(f"🔥 Templates aquecidos: {warmed}/{len(question_ids)}")
+        return warmed
+    
     def get_question_info(self, question_id: int) -> Dict:
         """Obtém informações sobre uma questão"""
         return self.metabase_service.get_question_info(question_id)
     
+    def get_pool_stats(self) -> Dict:
+        """Estatísticas do pool de conexões"""
+        return self.pool.stats()
+    
     def close_pool(self):
         """Fecha todas as conexões do pool"""
-        while self.connection_pool:
-            conn = self.connection_pool.pop()
-            conn.close()
+        self.pool.close_all()
         print("🔌 Pool de conexões fechado")
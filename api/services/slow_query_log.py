@@ -0,0 +1,341 @@
+"""
+Log de queries lentas com captura do plano (EXPLAIN)
+
+Toda query de pergunta acima de SLOW_QUERY_THRESHOLD segundos vira uma
+entrada: fingerprint do SQL renderizado, pergunta, filtros, duração e
+linhas. O plano é capturado depois, numa thread própria e numa conexão
+separada do pool (não disputa conexão com os requests): EXPLAIN simples
+por padrão, EXPLAIN (ANALYZE, BUFFERS) numa fração SLOW_QUERY_ANALYZE_SAMPLE
+das capturas (reexecuta a query, em transação read-only com timeout).
+Cada fingerprint tem no máximo um plano a cada SLOW_QUERY_PLAN_INTERVAL.
+
+As entradas ficam num buffer circular em memória e, com
+SLOW_QUERY_LOG_FILE, num arquivo JSON lines rotacionado por tamanho
+(compartilhado entre workers). /api/debug/slow-queries agrupa por
+fingerprint; mais de uma forma de plano no mesmo fingerprint indica
+regressão de plano.
+"""
+
+import os
+import re
+import json
+import time
+import queue
+import random
+import hashlib
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from config.settings import SLOW_QUERY_CONFIG
+from api.utils import tracing
+
+# Capturas de plano pendentes além disso são descartadas (o request nunca espera)
+PLAN_QUEUE_SIZE = 32
+
+# Campos do nó do plano que definem a forma (custos e linhas estimadas ficam de fora)
+_SHAPE_FIELDS = ('Node Type', 'Join Type', 'Strategy', 'Relation Name', 'Index Name', 'Parent Relationship')
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LIST_RE = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_sql(query_sql: str) -> str:
+    """SQL sem literais nem espaços extras (filtros viram parâmetros, então só sobram os do template)"""
+    sql = _STRING_RE.sub('?', query_sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _LIST_RE.sub('(?...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def fingerprint(query_sql: str) -> str:
+    return hashlib.sha1(normalize_sql(query_sql).encode('utf-8')).hexdigest()[:16]
+
+
+def plan_shape(plan: Dict) -> str:
+    """Hash da árvore de nós do plano: muda quando o planner troca de estratégia"""
+    def walk(node):
+        fields = [str(node.get(field, '')) for field in _SHAPE_FIELDS]
+        children = [walk(child) for child in node.get('Plans', [])]
+        return '(' + '|'.join(fields) + ''.join(children) + ')'
+    return hashlib.sha1(walk(plan).encode('utf-8')).hexdigest()[:12]
+
+
+def summarize_plan(explain: List) -> Dict:
+    """Resumo do EXPLAIN (FORMAT JSON): forma, custo e, com ANALYZE, tempos e buffers"""
+    root = explain[0]
+    plan = root['Plan']
+    summary = {
+        'shape': plan_shape(plan),
+        'node': plan.get('Node Type'),
+        'total_cost': plan.get('Total Cost'),
+        'plan_rows': plan.get('Plan Rows')
+    }
+    if 'Execution Time' in root:
+        summary.update({
+            'execution_ms': root.get('Execution Time'),
+            'planning_ms': root.get('Planning Time'),
+            'actual_rows': plan.get('Actual Rows'),
+            'shared_hit': plan.get('Shared Hit Blocks'),
+            'shared_read': plan.get('Shared Read Blocks')
+        })
+    return summary
+
+
+class SlowQueryLog:
+    """Registro das queries lentas e fila de captura dos planos"""
+
+    def __init__(self, connect: Callable, configure: Optional[Callable] = None,
+                 config: Optional[Dict] = None):
+        """
+        connect(): nova conexão psycopg2 (fora do pool, read-only, sem autocommit) para o EXPLAIN
+        configure(cursor): mesma sessão das queries (search_path, work_mem)
+        """
+        self.connect = connect
+        self.configure = configure
+        self.config = dict(SLOW_QUERY_CONFIG, **(config or {}))
+
+        self._entries = deque(maxlen=self.config['max_entries'])
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=PLAN_QUEUE_SIZE)
+        self._last_plan: Dict[str, float] = {}
+        self._thread = None
+        self._thread_pid = None
+        self._conn = None
+        self._stats = {'recorded': 0, 'plans': 0, 'plan_errors': 0, 'plans_dropped': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.config['threshold'] > 0
+
+    # ------------------------------------------------------------------
+    # Caminho do request
+    # ------------------------------------------------------------------
+
+    def record(self, query_sql: str, params: List, duration: float, rows: int,
+               question_id: Optional[int] = None, filters: Optional[Dict] = None) -> Optional[Dict]:
+        """Registra a query se passou do limite e agenda o plano; None se não é lenta"""
+        if not self.enabled or duration < self.config['threshold']:
+            return None
+
+        trace = tracing.current()
+        entry = {
+            'kind': 'query',
+            'ts': datetime.now().isoformat(timespec='milliseconds'),
+            'fingerprint': fingerprint(query_sql),
+            'question_id': question_id,
+            'filters': filters or {},
+            'duration_ms': round(duration * 1000, 1),
+            'rows': rows,
+            'request_id': trace.request_id if trace is not None else None,
+            'sql': query_sql,
+            'params': params
+        }
+        print(f"🐢 Query lenta ({entry['duration_ms']:.0f}ms, {rows:,} linhas) "
+              f"pergunta {question_id} fingerprint {entry['fingerprint']}")
+        self._append(entry)
+        with self._lock:
+            self._stats['recorded'] += 1
+        self._schedule_plan(entry)
+        return entry
+
+    def _schedule_plan(self, entry: Dict):
+        if not self.config['explain']:
+            return
+        now = time.time()
+        with self._lock:
+            last = self._last_plan.get(entry['fingerprint'])
+            if last is not None and now - last < self.config['plan_interval']:
+                return
+            self._last_plan[entry['fingerprint']] = now
+
+        analyze = random.random() < self.config['analyze_sample']
+        try:
+            self._queue.put_nowait((entry, analyze))
+        except queue.Full:
+            with self._lock:
+                self._stats['plans_dropped'] += 1
+                self._last_plan.pop(entry['fingerprint'], None)
+            return
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        """Thread de captura por processo (threads não atravessam o fork do gunicorn)"""
+        with self._lock:
+            if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+                return
+            self._thread_pid = os.getpid()
+            self._conn = None
+            self._thread = threading.Thread(target=self._loop, name='slow-query-explain', daemon=True)
+            self._thread.start()
+
+    # ------------------------------------------------------------------
+    # Captura do plano (thread própria)
+    # ------------------------------------------------------------------
+
+    def _loop(self):
+        while True:
+            entry, analyze = self._queue.get()
+            try:
+                self.capture_plan(entry, analyze)
+            except Exception as e:
+                with self._lock:
+                    self._stats['plan_errors'] += 1
+                print(f"⚠️ EXPLAIN da query lenta {entry['fingerprint']} falhou: {e}")
+                self._close_connection()
+
+    def capture_plan(self, entry: Dict, analyze: bool = False) -> Dict:
+        """EXPLAIN (ou EXPLAIN ANALYZE, BUFFERS) da query registrada, na conexão separada"""
+        options = 'ANALYZE, BUFFERS, FORMAT JSON' if analyze else 'FORMAT JSON'
+        conn = self._connection()
+        try:
+            # Conexão read-only sem autocommit: tudo numa transação desfeita no fim
+            # (ANALYZE executa a query de verdade)
+            with conn.cursor() as cursor:
+                if self.configure is not None:
+                    self.configure(cursor)
+                cursor.execute("SELECT set_config('statement_timeout', %s, true)",
+                               (f"{int(self.config['explain_timeout'] * 1000)}ms",))
+                cursor.execute(f"EXPLAIN ({options}) {entry['sql']}", entry['params'] or None)
+                explain = cursor.fetchone()[0]
+        finally:
+            if not conn.closed:
+                conn.rollback()
+
+        if isinstance(explain, str):
+            explain = json.loads(explain)
+        plan_entry = {
+            'kind': 'plan',
+            'ts': datetime.now().isoformat(timespec='milliseconds'),
+            'fingerprint': entry['fingerprint'],
+            'question_id': entry['question_id'],
+            'analyze': analyze,
+            **summarize_plan(explain),
+            'plan': explain
+        }
+        self._append(plan_entry)
+        with self._lock:
+            self._stats['plans'] += 1
+        print(f"🔬 Plano capturado para {entry['fingerprint']}: {plan_entry['node']} "
+              f"(forma {plan_entry['shape']}{', ANALYZE' if analyze else ''})")
+        return plan_entry
+
+    def _connection(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = self.connect()
+        return self._conn
+
+    def _close_connection(self):
+        conn, self._conn = self._conn, None
+        if conn is not None and not conn.closed:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    # ------------------------------------------------------------------
+    # Armazenamento
+    # ------------------------------------------------------------------
+
+    def _append(self, entry: Dict):
+        with self._lock:
+            self._entries.append(entry)
+
+        path = self.config['log_file']
+        if not path:
+            return
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        try:
+            with self._file_lock:
+                if os.path.exists(path) and os.path.getsize(path) >= self.config['max_bytes']:
+                    # Rotação simples: o arquivo atual vira .1 (o .1 anterior é descartado)
+                    os.replace(path, path + '.1')
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+        except OSError as e:
+            print(f"⚠️ Erro ao gravar log de queries lentas: {e}")
+
+    def entries(self) -> List[Dict]:
+        """Entradas do arquivo (todos os workers, inclui o .1) ou do buffer em memória"""
+        path = self.config['log_file']
+        if not path:
+            with self._lock:
+                return list(self._entries)
+
+        entries = []
+        for name in (path + '.1', path):
+            try:
+                with open(name, encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            entries.append(json.loads(line))
+                        except ValueError:
+                            # Linha cortada por escrita concorrente ou rotação
+                            continue
+            except FileNotFoundError:
+                continue
+        return entries
+
+    def grouped(self, fingerprint_filter: Optional[str] = None) -> List[Dict]:
+        """
+        Entradas agrupadas por fingerprint (mais lentas primeiro)
+        plan_changed: o mesmo SQL teve planos de formas diferentes
+        """
+        groups: Dict[str, Dict] = {}
+        for entry in self.entries():
+            fp = entry['fingerprint']
+            if fingerprint_filter and fp != fingerprint_filter:
+                continue
+            group = groups.setdefault(fp, {
+                'fingerprint': fp, 'count': 0, 'question_ids': [], 'total_ms': 0.0, 'max_ms': 0.0,
+                'max_rows': 0, 'first_seen': entry['ts'], 'last_seen': entry['ts'],
+                'last_filters': None, 'sql': None, 'plans': {}
+            })
+            if entry['kind'] == 'plan':
+                shape = group['plans'].setdefault(entry['shape'], {
+                    'shape': entry['shape'], 'node': entry['node'], 'count': 0,
+                    'first_seen': entry['ts'], 'last_seen': entry['ts']
+                })
+                shape['count'] += 1
+                shape['last_seen'] = entry['ts']
+                shape.update({key: entry.get(key) for key in
+                              ('total_cost', 'plan_rows', 'analyze', 'execution_ms', 'planning_ms',
+                               'actual_rows', 'shared_hit', 'shared_read') if key in entry})
+                if fingerprint_filter:
+                    shape['plan'] = entry['plan']
+                continue
+
+            group['count'] += 1
+            group['total_ms'] += entry['duration_ms']
+            group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+            group['max_rows'] = max(group['max_rows'], entry['rows'])
+            group['last_seen'] = entry['ts']
+            group['last_filters'] = entry['filters']
+            group['sql'] = entry['sql']
+            if entry['question_id'] is not None and entry['question_id'] not in group['question_ids']:
+                group['question_ids'].append(entry['question_id'])
+
+        result = []
+        for group in groups.values():
+            plans = sorted(group.pop('plans').values(), key=lambda plan: plan['first_seen'])
+            group['avg_ms'] = round(group.pop('total_ms') / group['count'], 1) if group['count'] else None
+            group['plans'] = plans
+            group['plan_changed'] = len(plans) > 1
+            result.append(group)
+        return sorted(result, key=lambda group: group['max_ms'], reverse=True)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'threshold': self.config['threshold'],
+                'explain': self.config['explain'],
+                'analyze_sample': self.config['analyze_sample'],
+                'log_file': self.config['log_file'] or None,
+                'pending_plans': self._queue.qsize(),
+                **self._stats
+            }
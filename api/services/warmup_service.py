@@ -0,0 +1,269 @@
+"""
+Warm-up do cache de respostas
+
+Conta as combinações (pergunta, filtros) pedidas em /api/query e, em
+horários configurados, reexecuta as mais frequentes para renovar o corpo
+em cache antes do TTL vencer: quem abre o dashboard de manhã encontra
+tudo pronto em vez de esperar 10-30s pela query.
+
+Com Redis as contagens são compartilhadas entre workers (sorted set) e
+só um worker executa cada rodada (lock SET NX). O warm-up nunca usa mais
+que WARMUP_CONCURRENCY conexões e espera enquanto o pool tiver menos de
+WARMUP_POOL_RESERVE conexões livres para os requests.
+"""
+
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import WARMUP_CONFIG
+
+# Chaves no Redis
+HOT_KEY = "metabase:warmup:hot"
+LOCK_KEY = "metabase:warmup:lock"
+
+# Quanto uma query de warm-up espera o pool ter folga antes de desistir
+POOL_WAIT_SECONDS = 30
+
+
+def member(question_id: int, filters: Dict) -> str:
+    """Identifica a combinação pelos filtros crus (reexecutados, past7days resolve para o dia atual)"""
+    return f"{question_id}|{json.dumps(filters, sort_keys=True)}"
+
+
+def parse_member(value) -> Tuple[int, Dict]:
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    question_id, filters = value.split('|', 1)
+    return int(question_id), json.loads(filters)
+
+
+def next_daily_run(times: List[str], now: datetime) -> Optional[datetime]:
+    """Próximo horário HH:MM da lista depois de now (None sem horários)"""
+    runs = []
+    for value in times:
+        hour, minute = (int(part) for part in value.split(':'))
+        run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if run <= now:
+            run += timedelta(days=1)
+        runs.append(run)
+    return min(runs) if runs else None
+
+
+class WarmupService:
+    """Registra o tráfego e renova no cache as combinações mais acessadas"""
+
+    def __init__(self, query_service, config: Optional[Dict] = None):
+        self.query_service = query_service
+        self.config = dict(WARMUP_CONFIG, **(config or {}))
+        self.redis = query_service.cache_service.redis_client
+
+        # Contagens locais (sem Redis): membro -> acessos
+        self._counts: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._forced = False
+        self._running = threading.Lock()
+        self.last_run: Optional[Dict] = None
+
+    # ------------------------------------------------------------------
+    # Registro do tráfego
+    # ------------------------------------------------------------------
+
+    def record(self, question_id: int, filters: Dict):
+        """Conta um acesso (chamado pelo execute_query; nunca falha o request)"""
+        key = member(question_id, filters)
+        if self.redis:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.zincrby(HOT_KEY, 1, key)
+                # Mantém só as max_tracked combinações mais acessadas
+                pipe.zremrangebyrank(HOT_KEY, 0, -self.config['max_tracked'] - 1)
+                pipe.execute()
+                return
+            except Exception as e:
+                print(f"⚠️ Warm-up: erro ao registrar acesso no Redis: {e}")
+
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+            if len(self._counts) > self.config['max_tracked'] * 2:
+                self._counts = dict(self._top_local(self.config['max_tracked']))
+
+    def hot_keys(self, limit: Optional[int] = None) -> List[Tuple[int, Dict, float]]:
+        """(question_id, filtros, acessos) das combinações mais frequentes"""
+        limit = limit or self.config['top_n']
+        entries = None
+        if self.redis:
+            try:
+                entries = self.redis.zrevrange(HOT_KEY, 0, limit - 1, withscores=True)
+            except Exception as e:
+                print(f"⚠️ Warm-up: erro ao ler acessos no Redis: {e}")
+        if entries is None:
+            with self._lock:
+                entries = self._top_local(limit)
+
+        return [
+            parse_member(key) + (score,)
+            for key, score in entries
+            if score >= self.config['min_hits']
+        ]
+
+    def _top_local(self, limit: int) -> List[Tuple[str, float]]:
+        return sorted(self._counts.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def _decay(self):
+        """Tráfego antigo perde peso a cada rodada; combinações esquecidas saem"""
+        decay = self.config['decay']
+        if self.redis:
+            try:
+                self.redis.zunionstore(HOT_KEY, {HOT_KEY: decay})
+                self.redis.zremrangebyscore(HOT_KEY, 0, 0.1)
+                return
+            except Exception as e:
+                print(f"⚠️ Warm-up: erro ao atualizar acessos no Redis: {e}")
+        with self._lock:
+            self._counts = {key: count * decay for key, count in self._counts.items()
+                            if count * decay > 0.1}
+
+    # ------------------------------------------------------------------
+    # Execução
+    # ------------------------------------------------------------------
+
+    def run_once(self, force: bool = False, limit: Optional[int] = None) -> Dict:
+        """
+        Uma rodada de warm-up. Sem force só renova o que venceria antes da
+        próxima rodada por intervalo; com force reexecuta tudo
+        """
+        if not self._running.acquire(blocking=False):
+            return {'status': 'em_andamento'}
+
+        try:
+            started_at = time.time()
+            keys = self.hot_keys(limit)
+            min_remaining = None if force else self.config['interval'] + POOL_WAIT_SECONDS
+            summary = {'renovado': 0, 'fresco': 0, 'ignorado': 0, 'adiado': 0, 'erro': 0}
+
+            def warm(entry):
+                question_id, filters, _ = entry
+                if not self._wait_for_pool():
+                    return 'adiado'
+                try:
+                    return self.query_service.warm_query(question_id, filters, min_remaining)
+                except Exception as e:
+                    print(f"⚠️ Warm-up da pergunta {question_id} falhou: {e}")
+                    return 'erro'
+
+            with ThreadPoolExecutor(max_workers=self.config['concurrency'],
+                                    thread_name_prefix='warmup') as executor:
+                for result in executor.map(warm, keys):
+                    summary[result] += 1
+
+            self._decay()
+            summary.update({
+                'status': 'ok',
+                'combinacoes': len(keys),
+                'forcado': force,
+                'started_at': datetime.fromtimestamp(started_at).isoformat(),
+                'duration': round(time.time() - started_at, 2)
+            })
+            self.last_run = summary
+            print(f"🔥 Warm-up: {summary['renovado']} renovadas, {summary['fresco']} ainda frescas, "
+                  f"{summary['adiado']} adiadas, {summary['erro']} com erro em {summary['duration']}s")
+            return summary
+        finally:
+            self._running.release()
+
+    def _wait_for_pool(self) -> bool:
+        """Espera o pool ter mais que pool_reserve conexões livres para os requests"""
+        pool = self.query_service.pool
+        deadline = time.monotonic() + POOL_WAIT_SECONDS
+        while True:
+            stats = pool.stats()
+            if stats['max_size'] - stats['in_use'] > self.config['pool_reserve']:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.5)
+
+    # ------------------------------------------------------------------
+    # Agendamento
+    # ------------------------------------------------------------------
+
+    def start(self) -> bool:
+        """
+        Inicia o agendador (uma thread por processo)
+        Chamar depois do fork (post_fork do gunicorn), nunca no master
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._thread = threading.Thread(target=self._loop, name='cache-warmup', daemon=True)
+        self._thread.start()
+        return True
+
+    def trigger(self, force: bool = True):
+        """Pede uma rodada agora (ex: depois da carga de dados)"""
+        if self._thread is None or not self._thread.is_alive():
+            threading.Thread(target=self.run_once, kwargs={'force': force},
+                             name='cache-warmup-once', daemon=True).start()
+            return
+        self._forced = self._forced or force
+        self._wakeup.set()
+
+    def _loop(self):
+        interval = self.config['interval']
+        next_interval = time.time() + interval if interval else None
+
+        while True:
+            now = datetime.now()
+            daily = next_daily_run(self.config['times'], now)
+            candidates = [t for t in (next_interval, daily.timestamp() if daily else None) if t]
+            timeout = max(min(candidates) - time.time(), 0) if candidates else None
+
+            triggered = self._wakeup.wait(timeout)
+            self._wakeup.clear()
+
+            if triggered:
+                force, self._forced = self._forced, False
+            else:
+                # Horário fixo: tudo reexecutado; intervalo: só o que está vencendo
+                force = daily is not None and time.time() >= daily.timestamp()
+                if not self._acquire_round(interval):
+                    if interval:
+                        next_interval = time.time() + interval
+                    continue
+
+            try:
+                self.run_once(force=force)
+            except Exception as e:
+                print(f"⚠️ Warm-up falhou: {e}")
+
+            if interval:
+                next_interval = time.time() + interval
+
+    def _acquire_round(self, interval: int) -> bool:
+        """Entre workers: só quem pegar o lock executa a rodada agendada"""
+        if not self.redis:
+            return True
+        try:
+            # Expira antes da próxima rodada de qualquer worker
+            return bool(self.redis.set(LOCK_KEY, b'1', nx=True, px=int(max(interval, 60) * 900)))
+        except Exception:
+            return True
+
+    def get_stats(self) -> Dict:
+        return {
+            'enabled': self.config['enabled'],
+            'scheduler': self._thread is not None and self._thread.is_alive(),
+            'interval': self.config['interval'],
+            'times': self.config['times'],
+            'last_run': self.last_run,
+            'hot_keys': [
+                {'question_id': qid, 'filters': filters, 'hits': round(hits, 2)}
+                for qid, filters, hits in self.hot_keys()
+            ]
+        }
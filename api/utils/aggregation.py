@@ -0,0 +1,163 @@
+"""
+Agregação no servidor sobre o SQL renderizado de uma pergunta
+
+O SQL da pergunta (já com filtros) vira subquery e o GROUP BY roda no
+PostgreSQL: o cliente recebe algumas centenas de linhas agregadas em vez
+das linhas brutas. Identificadores são validados e sempre citados; funções
+e granularidades vêm de listas fechadas.
+"""
+
+import re
+from typing import Any, Dict, List, Tuple, Union
+
+Spec = Union[str, Dict[str, Any]]
+
+_IDENTIFIER_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+_TRAILING_SEMICOLONS_RE = re.compile(r'[\s;]+$')
+
+
+class QueryAggregator:
+    """Monta SELECT ... GROUP BY em volta do SQL de uma pergunta"""
+
+    # Granularidades aceitas em date_trunc
+    GRAINS = ['day', 'week', 'month', 'quarter', 'year']
+
+    # Função de agregação -> SQL
+    MEASURES = {
+        'sum': 'SUM',
+        'avg': 'AVG',
+        'count': 'COUNT',
+        'min': 'MIN',
+        'max': 'MAX'
+    }
+
+    MAX_DIMENSIONS = 5
+    MAX_MEASURES = 20
+
+    def parse_group_by(self, specs: Union[Spec, List[Spec]]) -> List[Dict[str, str]]:
+        """
+        Normaliza dimensões
+        Aceita 'coluna', 'coluna:grão' ou {'column', 'grain', 'as'}
+        """
+        dimensions = []
+        for spec in self._as_list(specs):
+            if isinstance(spec, dict):
+                column = spec.get('column')
+                grain = spec.get('grain')
+                alias = spec.get('as')
+            else:
+                column, _, grain = str(spec).partition(':')
+                alias = None
+
+            column = self._identifier(column, 'coluna de agrupamento')
+            grain = (grain or '').strip().lower() or None
+            if grain and grain not in self.GRAINS:
+                raise ValueError(f"Granularidade '{grain}' inválida (use {', '.join(self.GRAINS)})")
+
+            dimensions.append({
+                'column': column,
+                'grain': grain,
+                'as': self._identifier(alias, 'alias') if alias else column
+            })
+
+        if len(dimensions) > self.MAX_DIMENSIONS:
+            raise ValueError(f"Máximo de {self.MAX_DIMENSIONS} dimensões de agrupamento")
+        return dimensions
+
+    def parse_measures(self, specs: Union[Spec, List[Spec]]) -> List[Dict[str, str]]:
+        """
+        Normaliza métricas
+        Aceita 'função:coluna', 'count' ou {'fn', 'column', 'as'}
+        Alias padrão: a própria coluna para sum (mantém os nomes das colunas
+        originais), função_coluna para as demais e count para COUNT(*)
+        """
+        measures = []
+        for spec in self._as_list(specs):
+            if isinstance(spec, dict):
+                fn = spec.get('fn')
+                column = spec.get('column')
+                alias = spec.get('as')
+            else:
+                fn, _, column = str(spec).partition(':')
+                alias = None
+
+            fn = (fn or '').strip().lower()
+            if fn not in self.MEASURES:
+                raise ValueError(f"Agregação '{fn}' inválida (use {', '.join(self.MEASURES)})")
+
+            if column:
+                column = self._identifier(column, 'coluna de métrica')
+            elif fn != 'count':
+                raise ValueError(f"Agregação '{fn}' precisa de coluna")
+
+            if not alias:
+                alias = 'count' if not column else column if fn == 'sum' else f"{fn}_{column}"
+
+            measures.append({'fn': fn, 'column': column or None, 'as': self._identifier(alias, 'alias')})
+
+        if not measures:
+            raise ValueError("Informe ao menos uma métrica (measures)")
+        if len(measures) > self.MAX_MEASURES:
+            raise ValueError(f"Máximo de {self.MAX_MEASURES} métricas")
+        return measures
+
+    def build(self, query_sql: str, dimensions: List[Dict], measures: List[Dict]) -> str:
+        """Envolve o SQL da pergunta como subquery e aplica o GROUP BY"""
+        aliases = [d['as'] for d in dimensions] + [m['as'] for m in measures]
+        duplicated = sorted({a for a in aliases if aliases.count(a) > 1})
+        if duplicated:
+            raise ValueError(f"Aliases repetidos: {', '.join(duplicated)} (use 'as')")
+
+        select = []
+        for dimension in dimensions:
+            column = self._quote(dimension['column'])
+            if dimension['grain']:
+                # Grãos são de dia para cima: devolve date (YYYY-MM-DD) como a coluna original
+                column = f"date_trunc('{dimension['grain']}', {column})::date"
+            select.append(f"{column} AS {self._quote(dimension['as'])}")
+
+        for measure in measures:
+            argument = self._quote(measure['column']) if measure['column'] else '*'
+            select.append(f"{self.MEASURES[measure['fn']]}({argument}) AS {self._quote(measure['as'])}")
+
+        # Ponto e vírgula final quebraria a subquery
+        inner = _TRAILING_SEMICOLONS_RE.sub('', query_sql)
+        sql = "SELECT " + ",\n       ".join(select) + f"\nFROM (\n{inner}\n) AS pergunta"
+
+        if dimensions:
+            positions = ', '.join(str(i) for i in range(1, len(dimensions) + 1))
+            sql += f"\nGROUP BY {positions}\nORDER BY {positions}"
+        return sql
+
+    @staticmethod
+    def _as_list(specs) -> List:
+        """Aceita lista, item único ou string separada por vírgula (query string)"""
+        if not specs:
+            return []
+        if isinstance(specs, (list, tuple)):
+            items = []
+            for spec in specs:
+                items.extend(QueryAggregator._as_list(spec) if isinstance(spec, str) else [spec])
+            return items
+        if isinstance(specs, str):
+            return [part.strip() for part in specs.split(',') if part.strip()]
+        return [specs]
+
+    @staticmethod
+    def _identifier(name: Any, kind: str) -> str:
+        name = str(name or '').strip()
+        if not _IDENTIFIER_RE.match(name):
+            raise ValueError(f"Nome de {kind} inválido: '{name}'")
+        return name
+
+    @staticmethod
+    def _quote(name: str) -> str:
+        # Seguro: _identifier só aceita letras, dígitos e _
+        return f'"{name}"'
+
+    def describe(self, dimensions: List[Dict], measures: List[Dict]) -> Tuple[List, List]:
+        """Forma compacta da agregação (para logs e chave de cache)"""
+        return (
+            [f"{d['column']}:{d['grain'] or ''}:{d['as']}" for d in dimensions],
+            [f"{m['fn']}:{m['column'] or ''}:{m['as']}" for m in measures]
+        )
@@ -0,0 +1,96 @@
+"""
+Formato colunar Apache Arrow (IPC stream) para respostas de query
+
+Alternativa binária ao JSON do Metabase: cada lote do cursor vira um
+RecordBatch tipado (inteiros, floats e datas não passam por texto).
+pyarrow é opcional - sem ele, ARROW_AVAILABLE fica False e a API
+continua respondendo só em JSON.
+"""
+
+import io
+import json
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List
+
+try:
+    import pyarrow as pa
+    ARROW_AVAILABLE = True
+except ImportError:
+    pa = None
+    ARROW_AVAILABLE = False
+
+ARROW_MIME = 'application/vnd.apache.arrow.stream'
+
+# OID do PostgreSQL -> fábrica do tipo Arrow (texto para o que não estiver aqui)
+_PG_ARROW_TYPES = {
+    16: lambda: pa.bool_(),
+    20: lambda: pa.int64(),
+    21: lambda: pa.int16(),
+    23: lambda: pa.int32(),
+    700: lambda: pa.float32(),
+    701: lambda: pa.float64(),
+    1700: lambda: pa.float64(),    # NUMERIC: mesmo tratamento do JSON (float)
+    1082: lambda: pa.date32(),
+    1114: lambda: pa.timestamp('us'),
+    1184: lambda: pa.timestamp('us', tz='UTC'),
+}
+
+
+def build_schema(description, cols: List[Dict]) -> 'pa.Schema':
+    """
+    Monta o schema a partir do cursor.description
+    A metadata dos campos no formato do Metabase vai junto no schema
+    """
+    fields = []
+    for desc in description:
+        factory = _PG_ARROW_TYPES.get(desc[1])
+        fields.append(pa.field(desc[0], factory() if factory else pa.string()))
+
+    metadata = {b'metabase_cols': json.dumps(cols, separators=(',', ':')).encode('utf-8')}
+    return pa.schema(fields, metadata=metadata)
+
+
+def record_batch(schema: 'pa.Schema', rows: List[tuple]) -> 'pa.RecordBatch':
+    """Transpõe um lote de linhas do cursor em colunas tipadas"""
+    columns = list(zip(*rows)) if rows else [()] * len(schema)
+    arrays = [
+        pa.array(_column_values(values, field.type), type=field.type)
+        for values, field in zip(columns, schema)
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _column_values(values: Iterable, arrow_type) -> List:
+    """Ajusta valores Python que o pyarrow não converte sozinho"""
+    if pa.types.is_floating(arrow_type):
+        return [float(v) if isinstance(v, Decimal) else v for v in values]
+    if pa.types.is_string(arrow_type):
+        return [
+            v if v is None or isinstance(v, str)
+            else json.dumps(v) if isinstance(v, (dict, list))
+            else str(v)
+            for v in values
+        ]
+    return list(values)
+
+
+def iter_ipc_stream(schema: 'pa.Schema', batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """
+    Gera o IPC stream em pedaços: schema, um pedaço por lote e o marcador de fim
+    O buffer é esvaziado a cada lote, então a memória fica limitada a um lote
+    """
+    sink = io.BytesIO()
+
+    def drain() -> bytes:
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    with pa.ipc.new_stream(sink, schema) as writer:
+        yield drain()
+        for rows in batches:
+            writer.write_batch(record_batch(schema, rows))
+            yield drain()
+
+    yield drain()
@@ -0,0 +1,72 @@
+"""
+Cache das perguntas (cards) extraídas do Metabase
+
+LRU limitado em número de entradas. Cada entrada guarda o resultado de
+parse_question e quando ela foi confirmada pela última vez no Metabase:
+depois do TTL a entrada fica "velha" mas continua sendo servida enquanto
+a revalidação roda em segundo plano (stale-while-revalidate).
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class CardCache:
+    """LRU thread-safe de question_id -> query extraída do card, com TTL"""
+
+    def __init__(self, max_entries: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()   # question_id -> (info, verificado_em)
+        self._lock = threading.Lock()
+        self.changes = 0
+
+    def get(self, question_id: int) -> Tuple[Optional[Dict], bool]:
+        """(info, velha?) ou (None, False) se a pergunta não está no cache"""
+        with self._lock:
+            entry = self._entries.get(question_id)
+            if entry is None:
+                return None, False
+            self._entries.move_to_end(question_id)
+            return entry[0], self._clock() - entry[1] >= self.ttl
+
+    def set(self, question_id: int, info: Dict) -> bool:
+        """Guarda a versão confirmada no Metabase; True se o SQL mudou"""
+        with self._lock:
+            old = self._entries.pop(question_id, None)
+            self._entries[question_id] = (info, self._clock())
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+            changed = old is not None and old[0].get('revision') != info.get('revision')
+            if changed:
+                self.changes += 1
+            return changed
+
+    def touch(self, question_id: int):
+        """Card conferido e sem mudanças: renova o TTL"""
+        with self._lock:
+            entry = self._entries.get(question_id)
+            if entry is not None:
+                self._entries[question_id] = (entry[0], self._clock())
+
+    def stale_ids(self) -> List[int]:
+        with self._lock:
+            now = self._clock()
+            return [qid for qid, (_, checked) in self._entries.items() if now - checked >= self.ttl]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'revision_changes': self.changes
+            }
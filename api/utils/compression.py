@@ -0,0 +1,111 @@
+"""
+Compressão das respostas negociada pelo Accept-Encoding
+
+Algoritmos: zstd (zstandard, opcional), br (brotli, opcional), gzip e
+identity. O nível é configurável por algoritmo e respostas abaixo de
+COMPRESSION_MIN_SIZE bytes vão sem compressão. StreamCompressor comprime
+lote a lote junto com o corpo em streaming e acumula o tempo gasto
+(vai para o header X-Compression-Time).
+"""
+
+import time
+import zlib
+from typing import Optional, Tuple
+
+from werkzeug.http import parse_accept_header
+
+from config.settings import COMPRESSION_CONFIG
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+IDENTITY = 'identity'
+
+# Algoritmos instalados, na ordem de preferência configurada
+AVAILABLE = [
+    name for name in COMPRESSION_CONFIG['algorithms']
+    if name == 'gzip' or (name == 'br' and brotli) or (name == 'zstd' and zstandard)
+]
+
+
+def negotiate(accept_encoding: Optional[str], size: Optional[int] = None,
+              available=None) -> str:
+    """
+    Escolhe o algoritmo para o Accept-Encoding do cliente
+    Sem header: gzip (comportamento anterior). size abaixo do mínimo: identity
+    """
+    available = AVAILABLE if available is None else available
+    if size is not None and size < COMPRESSION_CONFIG['min_size']:
+        return IDENTITY
+    if accept_encoding is None:
+        return 'gzip' if 'gzip' in available else IDENTITY
+
+    accepted = parse_accept_header(accept_encoding)
+    best, best_quality = IDENTITY, 0
+    for name in available:
+        # Accept.quality considera '*' e devolve 0 para o que foi recusado (q=0)
+        quality = accepted.quality(name)
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def level_for(encoding: str) -> int:
+    return COMPRESSION_CONFIG['levels'][encoding]
+
+
+class StreamCompressor:
+    """Compressor incremental com a mesma interface para os três algoritmos"""
+
+    def __init__(self, encoding: str, level: Optional[int] = None):
+        self.encoding = encoding
+        self.elapsed = 0.0
+        level = level_for(encoding) if level is None and encoding != IDENTITY else level
+
+        if encoding == 'gzip':
+            # wbits=31 gera o formato gzip (header + deflate + trailer)
+            self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self._compress, self._finish = self._obj.compress, self._obj.flush
+        elif encoding == 'br':
+            self._obj = brotli.Compressor(quality=level)
+            self._compress, self._finish = self._obj.process, self._obj.finish
+        elif encoding == 'zstd':
+            self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+            self._compress, self._finish = self._obj.compress, self._obj.flush
+        elif encoding == IDENTITY:
+            self._compress, self._finish = (lambda data: data), (lambda: b'')
+        else:
+            raise ValueError(f"Compressão desconhecida: {encoding}")
+
+    def compress(self, data: bytes) -> bytes:
+        start = time.perf_counter()
+        out = self._compress(data)
+        self.elapsed += time.perf_counter() - start
+        return out
+
+    def flush(self) -> bytes:
+        start = time.perf_counter()
+        out = self._finish()
+        self.elapsed += time.perf_counter() - start
+        return out
+
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> Tuple[bytes, float]:
+    """Comprime o corpo inteiro; retorna (bytes, segundos gastos)"""
+    if encoding == IDENTITY:
+        return data, 0.0
+    compressor = StreamCompressor(encoding, level)
+    out = compressor.compress(data) + compressor.flush()
+    return out, compressor.elapsed
+
+
+def timing_header(seconds: float) -> str:
+    """Valor do X-Compression-Time (milissegundos)"""
+    return f"{seconds * 1000:.2f}"
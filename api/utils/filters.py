@@ -18,7 +18,8 @@ class FilterProcessor:
     ]
     
     # Parâmetros especiais que não são filtros
-    SPECIAL_PARAMS = ['question_id', 'format', 'limit', 'offset']
+    SPECIAL_PARAMS = ['question_id', 'format', 'limit', 'offset', 'stream', 'group_by', 'measures',
+                      'cursor', 'sort']
     
     # Mapa de normalização de nomes
     NORMALIZATION_MAP = {
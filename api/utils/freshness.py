@@ -0,0 +1,146 @@
+"""
+Validadores HTTP (ETag) para respostas de pergunta
+
+O ETag é calculado sem executar a query: pergunta, filtros normalizados,
+revisão do card e um token de "frescor" dos dados. O token vem de uma
+query de watermark configurada por pergunta (ex: SELECT max(updated_at))
+ou, sem watermark, da janela de tempo atual (dados assumidos estáveis
+por FRESHNESS_BUCKET_SECONDS). A chave do cache de respostas usa só o
+watermark (data_version); a validade sem watermark fica com o CACHE_TTL,
+e o ETag passa a seguir o corpo em cache (content_etag), não a janela.
+"""
+
+import json
+import time
+import hashlib
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from werkzeug.http import parse_etags
+
+
+def normalize_filters(filters: Dict[str, Any]) -> str:
+    """
+    Forma canônica dos filtros: chaves ordenadas, listas ordenadas
+    (IN ('a','b') == IN ('b','a')) e filtros vazios descartados
+    """
+    normalized = {}
+    for key, value in filters.items():
+        if value in (None, '', [], {}):
+            continue
+        if isinstance(value, (list, tuple)):
+            value = sorted(str(v) for v in value)
+        normalized[key] = value
+    return json.dumps(normalized, sort_keys=True, separators=(',', ':'), default=str)
+
+
+def build_etag(question_id: int, filters: Dict[str, Any], revision: str,
+               freshness: str, variant: str = '') -> str:
+    """ETag forte (entre aspas) para a combinação pergunta + filtros + dados"""
+    key = '|'.join([str(question_id), normalize_filters(filters), revision or '', freshness, variant])
+    return '"' + hashlib.sha256(key.encode('utf-8')).hexdigest()[:32] + '"'
+
+
+def content_etag(etag: str, body_etag: str) -> str:
+    """
+    ETag forte de um corpo em cache: base da pergunta (sem a janela de tempo)
+    + resumo dos bytes. Usado sem watermark: o 304 passa a valer "mesmos bytes"
+    """
+    key = etag.strip('"') + '|' + body_etag
+    return '"' + hashlib.sha256(key.encode('utf-8')).hexdigest()[:32] + '"'
+
+
+def data_version(freshness: str) -> str:
+    """
+    Parte do token de frescor que entra nas chaves de cache
+    Só o watermark identifica os dados; a janela de tempo ('t...') vale apenas
+    para o ETag, senão todas as entradas trocariam de chave a cada janela
+    """
+    return freshness if freshness.startswith('w') else ''
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    """Confere o header If-None-Match (lista de ETags ou *)"""
+    if not etag or not if_none_match:
+        return False
+    return parse_etags(if_none_match).contains_weak(etag.strip('"'))
+
+
+class FreshnessTracker:
+    """
+    Token de frescor por pergunta
+    O resultado da query de watermark é reaproveitado por check_interval
+    segundos, para não ir ao banco a cada request
+    """
+
+    def __init__(self, bucket_seconds: int, check_interval: float,
+                 queries: Dict[str, str], default_query: str = ''):
+        self.bucket_seconds = max(int(bucket_seconds), 1)
+        self.check_interval = check_interval
+        self.queries = {str(k): v for k, v in (queries or {}).items()}
+        self.default_query = default_query
+        self._tokens = {}       # question_id -> (token, verificado_em)
+        self._lock = threading.Lock()
+
+    def watermark_query(self, question_id: int) -> Optional[str]:
+        return self.queries.get(str(question_id)) or self.default_query or None
+
+    def token(self, question_id: int, run_scalar: Callable[[str], Any]) -> str:
+        """
+        Token atual de frescor da pergunta
+        run_scalar executa a query de watermark e devolve o primeiro valor
+        """
+        query = self.watermark_query(question_id)
+        cached = self._cached(question_id, query)
+        if cached:
+            return cached
+
+        try:
+            return self._store(question_id, run_scalar(query))
+        except Exception as e:
+            return self._fallback(question_id, e)
+
+    async def token_async(self, question_id: int,
+                          run_scalar: Callable[[str], Awaitable[Any]]) -> str:
+        """Mesmo que token(), com a query de watermark assíncrona"""
+        query = self.watermark_query(question_id)
+        cached = self._cached(question_id, query)
+        if cached:
+            return cached
+
+        try:
+            return self._store(question_id, await run_scalar(query))
+        except Exception as e:
+            return self._fallback(question_id, e)
+
+    def _bucket(self) -> str:
+        return f"t{int(time.time() // self.bucket_seconds)}"
+
+    def _cached(self, question_id: int, query: Optional[str]) -> Optional[str]:
+        """Token ainda válido (ou o da janela de tempo, sem watermark)"""
+        if not query:
+            return self._bucket()
+        with self._lock:
+            cached = self._tokens.get(question_id)
+            if cached and time.monotonic() - cached[1] < self.check_interval:
+                return cached[0]
+        return None
+
+    def _store(self, question_id: int, value: Any) -> str:
+        token = f"w{value}"
+        with self._lock:
+            self._tokens[question_id] = (token, time.monotonic())
+        return token
+
+    def _fallback(self, question_id: int, error: Exception) -> str:
+        # Sem watermark: cai para a janela de tempo
+        print(f"⚠️ Erro na query de frescor da pergunta {question_id}: {error}")
+        return self._bucket()
+
+    def invalidate(self, question_id: Optional[int] = None):
+        """Força nova consulta do watermark (todas as perguntas se None)"""
+        with self._lock:
+            if question_id is None:
+                self._tokens.clear()
+            else:
+                self._tokens.pop(question_id, None)
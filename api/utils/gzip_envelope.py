@@ -0,0 +1,116 @@
+"""
+Corpo gzip pré-comprimido com metadata anexada por request
+
+O JSON da resposta é dividido em duas partes:
+- prefixo: tudo que depende só do resultado (cols, rows, row_count...),
+  comprimido uma única vez e guardado no cache
+- sufixo: campos que mudam a cada request (started_at, running_time,
+  from_cache), comprimidos na hora (algumas dezenas de bytes)
+
+O prefixo termina com Z_FULL_FLUSH (fronteira de byte, sem bloco final),
+então um deflate novo do sufixo pode ser concatenado direto. O CRC32 do
+gzip continua a partir do CRC do prefixo: servir um hit não descomprime
+nem recomprime o resultado.
+"""
+
+import struct
+import time
+import zlib
+from typing import Dict, List
+
+from api.utils import serializer
+
+# Header gzip fixo: magic, deflate, sem flags, mtime 0, xfl 0, OS desconhecido
+_GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+# Serialização para o Redis: magic + crc, tamanho, tempo de execução, etag, linhas
+_MAGIC = b'MBZ2'
+_META = struct.Struct('>IId16sI')
+# Formato anterior (sem o número de linhas): ainda lido até as entradas expirarem
+_MAGIC_V1 = b'MBZ1'
+_META_V1 = struct.Struct('>IId16s')
+
+
+class CachedBody:
+    """Prefixo gzip de uma resposta JSON pronto para ser completado"""
+
+    __slots__ = ('gzip_prefix', 'crc', 'size', 'execution_time', 'etag', 'compress_time', 'row_count')
+
+    def __init__(self, gzip_prefix: bytes, crc: int, size: int,
+                 execution_time: float, etag: str, compress_time: float = 0.0,
+                 row_count: int = 0):
+        self.gzip_prefix = gzip_prefix
+        self.crc = crc
+        self.size = size
+        self.execution_time = execution_time
+        self.etag = etag
+        # Tempo gasto comprimindo o prefixo (não vai para o Redis)
+        self.compress_time = compress_time
+        # Linhas do resultado (métricas de linhas servidas, inclusive em hits)
+        self.row_count = row_count
+
+    @classmethod
+    def compress(cls, prefix: bytes, execution_time: float, etag: str,
+                 level: int = 9, row_count: int = 0) -> 'CachedBody':
+        """Comprime o prefixo JSON (sem o '}' final) deixando o deflate em aberto"""
+        start = time.perf_counter()
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        deflated = compressor.compress(prefix) + compressor.flush(zlib.Z_FULL_FLUSH)
+        return cls(_GZIP_HEADER + deflated, zlib.crc32(prefix), len(prefix), execution_time, etag,
+                   time.perf_counter() - start, row_count)
+
+    def render(self, suffix: bytes) -> List[bytes]:
+        """
+        Completa o gzip com o sufixo; retorna os pedaços do corpo
+        (o prefixo vai como está, sem cópia)
+        """
+        compressor = zlib.compressobj(1, zlib.DEFLATED, -15)
+        tail = compressor.compress(suffix) + compressor.flush()
+        trailer = struct.pack(
+            '<II',
+            zlib.crc32(suffix, self.crc) & 0xffffffff,
+            (self.size + len(suffix)) & 0xffffffff
+        )
+        return [self.gzip_prefix, tail + trailer]
+
+    def decompress(self, suffix: bytes) -> bytes:
+        """JSON completo sem compressão (cliente que não aceita gzip)"""
+        # O prefixo termina em Z_FULL_FLUSH: o decompressobj devolve tudo sem o trailer
+        return zlib.decompressobj(31).decompress(self.gzip_prefix) + suffix
+
+    def to_bytes(self) -> bytes:
+        etag = self.etag.encode('ascii')[:16].ljust(16, b' ')
+        return (_MAGIC + _META.pack(self.crc, self.size, self.execution_time, etag, self.row_count)
+                + self.gzip_prefix)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'CachedBody':
+        start = len(_MAGIC)
+        if data[:start] == _MAGIC:
+            crc, size, execution_time, etag, row_count = _META.unpack_from(data, start)
+            end = start + _META.size
+        elif data[:start] == _MAGIC_V1:
+            crc, size, execution_time, etag = _META_V1.unpack_from(data, start)
+            row_count, end = 0, start + _META_V1.size
+        else:
+            raise ValueError("Entrada de cache em formato desconhecido")
+        return cls(data[end:], crc, size, execution_time, etag.decode('ascii').strip(),
+                   row_count=row_count)
+
+    def __len__(self) -> int:
+        # Tamanho ocupado no cache em memória
+        return len(self.gzip_prefix)
+
+
+def split_response(response_data: Dict, per_request: List[str]) -> bytes:
+    """
+    Serializa o JSON sem as chaves per_request e sem o '}' final
+    As chaves ficam para o sufixo de cada request (render_suffix)
+    """
+    cached = {key: value for key, value in response_data.items() if key not in per_request}
+    return serializer.dumps(cached)[:-1]
+
+
+def render_suffix(fields: Dict) -> bytes:
+    """Sufixo ',"campo":valor,...}' que fecha o objeto do prefixo"""
+    return b',' + serializer.dumps(fields)[1:]
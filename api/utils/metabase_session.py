@@ -0,0 +1,142 @@
+"""
+Sessão HTTP com o Metabase
+
+Um requests.Session por processo: conexões keep-alive reaproveitadas
+(HTTPAdapter com pool), retentativas limitadas com backoff em erro de
+conexão e 429/502/503/504, e o token X-Metabase-Session renovado
+automaticamente quando o Metabase responde 401.
+"""
+
+import os
+import time
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from api.utils import metrics
+
+# Status que valem nova tentativa (Metabase reiniciando / sobrecarregado)
+RETRY_STATUS = (429, 502, 503, 504)
+
+
+def replayable(kwargs: dict) -> bool:
+    """
+    Corpo do request pode ser reenviado tal como está (bytes, str, dict, json ou nada)
+    Arquivos e geradores já foram lidos no primeiro envio
+    """
+    if kwargs.get('files'):
+        return False
+    return isinstance(kwargs.get('data'), (bytes, str, dict, type(None)))
+
+
+def create_session(max_retries: int, pool_size: int, backoff: float) -> requests.Session:
+    """requests.Session com pool de conexões e retentativas com backoff exponencial"""
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUS,
+        # POST (query, login) só é repetido em erro de conexão, nunca depois de enviado
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class MetabaseSession:
+    """Conexões + token do Metabase compartilhados entre as threads do processo"""
+
+    def __init__(self, base_url: str, username: Optional[str], password: Optional[str],
+                 max_retries: int = 3, pool_size: int = 10, backoff: float = 0.5,
+                 timeout: float = 30):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self._token = None
+        self._login_lock = threading.Lock()
+        self._http = None
+        self._pid = None
+        self.logins = 0
+
+    @property
+    def http(self) -> requests.Session:
+        # Sockets abertos antes do fork (preload do gunicorn) não são compartilhados
+        if self._http is None or self._pid != os.getpid():
+            self._http = create_session(self.max_retries, self.pool_size, self.backoff)
+            self._pid = os.getpid()
+        return self._http
+
+    def token(self) -> str:
+        """Token atual (faz login na primeira vez)"""
+        token = self._token
+        if token:
+            return token
+        return self._renew(None)
+
+    def _renew(self, expired: Optional[str]) -> str:
+        """
+        Um único login por vez: quem chega depois de outra thread já ter
+        renovado o token expirado só reaproveita o novo
+        """
+        with self._login_lock:
+            if self._token and self._token != expired:
+                return self._token
+
+            response = self.http.post(
+                f"{self.base_url}/api/session",
+                json={"username": self.username, "password": self.password},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            self._token = response.json()["id"]
+            self.logins += 1
+            if expired:
+                print("🔑 Sessão do Metabase expirada: novo login feito")
+            return self._token
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Request autenticado; um 401 renova o token e repete uma vez
+        Corpo que não pode ser reenviado (arquivo, gerador): o 401 sobe como HTTPError
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        headers = dict(kwargs.pop('headers', None) or {})
+
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            token = self.token()
+            headers['X-Metabase-Session'] = token
+            response = self.http.request(method, f"{self.base_url}{path}", headers=headers, **kwargs)
+
+            if response.status_code == 401:
+                if not replayable(kwargs):
+                    status = response.status_code
+                    response.raise_for_status()
+                response.close()
+                headers['X-Metabase-Session'] = self._renew(token)
+                response = self.http.request(method, f"{self.base_url}{path}", headers=headers, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            # Inclui retentativas e renovação do token: é o tempo que o request esperou
+            metrics.observe_metabase(method, path, status, time.perf_counter() - start)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request('POST', path, **kwargs)
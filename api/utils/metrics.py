@@ -0,0 +1,364 @@
+"""
+Métricas no formato texto do Prometheus (GET /api/debug/metrics)
+
+Sem dependência externa: contadores e histogramas ficam em memória no
+processo (um lock, sem I/O no caminho do request). Pool, cache e Metabase
+entram por coletores lidos só na hora do scrape, a partir dos contadores
+que esses serviços já mantêm - nada de SCAN/INFO no Redis.
+
+Com gunicorn cada worker tem a sua memória: com METRICS_DIR cada processo
+grava um snapshot (JSON) a cada METRICS_FLUSH_INTERVAL segundos e o scrape
+soma os snapshots de todos os workers. Contadores de workers que já
+morreram continuam somando (nunca diminuem); gauges só dos vivos.
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config.settings import METRICS_CONFIG
+
+PREFIX = 'metabase_api_'
+
+# Buckets de latência em segundos (consultas vão de ms a minutos)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# question_id das perguntas que não carregaram (id inexistente, Metabase fora):
+# ids arbitrários na URL não viram séries novas
+OTHER_QUESTION = 'other'
+
+
+def _labels(values: Dict) -> Labels:
+    return tuple(sorted((str(k), '' if v is None else str(v)) for k, v in values.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Registry:
+    """Contadores, histogramas e coletores (gauges/contadores lidos no scrape)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Tuple[str, str, tuple]] = {}   # nome -> (tipo, help, buckets)
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], List] = {}  # [contagens por bucket..., soma]
+        self._collectors: List[Callable[[], Iterable[Tuple[str, Dict, float]]]] = []
+
+    # ------------------------------------------------------------------
+    # Declaração
+    # ------------------------------------------------------------------
+
+    def counter(self, name: str, help_text: str):
+        self._meta[name] = ('counter', help_text, ())
+
+    def gauge(self, name: str, help_text: str):
+        self._meta[name] = ('gauge', help_text, ())
+
+    def histogram(self, name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS):
+        self._meta[name] = ('histogram', help_text, tuple(buckets))
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, Dict, float]]]):
+        """collector() -> [(nome, labels, valor)] de contadores/gauges já declarados"""
+        self._collectors.append(collector)
+
+    # ------------------------------------------------------------------
+    # Registro (caminho do request)
+    # ------------------------------------------------------------------
+
+    def inc(self, name: str, labels: Dict, value: float = 1.0):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, labels: Dict, value: float):
+        buckets = self._meta[name][2]
+        key = (name, _labels(labels))
+        with self._lock:
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+            # Contagem não cumulativa por bucket (acumulada só no render); último = +Inf
+            entry[bisect_left(buckets, value)] += 1
+            entry[-1] += value
+
+    # ------------------------------------------------------------------
+    # Snapshot / exposição
+    # ------------------------------------------------------------------
+
+    def snapshot(self) -> Dict:
+        """Estado do processo (serializável em JSON)"""
+        with self._lock:
+            counters = [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+            histograms = [[name, list(labels), list(entry)] for (name, labels), entry in self._histograms.items()]
+
+        collected = []
+        for collector in self._collectors:
+            try:
+                for name, labels, value in collector():
+                    collected.append([name, list(_labels(labels)), value])
+            except Exception as e:
+                print(f"⚠️ Coletor de métricas falhou: {e}")
+
+        return {'pid': os.getpid(), 'time': time.time(), 'counters': counters,
+                'histograms': histograms, 'collected': collected}
+
+    def render(self, snapshots: List[Dict]) -> str:
+        """Texto do Prometheus somando os snapshots (um por processo)"""
+        counters: Dict[Tuple[str, Labels], float] = {}
+        histograms: Dict[Tuple[str, Labels], List] = {}
+
+        for snap in snapshots:
+            live = snap.get('live', True)
+            for name, labels, value in snap['counters']:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0.0) + value
+            for name, labels, entry in snap['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                current = histograms.get(key)
+                histograms[key] = list(entry) if current is None else [a + b for a, b in zip(current, entry)]
+            for name, labels, value in snap['collected']:
+                if name not in self._meta or (self._meta[name][0] == 'gauge' and not live):
+                    continue
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0.0) + value
+
+        lines = []
+        for name in sorted(self._meta):
+            kind, help_text, buckets = self._meta[name]
+            series = sorted((labels, value) for (n, labels), value in
+                            (histograms if kind == 'histogram' else counters).items() if n == name)
+            if not series:
+                continue
+            full = PREFIX + name
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            for labels, value in series:
+                if kind != 'histogram':
+                    lines.append(f"{full}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + (float('inf'),), value[:-1]):
+                    cumulative += count
+                    lines.append(f"{full}_bucket{_format_labels(labels, ('le', _format_value(bound)))} {cumulative}")
+                lines.append(f"{full}_sum{_format_labels(labels)} {_format_value(value[-1])}")
+                lines.append(f"{full}_count{_format_labels(labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+
+class SnapshotStore:
+    """Snapshots dos workers em METRICS_DIR (um arquivo por pid)"""
+
+    def __init__(self, registry: Registry, directory: Optional[str] = None,
+                 interval: Optional[float] = None):
+        self.registry = registry
+        self.directory = METRICS_CONFIG['dir'] if directory is None else directory
+        self.interval = METRICS_CONFIG['flush_interval'] if interval is None else interval
+        self._thread = None
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"metrics_{pid}.json")
+
+    def flush(self):
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        snap = self.registry.snapshot()
+        tmp = self._path(snap['pid']) + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(snap, f)
+        os.replace(tmp, self._path(snap['pid']))
+
+    def start(self) -> bool:
+        """Grava o snapshot periodicamente (chamar no worker, depois do fork)"""
+        if not self.directory or (self._thread is not None and self._thread.is_alive()):
+            return False
+
+        def loop():
+            while True:
+                time.sleep(self.interval)
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"⚠️ Erro ao gravar métricas: {e}")
+
+        self._thread = threading.Thread(target=loop, name='metrics-flush', daemon=True)
+        self._thread.start()
+        return True
+
+    def clear(self):
+        """Apaga snapshots de uma execução anterior (master, antes do fork)"""
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.startswith('metrics_'):
+                os.remove(os.path.join(self.directory, name))
+
+    def collect(self) -> List[Dict]:
+        """Snapshot ao vivo deste processo + os gravados pelos outros workers"""
+        own = self.registry.snapshot()
+        snapshots = [own]
+        if not self.directory or not os.path.isdir(self.directory):
+            return snapshots
+
+        for name in os.listdir(self.directory):
+            match = re.match(r'^metrics_(\d+)\.json$', name)
+            if not match or int(match.group(1)) == own['pid']:
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                    snap = json.load(f)
+            except (OSError, ValueError):
+                continue
+            snap['live'] = _pid_alive(snap['pid'])
+            snapshots.append(snap)
+        return snapshots
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# ----------------------------------------------------------------------
+# Métricas da API
+# ----------------------------------------------------------------------
+
+registry = Registry()
+store = SnapshotStore(registry)
+
+registry.counter('requests_total', 'Requests de query por rota, pergunta, status HTTP e origem no cache')
+registry.histogram('request_duration_seconds', 'Duração por pergunta e etapa (phase=total: request inteiro)')
+registry.counter('rows_served_total', 'Linhas entregues por pergunta')
+registry.counter('response_bytes_total', 'Bytes do corpo enviados (comprimidos) por pergunta')
+registry.counter('response_raw_bytes_total', 'Bytes do JSON antes da compressão por pergunta')
+registry.histogram('metabase_request_duration_seconds', 'Latência das chamadas à API do Metabase')
+
+registry.counter('cache_requests_total', 'Consultas ao cache de respostas por resultado (l1, l2, wait, miss)')
+registry.gauge('cache_local_entries', 'Entradas no cache L1 em memória')
+registry.gauge('cache_local_bytes', 'Bytes ocupados no cache L1 em memória')
+registry.counter('cache_local_evictions_total', 'Entradas removidas do L1 por falta de espaço')
+
+registry.gauge('pool_size', 'Conexões PostgreSQL abertas')
+registry.gauge('pool_in_use', 'Conexões PostgreSQL em uso')
+registry.gauge('pool_idle', 'Conexões PostgreSQL ociosas')
+registry.gauge('pool_max_size', 'Limite de conexões PostgreSQL')
+registry.counter('pool_checkouts_total', 'Conexões entregues pelo pool')
+registry.counter('pool_waits_total', 'Checkouts que esperaram por uma conexão livre')
+registry.counter('pool_wait_seconds_total', 'Tempo total esperando conexão livre')
+registry.counter('pool_timeouts_total', 'Checkouts que estouraram o POOL_TIMEOUT')
+
+
+def observe_trace(trace):
+    """Registra um request de query já concluído a partir do trace (spans + attrs)"""
+    if not METRICS_CONFIG['enabled']:
+        return
+    attrs = trace.attrs
+    question_id = attrs.get('question_id', '') if attrs.get('question_loaded') else OTHER_QUESTION
+    registry.inc('requests_total', {
+        'route': trace.name, 'question_id': question_id,
+        'status': attrs.get('status', ''), 'cache': attrs.get('cache') or 'none'
+    })
+
+    for phase, (seconds, _) in list(trace.spans.items()):
+        registry.observe('request_duration_seconds', {'question_id': question_id, 'phase': phase}, seconds)
+    registry.observe('request_duration_seconds', {'question_id': question_id, 'phase': 'total'},
+                     trace.elapsed())
+
+    for attr, name in (('rows', 'rows_served_total'), ('bytes', 'response_bytes_total'),
+                       ('raw_bytes', 'response_raw_bytes_total')):
+        if attrs.get(attr):
+            registry.inc(name, {'question_id': question_id}, attrs[attr])
+
+
+def observe_metabase(method: str, path: str, status, seconds: float):
+    """Latência de uma chamada ao Metabase (ids no caminho viram :id)"""
+    if METRICS_CONFIG['enabled']:
+        registry.observe('metabase_request_duration_seconds', {
+            'method': method.upper(), 'endpoint': re.sub(r'/\d+', '/:id', path), 'status': status
+        }, seconds)
+
+
+def watch_pool(pool):
+    """Gauges e contadores do ConnectionPool (psycopg2), lidos no scrape"""
+    def collect():
+        stats = pool.stats()
+        labels = {'pool': stats['name']}
+        return [
+            ('pool_size', labels, stats['size']),
+            ('pool_in_use', labels, stats['in_use']),
+            ('pool_idle', labels, stats['idle']),
+            ('pool_max_size', labels, stats['max_size']),
+            ('pool_checkouts_total', labels, stats['checkouts']),
+            ('pool_waits_total', labels, stats['waits']),
+            ('pool_wait_seconds_total', labels, stats['wait_time_total']),
+            ('pool_timeouts_total', labels, stats['timeouts'])
+        ]
+    registry.register_collector(collect)
+
+
+def watch_async_pool(pool):
+    """Mesmas métricas a partir do get_stats() do psycopg_pool (caminho ASGI)"""
+    def collect():
+        stats = pool.get_stats()
+        labels = {'pool': pool.name}
+        size, idle = stats.get('pool_size', 0), stats.get('pool_available', 0)
+        return [
+            ('pool_size', labels, size),
+            ('pool_in_use', labels, size - idle),
+            ('pool_idle', labels, idle),
+            ('pool_max_size', labels, stats.get('pool_max', 0)),
+            ('pool_checkouts_total', labels, stats.get('requests_num', 0)),
+            ('pool_waits_total', labels, stats.get('requests_queued', 0)),
+            ('pool_wait_seconds_total', labels, stats.get('requests_wait_ms', 0) / 1000),
+            ('pool_timeouts_total', labels, stats.get('requests_errors', 0))
+        ]
+    registry.register_collector(collect)
+
+
+def watch_cache(cache_service):
+    """Hits/misses por camada e ocupação do L1 (sem tocar no Redis)"""
+    def collect():
+        counts = cache_service.counters()
+        local = cache_service.local.stats()
+        return [
+            ('cache_requests_total', {'result': 'l1'}, counts['hits_l1']),
+            ('cache_requests_total', {'result': 'l2'}, counts['hits_l2']),
+            ('cache_requests_total', {'result': 'wait'}, counts['hits_wait']),
+            ('cache_requests_total', {'result': 'miss'}, counts['misses']),
+            ('cache_local_entries', {}, local['entries']),
+            ('cache_local_bytes', {}, local['bytes']),
+            ('cache_local_evictions_total', {}, local['evictions'])
+        ]
+    registry.register_collector(collect)
+
+
+def render() -> str:
+    return registry.render(store.collect())
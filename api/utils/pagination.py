@@ -0,0 +1,170 @@
+"""
+Paginação do resultado de uma pergunta (modo janela da tabela virtual)
+
+O SQL renderizado vira subquery e só uma janela de linhas é buscada:
+- limit/offset: LIMIT/OFFSET simples
+- cursor: token opaco com o último valor da coluna de ordenação
+  (keyset: WHERE coluna >= último valor) e quantas linhas com esse mesmo
+  valor já foram entregues. O desempate usa a linha inteira como texto,
+  então a ordem é estável entre requests.
+
+O valor do cursor sai do banco como texto (coluna extra CURSOR_COLUMN): os
+typecasters do pool viram NUMERIC em float, e um float no cursor perderia
+precisão na fronteira da página (linhas puladas ou repetidas).
+"""
+
+import re
+import json
+import base64
+from typing import Any, Dict, List, Optional, Tuple
+
+_IDENTIFIER_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+_TRAILING_SEMICOLONS_RE = re.compile(r'[\s;]+$')
+
+# Valor exato da coluna de ordenação (::text), removido antes da resposta
+CURSOR_COLUMN = '_cursor_value'
+
+
+class QueryPaginator:
+    """Monta a janela paginada e o cursor da próxima página"""
+
+    def parse_sort(self, sort: Optional[str]) -> Tuple[Optional[str], bool]:
+        """
+        Coluna e direção da ordenação
+        Aceita 'coluna', 'coluna:desc' ou '-coluna'
+        """
+        if not sort:
+            return None, False
+
+        sort = str(sort).strip()
+        desc = sort.startswith('-')
+        column, _, direction = sort.lstrip('-').partition(':')
+        direction = direction.strip().lower()
+
+        if direction not in ('', 'asc', 'desc'):
+            raise ValueError(f"Direção '{direction}' inválida (use asc ou desc)")
+        if not _IDENTIFIER_RE.match(column):
+            raise ValueError(f"Coluna de ordenação inválida: '{column}'")
+        return column, desc or direction == 'desc'
+
+    def new_page(self, limit: int, offset: int = 0, cursor: Optional[str] = None,
+                 sort: Optional[str] = None, scope: str = '') -> Dict[str, Any]:
+        """
+        Estado da página pedida
+        scope amarra o cursor à pergunta + filtros que o geraram
+        """
+        column, desc = self.parse_sort(sort)
+        page = {
+            'limit': limit, 'offset': offset, 'scope': scope,
+            'sort': column, 'desc': desc, 'keyset': False, 'value': None, 'tie': 0
+        }
+        if not cursor:
+            return page
+
+        token = self.decode_cursor(cursor)
+        if token.get('q') != scope:
+            raise ValueError("Cursor não pertence a esta pergunta/filtros")
+        if column and (token.get('s'), bool(token.get('d'))) != (column, desc):
+            raise ValueError("Cursor gerado com outra ordenação")
+
+        page['sort'] = token.get('s')
+        page['desc'] = bool(token.get('d'))
+        if 'o' in token:
+            page['offset'] = int(token['o'])
+        else:
+            page.update({'keyset': True, 'offset': 0, 'value': token.get('v'), 'tie': int(token.get('t', 0))})
+        return page
+
+    def build_page(self, query_sql: str, params: List, page: Dict) -> Tuple[str, List]:
+        """
+        SQL da janela: busca limit + 1 linhas para saber se há próxima página
+        """
+        inner = _TRAILING_SEMICOLONS_RE.sub('', query_sql)
+        page_params = list(params)
+        select, where, order = '*', '', ''
+
+        if page['sort']:
+            column = f'"{page["sort"]}"'
+            select = f'pergunta.*, {column}::text AS "{CURSOR_COLUMN}"'
+            direction = 'DESC' if page['desc'] else 'ASC'
+            order = f"\nORDER BY {column} {direction} NULLS LAST, pergunta::text {direction}"
+
+            if page['keyset']:
+                if page['value'] is None:
+                    # Já está nos NULLs (sempre no fim)
+                    where = f"\nWHERE {column} IS NULL"
+                else:
+                    # Texto sem tipo: o PostgreSQL converte para o tipo da coluna
+                    operator = '<=' if page['desc'] else '>='
+                    where = f"\nWHERE ({column} {operator} %s OR {column} IS NULL)"
+                    page_params.append(page['value'])
+
+        skip = page['tie'] if page['keyset'] else page['offset']
+        sql = f"SELECT {select} FROM (\n{inner}\n) AS pergunta{where}{order}\nLIMIT %s OFFSET %s"
+        return sql, page_params + [page['limit'] + 1, skip]
+
+    def build_count(self, query_sql: str) -> str:
+        """SQL do total de linhas da pergunta com os filtros"""
+        inner = _TRAILING_SEMICOLONS_RE.sub('', query_sql)
+        return f"SELECT COUNT(*) FROM (\n{inner}\n) AS pergunta"
+
+    def next_cursor(self, page: Dict, cols: List[Dict], rows: List[List]) -> Optional[str]:
+        """Cursor da página seguinte (None quando não há mais linhas)"""
+        if not rows:
+            return None
+
+        token = {'q': page['scope']}
+        if page['sort']:
+            token.update({'s': page['sort'], 'd': int(page['desc'])})
+
+        names = [col['name'] for col in cols]
+        if not page['sort'] or page['sort'] not in names:
+            token['o'] = page['offset'] + len(rows)
+            return self.encode_cursor(token)
+
+        index = names.index(CURSOR_COLUMN if CURSOR_COLUMN in names else page['sort'])
+        last = rows[-1][index]
+        run = 0
+        for row in reversed(rows):
+            if row[index] != last:
+                break
+            run += 1
+
+        if run < len(rows):
+            tie = run
+        elif page['keyset']:
+            # Página inteira com o mesmo valor: soma ao empate anterior se for o mesmo valor
+            tie = page['tie'] + run if page['value'] == last else run
+        elif page['offset'] == 0:
+            tie = run
+        else:
+            # Página inteira com o mesmo valor após um offset: não dá para saber
+            # quantas linhas iguais vieram antes, continua por offset
+            token['o'] = page['offset'] + len(rows)
+            return self.encode_cursor(token)
+
+        token.update({'v': last, 't': tie})
+        return self.encode_cursor(token)
+
+    @staticmethod
+    def strip_cursor_column(cols: List[Dict], rows: List) -> Tuple[List[Dict], List]:
+        """Remove a coluna do cursor (sempre a última) antes de montar a resposta"""
+        if not cols or cols[-1]['name'] != CURSOR_COLUMN:
+            return cols, rows
+        return cols[:-1], [row[:-1] for row in rows]
+
+    @staticmethod
+    def encode_cursor(token: Dict) -> str:
+        data = json.dumps(token, separators=(',', ':'), default=str).encode('utf-8')
+        return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Dict:
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            token = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        except (ValueError, TypeError):
+            raise ValueError("Cursor inválido")
+        if not isinstance(token, dict):
+            raise ValueError("Cursor inválido")
+        return token
@@ -0,0 +1,125 @@
+"""
+Typecasters do psycopg2 para as conexões do pool
+
+O psycopg2 converte o texto do PostgreSQL em Decimal/date/datetime e
+depois cada célula voltava a ser float/string ISO em Python. Registrando
+os casts na conexão, NUMERIC já chega como float e datas já chegam como
+string ISO: as linhas vão direto do cursor para o JSON.
+
+O Arrow precisa dos tipos nativos (date32/timestamp): register_native_casts
+restaura os casts padrão só no cursor que gera o IPC stream.
+
+register_psycopg3_loaders faz o mesmo nas conexões do psycopg 3 (caminho
+assíncrono, opcional).
+"""
+
+import psycopg2.extensions as ext
+
+try:
+    from psycopg.adapt import Loader
+    PSYCOPG3_AVAILABLE = True
+except ImportError:
+    Loader = object
+    PSYCOPG3_AVAILABLE = False
+
+# OIDs do PostgreSQL
+NUMERIC_OID = 1700
+DATE_OID = 1082
+TIMESTAMP_OID = 1114
+TIMESTAMPTZ_OID = 1184
+NUMERIC_ARRAY_OID = 1231
+DATE_ARRAY_OID = 1182
+TIMESTAMP_ARRAY_OID = 1115
+TIMESTAMPTZ_ARRAY_OID = 1185
+
+
+def _cast_numeric(value, cursor):
+    # 'NaN' também vira float; o JSON do Metabase nunca teve Decimal
+    return float(value) if value is not None else None
+
+
+def _cast_date(value, cursor):
+    # Com DateStyle ISO o texto do PostgreSQL já é 'YYYY-MM-DD'
+    return value
+
+
+def _cast_timestamp(value, cursor):
+    # '2024-01-01 10:00:00' -> '2024-01-01T10:00:00' (mesmo separador do isoformat)
+    return value.replace(' ', 'T', 1) if value is not None else None
+
+
+def _cast_timestamptz(value, cursor):
+    # Offset só com horas ('-03') vira '-03:00' como no isoformat
+    if value is None:
+        return None
+    value = value.replace(' ', 'T', 1)
+    if len(value) > 3 and value[-3] in '+-':
+        value += ':00'
+    return value
+
+
+FLOAT_NUMERIC = ext.new_type((NUMERIC_OID,), 'MB_NUMERIC_FLOAT', _cast_numeric)
+ISO_DATE = ext.new_type((DATE_OID,), 'MB_DATE_ISO', _cast_date)
+ISO_TIMESTAMP = ext.new_type((TIMESTAMP_OID,), 'MB_TIMESTAMP_ISO', _cast_timestamp)
+ISO_TIMESTAMPTZ = ext.new_type((TIMESTAMPTZ_OID,), 'MB_TIMESTAMPTZ_ISO', _cast_timestamptz)
+
+JSON_CASTS = [
+    FLOAT_NUMERIC,
+    ISO_DATE,
+    ISO_TIMESTAMP,
+    ISO_TIMESTAMPTZ,
+    ext.new_array_type((NUMERIC_ARRAY_OID,), 'MB_NUMERIC_FLOAT[]', FLOAT_NUMERIC),
+    ext.new_array_type((DATE_ARRAY_OID,), 'MB_DATE_ISO[]', ISO_DATE),
+    ext.new_array_type((TIMESTAMP_ARRAY_OID,), 'MB_TIMESTAMP_ISO[]', ISO_TIMESTAMP),
+    ext.new_array_type((TIMESTAMPTZ_ARRAY_OID,), 'MB_TIMESTAMPTZ_ISO[]', ISO_TIMESTAMPTZ),
+]
+
+# Casts padrão do psycopg2 (Decimal, date, datetime)
+NATIVE_CASTS = [ext.DECIMAL, ext.PYDATE, ext.PYDATETIME, ext.PYDATETIMETZ]
+
+
+def register_json_casts(conn):
+    """Registra na conexão os casts prontos para JSON (chamado na criação da conexão)"""
+    with conn.cursor() as cursor:
+        # Os casts de data dependem do formato ISO na saída do PostgreSQL
+        cursor.execute("SET DateStyle TO ISO, YMD")
+    for caster in JSON_CASTS:
+        ext.register_type(caster, conn)
+
+
+def register_native_casts(cursor):
+    """Volta aos tipos Python nativos só neste cursor (ex: geração do Arrow)"""
+    for caster in NATIVE_CASTS:
+        ext.register_type(caster, cursor)
+
+
+# ----------------------------------------------------------------------
+# psycopg 3 (mesmas conversões, via loaders registrados na conexão)
+# ----------------------------------------------------------------------
+
+class _FloatLoader(Loader):
+    def load(self, data):
+        return float(bytes(data))
+
+
+class _IsoDateLoader(Loader):
+    def load(self, data):
+        return bytes(data).decode('ascii')
+
+
+class _IsoTimestampLoader(Loader):
+    def load(self, data):
+        return _cast_timestamp(bytes(data).decode('ascii'), None)
+
+
+class _IsoTimestamptzLoader(Loader):
+    def load(self, data):
+        return _cast_timestamptz(bytes(data).decode('ascii'), None)
+
+
+def register_psycopg3_loaders(conn):
+    """Registra os loaders prontos para JSON numa conexão psycopg 3 (arrays herdam do tipo base)"""
+    conn.adapters.register_loader('numeric', _FloatLoader)
+    conn.adapters.register_loader('date', _IsoDateLoader)
+    conn.adapters.register_loader('timestamp', _IsoTimestampLoader)
+    conn.adapters.register_loader('timestamptz', _IsoTimestamptzLoader)
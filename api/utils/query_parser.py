@@ -35,10 +35,15 @@ Casos especiais:
 """
 
 import re
+import hashlib
+import threading
+from collections import OrderedDict
 from typing import Dict, List, Any, Tuple, Optional
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from dateutil.relativedelta import relativedelta
 
+from api.utils.query_template import QueryTemplate
+
 class QueryParser:
     """Processa e transforma queries SQL"""
     
@@ -84,6 +89,122 @@ class QueryParser:
         'minutes': 'minutes'
     }
     
+    # Período que define quando um filtro de data relativo "vira" (o intervalo resolvido muda)
+    ROLLOVER_SPECIAL = {
+        'today': 'day', 'thisday': 'day', 'yesterday': 'day', 'tomorrow': 'day', 'alltime': 'day',
+        'thisweek': 'week', 'lastweek': 'week', 'nextweek': 'week',
+        'thismonth': 'month', 'lastmonth': 'month', 'nextmonth': 'month',
+        'thisquarter': 'quarter', 'lastquarter': 'quarter', 'nextquarter': 'quarter',
+        'thisyear': 'year', 'lastyear': 'year', 'nextyear': 'year'
+    }
+    
+    # Máximo de templates compilados mantidos em memória (LRU)
+    TEMPLATE_CACHE_SIZE = 256
+    
+    def __init__(self):
+        self._templates = OrderedDict()  # (question_id, revisão) -> QueryTemplate
+        self._templates_lock = threading.Lock()
+    
+    def render_query(self, question_id: int, query: str, filters: Dict[str, Any],
+                     revision: Optional[str] = None) -> Tuple[str, List]:
+        """
+        Substitui template tags usando o template compilado da pergunta
+        Mesmas regras de apply_filters, mas sem re-escanear o SQL a cada request
+        e com os valores dos filtros como parâmetros
+        
+        Retorna (sql com placeholders %s, lista de parâmetros)
+        """
+        template = self.get_template(question_id, query, revision)
+        query_processed, params = template.render(self._make_resolver(filters))
+        
+        print(f"🔧 Template {question_id}@{template.revision} renderizado "
+              f"({len(filters)} filtros, {len(params)} parâmetros)")
+        
+        return query_processed, params
+    
+    def get_template(self, question_id: int, query: str,
+                     revision: Optional[str] = None) -> QueryTemplate:
+        """Retorna o template compilado da pergunta, compilando na primeira vez"""
+        revision = revision or self.query_revision(query)
+        key = (question_id, revision)
+        
+        with self._templates_lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                return template
+        
+        template = QueryTemplate(query, revision)
+        print(f"🧩 Template compilado para pergunta {question_id}: "
+              f"{len(template.segments)} segmentos, tags {template.tags}")
+        
+        with self._templates_lock:
+            self._templates[key] = template
+            while len(self._templates) > self.TEMPLATE_CACHE_SIZE:
+                self._templates.popitem(last=False)
+        
+        return template
+    
+    @staticmethod
+    def query_revision(query: str) -> str:
+        """Hash do SQL da pergunta, usado como revisão do template"""
+        return hashlib.sha256(query.encode('utf-8')).hexdigest()[:16]
+    
+    def clear_templates(self):
+        """Descarta todos os templates compilados"""
+        with self._templates_lock:
+            self._templates.clear()
+    
+    def _make_resolver(self, filters: Dict[str, Any]):
+        """Cria o resolver de tags para um conjunto de filtros (memoizado por request)"""
+        resolved = ({}, {})  # (tags soltas, tags em bloco)
+        
+        def resolve(tag: str, in_block: bool) -> Optional[Tuple[str, List]]:
+            cache = resolved[in_block]
+            if tag in cache:
+                return cache[tag]
+            clause = cache[tag] = self._resolve_tag(tag, in_block, filters)
+            return clause
+        
+        return resolve
+    
+    def _resolve_tag(self, tag: str, in_block: bool,
+                     filters: Dict[str, Any]) -> Optional[Tuple[str, List]]:
+        """(cláusula, parâmetros) de uma tag - None quando não há filtro aplicável"""
+        # Field Filter especial: substituído em qualquer posição (EXISTS ou WHERE solto)
+        if tag == 'conversoes_consideradas':
+            values = filters.get(tag)
+            if not values:
+                return None
+            if isinstance(values, list):
+                return "action_type = ANY(%s)", [[str(v) for v in values]]
+            return "action_type = %s", [str(values)]
+        
+        # Demais tags só recebem valor dentro de [[AND {{tag}}]]
+        if not in_block:
+            return None
+        
+        # Aceita o nome do filtro ou o nome mapeado (ex: data -> {{date}})
+        for filter_name, value in filters.items():
+            if not value or filter_name == 'conversoes_consideradas':
+                continue
+            if filter_name == tag or self.FIELD_MAPPING.get(filter_name) == tag:
+                clause, params = self._build_sql_clause_params(filter_name, value)
+                return (clause, params) if clause else None
+        
+        return None
+    
+    def _build_conversoes_clause(self, values: Any) -> str:
+        """Cláusula de action_type para o filtro conversoes_consideradas"""
+        if not values:
+            return ""
+        
+        if isinstance(values, list):
+            formatted_values = ", ".join(f"'{self._escape_sql_value(v)}'" for v in values)
+            return f"action_type IN ({formatted_values})"
+        
+        # Valor único
+        return f"action_type = '{self._escape_sql_value(values)}'"
 
     def apply_filters(self, query: str, filters: Dict[str, Any]) -> str:
         """Substitui template tags pelos valores dos filtros"""
@@ -101,12 +222,7 @@ class QueryParser:
             conversoes_values = filters.get('conversoes_consideradas')
             if conversoes_values:
                 # Se tem valores, processa normalmente
-                if isinstance(conversoes_values, list):
-                    formatted_values = ", ".join(f"'{self._escape_sql_value(v)}'" for v in conversoes_values)
-                    replacement = f"action_type IN ({formatted_values})"
-                else:
-                    # Valor único
-                    replacement = f"action_type = '{self._escape_sql_value(conversoes_values)}'"
+                replacement = self._build_conversoes_clause(conversoes_values)
                 
                 # Substitui {{conversoes_consideradas}} dentro do bloco EXISTS
                 query_processed = query_processed.replace('{{conversoes_consideradas}}', replacement)
@@ -200,6 +316,90 @@ class QueryParser:
             escaped_value = self._escape_sql_value(value)
             return f"{sql_field} = '{escaped_value}'"
     
+    def _build_sql_clause_params(self, field: str, value: Any) -> Tuple[str, List]:
+        """
+        Constrói cláusula SQL parametrizada para um filtro
+        Valores vão como parâmetros (%s); listas viram = ANY(%s) com array
+        """
+        if not value:
+            return "", []
+        
+        # Mapeamento de campos para colunas SQL
+        sql_field = self.FIELD_MAPPING.get(field, field)
+        
+        # Tratamento especial para filtros de data
+        if field == 'data':
+            return self._build_date_clause_params(sql_field, value)
+        
+        if isinstance(value, list):
+            # Múltiplos valores - array único mantém o SQL igual para qualquer quantidade
+            return f"{sql_field} = ANY(%s)", [[str(v) for v in value]]
+        
+        # Valor único
+        return f"{sql_field} = %s", [str(value)]
+    
+    def filters_rollover(self, filters: Dict[str, Any],
+                         now: Optional[datetime] = None) -> Optional[datetime]:
+        """
+        Quando o filtro de data relativo passa a resolver para outro intervalo
+        (None se não há filtro relativo). Usado para alinhar o TTL do cache.
+        """
+        value = filters.get('data')
+        if not value or not isinstance(value, str):
+            return None
+        
+        period = self._rollover_period(value.lower().strip())
+        if period is None:
+            return None
+        
+        now = now or datetime.now()
+        midnight = datetime.combine(now.date(), datetime.min.time())
+        if period == 'day':
+            return midnight + timedelta(days=1)
+        if period == 'week':
+            # Semanas de domingo a sábado: vira no próximo domingo
+            return midnight + timedelta(days=(6 - now.weekday()) % 7 or 7)
+        
+        month_start = midnight.replace(day=1)
+        if period == 'month':
+            return month_start + relativedelta(months=1)
+        if period == 'quarter':
+            quarter_start = month_start.replace(month=(now.month - 1) // 3 * 3 + 1)
+            return quarter_start + relativedelta(months=3)
+        return month_start.replace(month=1) + relativedelta(years=1)
+    
+    def date_filter_range(self, filters: Dict[str, Any]) -> Optional[Tuple[date, date]]:
+        """
+        Intervalo fechado (início, fim) do filtro de data, já resolvido
+        None sem filtro de data ou com intervalo aberto (~, data~, ~data)
+        """
+        value = filters.get('data')
+        if not value or not isinstance(value, str):
+            return None
+
+        condition = self._parse_date_filter(value)
+        if not condition or condition[0] not in ('=', 'BETWEEN'):
+            return None
+
+        try:
+            dates = [date.fromisoformat(str(d).strip()[:10]) for d in condition[1]]
+        except ValueError:
+            return None
+        return dates[0], dates[-1]
+
+    def _rollover_period(self, value: str) -> Optional[str]:
+        """Período do filtro relativo ('day', 'week', ...) ou None para datas absolutas"""
+        if value == '~':
+            return 'day'   # tudo até hoje
+        if value in self.ROLLOVER_SPECIAL:
+            return self.ROLLOVER_SPECIAL[value]
+        
+        match = re.match(r'^(?:past|last|next|previous)\d+(day|week|month|quarter|year|hour|minute)s?~?$', value)
+        if not match:
+            return None
+        # Horas e minutos são truncados para a data: viram à meia-noite
+        return 'day' if match.group(1) in ('hour', 'minute') else match.group(1)
+    
     def _parse_relative_date(self, value: str) -> Optional[Tuple[datetime, datetime]]:
         """
         Parse dinâmico de filtros relativos de data
@@ -590,10 +790,35 @@ class QueryParser:
     
     def _build_date_clause(self, sql_field: str, value: str) -> str:
         """Constrói cláusula SQL para filtros de data"""
+        condition = self._parse_date_filter(value)
+        if not condition:
+            return ""
+        
+        operator, dates = condition
+        if operator == 'BETWEEN':
+            return f"{sql_field} BETWEEN '{dates[0]}' AND '{dates[1]}'"
+        return f"{sql_field} {operator} '{dates[0]}'"
+    
+    def _build_date_clause_params(self, sql_field: str, value: str) -> Tuple[str, List]:
+        """Versão parametrizada de _build_date_clause: (cláusula com %s, valores)"""
+        condition = self._parse_date_filter(value)
+        if not condition:
+            return "", []
+        
+        operator, dates = condition
+        if operator == 'BETWEEN':
+            return f"{sql_field} BETWEEN %s AND %s", dates
+        return f"{sql_field} {operator} %s", dates
+    
+    def _parse_date_filter(self, value: str) -> Optional[Tuple[str, List[str]]]:
+        """
+        Interpreta o valor de um filtro de data
+        Retorna (operador, datas) - operador é '=', '<=', '>=' ou 'BETWEEN' - ou None
+        """
         
         # Se valor é None ou vazio, retorna vazio
         if not value:
-            return ""
+            return None
         
         # Converte para string se necessário
         value = str(value).strip()
@@ -604,13 +829,13 @@ class QueryParser:
             start_date, end_date = date_range
             
             if start_date == end_date:
-                return f"{sql_field} = '{start_date}'"
+                return '=', [str(start_date)]
             else:
-                return f"{sql_field} BETWEEN '{start_date}' AND '{end_date}'"
+                return 'BETWEEN', [str(start_date), str(end_date)]
         
         # Verifica se é apenas ~ (tudo até hoje)
         elif value == "~":
-            return f"{sql_field} <= '{datetime.now().date()}'"
+            return '<=', [str(datetime.now().date())]
         
         # Verifica se é um range (formato: data1~data2)
         elif "~" in value and not value.endswith('~'):
@@ -622,21 +847,21 @@ class QueryParser:
                 
                 # Se alguma data estiver vazia, ignora
                 if date1 and date2:
-                    return f"{sql_field} BETWEEN '{date1}' AND '{date2}'"
+                    return 'BETWEEN', [date1, date2]
                 elif date1:
-                    return f"{sql_field} >= '{date1}'"
+                    return '>=', [date1]
                 elif date2:
-                    return f"{sql_field} <= '{date2}'"
+                    return '<=', [date2]
         
         # Verifica se é uma data única (formato: YYYY-MM-DD)
         elif re.match(r'^\d{4}-\d{2}-\d{2}$', value):
-            return f"{sql_field} = '{value}'"
+            return '=', [value]
         
         # Verifica se é formato especial do Metabase (ex: "2024-01-01T00:00:00")
         elif re.match(r'^\d{4}-\d{2}-\d{2}T', value):
             # Extrai apenas a data
             date_part = value.split('T')[0]
-            return f"{sql_field} = '{date_part}'"
+            return '=', [date_part]
         
         # Verifica se é um range com formato especial (ex: "between:2024-01-01~2024-01-31")
         elif value.startswith("between:"):
@@ -644,13 +869,15 @@ class QueryParser:
             if "~" in range_part:
                 dates = range_part.split("~")
                 if len(dates) == 2:
-                    return f"{sql_field} BETWEEN '{dates[0]}' AND '{dates[1]}'"
+                    return 'BETWEEN', [dates[0], dates[1]]
         
         # Formato não reconhecido
         else:
             print(f"   ⚠️ Formato de data não reconhecido: {value}")
             # NÃO usa o valor diretamente para evitar erros SQL
-            return ""
+            return None
+        
+        return None
     
     def _escape_sql_value(self, value: str) -> str:
         """Escapa valor para prevenir SQL injection"""
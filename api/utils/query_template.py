@@ -0,0 +1,142 @@
+"""
+Templates compilados para queries nativas do Metabase
+
+O SQL de cada pergunta é quebrado uma única vez em segmentos:
+- texto literal
+- tags {{tag}}
+- blocos opcionais [[...]] (texto + tags)
+
+A renderização percorre a lista de segmentos uma vez, pedindo a cláusula
+de cada tag a um resolver, sem re-escanear o SQL com regex a cada request.
+O SQL gerado usa placeholders %s (estilo psycopg2): o texto literal tem
+'%' escapado como '%%' já na compilação.
+"""
+
+import re
+from typing import Callable, List, Optional, Tuple
+
+# Tipos de segmento
+TEXT = 0
+TAG = 1
+OPTIONAL = 2
+
+_TOKEN_RE = re.compile(r'\[\[|\]\]|\{\{\s*([^}]+?)\s*\}\}')
+_BLANK_LINES_RE = re.compile(r'\n\s*\n')
+_ENDS_WITH_WHERE_RE = re.compile(r'\bWHERE\s+$', re.IGNORECASE)
+
+# resolver(tag, dentro_de_bloco_opcional) -> (cláusula com %s, parâmetros) ou None
+Resolver = Callable[[str, bool], Optional[Tuple[str, List]]]
+
+
+class QueryTemplate:
+    """SQL do Metabase compilado em segmentos"""
+
+    __slots__ = ('segments', 'tags', 'revision')
+
+    def __init__(self, query: str, revision: str = ''):
+        self.revision = revision
+        self.segments = self._compile(query)
+        self.tags = self._collect_tags(self.segments)
+
+    @staticmethod
+    def _compile(query: str) -> List[Tuple]:
+        """
+        Quebra o SQL em segmentos (uma única passada)
+        Cada segmento é (tipo, valor, fallback); fallback é o texto usado por
+        uma tag solta sem valor (1=1 logo após WHERE, senão vazio)
+        """
+        segments = []
+        block = None      # segmentos do bloco [[...]] aberto
+        pos = 0
+
+        for match in _TOKEN_RE.finditer(query):
+            target = block if block is not None else segments
+            if match.start() > pos:
+                target.append((TEXT, _escape(query[pos:match.start()]), None))
+            pos = match.end()
+
+            token = match.group(0)
+            if token == '[[':
+                if block is not None:
+                    # Metabase não aceita blocos aninhados: trata como texto
+                    block.append((TEXT, token, None))
+                else:
+                    block = []
+            elif token == ']]':
+                if block is None:
+                    segments.append((TEXT, token, None))
+                else:
+                    segments.append((OPTIONAL, tuple(block), None))
+                    block = None
+            else:
+                after_where = bool(target) and target[-1][0] == TEXT and \
+                    _ENDS_WITH_WHERE_RE.search(target[-1][1]) is not None
+                target.append((TAG, match.group(1), '1=1' if after_where else ''))
+
+        target = block if block is not None else segments
+        if pos < len(query):
+            target.append((TEXT, _escape(query[pos:]), None))
+
+        if block is not None:
+            # Bloco sem fechamento: mantém o texto original
+            segments.append((TEXT, '[[', None))
+            segments.extend(block)
+
+        return segments
+
+    @staticmethod
+    def _collect_tags(segments: List[Tuple]) -> List[str]:
+        tags = []
+        for kind, value, _ in segments:
+            if kind == TAG:
+                tags.append(value)
+            elif kind == OPTIONAL:
+                tags.extend(v for k, v, _ in value if k == TAG)
+        return list(dict.fromkeys(tags))
+
+    def render(self, resolve: Resolver) -> Tuple[str, List]:
+        """
+        Renderiza o SQL final e a lista de parâmetros
+        - Bloco opcional só entra se todas as suas tags tiverem cláusula
+        - Tag solta sem valor some; logo após WHERE vira 1=1
+        """
+        out = []
+        params = []
+        append = out.append
+
+        for kind, value, fallback in self.segments:
+            if kind == TEXT:
+                append(value)
+
+            elif kind == TAG:
+                resolved = resolve(value, False)
+                if resolved:
+                    append(resolved[0])
+                    params.extend(resolved[1])
+                else:
+                    append(fallback)
+
+            else:
+                parts = []
+                block_params = []
+                for part_kind, part, _ in value:
+                    if part_kind == TEXT:
+                        parts.append(part)
+                        continue
+                    resolved = resolve(part, True)
+                    if not resolved:
+                        parts = None
+                        break
+                    parts.append(resolved[0])
+                    block_params.extend(resolved[1])
+                if parts:
+                    out.extend(parts)
+                    params.extend(block_params)
+
+        # Remove linhas que ficaram vazias com os blocos removidos
+        return _BLANK_LINES_RE.sub('\n', ''.join(out)), params
+
+
+def _escape(text: str) -> str:
+    """Escapa '%' literal para uso com placeholders %s"""
+    return text.replace('%', '%%')
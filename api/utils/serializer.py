@@ -0,0 +1,61 @@
+"""
+Serialização JSON das respostas e do cache
+
+orjson (opcional) serializa direto para bytes e entende date/datetime
+nativamente; sem ele, usa o json da stdlib com a mesma saída compacta.
+Decimal vira float nos dois (mesmo formato que o Metabase devolve).
+O backend vem de JSON_SERIALIZER (auto | orjson | json).
+"""
+
+import json
+from decimal import Decimal
+from datetime import date, datetime, time
+from typing import Any, Callable, Dict, Tuple
+
+from config.settings import PERFORMANCE_CONFIG
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+
+def _default(value: Any) -> Any:
+    """Tipos que nenhum dos backends serializa sozinho"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).decode('utf-8', 'replace')
+    return str(value)
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, default=_default).encode('utf-8')
+
+
+def _orjson_dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+BACKENDS: Dict[str, Tuple[Callable[[Any], bytes], Callable[[Any], Any]]] = {
+    'json': (_json_dumps, json.loads),
+}
+if ORJSON_AVAILABLE:
+    BACKENDS['orjson'] = (_orjson_dumps, orjson.loads)
+
+
+def _select_backend(name: str) -> str:
+    if name == 'auto':
+        return 'orjson' if ORJSON_AVAILABLE else 'json'
+    if name not in BACKENDS:
+        print(f"⚠️ Serializer '{name}' indisponível, usando json da stdlib")
+        return 'json'
+    return name
+
+
+BACKEND = _select_backend(PERFORMANCE_CONFIG['json_serializer'])
+dumps, loads = BACKENDS[BACKEND]
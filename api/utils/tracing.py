@@ -0,0 +1,173 @@
+"""
+Tempo por etapa de cada request (Server-Timing + trace em JSON lines)
+
+Cada request de /api/query abre um Trace com um request id; as etapas
+(card do Metabase, renderização, pool, execução, fetch, JSON, gzip...)
+somam a duração em spans nomeados. No fim os tempos vão no header
+Server-Timing (aparece no DevTools do navegador) e, com TRACE_LOG_FILE,
+numa linha JSON por request.
+
+O trace atual fica num ContextVar: vale por thread (Flask) e por task
+(asyncio). Fora de um request (warm-up, refresher) span() não faz nada.
+O mesmo id vai para o application_name da conexão do PostgreSQL, para
+achar a query em pg_stat_activity.
+"""
+
+import re
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Optional
+
+from config.settings import TRACE_CONFIG
+
+_current: ContextVar = ContextVar('metabase_trace', default=None)
+
+# Ids recebidos em X-Request-ID: só caracteres seguros em header, log e application_name
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# application_name do PostgreSQL é truncado em 63 bytes
+APPLICATION_NAME_MAX = 63
+
+
+class Trace:
+    """Spans de um request: nome -> [segundos somados, ocorrências]"""
+
+    def __init__(self, request_id: str, name: str = ''):
+        self.request_id = request_id
+        self.name = name
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.spans: Dict[str, list] = OrderedDict()
+        self.attrs: Dict = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            entry = self.spans.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def server_timing(self) -> str:
+        """Valor do header Server-Timing (ms com uma casa, total no fim)"""
+        with self._lock:
+            parts = [f"{name};dur={seconds * 1000:.1f}" for name, (seconds, _) in self.spans.items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ', '.join(parts)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            spans = {name: {'ms': round(seconds * 1000, 2), 'count': count}
+                     for name, (seconds, count) in self.spans.items()}
+        return {
+            'ts': datetime.fromtimestamp(self.started_at).isoformat(timespec='milliseconds'),
+            'request_id': self.request_id,
+            'name': self.name,
+            'total_ms': round(self.elapsed() * 1000, 2),
+            'spans': spans,
+            **self.attrs
+        }
+
+
+def new_request_id(incoming: Optional[str] = None) -> str:
+    """Reaproveita o X-Request-ID do cliente/proxy se for seguro, senão gera um"""
+    if incoming and _REQUEST_ID_RE.match(incoming):
+        return incoming
+    return uuid.uuid4().hex[:16]
+
+
+def start(name: str = '', request_id: Optional[str] = None):
+    """Abre o trace do request atual; retorna (trace, token para finish)"""
+    trace = Trace(new_request_id(request_id), name)
+    return trace, _current.set(trace)
+
+
+def finish(token):
+    _current.reset(token)
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str):
+    """Soma o tempo do bloco no span do trace atual (sem trace: nada)"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - start_time)
+
+
+def record(name: str, seconds: float):
+    """Registra um tempo já medido (ex: compressão cronometrada pelo próprio código)"""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+def annotate(**attrs):
+    """Campos extras da linha do trace (ex: question_id)"""
+    trace = _current.get()
+    if trace is not None:
+        trace.attrs.update(attrs)
+
+
+def application_name() -> str:
+    """application_name da conexão: base + request id do trace atual"""
+    base = TRACE_CONFIG['application_name']
+    trace = _current.get()
+    if trace is None:
+        return base[:APPLICATION_NAME_MAX]
+    return f"{base} {trace.request_id}"[:APPLICATION_NAME_MAX]
+
+
+def apply_headers(response, trace: Trace):
+    """Server-Timing e X-Request-ID na Response (tempos até aqui; streaming segue só no log)"""
+    response.headers['Server-Timing'] = trace.server_timing()
+    # Sem isso o navegador esconde o Server-Timing de páginas em outra origem (iframes)
+    response.headers['Timing-Allow-Origin'] = '*'
+    response.headers['X-Request-ID'] = trace.request_id
+    trace.attrs.update({
+        'status': response.status_code,
+        'cache': response.headers.get('X-Cache'),
+        'streaming': response.headers.get('X-Streaming') == 'true'
+    })
+
+
+class TraceLog:
+    """Arquivo JSON lines com um trace por request (TRACE_LOG_FILE)"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = TRACE_CONFIG['log_file'] if path is None else path
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def write(self, trace: Trace):
+        if not self.path:
+            return
+        line = json.dumps(trace.to_dict(), ensure_ascii=False, default=str)
+        try:
+            with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        except OSError as e:
+            print(f"⚠️ Erro ao gravar trace: {e}")
+
+
+trace_log = TraceLog()
@@ -0,0 +1,54 @@
+"""
+Warm-up do cache pela linha de comando (cron / fim da carga de dados)
+
+Usa as combinações mais acessadas registradas no Redis pelos workers da
+API e renova o corpo em cache no Redis (L2); os workers passam a
+encontrá-lo na primeira leitura. Sem Redis, só faz sentido a chamada
+HTTP: POST /api/debug/warmup.
+
+Execute com:
+    python -m api.warmup                 # renova tudo das mais acessadas
+    python -m api.warmup --expiring      # só o que venceria antes da próxima rodada
+    python -m api.warmup --question 51 --filters '{"data": "past7days~"}'
+"""
+
+import argparse
+import json
+import sys
+import os
+
+# Adiciona o diretório raiz ao path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.services.query_service import QueryService
+from api.services.warmup_service import WarmupService
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Renova o cache das combinações mais acessadas')
+    parser.add_argument('--top', type=int, help='quantas combinações (padrão: WARMUP_TOP_N)')
+    parser.add_argument('--expiring', action='store_true',
+                        help='só renova entradas perto de expirar')
+    parser.add_argument('--question', type=int, help='aquece uma pergunta específica')
+    parser.add_argument('--filters', default='{}', help='filtros da pergunta em JSON')
+    args = parser.parse_args(argv)
+
+    query_service = QueryService()
+    try:
+        if args.question:
+            result = query_service.warm_query(args.question, json.loads(args.filters))
+            print(f"🔥 Pergunta {args.question}: {result}")
+            return 0
+
+        warmup = WarmupService(query_service)
+        if not warmup.redis:
+            print("⚠️ Redis indisponível: as contagens ficam em cada worker, use POST /api/debug/warmup")
+            return 1
+        summary = warmup.run_once(force=not args.expiring, limit=args.top)
+        return 0 if summary.get('erro', 0) == 0 else 1
+    finally:
+        query_service.close_pool()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
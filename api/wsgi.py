@@ -0,0 +1,15 @@
+"""
+Entrada WSGI da API para produção
+
+Execute com: gunicorn -c gunicorn.conf.py api.wsgi:app
+"""
+
+import sys
+import os
+
+# Adiciona o diretório raiz ao path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.server import create_app
+
+app = create_app()
@@ -33,7 +33,11 @@ const CHART_CONFIG = {
     // Configurações de agregação
     aggregation: {
         // Formato de data para agrupamento (não alterar)
-        dateFormat: 'YYYY-MM'
+        dateFormat: 'YYYY-MM',
+        
+        // Agrega mês × conta no PostgreSQL (/api/query/aggregate)
+        // em vez de baixar as linhas brutas e somar no navegador
+        serverSide: true
     },
     
     // Timeout para requisições
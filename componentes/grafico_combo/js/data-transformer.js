@@ -163,8 +163,11 @@ class DataTransformer {
                 
                 // Inicializar estrutura se necessário
                 if (!aggregated[dateStr]) {
+                    // Data local do mês: new Date('2025-06-01') é UTC e no fuso
+                    // do Brasil cairia em maio (o /aggregate sempre devolve o dia 1)
+                    const [year, month] = dateStr.split('-').map(Number);
                     aggregated[dateStr] = {
-                        date: new Date(dateValue),
+                        date: new Date(year, month - 1, 1),
                         accounts: {},
                         totals: { impressions: 0, clicks: 0, spend: 0 }
                     };
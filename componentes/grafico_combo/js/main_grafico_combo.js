@@ -14,7 +14,9 @@ class ChartApp {
         
         // Tentar carregar APIClient
         try {
-            if (typeof APIClient !== 'undefined') {
+            if (typeof MetabaseAPIClient !== 'undefined') {
+                this.apiClient = new MetabaseAPIClient();
+            } else if (typeof APIClient !== 'undefined') {
                 this.apiClient = new APIClient();
             } else if (typeof ApiClient !== 'undefined') {
                 this.apiClient = new ApiClient();
@@ -196,6 +198,24 @@ class ChartApp {
         return id;
     }
 
+    /**
+     * Parâmetros do /api/query/aggregate (null quando a agregação é feita no navegador)
+     * Os aliases são os próprios nomes de columnMapping, então o DataTransformer
+     * lê as colunas agregadas com o mesmo mapeamento das linhas brutas
+     */
+    getAggregationParams() {
+        const config = window.CHART_CONFIG || {};
+        if (!config.aggregation?.serverSide) {
+            return null;
+        }
+
+        const cols = config.columnMapping;
+        return {
+            group_by: `${cols.date}:month,${cols.account}`,
+            measures: `sum:${cols.impressions},sum:${cols.clicks},sum:${cols.spend},count`
+        };
+    }
+
     /**
      * Inicializa a aplicação
      */
@@ -301,16 +321,22 @@ class ChartApp {
             
             let response;
             
+            // Com agregação no servidor o PostgreSQL devolve só mês × conta
+            const aggregation = this.getAggregationParams();
+
             // Tentar usar APIClient se disponível, senão usar fetch direto
-            if (this.apiClient && this.apiClient.query) {
+            if (aggregation && this.apiClient && this.apiClient.queryAggregate) {
+                response = await this.apiClient.queryAggregate(this.questionId, filters, aggregation);
+            } else if (!aggregation && this.apiClient && this.apiClient.query) {
                 response = await this.apiClient.query(params);
             } else {
                 console.warn('[ChartApp] APIClient não disponível, usando fetch direto');
                 
                 // Construir URL com parâmetros
-                const baseUrl = 'https://metabasedashboards.ngrok.io/metabase_customizacoes/api/query';
+                const baseUrl = 'https://metabasedashboards.ngrok.io/metabase_customizacoes/api/query' +
+                    (aggregation ? '/aggregate' : '');
                 const url = new URL(baseUrl);
-                Object.entries(params).forEach(([key, value]) => {
+                Object.entries({ ...params, ...aggregation }).forEach(([key, value]) => {
                     if (value !== undefined && value !== null && value !== '') {
                         url.searchParams.append(key, value);
                     }
@@ -338,8 +364,11 @@ class ChartApp {
                 throw new Error('Resposta inválida da API');
             }
 
-            // Armazenar total de linhas
-            const totalRows = response.row_count || response.data?.rows?.length || 0;
+            // Armazenar total de linhas (agregado: soma a contagem de linhas de cada grupo)
+            const countIdx = (response.data.cols || []).findIndex(col => col.name === 'count');
+            const totalRows = countIdx >= 0
+                ? response.data.rows.reduce((total, row) => total + (Number(row[countIdx]) || 0), 0)
+                : (response.row_count || response.data?.rows?.length || 0);
 
             // Transformar dados com medição de tempo
             const transformStartTime = Date.now();
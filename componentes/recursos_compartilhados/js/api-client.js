@@ -110,6 +110,89 @@ class MetabaseAPIClient {
     }
   }
   
+  /**
+   * Busca uma janela de linhas (modo paginado)
+   * @param {string|number} questionId - ID da pergunta
+   * @param {Object} filters - Filtros a aplicar
+   * @param {Object} page - { limit, offset } ou { limit, cursor }; sort opcional ('coluna' ou '-coluna')
+   * @returns {Promise<Object>} Dados da janela + page.total_count e page.next_cursor
+   */
+  async queryPage(questionId, filters = {}, page = {}) {
+    const url = new URL(`${this.baseUrl}/api/query`);
+    url.searchParams.append('question_id', questionId);
+
+    ['limit', 'offset', 'cursor', 'sort'].forEach(key => {
+      if (page[key] !== undefined && page[key] !== null && page[key] !== '') {
+        url.searchParams.append(key, page[key]);
+      }
+    });
+
+    Object.entries(filters).forEach(([key, value]) => {
+      if (Array.isArray(value)) {
+        value.forEach(v => url.searchParams.append(key, v));
+      } else if (value !== null && value !== undefined && value !== '') {
+        url.searchParams.append(key, value);
+      }
+    });
+
+    this.stats.requests++;
+    const response = await fetch(url.toString(), {
+      headers: { 'Accept': 'application/json' },
+      credentials: 'same-origin'
+    });
+
+    if (!response.ok) {
+      throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+    }
+
+    const data = await response.json();
+    console.log(`📄 Janela: ${data.data.rows.length} de ${data.page.total_count} linhas`);
+    return data;
+  }
+
+  /**
+   * Busca dados já agregados no PostgreSQL (/api/query/aggregate)
+   * @param {string|number} questionId - ID da pergunta
+   * @param {Object} filters - Filtros a aplicar
+   * @param {Object} aggregation - { group_by: 'date:month,account_name', measures: 'sum:impressions,count' }
+   * @returns {Promise<Object>} Mesmo formato do /api/query, uma linha por grupo
+   */
+  async queryAggregate(questionId, filters = {}, aggregation = {}) {
+    const url = new URL(`${this.baseUrl}/api/query/aggregate`);
+    url.searchParams.append('question_id', questionId);
+
+    ['group_by', 'measures'].forEach(key => {
+      if (aggregation[key]) {
+        url.searchParams.append(key, aggregation[key]);
+      }
+    });
+
+    Object.entries(filters).forEach(([key, value]) => {
+      if (Array.isArray(value)) {
+        value.forEach(v => url.searchParams.append(key, v));
+      } else if (value !== null && value !== undefined && value !== '') {
+        url.searchParams.append(key, value);
+      }
+    });
+
+    this.stats.requests++;
+    const response = await fetch(url.toString(), {
+      headers: { 'Accept': 'application/json' },
+      credentials: 'same-origin'
+    });
+
+    if (!response.ok) {
+      throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+    }
+
+    const data = await response.json();
+    if (!data || !data.data || !data.data.rows) {
+      throw new Error('Resposta inválida da API');
+    }
+    console.log(`📊 Agregado: ${data.data.rows.length} grupos (${data.data.cols.length} colunas)`);
+    return data;
+  }
+
   /**
    * Gera chave única para cache
    * @private
@@ -4,6 +4,7 @@ Carrega variáveis de ambiente e define defaults
 """
 
 import os
+import json
 from pathlib import Path
 
 # Carrega config/.env via loader isolado por branch
@@ -17,7 +18,21 @@ _spec.loader.exec_module(_mod)
 METABASE_CONFIG = {
     'url': os.getenv('METABASE_URL', 'http://localhost:3000'),
     'username': os.getenv('METABASE_USERNAME'),
-    'password': os.getenv('METABASE_PASSWORD')
+    'password': os.getenv('METABASE_PASSWORD'),
+    # Conexões keep-alive por processo e backoff entre retentativas (API_MAX_RETRIES)
+    'pool_size': int(os.getenv('METABASE_POOL_SIZE', '10')),
+    'retry_backoff': float(os.getenv('METABASE_RETRY_BACKOFF', '0.5'))
+}
+
+# Cache dos cards do Metabase (SQL das perguntas)
+CARD_CACHE_CONFIG = {
+    # Depois do TTL o card continua servido e é revalidado em segundo plano
+    'ttl': int(os.getenv('CARD_CACHE_TTL', '300')),
+    'max_entries': int(os.getenv('CARD_CACHE_MAX_ENTRIES', '256')),
+    # Intervalo do refresher (prefetch dos dashboards + revalidação)
+    'refresh_interval': int(os.getenv('CARD_REFRESH_INTERVAL', '60')),
+    # Dashboards cujos cards são pré-carregados (ex: "3,7")
+    'dashboard_ids': [int(d) for d in os.getenv('METABASE_DASHBOARD_IDS', '').split(',') if d.strip()]
 }
 
 
@@ -34,6 +49,13 @@ DATABASE_CONFIG = {
 # Schema separado (não é parte da conexão)
 DB_SCHEMA = os.getenv('DB_SCHEMA', 'road')
 
+# Parâmetros de sessão dos dois caminhos (Flask e ASGI): mesma pergunta, mesmo plano
+SESSION_SETTINGS = {
+    'search_path': f"{DB_SCHEMA}, public",
+    'work_mem': os.getenv('WORK_MEM', '256MB'),
+    'random_page_cost': '1.1'
+}
+
 
 
 # Redis Configuration
@@ -54,13 +76,139 @@ API_CONFIG = {
 # Cache Configuration
 CACHE_CONFIG = {
     'enabled': os.getenv('CACHE_ENABLED', 'true').lower() == 'true',
-    'ttl': int(os.getenv('CACHE_TTL', '300'))
+    'ttl': int(os.getenv('CACHE_TTL', '300')),
+    # L1 em memória (por processo): total e tamanho máximo de uma resposta
+    'local_max_bytes': int(os.getenv('CACHE_LOCAL_MAX_MB', '256')) * 1024 * 1024,
+    'local_max_entry_bytes': int(os.getenv('CACHE_LOCAL_MAX_ENTRY_MB', '32')) * 1024 * 1024,
+    # Quanto um worker espera outro preencher a mesma chave (lock no Redis)
+    'fill_lock_timeout': float(os.getenv('CACHE_FILL_LOCK_TIMEOUT', '120'))
+}
+
+# Warm-up do cache com as combinações (pergunta, filtros) mais acessadas
+WARMUP_CONFIG = {
+    'enabled': os.getenv('WARMUP_ENABLED', 'false').lower() == 'true',
+    # A cada N segundos renova o que expiraria antes da próxima rodada (0 = desligado)
+    'interval': int(os.getenv('WARMUP_INTERVAL', '240')),
+    # Horários fixos (HH:MM, horário local) em que tudo é reexecutado, ex: "06:30,12:00"
+    'times': [t.strip() for t in os.getenv('WARMUP_AT', '').split(',') if t.strip()],
+    'top_n': int(os.getenv('WARMUP_TOP_N', '20')),
+    'min_hits': int(os.getenv('WARMUP_MIN_HITS', '2')),
+    # Queries de warm-up em paralelo e conexões do pool sempre livres para requests
+    'concurrency': int(os.getenv('WARMUP_CONCURRENCY', '2')),
+    'pool_reserve': int(os.getenv('WARMUP_POOL_RESERVE', '5')),
+    'max_tracked': int(os.getenv('WARMUP_MAX_TRACKED', '1000')),
+    # Contagens multiplicadas por este fator a cada rodada (tráfego antigo perde peso)
+    'decay': float(os.getenv('WARMUP_DECAY', '0.5'))
+}
+
+# Cache incremental por dia (perguntas com uma linha por data, ver incremental_cache.py)
+INCREMENTAL_CACHE_CONFIG = {
+    # Perguntas habilitadas (ex: "51,52"); vazio = desligado
+    'questions': [int(q) for q in os.getenv('INCREMENTAL_QUESTION_IDS', '').split(',') if q.strip()],
+    # Coluna do resultado com a data de cada linha
+    'date_column': os.getenv('INCREMENTAL_DATE_COLUMN', 'date'),
+    # Dias fechados ficam em cache por este tempo; os últimos RECENT_DAYS seguem o CACHE_TTL
+    'day_ttl': int(os.getenv('INCREMENTAL_DAY_TTL', '86400')),
+    'recent_days': int(os.getenv('INCREMENTAL_RECENT_DAYS', '3')),
+    # Intervalos maiores que isso executam a pergunta inteira
+    'max_days': int(os.getenv('INCREMENTAL_MAX_DAYS', '400'))
+}
+
+# Servidor de produção (gunicorn.conf.py)
+SERVER_CONFIG = {
+    'bind': os.getenv('SERVER_BIND', f"0.0.0.0:{os.getenv('API_PORT', '3500')}"),
+    # Cada worker tem o próprio pool: workers × MAX_POOL_SIZE <= max_connections do PostgreSQL
+    'workers': int(os.getenv('WEB_CONCURRENCY', str(min(os.cpu_count() or 1, 4)))),
+    # gthread: requests presos no banco não bloqueiam o heartbeat do worker
+    'worker_class': os.getenv('GUNICORN_WORKER_CLASS', 'gthread'),
+    'threads': int(os.getenv('GUNICORN_THREADS', '8')),
+    # Tempo para requests em andamento (inclusive streaming) terminarem num reload/stop
+    'graceful_timeout': int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', os.getenv('API_TIMEOUT', '300'))),
+    'max_requests': int(os.getenv('GUNICORN_MAX_REQUESTS', '0')),
+    # Perguntas carregadas do Metabase e compiladas antes do fork
+    'warmup_questions': [int(q) for q in os.getenv('WARMUP_QUESTION_IDS', '51').split(',') if q.strip()]
+}
+
+# Compressão das respostas (negociada pelo Accept-Encoding)
+COMPRESSION_CONFIG = {
+    # Ordem de preferência; br e zstd só entram com brotli/zstandard instalados
+    'algorithms': [a.strip() for a in os.getenv('COMPRESSION_ALGORITHMS', 'zstd,br,gzip').split(',') if a.strip()],
+    'levels': {
+        'gzip': int(os.getenv('GZIP_LEVEL', '6')),
+        'br': int(os.getenv('BROTLI_LEVEL', '4')),
+        'zstd': int(os.getenv('ZSTD_LEVEL', '3'))
+    },
+    # Respostas menores que isso vão sem compressão
+    'min_size': int(os.getenv('COMPRESSION_MIN_SIZE', '1024')),
+    # Nível do gzip do corpo guardado em cache (comprimido uma vez, servido várias)
+    'cache_gzip_level': int(os.getenv('CACHE_GZIP_LEVEL', '6'))
+}
+
+# ETag / 304 Not Modified
+FRESHNESS_CONFIG = {
+    'etag_enabled': os.getenv('ETAG_ENABLED', 'true').lower() == 'true',
+    # Sem query de watermark, os dados são considerados estáveis dentro desta janela (só o ETag;
+    # a chave do cache não muda com a janela)
+    'bucket_seconds': int(os.getenv('FRESHNESS_BUCKET_SECONDS', os.getenv('CACHE_TTL', '300'))),
+    # Intervalo mínimo entre execuções da query de watermark (por pergunta)
+    'check_interval': float(os.getenv('FRESHNESS_CHECK_INTERVAL', '30')),
+    # Watermark padrão e por pergunta, ex: {"51": "SELECT max(updated_at) FROM road.meta_ads_insights"}
+    'default_query': os.getenv('FRESHNESS_QUERY', ''),
+    'queries': json.loads(os.getenv('FRESHNESS_QUERIES', '') or '{}')
+}
+
+# Tempo por etapa dos requests (Server-Timing / trace)
+TRACE_CONFIG = {
+    'enabled': os.getenv('TRACE_ENABLED', 'true').lower() == 'true',
+    # Uma linha JSON por request com os spans (vazio = não grava)
+    'log_file': os.getenv('TRACE_LOG_FILE', ''),
+    # application_name das conexões; o request id é anexado (visível em pg_stat_activity)
+    'application_name': os.getenv('DB_APPLICATION_NAME', 'metabase_api')
+}
+
+# Log de queries lentas + EXPLAIN em segundo plano (GET /api/debug/slow-queries)
+SLOW_QUERY_CONFIG = {
+    # Segundos; 0 desliga
+    'threshold': float(os.getenv('SLOW_QUERY_THRESHOLD', '5')),
+    'explain': os.getenv('SLOW_QUERY_EXPLAIN', 'true').lower() == 'true',
+    # Fração das capturas feitas com EXPLAIN (ANALYZE, BUFFERS): reexecuta a query
+    'analyze_sample': float(os.getenv('SLOW_QUERY_ANALYZE_SAMPLE', '0')),
+    'explain_timeout': float(os.getenv('SLOW_QUERY_EXPLAIN_TIMEOUT', '120')),
+    # Um plano por fingerprint a cada N segundos
+    'plan_interval': int(os.getenv('SLOW_QUERY_PLAN_INTERVAL', '600')),
+    'max_entries': int(os.getenv('SLOW_QUERY_MAX_ENTRIES', '500')),
+    # JSON lines compartilhado entre workers (vazio = só memória do processo)
+    'log_file': os.getenv('SLOW_QUERY_LOG_FILE', ''),
+    'max_bytes': int(os.getenv('SLOW_QUERY_LOG_MAX_BYTES', str(20 * 1024 * 1024)))
+}
+
+# Métricas Prometheus (GET /api/debug/metrics)
+METRICS_CONFIG = {
+    'enabled': os.getenv('METRICS_ENABLED', 'true').lower() == 'true',
+    # Snapshot de cada worker do gunicorn (vazio = só o processo que atende o scrape)
+    'dir': os.getenv('METRICS_DIR', ''),
+    'flush_interval': float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
 }
 
 # Performance Configuration
 PERFORMANCE_CONFIG = {
+    'min_pool_size': int(os.getenv('MIN_POOL_SIZE', '5')),
     'max_pool_size': int(os.getenv('MAX_POOL_SIZE', '20')),
-    'max_rows_without_warning': int(os.getenv('MAX_ROWS_WITHOUT_WARNING', '10000'))
+    'pool_timeout': float(os.getenv('POOL_TIMEOUT', '30')),
+    'pool_max_age': float(os.getenv('POOL_MAX_AGE', '1800')),
+    'pool_max_idle': float(os.getenv('POOL_MAX_IDLE', '300')),
+    'max_rows_without_warning': int(os.getenv('MAX_ROWS_WITHOUT_WARNING', '10000')),
+    'stream_batch_size': int(os.getenv('STREAM_BATCH_SIZE', '5000')),
+    'prepared_statements': os.getenv('PREPARED_STATEMENTS', 'true').lower() == 'true',
+    'prepared_statements_per_conn': int(os.getenv('PREPARED_STATEMENTS_PER_CONN', '50')),
+    # Vazio = padrão do servidor; force_custom_plan evita plano genérico ruim em ranges de data muito diferentes
+    'plan_cache_mode': os.getenv('PLAN_CACHE_MODE', ''),
+    'page_default_limit': int(os.getenv('PAGE_DEFAULT_LIMIT', '1000')),
+    'page_max_limit': int(os.getenv('PAGE_MAX_LIMIT', '10000')),
+    'page_count_ttl': int(os.getenv('PAGE_COUNT_TTL', '300')),
+    'page_count_cache_size': int(os.getenv('PAGE_COUNT_CACHE_SIZE', '1000')),
+    # auto = orjson se instalado, senão json da stdlib
+    'json_serializer': os.getenv('JSON_SERIALIZER', 'auto').lower()
 }
 
 # Development Configuration
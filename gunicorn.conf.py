@@ -0,0 +1,77 @@
+"""
+Configuração do gunicorn (produção)
+
+Execute com: gunicorn -c gunicorn.conf.py api.wsgi:app
+
+- preload_app: o app é importado uma vez no master; cards do Metabase e
+  templates compilados (dashboards de METABASE_DASHBOARD_IDS + perguntas
+  de WARMUP_QUESTION_IDS) ficam prontos antes do fork e são herdados
+  pelos workers (copy-on-write)
+- Conexões psycopg2 não podem atravessar o fork: o master fecha o pool
+  depois do warm-up e cada worker abre o seu em post_fork
+- gthread: o heartbeat do worker roda fora das threads de request, então
+  queries longas e streaming não são mortos pelo timeout; num HUP/TERM
+  os requests em andamento têm graceful_timeout para terminar
+- Métricas: com METRICS_DIR cada worker grava o seu snapshot e o
+  /api/debug/metrics soma todos (o master limpa os da execução anterior)
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config.settings import SERVER_CONFIG, API_CONFIG
+
+bind = SERVER_CONFIG['bind']
+workers = SERVER_CONFIG['workers']
+worker_class = SERVER_CONFIG['worker_class']
+threads = SERVER_CONFIG['threads']
+timeout = API_CONFIG['timeout']
+graceful_timeout = SERVER_CONFIG['graceful_timeout']
+keepalive = 5
+max_requests = SERVER_CONFIG['max_requests']
+max_requests_jitter = max_requests // 10
+preload_app = True
+
+accesslog = 'logs/access.log'
+errorlog = 'logs/error.log'
+os.makedirs('logs', exist_ok=True)
+
+
+def when_ready(server):
+    """Master, depois do preload e antes do primeiro fork"""
+    from api.routes.query_routes import query_service
+
+    # Cards dos dashboards + perguntas avulsas: os workers já nascem com tudo em cache
+    dashboard_questions = query_service.metabase_service.refresh_dashboards()
+    query_service.warm_templates(sorted(set(SERVER_CONFIG['warmup_questions']) | set(dashboard_questions)))
+    # Nenhuma conexão aberta no master pode ser compartilhada com os workers
+    query_service.close_pool()
+
+    from api.utils import metrics
+    metrics.store.clear()
+
+
+def post_fork(server, worker):
+    """Cada worker abre as próprias conexões antes do primeiro request"""
+    from api.routes.query_routes import query_service
+
+    created = query_service.pool.warm()
+    print(f"🔌 Worker {worker.pid}: {created} conexões abertas")
+    # Threads não atravessam o fork: refresher de cards e warm-up nascem em cada worker
+    query_service.metabase_service.start_refresher()
+    if query_service.warmup is not None:
+        query_service.warmup.start()
+
+    from api.utils import metrics
+    metrics.store.start()
+
+
+def worker_exit(server, worker):
+    """Último snapshot do worker: os contadores dele continuam somando no scrape"""
+    from api.utils import metrics
+    try:
+        metrics.store.flush()
+    except Exception as e:
+        print(f"⚠️ Erro ao gravar métricas: {e}")
@@ -21,7 +21,8 @@ CORS_HEADERS = ["Content-Type", "Authorization"]
 SERVER_CONFIG = {
     'host': '0.0.0.0',
     'port': PROXY_PORT,
-    'debug': True,
+    # Nunca ligado por padrão: o debugger do werkzeug executa código remoto
+    'debug': os.getenv('DEBUG', 'False').lower() == 'true',
     'threaded': True
 }
 
@@ -11,7 +11,7 @@ import os
 # Adiciona o diretório raiz ao path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from .config import PROXY_PORT
+from .config import PROXY_PORT, SERVER_CONFIG
 from .routes import register_routes
 
 def create_app():
@@ -38,7 +38,7 @@ def main():
     
     print(f"\n🚀 Servidor proxy iniciando na porta {PROXY_PORT}")
     print(f"   Acesse: http://localhost:{PROXY_PORT}")
-    print(f"   Modo: Desenvolvimento")
+    print(f"   Modo: {'Debug' if SERVER_CONFIG['debug'] else 'Padrão'}")
     print(f"   CORS: Habilitado")
     print(f"\n📍 Endpoints disponíveis:")
     print(f"   GET  /api/query")
@@ -48,12 +48,7 @@ def main():
     print(f"   GET  /health")
     print(f"\n✨ Servidor pronto!\n")
     
-    app.run(
-        host='0.0.0.0',
-        port=PROXY_PORT,
-        debug=True,
-        threaded=True
-    )
+    app.run(**SERVER_CONFIG)
 
 if __name__ == '__main__':
     main()
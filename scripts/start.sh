@@ -94,6 +94,7 @@ except Exception as e:
 # Mata processos antigos
 echo -e "${YELLOW}🔄 Verificando processos existentes...${NC}"
 pkill -f "api.server" 2>/dev/null
+pkill -f "api.wsgi" 2>/dev/null
 sleep 2
 
 # Inicia servidor
@@ -103,11 +104,8 @@ echo "=================================="
 # Modo de execução
 if [ "$1" == "prod" ]; then
     echo -e "${BLUE}Modo: PRODUÇÃO${NC}"
-    gunicorn -w 4 -b 0.0.0.0:${API_PORT:-3500} \
-             --timeout 300 \
-             --access-logfile logs/access.log \
-             --error-logfile logs/error.log \
-             "api.server:create_app()"
+    # Workers, threads e warm-up em gunicorn.conf.py (variáveis no .env)
+    gunicorn -c gunicorn.conf.py api.wsgi:app
 else
     echo -e "${BLUE}Modo: DESENVOLVIMENTO${NC}"
     python -m api.server
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Metabase simulado para o benchmark end-to-end (sem Metabase de verdade)
+
+Serve só o que a API usa do Metabase:
+- POST /api/session          -> token (qualquer usuário/senha)
+- GET  /api/card/:id         -> card de cards.json (SQL nativo + template tags)
+- GET  /api/dashboard/:id    -> dashboard com os cards completos (prefetch)
+Sem o header X-Metabase-Session válido responde 401, como o Metabase.
+
+Execute com: python tests/benchmark/fake_metabase.py --port 3999
+"""
+
+import os
+import sys
+import json
+import re
+import argparse
+import threading
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CARDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cards.json')
+
+
+def load_fixtures(path: str = CARDS_FILE):
+    """(cards por id, dashboards por id) do arquivo de fixtures"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    cards = {card['id']: card for card in data.get('cards', [])}
+    dashboards = {}
+    for dashboard in data.get('dashboards', []):
+        dashcards = [dict(dashcard, card=cards[dashcard['card_id']])
+                     for dashcard in dashboard.get('dashcards', []) if dashcard.get('card_id') in cards]
+        dashboards[dashboard['id']] = dict(dashboard, dashcards=dashcards)
+    return cards, dashboards
+
+
+class FakeMetabaseHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # keep-alive, como o MetabaseSession espera
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _count(self, key):
+        state = self.server.state
+        with state['lock']:
+            state['requests'][key] = state['requests'].get(key, 0) + 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path != '/api/session':
+            return self._reply(404, {'error': 'não simulado'})
+        state = self.server.state
+        with state['lock']:
+            state['logins'] += 1
+            state['token'] = f"bench-token-{state['logins']}"
+        self._count('session')
+        self._reply(200, {'id': state['token']})
+
+    def do_GET(self):
+        state = self.server.state
+        if self.headers.get('X-Metabase-Session') != state['token']:
+            return self._reply(401, 'Unauthenticated')
+
+        match = re.fullmatch(r'/api/(card|dashboard)/(\d+)', self.path.split('?')[0])
+        if not match:
+            return self._reply(404, {'error': 'não simulado'})
+        kind, object_id = match.group(1), int(match.group(2))
+        source = state['cards'] if kind == 'card' else state['dashboards']
+        self._count(kind)
+        if object_id not in source:
+            return self._reply(404, 'Not found.')
+        self._reply(200, source[object_id])
+
+
+def make_server(host: str = '127.0.0.1', port: int = 0, cards_file: str = CARDS_FILE) -> ThreadingHTTPServer:
+    """Servidor pronto (ainda sem thread); port=0 escolhe uma porta livre"""
+    cards, dashboards = load_fixtures(cards_file)
+    server = ThreadingHTTPServer((host, port), FakeMetabaseHandler)
+    server.daemon_threads = True
+    server.state = {'cards': cards, 'dashboards': dashboards, 'token': None, 'logins': 0,
+                    'requests': {}, 'lock': threading.Lock()}
+    return server
+
+
+@contextlib.contextmanager
+def running(host: str = '127.0.0.1', port: int = 0, cards_file: str = CARDS_FILE):
+    """Metabase simulado numa thread; devolve o servidor (url em server.url)"""
+    server = make_server(host, port, cards_file)
+    server.url = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Metabase simulado para o benchmark')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3999)
+    parser.add_argument('--cards', default=CARDS_FILE, help='Arquivo de fixtures (default: cards.json)')
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.cards)
+    print(f"🧪 Metabase simulado em http://{args.host}:{server.server_address[1]}")
+    print(f"   Cards: {sorted(server.state['cards'])}  Dashboards: {sorted(server.state['dashboards'])}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Gera a base sintética do benchmark: N linhas no formato do schema `road`
+
+Cria road.view_metaads_insights_alldata (mesmas colunas que as perguntas
+usam, conversions em jsonb) e road.view_conversions_action_types_list num
+PostgreSQL local e carrega as linhas via COPY. A base é determinística:
+mesma seed, --rows, --days e --end geram exatamente os mesmos dados, então
+resultados de commits diferentes são comparáveis.
+
+Só apaga tabelas criadas por este script (marcadas com COMMENT); nunca
+rode contra o banco de produção - use um banco próprio (BENCH_DB_NAME).
+
+Execute com: python tests/benchmark/generate_data.py --rows 5M [--days 365] [--replace]
+Conexão: BENCH_DB_HOST, BENCH_DB_PORT, BENCH_DB_NAME (metabase_bench), BENCH_DB_USER, BENCH_DB_PASSWORD
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from datetime import date, timedelta
+
+import psycopg2
+from psycopg2 import sql
+
+SCHEMA = 'road'
+TABLE = 'view_metaads_insights_alldata'
+ACTION_TYPES_TABLE = 'view_conversions_action_types_list'
+# Marca das tabelas do benchmark: só estas podem ser apagadas com --replace
+MARKER = 'metabase_api benchmark: dados sintéticos'
+
+ACCOUNTS = [
+    'ASSOCIACAO DOS LOJISTAS DO SHOPPING CENTER DA BARRA', "CONTA D'AGUA SANEAMENTO", 'Padaria São João',
+    'EMPRESA LTDA', 'Clínica Odontológica Sorriso', 'Road Imóveis', 'Auto Peças 100%', 'Ótica Visão & Cia',
+    'Construtora Horizonte', 'Farmácia Popular do Bairro', 'Escola de Idiomas Fluência', 'Pet Shop Amigo Fiel',
+    'Academia Corpo em Forma', 'Loja "Tudo Barato"', 'Restaurante Sabor Caseiro', 'Hotel Beira-Mar',
+    'Concessionária Veloz', 'Livraria Página 1', 'Estúdio de Pilates Equilíbrio', 'Supermercado Economia',
+]
+OBJECTIVES = {
+    'OUTCOME_SALES': 'Conversão', 'OUTCOME_LEADS': 'Cadastro',
+    'OUTCOME_ENGAGEMENT': 'Engajamento', 'OUTCOME_TRAFFIC': 'Tráfego',
+}
+PLATFORMS = {
+    'facebook': ['feed', 'facebook_stories', 'facebook_reels', 'marketplace', 'video_feeds'],
+    'instagram': ['feed', 'instagram_stories', 'instagram_reels', 'instagram_explore'],
+    'audience_network': ['classic', 'rewarded_video'],
+    'messenger': ['messenger_inbox'],
+}
+PLATFORM_WEIGHTS = [45, 45, 6, 4]
+DEVICES = ['mobile_app', 'mobile_web', 'desktop']
+DEVICE_WEIGHTS = [80, 12, 8]
+ACTION_TYPES = [
+    'purchase', 'lead', 'add_to_cart', 'initiate_checkout', 'complete_registration',
+    'link_click', 'landing_page_view', 'post_engagement', 'video_view',
+    'onsite_conversion.messaging_conversation_started_7d',
+]
+CAMPAIGNS_PER_ACCOUNT = 15
+ADSETS_PER_CAMPAIGN = 5
+ADS_PER_ADSET = 4
+
+COLUMNS = [
+    ('date', 'date NOT NULL'), ('account_id', 'text'), ('account_name', 'text'),
+    ('campaign_id', 'text'), ('campaign_name', 'text'), ('adset_id', 'text'), ('adset_name', 'text'),
+    ('ad_id', 'text'), ('ad_name', 'text'), ('publisher_platform', 'text'), ('platform_position', 'text'),
+    ('impression_device', 'text'), ('objective', 'text'), ('optimization_goal', 'text'),
+    ('buying_type', 'text'), ('impressions', 'bigint'), ('clicks', 'bigint'), ('spend', 'numeric(14,2)'),
+    ('reach', 'bigint'), ('conversions', 'jsonb'),
+]
+INDEXES = [('date',), ('account_name', 'date')]
+
+
+def bench_db_config() -> dict:
+    """Conexão do banco do benchmark (BENCH_DB_*), separada da configuração da API"""
+    return {
+        'host': os.getenv('BENCH_DB_HOST', 'localhost'),
+        'port': int(os.getenv('BENCH_DB_PORT', '5432')),
+        'database': os.getenv('BENCH_DB_NAME', 'metabase_bench'),
+        'user': os.getenv('BENCH_DB_USER', os.getenv('USER', 'postgres')),
+        'password': os.getenv('BENCH_DB_PASSWORD', ''),
+    }
+
+
+def parse_count(value: str) -> int:
+    """'5M', '500k' ou '200000' -> número de linhas"""
+    value = str(value).strip().lower().replace('_', '')
+    factor = {'k': 1_000, 'm': 1_000_000}.get(value[-1:], 1)
+    number = value[:-1] if factor > 1 else value
+    count = int(float(number) * factor)
+    if count <= 0:
+        raise argparse.ArgumentTypeError(f"Quantidade de linhas inválida: {value}")
+    return count
+
+
+def build_ads(rng: random.Random) -> list:
+    """Hierarquia conta > campanha > adset > anúncio (fixa para a seed)"""
+    ads = []
+    for a, account in enumerate(ACCOUNTS):
+        for c in range(CAMPAIGNS_PER_ACCOUNT):
+            objective = rng.choice(list(OBJECTIVES))
+            start = date(2025, 1, 1) + timedelta(days=rng.randrange(180))
+            campaign = f"Road | {OBJECTIVES[objective]} | {start:%d/%m}"
+            for s in range(ADSETS_PER_CAMPAIGN):
+                adset = f"Público {s + 1} - {rng.choice(['Interesses', 'Lookalike 1%', 'Remarketing', 'Aberto'])}"
+                for n in range(ADS_PER_ADSET):
+                    ad = f"Anúncio {n + 1} - {rng.choice(['Carrossel', 'Vídeo', 'Imagem', 'Coleção'])}"
+                    ads.append((
+                        f"act_{1000 + a}", account, f"{a}{c:02d}", campaign,
+                        f"{a}{c:02d}{s}", adset, f"{a}{c:02d}{s}{n}", ad, objective,
+                    ))
+    return ads
+
+
+def _copy_text(value) -> str:
+    """Valor no formato texto do COPY (escapa \\, tab e quebras de linha)"""
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def generate_rows(rows: int, days: int, end: date, seed: int):
+    """Linhas da tabela (tuplas na ordem de COLUMNS), distribuídas igualmente pelos dias"""
+    rng = random.Random(seed)
+    ads = build_ads(rng)
+    platforms = list(PLATFORMS)
+    start = end - timedelta(days=days - 1)
+    for index in range(rows):
+        day = start + timedelta(days=index * days // rows)
+        account_id, account, campaign_id, campaign, adset_id, adset, ad_id, ad, objective = \
+            ads[rng.randrange(len(ads))]
+        platform = rng.choices(platforms, PLATFORM_WEIGHTS)[0]
+        impressions = int(rng.expovariate(1 / 800)) + 1
+        clicks = int(impressions * rng.uniform(0.002, 0.03))
+        conversions = [
+            {'action_type': action, 'value': str(rng.randint(1, max(1, clicks)))}
+            for action in rng.sample(ACTION_TYPES, rng.choices([0, 1, 2, 3, 4], [30, 30, 20, 15, 5])[0])
+        ]
+        yield (
+            day, account_id, account, campaign_id, campaign, adset_id, adset, ad_id, ad,
+            platform, rng.choice(PLATFORMS[platform]), rng.choices(DEVICES, DEVICE_WEIGHTS)[0],
+            objective, 'OFFSITE_CONVERSIONS' if objective == 'OUTCOME_SALES' else 'LINK_CLICKS',
+            'AUCTION', impressions, clicks, f"{impressions * rng.uniform(0.005, 0.03):.2f}",
+            int(impressions * rng.uniform(0.6, 0.95)),
+            json.dumps(conversions, ensure_ascii=False),
+        )
+
+
+class CopyStream:
+    """Arquivo só-leitura sobre o gerador: o COPY consome sem montar tudo em memória"""
+
+    def __init__(self, rows, progress_every: int = 0):
+        self._rows = iter(rows)
+        self._buffer = b''
+        self.count = 0
+        self._progress_every = progress_every
+        self._started = time.time()
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            lines = []
+            for row in self._rows:
+                lines.append('\t'.join(_copy_text(value) for value in row))
+                if len(lines) == 5000:
+                    break
+            if not lines:
+                break
+            self.count += len(lines)
+            self._buffer += ('\n'.join(lines) + '\n').encode('utf-8')
+            if self._progress_every and self.count % self._progress_every < len(lines):
+                rate = self.count / max(time.time() - self._started, 1e-9)
+                print(f"   {self.count:,} linhas ({rate:,.0f}/s)")
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+
+def connect(config: dict):
+    """Conecta no banco do benchmark; cria o banco se ainda não existir"""
+    try:
+        return psycopg2.connect(**config)
+    except psycopg2.OperationalError as e:
+        if 'does not exist' not in str(e):
+            raise
+    admin = psycopg2.connect(**dict(config, database='postgres'))
+    admin.autocommit = True
+    with admin.cursor() as cursor:
+        cursor.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(config['database'])))
+    admin.close()
+    print(f"🆕 Banco {config['database']} criado")
+    return psycopg2.connect(**config)
+
+
+def _table_comment(cursor, table: str):
+    cursor.execute("SELECT obj_description(to_regclass(%s), 'pg_class'), to_regclass(%s) IS NOT NULL",
+                   [f"{SCHEMA}.{table}", f"{SCHEMA}.{table}"])
+    comment, exists = cursor.fetchone()
+    return exists, comment
+
+
+def prepare_schema(conn, replace: bool):
+    """Cria schema e tabelas; recusa apagar qualquer tabela que não seja do benchmark"""
+    with conn.cursor() as cursor:
+        for table in (TABLE, ACTION_TYPES_TABLE):
+            exists, comment = _table_comment(cursor, table)
+            if not exists:
+                continue
+            if comment != MARKER:
+                raise RuntimeError(f"{SCHEMA}.{table} já existe e não foi criada pelo benchmark - abortando")
+            if not replace:
+                raise RuntimeError(f"{SCHEMA}.{table} já existe - use --replace para recriar")
+            cursor.execute(sql.SQL("DROP TABLE {}.{}").format(sql.Identifier(SCHEMA), sql.Identifier(table)))
+
+        cursor.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(sql.Identifier(SCHEMA)))
+        cursor.execute(sql.SQL("CREATE TABLE {}.{} ({})").format(
+            sql.Identifier(SCHEMA), sql.Identifier(TABLE),
+            sql.SQL(', ').join(sql.SQL("{} {}").format(sql.Identifier(name), sql.SQL(kind))
+                               for name, kind in COLUMNS)))
+        cursor.execute(sql.SQL("CREATE TABLE {}.{} (action_type text PRIMARY KEY)").format(
+            sql.Identifier(SCHEMA), sql.Identifier(ACTION_TYPES_TABLE)))
+        for table in (TABLE, ACTION_TYPES_TABLE):
+            cursor.execute(sql.SQL("COMMENT ON TABLE {}.{} IS {}").format(
+                sql.Identifier(SCHEMA), sql.Identifier(table), sql.Literal(MARKER)))
+        cursor.execute(sql.SQL("INSERT INTO {}.{} VALUES {}").format(
+            sql.Identifier(SCHEMA), sql.Identifier(ACTION_TYPES_TABLE),
+            sql.SQL(', ').join(sql.SQL("({})").format(sql.Literal(action)) for action in ACTION_TYPES)))
+
+
+def load(conn, rows: int, days: int, end: date, seed: int) -> int:
+    """COPY das linhas geradas + índices + ANALYZE; devolve o total carregado"""
+    stream = CopyStream(generate_rows(rows, days, end, seed), progress_every=max(rows // 10, 1))
+    columns = ', '.join(name for name, _ in COLUMNS)
+    with conn.cursor() as cursor:
+        cursor.copy_expert(f"COPY {SCHEMA}.{TABLE} ({columns}) FROM STDIN", stream, size=1 << 20)
+        for index in INDEXES:
+            cursor.execute(sql.SQL("CREATE INDEX ON {}.{} ({})").format(
+                sql.Identifier(SCHEMA), sql.Identifier(TABLE),
+                sql.SQL(', ').join(sql.Identifier(column) for column in index)))
+        cursor.execute(sql.SQL("ANALYZE {}.{}").format(sql.Identifier(SCHEMA), sql.Identifier(TABLE)))
+    return stream.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Carrega a base sintética do benchmark')
+    parser.add_argument('--rows', type=parse_count, default=parse_count('1M'), help='Linhas (ex: 5M, 500k)')
+    parser.add_argument('--days', type=int, default=365, help='Dias cobertos pela base')
+    parser.add_argument('--end', type=date.fromisoformat, default=date(2025, 6, 30),
+                        help='Último dia da base (fixo para os resultados serem comparáveis)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--replace', action='store_true', help='Recria as tabelas do benchmark se já existirem')
+    args = parser.parse_args()
+
+    config = bench_db_config()
+    print(f"🏗️  Gerando {args.rows:,} linhas em {config['database']}@{config['host']}:{config['port']}")
+    print(f"   {args.days} dias até {args.end}, seed {args.seed}")
+
+    conn = connect(config)
+    started = time.time()
+    try:
+        prepare_schema(conn, args.replace)
+        count = load(conn, args.rows, args.days, args.end, args.seed)
+        conn.commit()
+    except RuntimeError as e:
+        conn.rollback()
+        print(f"❌ {e}")
+        return 1
+    finally:
+        conn.close()
+
+    print(f"✅ {count:,} linhas carregadas em {time.time() - started:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+Teste de carga do /api/query: muitos dashboards com vários iframes ao mesmo tempo
+
+Dois geradores de carga:
+- dashboard: N usuários chegam ao longo de --ramp segundos (ou a --rate
+  usuários/s) e abrem um dashboard; cada iframe é um GET /api/query em
+  paralelo com os mesmos filtros. Depois de um tempo de leitura (--think)
+  o usuário troca os filtros e o dashboard recarrega (--actions vezes).
+  Com --same-filters a maioria abre com o filtro padrão (últimos 7 dias),
+  como às 9h, quando todo mundo abre o mesmo dashboard.
+- replay: reproduz requests gravados - linhas do TRACE_LOG_FILE (pergunta +
+  filtros) ou linhas de access log com /api/query?... (nginx) - no ritmo
+  original (--speed) ou a --rate requests/s, com no máximo --concurrency em
+  voo. A latência também é medida a partir do horário previsto do request
+  (latency_with_queue_ms), então a fila do próprio gerador não esconde
+  lentidão.
+
+Reporta throughput, p50/p95/p99, taxa de erro e, a cada --interval, uma
+série temporal com requests/s, p95, requests em voo e as métricas da API
+(/api/debug/metrics: conexões do pool em uso, esperas e timeouts do pool,
+hits/misses do cache). Sem --url sobe o Metabase simulado e a API contra a
+base do benchmark (generate_data.py), como o run_benchmark.py.
+
+Execute com:
+    python tests/benchmark/load_test.py dashboard --users 30 --ramp 60 [--actions 3] [--think 10]
+    python tests/benchmark/load_test.py replay logs/trace.jsonl [--speed 2 | --rate 20] [--concurrency 50]
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs
+
+import requests
+from requests.adapters import HTTPAdapter
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+import fake_metabase
+import run_benchmark
+from run_benchmark import FILTER_MIXES, RESULTS_DIR
+
+# Parâmetros da URL que não são filtros (mesma lista do FilterProcessor)
+SPECIAL_PARAMS = {'question_id', 'format', 'limit', 'offset', 'stream', 'group_by', 'measures',
+                  'cursor', 'sort'}
+ACCESS_LOG_TIME = re.compile(r'\[(\d{2}/\w{3}/\d{4}:\d{2}:\d{2}:\d{2} [+-]\d{4})\]')
+ACCESS_LOG_QUERY = re.compile(r'/api/query\?(\S+)')
+
+# Séries do /api/debug/metrics acompanhadas durante a carga
+POOL_GAUGES = ('pool_in_use', 'pool_size', 'pool_max_size')
+POOL_COUNTERS = ('pool_waits_total', 'pool_timeouts_total')
+METRICS_PREFIX = 'metabase_api_'
+
+
+def percentiles(values) -> dict:
+    """p50/p95/p99/max por posição (nearest-rank), em ms com uma casa"""
+    values = sorted(values)
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None}
+
+    def rank(p):
+        return round(values[max(0, math.ceil(p * len(values) / 100) - 1)], 1)
+    return {'p50': rank(50), 'p95': rank(95), 'p99': rank(99), 'max': round(values[-1], 1)}
+
+
+class Recorder:
+    """Resultado de cada request e de cada carregamento de dashboard (thread-safe)"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.samples = []
+        self.pages = []
+        self.inflight = 0
+        self._lock = threading.Lock()
+
+    def begin(self):
+        with self._lock:
+            self.inflight += 1
+
+    def add(self, sample: dict):
+        with self._lock:
+            self.inflight -= 1
+            self.samples.append(sample)
+
+    def page(self, started: float, samples: list):
+        with self._lock:
+            self.pages.append({
+                't': round(started - self.started, 3),
+                'ms': max(s['ms'] + s['delay_ms'] for s in samples),
+                'ok': all(s['status'] == 200 for s in samples),
+            })
+
+
+def send(session, url, question_id, filters, recorder, encoding, timeout, intended=None) -> dict:
+    """Um GET /api/query; corpo lido sem descomprimir (o gerador não pode virar o gargalo)"""
+    recorder.begin()
+    sent = time.perf_counter()
+    sample = {'t': round(sent - recorder.started, 3), 'question_id': question_id,
+              'delay_ms': max(0.0, (sent - intended) * 1000) if intended else 0.0,
+              'status': None, 'cache': None, 'bytes': 0, 'error': None}
+    try:
+        response = session.get(f"{url}/api/query", params=dict(filters, question_id=question_id),
+                               headers={'Accept-Encoding': encoding}, stream=True, timeout=timeout)
+        for chunk in response.raw.stream(1 << 16, decode_content=False):
+            sample['bytes'] += len(chunk)
+        response.close()
+        sample['status'] = response.status_code
+        sample['cache'] = response.headers.get('X-Cache')
+    except requests.RequestException as e:
+        sample['error'] = type(e).__name__
+    sample['ms'] = (time.perf_counter() - sent) * 1000
+    recorder.add(sample)
+    return sample
+
+
+def make_session(connections: int) -> requests.Session:
+    """Sessão keep-alive com conexões suficientes para os iframes em paralelo"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(connections, 1))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+# ---------------------------------------------------------------------------
+# Geradores de carga
+# ---------------------------------------------------------------------------
+
+def pick_filters(rng: random.Random, last_day, same_filters: float) -> dict:
+    """Filtro padrão do dashboard (últimos 7 dias) ou uma combinação sorteada"""
+    if rng.random() < same_filters:
+        return {'data': f"{last_day - timedelta(days=6)}~{last_day}"}
+    days = rng.choice([1, 7, 30, 90])
+    mix = FILTER_MIXES[rng.choice(sorted(FILTER_MIXES))]
+    return dict(mix, data=f"{last_day - timedelta(days=days - 1)}~{last_day}")
+
+
+def arrivals(count: int, ramp: float, rate: float, rng: random.Random) -> list:
+    """Instantes de chegada (s): Poisson a `rate`/s ou espalhados em `ramp` segundos"""
+    if rate:
+        offsets, now = [], 0.0
+        for _ in range(count):
+            offsets.append(now)
+            now += rng.expovariate(rate)
+        return offsets
+    return sorted(rng.uniform(0, ramp) for _ in range(count))
+
+
+def run_dashboard(args, url, recorder, stop):
+    """Usuários abrindo o dashboard: iframes em paralelo, leitura, troca de filtros"""
+    rng = random.Random(args.seed)
+    last_day = datetime.strptime(args.end_date, '%Y-%m-%d').date()
+    questions = args.questions
+    iframes = [questions[i % len(questions)] for i in range(args.iframes or len(questions))]
+    start = time.perf_counter()
+
+    def user(user_id: int, arrival: float):
+        user_rng = random.Random(args.seed * 1000 + user_id)
+        session = make_session(len(iframes))
+        if stop.wait(max(0.0, start + arrival - time.perf_counter())):
+            return
+        for action in range(args.actions + 1):
+            filters = pick_filters(user_rng, last_day, args.same_filters)
+            page_started = time.perf_counter()
+            samples = []
+            threads = [threading.Thread(target=lambda q=question: samples.append(
+                send(session, url, q, filters, recorder, args.encoding, args.timeout, page_started)))
+                for question in iframes]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            recorder.page(page_started, samples)
+            think = user_rng.expovariate(1 / args.think) if args.think else 0
+            if action == args.actions or stop.wait(think):
+                break
+
+    threads = [threading.Thread(target=user, args=(i, offset), daemon=True)
+               for i, offset in enumerate(arrivals(args.users, args.ramp, args.rate, rng))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def load_records(path: str) -> list:
+    """(timestamp ou None, question_id, filtros) de um TRACE_LOG_FILE ou access log"""
+    records = []
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('{'):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get('name') != '/api/query' or entry.get('question_id') is None:
+                    continue
+                moment = datetime.fromisoformat(entry['ts']).timestamp() if entry.get('ts') else None
+                records.append((moment, int(entry['question_id']), entry.get('filters') or {}))
+                continue
+
+            match = ACCESS_LOG_QUERY.search(line)
+            if not match:
+                continue
+            query = parse_qs(match.group(1), keep_blank_values=False)
+            question_id = int(query.get('question_id', ['51'])[0])
+            filters = {key: values if len(values) > 1 else values[0]
+                       for key, values in query.items() if key not in SPECIAL_PARAMS}
+            stamp = ACCESS_LOG_TIME.search(line)
+            moment = datetime.strptime(stamp.group(1), '%d/%b/%Y:%H:%M:%S %z').timestamp() if stamp else None
+            records.append((moment, question_id, filters))
+    return records
+
+
+def run_replay(args, url, recorder, stop):
+    """Reproduz os requests gravados no ritmo original (÷ --speed) ou a --rate/s"""
+    records = load_records(args.log)[:args.limit or None]
+    if not records:
+        raise SystemExit(f"❌ Nenhum request de /api/query em {args.log}")
+    if args.rate or any(moment is None for moment, _, _ in records):
+        if not args.rate:
+            raise SystemExit("❌ Log sem horários: informe --rate")
+        offsets = arrivals(len(records), 0, args.rate, random.Random(args.seed))
+    else:
+        first = min(moment for moment, _, _ in records)
+        records.sort(key=lambda record: record[0])
+        offsets = [(moment - first) / args.speed for moment, _, _ in records]
+    print(f"   {len(records):,} requests em {offsets[-1]:.0f}s de log")
+
+    local = threading.local()
+
+    def replay(question_id, filters, intended):
+        if not hasattr(local, 'session'):
+            local.session = make_session(1)
+        send(local.session, url, question_id, filters, recorder, args.encoding, args.timeout, intended)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for offset, (_, question_id, filters) in zip(offsets, records):
+            if stop.wait(max(0.0, start + offset - time.perf_counter())):
+                break
+            executor.submit(replay, question_id, filters, start + offset)
+
+
+# ---------------------------------------------------------------------------
+# Série temporal e relatório
+# ---------------------------------------------------------------------------
+
+def scrape_metrics(session, url) -> dict:
+    """Pool e cache do /api/debug/metrics (somados entre workers); {} se desabilitado"""
+    try:
+        response = session.get(f"{url}/api/debug/metrics", timeout=5)
+    except requests.RequestException:
+        return {}
+    if response.status_code != 200:
+        return {}
+    values = {}
+    for line in response.text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        series, _, value = line.rpartition(' ')
+        name, _, labels = series.partition('{')
+        name = name[len(METRICS_PREFIX):] if name.startswith(METRICS_PREFIX) else name
+        if name == 'cache_requests_total':
+            result = re.search(r'result="(\w+)"', labels)
+            name = f"cache_{result.group(1)}" if result else name
+        elif name not in POOL_GAUGES + POOL_COUNTERS:
+            continue
+        values[name] = values.get(name, 0) + float(value)
+    return values
+
+
+def sample_timeline(url, recorder, stop, interval, timeline):
+    """A cada intervalo: requests/s, p95, em voo e métricas do servidor (deltas dos contadores)"""
+    session = requests.Session()
+    previous, seen = scrape_metrics(session, url), 0
+    while not stop.wait(interval):
+        now = time.perf_counter() - recorder.started
+        samples = recorder.samples[seen:]
+        seen += len(samples)
+        current = scrape_metrics(session, url)
+        point = {
+            't': round(now, 1),
+            'rps': round(len(samples) / interval, 1),
+            'errors': sum(1 for s in samples if s['status'] != 200),
+            'p95_ms': percentiles(s['ms'] for s in samples)['p95'],
+            'inflight': recorder.inflight,
+        }
+        for name in POOL_GAUGES:
+            point[name] = current.get(name)
+        for name in POOL_COUNTERS:
+            point[name[:-len('_total')]] = current.get(name, 0) - previous.get(name, 0) if current else None
+        if current:
+            point['cache_hits'] = sum(current.get(f"cache_{r}", 0) - previous.get(f"cache_{r}", 0)
+                                      for r in ('l1', 'l2', 'wait'))
+            point['cache_misses'] = current.get('cache_miss', 0) - previous.get('cache_miss', 0)
+        previous = current or previous
+        timeline.append(point)
+        print(f"   t={point['t']:>6.1f}s  {point['rps']:>6.1f} req/s  p95 {point['p95_ms'] or 0:>8,.0f}ms  "
+              f"em voo {point['inflight']:>3}  pool {point['pool_in_use'] or 0:.0f}/"
+              f"{point['pool_max_size'] or 0:.0f} esperas {point['pool_waits'] or 0:.0f}  "
+              f"erros {point['errors']}")
+
+
+def summarize(recorder, elapsed: float) -> dict:
+    samples = recorder.samples
+    ok = [s for s in samples if s['status'] == 200]
+    by_question = {}
+    for question_id in sorted({s['question_id'] for s in samples}):
+        mine = [s for s in samples if s['question_id'] == question_id]
+        by_question[str(question_id)] = dict(
+            requests=len(mine), errors=sum(1 for s in mine if s['status'] != 200),
+            **percentiles(s['ms'] for s in mine if s['status'] == 200))
+    summary = {
+        'duration_s': round(elapsed, 1),
+        'requests': len(samples),
+        'errors': len(samples) - len(ok),
+        'error_rate': round((len(samples) - len(ok)) / len(samples), 4) if samples else 0.0,
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': percentiles(s['ms'] for s in ok),
+        'latency_with_queue_ms': percentiles(s['ms'] + s['delay_ms'] for s in ok),
+        'bytes': sum(s['bytes'] for s in samples),
+        'cache': dict(Counter(s['cache'] or '-' for s in ok)),
+        'error_kinds': dict(Counter(str(s['status'] or s['error']) for s in samples if s['status'] != 200)),
+        'by_question': by_question,
+    }
+    if recorder.pages:
+        summary['dashboard_loads'] = dict(
+            count=len(recorder.pages), failed=sum(1 for p in recorder.pages if not p['ok']),
+            **percentiles(p['ms'] for p in recorder.pages))
+    return summary
+
+
+def _ms(value) -> str:
+    return '-' if value is None else f"{value:,.1f}ms"
+
+
+def _line(stats: dict) -> str:
+    return f"p50 {_ms(stats['p50'])}  p95 {_ms(stats['p95'])}  p99 {_ms(stats['p99'])}"
+
+
+def print_summary(summary: dict):
+    print(f"\n📊 {summary['requests']:,} requests em {summary['duration_s']}s "
+          f"({summary['throughput_rps']} req/s), erros {summary['errors']} ({summary['error_rate']:.2%})")
+    print(f"   latência       {_line(summary['latency_ms'])}  max {_ms(summary['latency_ms']['max'])}")
+    print(f"   com fila       {_line(summary['latency_with_queue_ms'])}")
+    if 'dashboard_loads' in summary:
+        pages = summary['dashboard_loads']
+        print(f"   dashboard      {_line(pages)}  ({pages['count']} carregamentos, {pages['failed']} com erro)")
+    for question_id, stats in summary['by_question'].items():
+        print(f"   pergunta {question_id:<6}{_line(stats)}  ({stats['requests']} requests, {stats['errors']} erros)")
+    print(f"   cache: {summary['cache'] or '-'}  erros: {summary['error_kinds'] or '-'}")
+
+
+# ---------------------------------------------------------------------------
+# Execução
+# ---------------------------------------------------------------------------
+
+def run(args) -> int:
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    overrides = dict(item.split('=', 1) for item in args.env)
+    if args.command == 'dashboard':
+        _, dashboards = fake_metabase.load_fixtures()
+        if not args.questions:
+            args.questions = [dashcard['card_id'] for dashcard in dashboards[args.dashboard]['dashcards']]
+        if not args.end_date:
+            args.end_date = run_benchmark.dataset_info()['max_date']
+
+    meta = {
+        'git': run_benchmark.git_meta(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'server': args.url or args.server,
+        'args': {key: value for key, value in vars(args).items() if key != 'func'},
+    }
+    print(f"🔥 Teste de carga ({args.command}) - commit {meta['git']['commit'][:8]}")
+
+    recorder, stop, timeline = Recorder(), threading.Event(), []
+    with fake_metabase.running() as metabase:
+        process = None
+        if args.url:
+            url = args.url.rstrip('/')
+        else:
+            port = run_benchmark.free_port()
+            if args.server == 'gunicorn':
+                # Cada worker grava o snapshot e o /api/debug/metrics soma todos
+                overrides.setdefault('METRICS_DIR', os.path.join(RESULTS_DIR, 'metrics'))
+            process, url = run_benchmark.start_server(
+                args.server, run_benchmark.server_env(metabase.url, port, overrides), port,
+                os.path.join(RESULTS_DIR, 'server.log'))
+        sampler = threading.Thread(target=sample_timeline, args=(url, recorder, stop, args.interval, timeline),
+                                   daemon=True)
+        sampler.start()
+        timer = threading.Timer(args.duration, stop.set) if args.duration else None
+        if timer is not None:
+            timer.daemon = True
+            timer.start()
+        try:
+            generator = run_dashboard if args.command == 'dashboard' else run_replay
+            generator(args, url, recorder, stop)
+        except KeyboardInterrupt:
+            print("\n⏹️ Interrompido - relatório parcial")
+        finally:
+            elapsed = time.perf_counter() - recorder.started
+            stop.set()
+            if timer is not None:
+                timer.cancel()
+            sampler.join()
+            if process is not None:
+                run_benchmark.stop_server(process)
+
+    summary = summarize(recorder, elapsed)
+    print_summary(summary)
+
+    commit = meta['git']['commit'][:8] or 'sem-git'
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{datetime.now():%Y%m%d-%H%M%S}-{commit}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'meta': meta, 'summary': summary, 'timeline': timeline}, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Resultados: {output}")
+    return 1 if summary['requests'] and summary['error_rate'] > args.max_error_rate else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga do /api/query')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    dashboard = commands.add_parser('dashboard', help='Sessões sintéticas de dashboard')
+    dashboard.add_argument('--users', type=int, default=30, help='Usuários que abrem o dashboard')
+    dashboard.add_argument('--ramp', type=float, default=60, help='Segundos em que os usuários chegam')
+    dashboard.add_argument('--rate', type=float, default=0, help='Chegadas Poisson (usuários/s) em vez de --ramp')
+    dashboard.add_argument('--dashboard', type=int, default=901, help='Dashboard de cards.json')
+    dashboard.add_argument('--questions', type=lambda v: [int(q) for q in v.split(',')],
+                           help='Perguntas dos iframes (ex: 51,52) em vez do dashboard')
+    dashboard.add_argument('--iframes', type=int, default=0, help='Iframes por dashboard (default: um por card)')
+    dashboard.add_argument('--actions', type=int, default=3, help='Trocas de filtro depois de abrir')
+    dashboard.add_argument('--think', type=float, default=10, help='Tempo médio de leitura entre trocas (s)')
+    dashboard.add_argument('--same-filters', type=float, default=0.7,
+                           help='Fração dos carregamentos com o filtro padrão (últimos 7 dias)')
+    dashboard.add_argument('--end-date', help='Último dia dos filtros (default: último dia da base)')
+
+    replay = commands.add_parser('replay', help='Reproduz requests gravados')
+    replay.add_argument('log', help='TRACE_LOG_FILE (JSON lines) ou access log com /api/query?...')
+    replay.add_argument('--speed', type=float, default=1.0, help='Acelera o ritmo original (2 = dobro)')
+    replay.add_argument('--rate', type=float, default=0, help='Requests/s (Poisson) em vez do ritmo gravado')
+    replay.add_argument('--concurrency', type=int, default=50, help='Máximo de requests em voo')
+    replay.add_argument('--limit', type=int, default=0, help='Só os primeiros N requests')
+
+    for command in (dashboard, replay):
+        command.add_argument('--server', choices=sorted(run_benchmark.SERVERS), default='flask')
+        command.add_argument('--url', help='Usa uma API já rodando')
+        command.add_argument('--env', action='append', default=[], metavar='CHAVE=VALOR',
+                             help='Variável extra para a API (ex: MAX_POOL_SIZE=10)')
+        command.add_argument('--duration', type=float, default=0, help='Interrompe depois de N segundos')
+        command.add_argument('--interval', type=float, default=1.0, help='Intervalo da série temporal (s)')
+        command.add_argument('--encoding', default='gzip', help='Accept-Encoding dos requests')
+        command.add_argument('--timeout', type=float, default=300)
+        command.add_argument('--seed', type=int, default=42)
+        command.add_argument('--max-error-rate', type=float, default=0.01,
+                             help='Sai com código 1 acima desta taxa de erro')
+        command.add_argument('--output', help='Arquivo de saída (default: results/load-<data>-<commit>.json)')
+
+    args = parser.parse_args()
+    return run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+Benchmark end-to-end do /api/query contra a base sintética (sem Metabase de verdade)
+
+Sobe o Metabase simulado (fake_metabase.py) e a API num subprocesso
+apontando para o banco do benchmark (generate_data.py) e mede, por cenário:
+- latência do request completo (até o último byte) e até o primeiro byte
+- Server-Timing da API por etapa (db, serialize, compress...)
+- bytes no fio e descomprimidos, linhas devolvidas e X-Cache
+- pico de RSS do processo da API (VmHWM, zerado a cada cenário; só Linux)
+
+Cenários: perguntas de cards.json x intervalos de data terminando no último
+dia da base x combinações de filtros, cada um frio (cache de respostas e de
+cards limpo antes de cada request) e quente (resposta já em cache).
+
+O resultado vai para tests/benchmark/results/<data>-<commit>.json; compare
+duas execuções (ex: antes/depois de um commit) com o subcomando compare.
+
+Execute com:
+    python tests/benchmark/generate_data.py --rows 5M
+    python tests/benchmark/run_benchmark.py run [--repeat 5] [--only 9001] [--env JSON_SERIALIZER=stdlib]
+    python tests/benchmark/run_benchmark.py compare results/A.json results/B.json [--threshold 10]
+"""
+
+import os
+import re
+import sys
+import json
+import gzip
+import time
+import socket
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timedelta
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BENCH_DIR, '..', '..'))
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+sys.path.insert(0, BENCH_DIR)
+
+import fake_metabase
+from generate_data import ACCOUNTS, SCHEMA, TABLE, bench_db_config
+
+# Intervalos (dias até o último dia da base) por pergunta: detalhe cresce com o período
+RANGES = {9001: [1, 7, 30, 90], 9002: [30, 365]}
+
+# Combinações de filtros aplicadas além do intervalo de data
+FILTER_MIXES = {
+    'data': {},
+    'data+conta': {'conta': ACCOUNTS[:3]},
+    'data+conversoes': {'conversoes_consideradas': ['purchase', 'lead']},
+    'data+conta+plataforma+device': {'conta': ACCOUNTS[1], 'plataforma': ['facebook', 'instagram'],
+                                     'device': 'mobile_app'},
+}
+
+MODES = ('cold', 'warm')
+
+# Ambiente da API durante o benchmark: só o que é medido fica ligado.
+# config/.env não sobrescreve variáveis já definidas, então tudo aqui vale.
+SERVER_ENV = {
+    'DEBUG': 'false',
+    'METABASE_USERNAME': 'bench',
+    'METABASE_PASSWORD': 'bench',
+    'METABASE_DASHBOARD_IDS': '',
+    'REDIS_ENABLED': 'false',
+    'CACHE_ENABLED': 'true',
+    'WARMUP_ENABLED': 'false',
+    'INCREMENTAL_QUESTION_IDS': '',
+    'FRESHNESS_QUERY': '',
+    'FRESHNESS_QUERIES': '',
+    'TRACE_ENABLED': 'true',
+    'TRACE_LOG_FILE': '',
+    'SLOW_QUERY_THRESHOLD': '0',
+    'METRICS_DIR': '',
+}
+
+SERVERS = {
+    'flask': [sys.executable, '-m', 'api.server'],
+    'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT_DIR, 'gunicorn.conf.py'),
+                 'api.wsgi:app'],
+    'asgi': [sys.executable, '-m', 'uvicorn', 'api.asgi:app', '--host', '127.0.0.1', '--port', '{port}'],
+}
+
+
+# ---------------------------------------------------------------------------
+# Processo da API
+# ---------------------------------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_env(metabase_url: str, port: int, overrides: dict) -> dict:
+    """Ambiente do subprocesso da API: banco do benchmark + Metabase simulado"""
+    db = bench_db_config()
+    env = dict(os.environ, **SERVER_ENV)
+    env.update({
+        'PYTHONPATH': ROOT_DIR,
+        'METABASE_URL': metabase_url,
+        'API_PORT': str(port),
+        'SERVER_BIND': f"127.0.0.1:{port}",
+        'DB_HOST': db['host'],
+        'DB_PORT': str(db['port']),
+        'DB_NAME': db['database'],
+        'DB_USER': db['user'],
+        # Com DEBUG=false a API exige DB_PASSWORD; trust/peer ignoram o valor
+        'DB_PASSWORD': db['password'] or 'bench',
+        'DB_SCHEMA': SCHEMA,
+    })
+    env.update(overrides)
+    return env
+
+
+def start_server(kind: str, env: dict, port: int, log_path: str, timeout: float = 60):
+    """Sobe a API e espera responder; o log (stdout/stderr) vai para log_path"""
+    command = [part.format(port=port) for part in SERVERS[kind]]
+    log = open(log_path, 'w')
+    # cwd nos resultados: logs/ do modo produção não sujam a raiz do repo
+    process = subprocess.Popen(command, cwd=RESULTS_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API terminou ao subir (código {process.returncode}) - veja {log_path}")
+        try:
+            if requests.get(f"{url}/api/debug/pool/stats", timeout=2).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"API não respondeu em {timeout:.0f}s - veja {log_path}")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def process_tree(pid: int) -> list:
+    """pid + descendentes (workers do gunicorn/uvicorn) via /proc"""
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        try:
+            for tid in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{tid}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def reset_peak_rss(pids: list):
+    """Zera o VmHWM (pico de RSS) dos processos - Linux >= 4.0"""
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/clear_refs", 'w') as f:
+                f.write('5')
+        except OSError:
+            pass
+
+
+def read_rss_mb(pids: list, field: str = 'VmHWM'):
+    """Soma de VmHWM (pico) ou VmRSS (atual) dos processos em MB; None fora do Linux"""
+    total = None
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith(field + ':'):
+                        total = (total or 0) + int(line.split()[1])
+        except OSError:
+            pass
+    return round(total / 1024, 1) if total is not None else None
+
+
+# ---------------------------------------------------------------------------
+# Cenários e medição
+# ---------------------------------------------------------------------------
+
+def dataset_info() -> dict:
+    """Tamanho e período da base do benchmark"""
+    import psycopg2
+    conn = psycopg2.connect(**bench_db_config())
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT count(*), min(date), max(date) FROM {SCHEMA}.{TABLE}")
+            rows, first, last = cursor.fetchone()
+    finally:
+        conn.close()
+    return {'rows': rows, 'min_date': str(first), 'max_date': str(last)}
+
+
+def build_scenarios(max_date: str, only: str = '') -> list:
+    last = datetime.strptime(max_date, '%Y-%m-%d').date()
+    scenarios = []
+    for question_id, ranges in RANGES.items():
+        for days in ranges:
+            first = last - timedelta(days=days - 1)
+            for mix, filters in FILTER_MIXES.items():
+                name = f"{question_id}/{days}d/{mix}"
+                if only and only not in name:
+                    continue
+                params = dict(filters, question_id=question_id, data=f"{first}~{last}")
+                scenarios.append({'name': name, 'question_id': question_id, 'days': days,
+                                  'filters': mix, 'params': params})
+    return scenarios
+
+
+def parse_server_timing(header: str) -> dict:
+    """'db;dur=12.3, total;dur=20.1' -> {'db': 12.3, 'total': 20.1}"""
+    phases = {}
+    for part in (header or '').split(','):
+        match = re.match(r'\s*([\w.-]+);dur=([\d.]+)', part)
+        if match:
+            phases[match.group(1)] = float(match.group(2))
+    return phases
+
+
+def count_rows(body: bytes):
+    """row_count da resposta (metadata no fim do JSON); parse completo só se faltar"""
+    match = re.search(rb'"row_count":\s*(\d+)', body[-4096:])
+    if match:
+        return int(match.group(1))
+    try:
+        return len(json.loads(body)['data']['rows'])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def measure(session: requests.Session, url: str, params: dict, encoding: str, timeout: float) -> dict:
+    """Um request: latência até o último byte, TTFB, bytes no fio e descomprimidos"""
+    started = time.perf_counter()
+    response = session.get(f"{url}/api/query", params=params, headers={'Accept-Encoding': encoding},
+                           stream=True, timeout=timeout)
+    first_byte, chunks = None, []
+    for chunk in response.raw.stream(1 << 16, decode_content=False):
+        if first_byte is None:
+            first_byte = time.perf_counter()
+        chunks.append(chunk)
+    elapsed = time.perf_counter() - started
+    response.close()
+
+    wire = b''.join(chunks)
+    body = gzip.decompress(wire) if response.headers.get('Content-Encoding') == 'gzip' else wire
+    return {
+        'status': response.status_code,
+        'ms': elapsed * 1000,
+        'ttfb_ms': ((first_byte or time.perf_counter()) - started) * 1000,
+        'bytes': len(wire),
+        'raw_bytes': len(body),
+        'rows': count_rows(body) if response.status_code == 200 else None,
+        'cache': response.headers.get('X-Cache'),
+        'server_timing': parse_server_timing(response.headers.get('Server-Timing')),
+        'error': body[:300].decode('utf-8', 'replace') if response.status_code != 200 else None,
+    }
+
+
+def summarize(runs: list) -> dict:
+    latencies = [run['ms'] for run in runs]
+    phases = {}
+    for run in runs:
+        for name, value in run['server_timing'].items():
+            phases.setdefault(name, []).append(value)
+    last = runs[-1]
+    return {
+        'status': last['status'],
+        'rows': last['rows'],
+        'bytes': last['bytes'],
+        'raw_bytes': last['raw_bytes'],
+        'cache': sorted({run['cache'] for run in runs if run['cache']}),
+        'latency_ms': {
+            'min': round(min(latencies), 1),
+            'p50': round(statistics.median(latencies), 1),
+            'mean': round(statistics.mean(latencies), 1),
+            'max': round(max(latencies), 1),
+        },
+        'ttfb_ms': round(statistics.median(run['ttfb_ms'] for run in runs), 1),
+        'server_timing_ms': {name: round(statistics.median(values), 1) for name, values in phases.items()},
+        'error': last['error'],
+    }
+
+
+def run_scenario(session, url, scenario, mode, encoding, repeat, timeout, pids) -> dict:
+    if mode == 'warm':
+        measure(session, url, scenario['params'], encoding, timeout)   # preenche o cache, não conta
+    reset_peak_rss(pids)
+    runs = []
+    for _ in range(repeat):
+        if mode == 'cold':
+            session.post(f"{url}/api/debug/cache/clear", timeout=timeout)
+        runs.append(measure(session, url, scenario['params'], encoding, timeout))
+    result = dict(scenario, mode=mode, encoding=encoding, **summarize(runs))
+    result['peak_rss_mb'] = read_rss_mb(pids)
+    result['rss_after_mb'] = read_rss_mb(pids, 'VmRSS')
+    return result
+
+
+def git_meta() -> dict:
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=ROOT_DIR, capture_output=True, text=True,
+                                  timeout=30).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ''
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'subject': git('log', '-1', '--format=%s'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Subcomandos
+# ---------------------------------------------------------------------------
+
+def cmd_run(args) -> int:
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    overrides = dict(item.split('=', 1) for item in args.env)
+
+    dataset = dataset_info()
+    if not dataset['rows']:
+        print("❌ Base vazia - rode antes: python tests/benchmark/generate_data.py --rows 1M")
+        return 1
+    scenarios = build_scenarios(dataset['max_date'], args.only)
+    encodings = [encoding.strip() for encoding in args.encodings.split(',') if encoding.strip()]
+    modes = [mode for mode in MODES if mode in args.modes.split(',')]
+
+    meta = {
+        'git': git_meta(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'server': args.url or args.server,
+        'repeat': args.repeat,
+        'env': overrides,
+        'dataset': dataset,
+    }
+    print(f"🏁 Benchmark: {len(scenarios)} cenários x {len(modes)} modos x {len(encodings)} encodings")
+    print(f"   Base: {dataset['rows']:,} linhas ({dataset['min_date']} a {dataset['max_date']})")
+    print(f"   Commit: {meta['git']['commit'][:8]}{' (com alterações)' if meta['git']['dirty'] else ''}")
+
+    results = []
+    with fake_metabase.running() as metabase:
+        process = None
+        if args.url:
+            url, pids = args.url.rstrip('/'), []
+        else:
+            port = free_port()
+            log_path = os.path.join(RESULTS_DIR, 'server.log')
+            process, url = start_server(args.server, server_env(metabase.url, port, overrides),
+                                        port, log_path)
+            pids = process_tree(process.pid)
+        try:
+            session = requests.Session()
+            for scenario in scenarios:
+                for mode in modes:
+                    for encoding in encodings:
+                        result = run_scenario(session, url, scenario, mode, encoding,
+                                              args.repeat, args.timeout, pids)
+                        results.append(result)
+                        rss = f"{result['peak_rss_mb']:,.0f}MB" if result['peak_rss_mb'] else '-'
+                        print(f"   {scenario['name']:<42} {mode:<4} {encoding:<8} "
+                              f"p50 {result['latency_ms']['p50']:>9,.1f}ms  "
+                              f"{result['rows'] or 0:>9,} linhas  {result['bytes']:>12,}B  RSS {rss}")
+                        if result['status'] != 200:
+                            print(f"      ⚠️ HTTP {result['status']}: {result['error']}")
+        finally:
+            if process is not None:
+                stop_server(process)
+        meta['metabase_requests'] = dict(metabase.state['requests'])
+
+    commit = meta['git']['commit'][:8] or 'sem-git'
+    name = f"{datetime.now():%Y%m%d-%H%M%S}-{commit}{'-dirty' if meta['git']['dirty'] else ''}.json"
+    output = args.output or os.path.join(RESULTS_DIR, name)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'meta': meta, 'results': results}, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Resultados: {output}")
+    return 0
+
+
+def result_key(result: dict) -> str:
+    return f"{result['name']} {result['mode']} {result['encoding']}"
+
+
+def compare(base: dict, new: dict, threshold: float) -> list:
+    """Linhas da comparação: (chave, p50 antes, p50 depois, delta %, bytes, RSS, piorou?)"""
+    previous = {result_key(result): result for result in base['results']}
+    rows = []
+    for result in new['results']:
+        old = previous.get(result_key(result))
+        if old is None:
+            continue
+        before, after = old['latency_ms']['p50'], result['latency_ms']['p50']
+        delta = (after - before) / before * 100 if before else 0.0
+        rows.append({
+            'key': result_key(result),
+            'before_ms': before,
+            'after_ms': after,
+            'delta_pct': round(delta, 1),
+            'bytes': (old['bytes'], result['bytes']),
+            'peak_rss_mb': (old.get('peak_rss_mb'), result.get('peak_rss_mb')),
+            'regression': delta > threshold,
+        })
+    return rows
+
+
+def cmd_compare(args) -> int:
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.new, encoding='utf-8') as f:
+        new = json.load(f)
+
+    for label, data in (('antes ', base), ('depois', new)):
+        git = data['meta']['git']
+        print(f"{label}: {git['commit'][:8]}{'*' if git['dirty'] else ''} {git['subject']} "
+              f"({data['meta']['dataset']['rows']:,} linhas)")
+    if base['meta']['dataset'] != new['meta']['dataset']:
+        print("⚠️ Bases diferentes entre as execuções - a comparação não é direta")
+
+    rows = compare(base, new, args.threshold)
+    print(f"\n{'cenário':<58} {'p50 antes':>10} {'p50 depois':>11} {'Δ':>8} {'bytes Δ':>9} {'RSS Δ':>9}")
+    for row in rows:
+        bytes_before, bytes_after = row['bytes']
+        rss_before, rss_after = row['peak_rss_mb']
+        bytes_delta = f"{(bytes_after - bytes_before) / bytes_before * 100:+.1f}%" if bytes_before else '-'
+        rss_delta = f"{rss_after - rss_before:+.0f}MB" if rss_before is not None and rss_after is not None else '-'
+        flag = ' ⚠️' if row['regression'] else ''
+        print(f"{row['key']:<58} {row['before_ms']:>9,.1f} {row['after_ms']:>10,.1f} "
+              f"{row['delta_pct']:>+7.1f}% {bytes_delta:>9} {rss_delta:>9}{flag}")
+
+    regressions = [row for row in rows if row['regression']]
+    print(f"\n{len(rows)} cenários comparados, {len(regressions)} acima de +{args.threshold:g}%")
+    return 1 if regressions and args.fail else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark end-to-end do /api/query')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='Executa o benchmark e salva o JSON')
+    run.add_argument('--server', choices=sorted(SERVERS), default='flask', help='Como subir a API')
+    run.add_argument('--url', help='Usa uma API já rodando (sem medir RSS)')
+    run.add_argument('--repeat', type=int, default=3, help='Requests medidos por cenário')
+    run.add_argument('--only', default='', help='Só cenários cujo nome contém o texto (ex: 9001/30d)')
+    run.add_argument('--modes', default='cold,warm')
+    run.add_argument('--encodings', default='gzip', help='Accept-Encoding testados (ex: gzip,identity)')
+    run.add_argument('--env', action='append', default=[], metavar='CHAVE=VALOR',
+                     help='Variável extra para a API (ex: JSON_SERIALIZER=stdlib)')
+    run.add_argument('--timeout', type=float, default=600)
+    run.add_argument('--output', help='Arquivo de saída (default: results/<data>-<commit>.json)')
+    run.set_defaults(func=cmd_run)
+
+    comp = commands.add_parser('compare', help='Compara dois resultados')
+    comp.add_argument('base')
+    comp.add_argument('new')
+    comp.add_argument('--threshold', type=float, default=10, help='Piora do p50 (%%) marcada como regressão')
+    comp.add_argument('--fail', action='store_true', help='Sai com código 1 se houver regressão')
+    comp.set_defaults(func=cmd_compare)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: apply_filters (regex/replace a cada request) vs
+render_query (template compilado uma vez por pergunta)
+Execute com: python tests/benchmark_query_template.py [iterações]
+"""
+
+import sys
+import os
+import io
+import time
+import contextlib
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from api.utils.query_parser import QueryParser
+from test_query_template import SAMPLE_QUERY, FILTER_SETS
+
+
+def medir(func, iteracoes: int) -> float:
+    """Tempo médio por request em microssegundos (stdout descartado)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        inicio = time.perf_counter()
+        for i in range(iteracoes):
+            func(FILTER_SETS[i % len(FILTER_SETS)])
+        total = time.perf_counter() - inicio
+    return total / iteracoes * 1_000_000
+
+
+def main():
+    iteracoes = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    parser = QueryParser()
+
+    # Query grande como as do dashboard: repete o bloco principal
+    query = "\nUNION ALL\n".join([SAMPLE_QUERY.replace("ORDER BY date DESC", "")] * 8)
+
+    antes = medir(lambda filtros: parser.apply_filters(query, filtros), iteracoes)
+    # Como no QueryService: a revisão vem junto com o card do Metabase
+    revisao = parser.query_revision(query)
+    depois = medir(lambda filtros: parser.render_query(51, query, filtros, revisao), iteracoes)
+
+    print(f"📏 Query: {len(query):,} caracteres, {len(FILTER_SETS)} combinações de filtros, "
+          f"{iteracoes:,} iterações")
+    print(f"   apply_filters (antes):  {antes:8.1f} µs/request")
+    print(f"   render_query (depois):  {depois:8.1f} µs/request")
+    print(f"   Ganho: {antes / depois:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: conversão das linhas para JSON em tabelas largas sintéticas
+Antes: casts padrão do psycopg2 (Decimal/date/datetime) + laço isinstance por célula
+Depois: typecasters da conexão (api/utils/pg_types.py), linhas direto para o json.dumps
+Os casts recebem o texto como o PostgreSQL envia, do mesmo jeito que o cursor chama
+Execute com: python tests/benchmark_row_conversion.py [linhas] [colunas]
+"""
+
+import sys
+import os
+import json
+import time
+from decimal import Decimal
+from datetime import datetime, date
+
+import psycopg2.extensions as ext
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.utils import pg_types
+
+# Tipos das colunas, repetidos até a largura pedida (perfil do meta_ads_insights)
+PERFIL = ['date', 'text', 'text', 'numeric', 'numeric', 'int', 'numeric', 'timestamp', 'text', 'numeric']
+
+CASTS_ANTES = {'numeric': ext.DECIMAL, 'date': ext.PYDATE, 'timestamp': ext.PYDATETIME}
+CASTS_DEPOIS = {'numeric': pg_types.FLOAT_NUMERIC, 'date': pg_types.ISO_DATE,
+                'timestamp': pg_types.ISO_TIMESTAMP}
+
+
+def gerar_texto(linhas: int, colunas: int):
+    """Linhas como o PostgreSQL envia (texto por célula)"""
+    tipos = [PERFIL[i % len(PERFIL)] for i in range(colunas)]
+    amostra = {
+        'date': lambda i: f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+        'timestamp': lambda i: f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d} 10:{i % 60:02d}:00",
+        'numeric': lambda i: f"{i * 1.37:.2f}",
+        'int': lambda i: i,
+        'text': lambda i: f"Campanha {i % 500}",
+    }
+    return tipos, [tuple(amostra[t](i + c) for c, t in enumerate(tipos)) for i in range(linhas)]
+
+
+def cast_linhas(tipos, linhas, casts):
+    """Aplica os casts célula a célula como o cursor faz no fetchall"""
+    funcs = [casts.get(t) for t in tipos]
+    return [
+        tuple(f(v, None) if f else v for f, v in zip(funcs, linha))
+        for linha in linhas
+    ]
+
+
+def processar_antigo(rows):
+    """Cópia do antigo QueryService._process_rows_native"""
+    processed = []
+    for row in rows:
+        processed_row = []
+        for value in row:
+            if isinstance(value, Decimal):
+                processed_row.append(float(value))
+            elif isinstance(value, (datetime, date)):
+                processed_row.append(value.isoformat())
+            elif isinstance(value, dict):
+                processed_row.append(value)
+            elif value is None:
+                processed_row.append(None)
+            else:
+                processed_row.append(value)
+        processed.append(processed_row)
+    return processed
+
+
+def medir(func) -> float:
+    inicio = time.perf_counter()
+    func()
+    return time.perf_counter() - inicio
+
+
+def main():
+    linhas = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    colunas = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    tipos, texto = gerar_texto(linhas, colunas)
+
+    def antes():
+        rows = processar_antigo(cast_linhas(tipos, texto, CASTS_ANTES))
+        return json.dumps(rows, separators=(',', ':'))
+
+    def depois():
+        rows = cast_linhas(tipos, texto, CASTS_DEPOIS)
+        return json.dumps(rows, separators=(',', ':'))
+
+    assert antes() == depois(), "saídas diferentes"
+
+    t_antes = medir(antes)
+    t_depois = medir(depois)
+
+    print(f"📏 {linhas:,} linhas × {colunas} colunas ({linhas * colunas:,} células)")
+    print(f"   casts padrão + laço (antes):  {t_antes:6.2f}s")
+    print(f"   typecasters (depois):         {t_depois:6.2f}s")
+    print(f"   Ganho: {t_antes / t_depois:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark: montagem da resposta (JSON + gzip do corpo em cache) por backend
+Mede o mesmo caminho do QueryService._build_body: split_response + CachedBody.compress
+Execute com: python tests/benchmark_serializer.py [linhas ...]  (padrão: 100000 1000000)
+"""
+
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.utils import gzip_envelope, serializer
+from api.utils.gzip_envelope import CachedBody
+
+COLS = [
+    {'name': name, 'base_type': base_type, 'display_name': name.replace('_', ' ').title()}
+    for name, base_type in [
+        ('date', 'type/Date'), ('account_name', 'type/Text'), ('campaign_name', 'type/Text'),
+        ('adset_name', 'type/Text'), ('ad_name', 'type/Text'), ('impressions', 'type/BigInteger'),
+        ('clicks', 'type/BigInteger'), ('spend', 'type/Decimal'), ('reach', 'type/BigInteger'),
+        ('cpm', 'type/Decimal'), ('ctr', 'type/Decimal'), ('conversions', 'type/Integer'),
+    ]
+]
+
+
+def gerar_linhas(quantidade: int):
+    """Linhas como saem do cursor com os typecasters (tuplas, float, data ISO)"""
+    return [
+        (f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}", f"Conta {i % 20}", f"Campanha {i % 300}",
+         f"Conjunto {i % 2000}", f"Anúncio {i % 9000}", i * 37 % 100000, i % 900,
+         round(i * 0.731 % 5000, 2), i * 17 % 80000, round(i * 0.013 % 90, 4),
+         round(i * 0.0007 % 3, 4), i % 40)
+        for i in range(quantidade)
+    ]
+
+
+def montar(rows):
+    response_data = {
+        'data': {'cols': COLS, 'rows': rows, 'rows_truncated': len(rows),
+                 'results_metadata': {'columns': COLS}},
+        'database_id': 2, 'json_query': {}, 'status': 'completed',
+        'context': 'question', 'row_count': len(rows)
+    }
+    inicio = time.perf_counter()
+    prefix = gzip_envelope.split_response(response_data, [])
+    meio = time.perf_counter()
+    body = CachedBody.compress(prefix, 0.0, 'bench')
+    fim = time.perf_counter()
+    return meio - inicio, fim - inicio, len(prefix), len(body)
+
+
+def main():
+    tamanhos = [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000]
+    original = serializer.dumps
+
+    for quantidade in tamanhos:
+        rows = gerar_linhas(quantidade)
+        print(f"📏 {quantidade:,} linhas × {len(COLS)} colunas")
+        resultados = {}
+        for name, (dumps, _) in serializer.BACKENDS.items():
+            # split_response usa serializer.dumps: troca o backend só para a medição
+            serializer.dumps = dumps
+            try:
+                resultados[name] = montar(rows)
+            finally:
+                serializer.dumps = original
+            json_s, total_s, tamanho, comprimido = resultados[name]
+            print(f"   {name:7s} JSON {json_s:6.2f}s | JSON + gzip {total_s:6.2f}s "
+                  f"| {tamanho / 1e6:,.1f} MB → {comprimido / 1e6:,.1f} MB")
+        if 'orjson' in resultados:
+            print(f"   Ganho no JSON: {resultados['json'][0] / resultados['orjson'][0]:.1f}x")
+        del rows
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Testa a montagem do SQL agregado (/api/query/aggregate)
+Não precisa de PostgreSQL: valida só o SQL gerado
+Execute com: python tests/test_aggregation.py  (ou pytest tests/test_aggregation.py)
+"""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.utils.aggregation import QueryAggregator
+
+QUESTION_SQL = """SELECT date, account_name, impressions, clicks, spend
+FROM road.meta_ads_insights
+WHERE account_name = ANY(%s) AND observacao <> '100%%';
+"""
+
+
+def _expect_error(func, *args):
+    try:
+        func(*args)
+    except ValueError as e:
+        return str(e)
+    assert False, f"deveria rejeitar {args}"
+
+
+def test_chart_rollup():
+    aggregator = QueryAggregator()
+    dimensions = aggregator.parse_group_by('date:month,account_name')
+    measures = aggregator.parse_measures(['sum:impressions', 'sum:clicks', 'sum:spend'])
+    sql = aggregator.build(QUESTION_SQL, dimensions, measures)
+
+    assert sql.startswith("SELECT date_trunc('month', \"date\")::date AS \"date\",")
+    assert 'SUM("spend") AS "spend"' in sql
+    # Ponto e vírgula removido, placeholders e escapes preservados
+    assert "'100%%'\n) AS pergunta" in sql
+    assert "ANY(%s)" in sql
+    assert sql.endswith("GROUP BY 1, 2\nORDER BY 1, 2")
+
+
+def test_dict_specs_and_default_aliases():
+    aggregator = QueryAggregator()
+    dimensions = aggregator.parse_group_by([{'column': 'date', 'grain': 'WEEK', 'as': 'semana'}])
+    measures = aggregator.parse_measures([
+        {'fn': 'avg', 'column': 'spend'},
+        {'fn': 'count'},
+        'max:clicks'
+    ])
+
+    assert dimensions == [{'column': 'date', 'grain': 'week', 'as': 'semana'}]
+    assert [m['as'] for m in measures] == ['avg_spend', 'count', 'max_clicks']
+    sql = aggregator.build(QUESTION_SQL, dimensions, measures)
+    assert 'COUNT(*) AS "count"' in sql
+
+
+def test_totals_without_group_by():
+    aggregator = QueryAggregator()
+    sql = aggregator.build(QUESTION_SQL, [], aggregator.parse_measures('sum:spend'))
+
+    assert 'GROUP BY' not in sql
+
+
+def test_rejects_injection_and_unknown_functions():
+    aggregator = QueryAggregator()
+
+    _expect_error(aggregator.parse_group_by, 'date; DROP TABLE x')
+    _expect_error(aggregator.parse_group_by, 'date:century')
+    _expect_error(aggregator.parse_group_by, [{'column': 'date', 'as': 'a"b'}])
+    _expect_error(aggregator.parse_measures, 'sum:spend)--')
+    _expect_error(aggregator.parse_measures, 'median:spend')
+    _expect_error(aggregator.parse_measures, 'sum')
+    _expect_error(aggregator.parse_measures, [])
+
+    message = _expect_error(
+        aggregator.build, QUESTION_SQL,
+        aggregator.parse_group_by('spend'), aggregator.parse_measures('sum:spend')
+    )
+    assert 'spend' in message
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Testa a geração do Arrow IPC stream a partir de lotes do cursor
+Precisa do pyarrow instalado (não precisa de PostgreSQL)
+Execute com: python tests/test_arrow_format.py  (ou pytest tests/test_arrow_format.py)
+"""
+
+import sys
+import os
+import json
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+
+from api.utils import arrow_format
+
+# (name, type_code) como no cursor.description do psycopg2
+DESCRIPTION = [
+    ('date', 1082),
+    ('account_name', 25),
+    ('impressions', 20),
+    ('spend', 1700),
+    ('ctr', 701),
+    ('updated_at', 1184),
+    ('conversions', 3802),
+]
+COLS = [{'name': name, 'base_type': 'type/Text', 'display_name': name} for name, _ in DESCRIPTION]
+
+BATCHES = [
+    [
+        (date(2025, 1, 1), 'CONTA A', 1000, Decimal('150.50'), 0.0125,
+         datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc), {'purchase': 2}),
+        (date(2025, 1, 2), None, None, None, None, None, None),
+    ],
+    [
+        (date(2025, 1, 3), "CONTA D'AGUA", 3, Decimal('0.10'), 1.0,
+         datetime(2025, 1, 3, 8, 30, tzinfo=timezone.utc), [1, 2]),
+    ],
+]
+
+
+def _read(chunks):
+    return pa.ipc.open_stream(b''.join(chunks)).read_all()
+
+
+def test_schema_is_typed():
+    schema = arrow_format.build_schema(DESCRIPTION, COLS)
+
+    assert schema.field('date').type == pa.date32()
+    assert schema.field('impressions').type == pa.int64()
+    assert schema.field('spend').type == pa.float64()
+    assert schema.field('updated_at').type == pa.timestamp('us', tz='UTC')
+    assert schema.field('account_name').type == pa.string()
+    assert json.loads(schema.metadata[b'metabase_cols']) == COLS
+
+
+def test_stream_round_trip():
+    schema = arrow_format.build_schema(DESCRIPTION, COLS)
+    chunks = list(arrow_format.iter_ipc_stream(schema, BATCHES))
+    table = _read(chunks)
+
+    # schema + um pedaço por lote + fim do stream
+    assert len(chunks) == len(BATCHES) + 2
+    assert table.num_rows == 3
+    assert table.column('spend').to_pylist() == [150.5, None, 0.1]
+    assert table.column('impressions').to_pylist() == [1000, None, 3]
+    assert table.column('date').to_pylist()[2] == date(2025, 1, 3)
+    assert table.column('conversions').to_pylist() == ['{"purchase": 2}', None, '[1, 2]']
+
+
+def test_empty_result_keeps_schema():
+    schema = arrow_format.build_schema(DESCRIPTION, COLS)
+    table = _read(arrow_format.iter_ipc_stream(schema, []))
+
+    assert table.num_rows == 0
+    assert table.schema.names == [name for name, _ in DESCRIPTION]
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
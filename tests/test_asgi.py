@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Testa a tradução ASGI <-> werkzeug da entrada assíncrona (headers do request e CORS da resposta)
+Precisa de asgiref e psycopg 3 instalados (não precisa de PostgreSQL: o pool não é aberto)
+Execute com: python tests/test_asgi.py  (ou pytest tests/test_asgi.py)
+"""
+
+import sys
+import os
+import io
+import asyncio
+import contextlib
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+pytest.importorskip('asgiref')
+pytest.importorskip('psycopg_pool')
+
+from werkzeug.wrappers import Response
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from api import asgi
+from api.server import EXPOSE_HEADERS
+
+
+def test_repeated_headers_are_joined():
+    scope = {'type': 'http', 'method': 'GET', 'path': '/metabase_customizacoes/api/query',
+             'root_path': '/metabase_customizacoes', 'query_string': b'question_id=51',
+             'headers': [(b'accept-encoding', b'gzip'), (b'accept-encoding', b'br'),
+                         (b'x-request-id', b'dash-1')]}
+    environ = asgi._environ(scope)
+
+    assert environ['HTTP_ACCEPT_ENCODING'] == 'gzip,br'
+    assert environ['HTTP_X_REQUEST_ID'] == 'dash-1'
+    assert environ['PATH_INFO'] == '/api/query'
+
+
+def test_response_exposes_headers_like_flask_cors():
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi._send(send, Response(b'{}', mimetype='application/json')))
+    headers = dict(sent[0]['headers'])
+
+    assert headers[b'access-control-allow-origin'] == b'*'
+    assert headers[b'access-control-expose-headers'].decode() == ', '.join(EXPOSE_HEADERS)
+    assert sent[-1]['body'] == b'{}'
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Testa a configuração da sessão: caminho assíncrono com prepare_threshold=0
+(padrão com PREPARED_STATEMENTS=true): o psycopg 3 prepara todo comando, e
+PREPARE não aceita vários comandos nem deveria receber um por request id;
+os dois caminhos aplicam os mesmos parâmetros (SESSION_SETTINGS)
+Não precisa de PostgreSQL nem do psycopg 3: conexão e pool são simulados
+Execute com: python tests/test_async_session.py  (ou pytest tests/test_async_session.py)
+"""
+
+import sys
+import os
+import io
+import asyncio
+import contextlib
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config.settings import SESSION_SETTINGS
+from api.services.async_query_service import AsyncQueryService
+from api.services.query_service import QueryService
+from api.utils import tracing
+
+
+class FakeConnection:
+    """Imita o psycopg 3 com prepare_threshold=0: prepara tudo que não vier com prepare=False"""
+
+    def __init__(self):
+        self.prepared = set()
+        self.executed = []
+        self.adapters = type('Adapters', (), {'register_loader': lambda self, *args: None})()
+
+    async def execute(self, query, params=None, prepare=None):
+        if prepare is not False:
+            if ';' in query.strip().rstrip(';'):
+                raise RuntimeError('cannot insert multiple commands into a prepared statement')
+            self.prepared.add(query)
+        self.executed.append((query, params))
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = [('date', 1082)]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def execute(self, query, params=None, prepare=None):
+        await self.conn.execute(query, params, prepare)
+
+    async def fetchall(self):
+        return [('2025-01-01',)]
+
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def getconn(self):
+        return self.conn
+
+    async def putconn(self, conn):
+        pass
+
+
+def make_service(conn):
+    service = AsyncQueryService.__new__(AsyncQueryService)
+    service.pool = FakePool(conn)
+    service.slow_queries = type('SlowQueries', (), {'record': lambda self, *args: None})()
+    return service
+
+
+async def requests(service, ids):
+    for request_id in ids:
+        _, token = tracing.start('/api/query', request_id)
+        try:
+            await service._execute_native_query('SELECT date FROM t WHERE date >= %s', ['2025-01-01'])
+        finally:
+            tracing.finish(token)
+
+
+def test_session_setup_survives_prepare_threshold_zero():
+    conn = FakeConnection()
+    service = make_service(conn)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(AsyncQueryService._configure_async_connection(conn))
+        asyncio.run(requests(service, ['dash-1', 'dash-2', 'dash-3']))
+
+    # Só a query da pergunta vira prepared statement: nada por request id
+    assert conn.prepared == {'SELECT date FROM t WHERE date >= %s'}
+    names = [params[0] for query, params in conn.executed if 'application_name' in query]
+    assert [name.split()[-1] for name in names] == ['dash-1', 'dash-2', 'dash-3']
+    # search_path, work_mem e random_page_cost ficam na conexão, com os valores do caminho síncrono
+    settings = [params for query, params in conn.executed if params and 'search_path' in params]
+    assert len(settings) == 1
+    assert dict(zip(settings[0][::2], settings[0][1::2])) == SESSION_SETTINGS
+
+
+def test_sync_session_uses_same_settings():
+    executed = []
+
+    class Cursor:
+        def execute(self, query, params=None):
+            executed.append((query, params))
+
+    _, token = tracing.start('/api/query', 'dash-9')
+    try:
+        QueryService._configure_session(Cursor())
+    finally:
+        tracing.finish(token)
+
+    query, params = executed[0]
+    assert len(executed) == 1 and ';' not in query
+    values = dict(zip(params[::2], params[1::2]))
+    assert values.pop('application_name').endswith('dash-9')
+    assert values == SESSION_SETTINGS and values['work_mem']
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Testa as peças do benchmark end-to-end que não precisam de PostgreSQL:
+Metabase simulado, cards de fixture renderizados pelo QueryParser,
+gerador da base (formato do COPY), comparação entre execuções e o
+teste de carga (leitura dos logs gravados e percentis)
+Execute com: python tests/test_benchmark_suite.py  (ou pytest tests/test_benchmark_suite.py)
+"""
+
+import sys
+import os
+import io
+import json
+import random
+import tempfile
+import contextlib
+from datetime import date
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), 'benchmark')))
+
+import fake_metabase
+import generate_data
+import load_test
+import run_benchmark
+from api.services.metabase_service import parse_question, dashboard_questions
+from api.utils.metabase_session import MetabaseSession
+from api.utils.query_parser import QueryParser
+
+
+def test_fake_metabase_serves_cards_and_dashboards():
+    with fake_metabase.running() as server:
+        session = MetabaseSession(server.url, 'bench', 'bench', backoff=0, timeout=5)
+        card = session.get('/api/card/9001').json()
+        dashboard = session.get('/api/dashboard/900').json()
+        missing = session.get('/api/card/1')
+
+    question = parse_question(9001, card)
+    assert 'conversoes_consideradas' in question['template_tags'] and question['updated_at']
+    assert sorted(dashboard_questions(dashboard)) == [9001, 9002]
+    assert missing.status_code == 404
+    assert server.state['logins'] == 1 and server.state['requests']['card'] == 2
+
+
+def test_fixture_cards_render_for_every_scenario():
+    cards, _ = fake_metabase.load_fixtures()
+    parser = QueryParser()
+    scenarios = run_benchmark.build_scenarios('2025-06-30')
+    assert {scenario['question_id'] for scenario in scenarios} == set(run_benchmark.RANGES)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for scenario in scenarios:
+            question = parse_question(scenario['question_id'], cards[scenario['question_id']])
+            filters = {key: value for key, value in scenario['params'].items() if key != 'question_id'}
+            sql, params = parser.render_query(scenario['question_id'], question['query'], filters)
+            assert '{{' not in sql and '[[' not in sql
+            assert sql.count('%s') == len(params)
+            assert 'BETWEEN' in sql and params[0] <= params[1] == '2025-06-30'
+            if scenario['filters'] == 'data+conversoes':
+                assert "action_type = ANY(%s)" in sql and ['purchase', 'lead'] in params
+
+        # Todos os cards do dashboard do teste de carga com o filtro padrão
+        filters = load_test.pick_filters(random.Random(1), date(2025, 6, 30), same_filters=1.0)
+        for question_id, card in cards.items():
+            sql, params = parser.render_query(question_id, parse_question(question_id, card)['query'], filters)
+            assert '{{' not in sql and params == ['2025-06-24', '2025-06-30']
+
+
+def test_generated_rows_are_deterministic_copy_text():
+    rows = list(generate_data.generate_rows(500, 10, date(2025, 6, 30), seed=7))
+    assert rows == list(generate_data.generate_rows(500, 10, date(2025, 6, 30), seed=7))
+    assert rows[0][0] == date(2025, 6, 21) and rows[-1][0] == date(2025, 6, 30)
+    assert len(rows[0]) == len(generate_data.COLUMNS)
+
+    text = generate_data.CopyStream(rows).read().decode('utf-8')
+    lines = text.splitlines()
+    assert len(lines) == 500 and all(line.count('\t') == len(generate_data.COLUMNS) - 1 for line in lines)
+    for line in lines[:50]:
+        for item in json.loads(line.split('\t')[-1]):
+            assert item['action_type'] in generate_data.ACTION_TYPES
+
+    assert generate_data._copy_text('a\tb\\c\nd') == 'a\\tb\\\\c\\nd'
+    assert generate_data.parse_count('2.5M') == 2_500_000 and generate_data.parse_count('500k') == 500_000
+
+
+def test_compare_flags_regressions():
+    def result(name, p50, size=1000):
+        return {'name': name, 'mode': 'cold', 'encoding': 'gzip', 'latency_ms': {'p50': p50},
+                'bytes': size, 'peak_rss_mb': 100.0}
+
+    base = {'results': [result('9001/7d/data', 100.0), result('9001/30d/data', 400.0)]}
+    new = {'results': [result('9001/7d/data', 150.0), result('9001/30d/data', 380.0), result('novo', 1.0)]}
+    rows = run_benchmark.compare(base, new, threshold=10)
+    assert [row['key'] for row in rows] == ['9001/7d/data cold gzip', '9001/30d/data cold gzip']
+    assert [row['regression'] for row in rows] == [True, False]
+    assert rows[0]['delta_pct'] == 50.0
+
+    assert run_benchmark.parse_server_timing('db;dur=12.5, serialize;dur=3.0, total;dur=20.1') == \
+        {'db': 12.5, 'serialize': 3.0, 'total': 20.1}
+    assert run_benchmark.count_rows(b'{"data":{"rows":[[1],[2]]},"row_count":2,"x":1}') == 2
+
+
+def test_load_test_reads_trace_and_access_logs():
+    with tempfile.TemporaryDirectory() as tmp:
+        trace = os.path.join(tmp, 'trace.jsonl')
+        with open(trace, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'ts': '2026-10-17T09:00:00.000', 'name': '/api/query', 'question_id': 51,
+                                'filters': {'data': 'past7days~', 'conta': ['A', "D'AGUA"]}}) + '\n')
+            f.write(json.dumps({'ts': '2026-10-17T09:00:02.500', 'name': '/api/query/aggregate',
+                                'question_id': 51}) + '\n')
+            f.write(json.dumps({'ts': '2026-10-17T09:00:03.000', 'name': '/api/query', 'question_id': 52}) + '\n')
+            f.write('{incompleto\n')
+        access = os.path.join(tmp, 'access.log')
+        with open(access, 'w', encoding='utf-8') as f:
+            f.write('10.0.0.1 - - [17/Oct/2026:09:00:01 +0000] "GET /api/query?question_id=51&data=2025-06-01~'
+                    '2025-06-30&conta=A&conta=B&format=json HTTP/1.1" 200 512\n')
+            f.write('10.0.0.1 - - [17/Oct/2026:09:00:02 +0000] "GET /api/query/aggregate?question_id=51 HTTP/1.1"\n')
+
+        traced = load_test.load_records(trace)
+        logged = load_test.load_records(access)
+
+    assert [(question_id, filters) for _, question_id, filters in traced] == \
+        [(51, {'data': 'past7days~', 'conta': ['A', "D'AGUA"]}), (52, {})]
+    assert traced[1][0] - traced[0][0] == 3.0
+    assert logged == [(logged[0][0], 51, {'data': '2025-06-01~2025-06-30', 'conta': ['A', 'B']})]
+
+
+def test_load_test_percentiles_and_summary():
+    assert load_test.percentiles(range(1, 101)) == {'p50': 50, 'p95': 95, 'p99': 99, 'max': 100}
+    assert load_test.percentiles([7.0])['p99'] == 7.0
+    assert load_test.percentiles([])['p50'] is None
+
+    offsets = load_test.arrivals(30, 60, 0, random.Random(1))
+    assert len(offsets) == 30 and offsets == sorted(offsets) and 0 <= offsets[0] and offsets[-1] <= 60
+    assert load_test.arrivals(3, 0, 10, random.Random(1))[0] == 0.0
+
+    recorder = load_test.Recorder()
+    samples = []
+    for i, (status, cache) in enumerate([(200, 'MISS'), (200, 'HIT-L1'), (200, 'HIT-WAIT'), (503, None)]):
+        sample = {'t': i, 'question_id': 51 + i % 2, 'ms': 100.0 * (i + 1), 'delay_ms': 10.0,
+                  'status': status, 'cache': cache, 'bytes': 10, 'error': None}
+        recorder.begin()
+        recorder.add(sample)
+        samples.append(sample)
+    recorder.page(recorder.started, samples)
+
+    summary = load_test.summarize(recorder, elapsed=2.0)
+    assert (summary['requests'], summary['errors'], summary['error_rate']) == (4, 1, 0.25)
+    assert summary['throughput_rps'] == 2.0 and recorder.inflight == 0
+    assert summary['latency_ms']['p50'] == 200.0 and summary['latency_with_queue_ms']['max'] == 310.0
+    assert summary['cache'] == {'MISS': 1, 'HIT-L1': 1, 'HIT-WAIT': 1}
+    assert summary['error_kinds'] == {'503': 1}
+    assert summary['by_question']['52']['errors'] == 1
+    assert summary['dashboard_loads'] == {'count': 1, 'failed': 1, 'p50': 410.0, 'p95': 410.0,
+                                          'p99': 410.0, 'max': 410.0}
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
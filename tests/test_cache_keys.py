@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Testa as chaves de cache pelo SQL resolvido e o TTL alinhado à virada do período
+Não precisa de PostgreSQL: só renderiza os templates e calcula as chaves
+Execute com: python tests/test_cache_keys.py  (ou pytest tests/test_cache_keys.py)
+"""
+
+import sys
+import os
+import io
+import time
+import contextlib
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.services import query_service
+from api.services.cache_service import CacheService, MISS
+from api.services.query_service import QueryService
+from api.utils import freshness
+from api.utils.freshness import FreshnessTracker
+from api.utils.gzip_envelope import CachedBody
+from api.utils.query_parser import QueryParser
+
+QUERY = """SELECT date, account_name, spend FROM road.meta_ads_insights
+WHERE 1=1
+[[AND {{date}}]]
+[[AND {{conta}}]]"""
+
+
+def make_service():
+    """QueryService sem pool nem Metabase: só o que monta chave e TTL"""
+    service = QueryService.__new__(QueryService)
+    service.query_parser = QueryParser()
+
+    class Cache:
+        ttl = 300
+    service.cache_service = Cache()
+    return service
+
+
+def key(service, filters, version=''):
+    with contextlib.redirect_stdout(io.StringIO()):
+        sql, params = service.query_parser.render_query(51, QUERY, filters)
+    return service._generate_cache_key(sql, params, version)
+
+
+@contextlib.contextmanager
+def validator_service(now, queries=None):
+    """QueryService com ETag ligado, card fixo e relógio controlado (now[0])"""
+    service = make_service()
+    service.freshness = FreshnessTracker(300, 30, queries or {})
+
+    class Metabase:
+        def get_question_query(self, question_id):
+            return {'revision': 'r1'}
+    service.metabase_service = Metabase()
+    service._execute_scalar = lambda sql: '2024-01-01'
+
+    clock, enabled = freshness.time, query_service.FRESHNESS_CONFIG['etag_enabled']
+    freshness.time = type('Clock', (), {'time': staticmethod(lambda: now[0]),
+                                        'monotonic': staticmethod(time.monotonic)})
+    query_service.FRESHNESS_CONFIG['etag_enabled'] = True
+    try:
+        yield service
+    finally:
+        freshness.time = clock
+        query_service.FRESHNESS_CONFIG['etag_enabled'] = enabled
+
+
+def validated_key(service, filters, variant='json'):
+    with contextlib.redirect_stdout(io.StringIO()):
+        sql, params = service.query_parser.render_query(51, QUERY, filters)
+    etag, version = service._question_validator(51, sql, params, variant)
+    return etag, service._generate_cache_key(sql, params, version)
+
+
+def test_relative_and_absolute_dates_share_key():
+    service = make_service()
+    today = datetime.now().date()
+    explicit = f"{today - timedelta(days=6)}~{today}"
+
+    assert key(service, {'data': 'past7days~'}) == key(service, {'data': explicit})
+    assert key(service, {'data': 'past7days'}) != key(service, {'data': explicit})
+
+
+def test_equivalent_filters_share_key():
+    service = make_service()
+    a = key(service, {'data': '2025-01-01~2025-01-07', 'conta': ['B', 'A'], 'campanha': ''})
+    b = key(service, {'conta': ['A', 'B'], 'data': '2025-01-01~2025-01-07'})
+
+    assert a == b
+    assert a != key(service, {'data': '2025-01-01~2025-01-07', 'conta': ['A']})
+    assert a != key(service, {'data': '2025-01-01~2025-01-07', 'conta': ['A', 'B']}, 'w2')
+
+
+def test_key_is_stable_across_freshness_buckets():
+    now = [299.0]
+    filters = {'data': '2025-01-01~2025-01-07', 'conta': ['A']}
+    with validator_service(now) as service:
+        etag_before, key_before = validated_key(service, filters)
+        now[0] = 301.0
+        etag_after, key_after = validated_key(service, filters)
+
+    # Sem watermark nem a base do ETag nem a chave dependem da janela de tempo
+    # (o ETag final vem do corpo em cache, ver test_bucket_etag_follows_cached_body)
+    assert etag_before == etag_after
+    assert key_before == key_after == key(service, filters)
+
+
+def test_bucket_etag_follows_cached_body():
+    now = [299.0]
+    filters = {'data': '2025-01-01~2025-01-07', 'conta': ['A']}
+    rows = [('2025-01-01', 'A', 1.5)]
+    with validator_service(now) as service:
+        class Metabase:
+            def get_question_query(self, question_id):
+                return {'query': QUERY, 'revision': 'r1'}
+        service.metabase_service = Metabase()
+        service.cache_service = CacheService(use_redis=False)
+        service.cache_service.enabled = True
+        service.warmup = None
+        service._incremental_fill = lambda *args: None
+        service._execute_native_query = lambda *args: ([{'name': 'date'}, {'name': 'account_name'},
+                                                        {'name': 'spend'}], list(rows), 0.01)
+
+        def request(if_none_match=None):
+            with contextlib.redirect_stdout(io.StringIO()):
+                return service.execute_query(51, filters, if_none_match=if_none_match)
+
+        first = request()
+        etag = first.headers['ETag']
+        assert first.status_code == 200 and not etag.startswith('W/')
+
+        # Janela nova, mesmo corpo em cache: 304 (antes o ETag mudava na virada)
+        now[0] = 301.0
+        revalidated = request(etag)
+        assert revalidated.status_code == 304 and revalidated.headers['ETag'] == etag
+
+        # Sem corpo em cache não há 304; com os mesmos bytes o ETag é o mesmo
+        service.cache_service.clear_all()
+        again = request(etag)
+        assert again.status_code == 200 and again.headers['ETag'] == etag
+
+        # Dados mudaram: corpo novo, ETag novo
+        service.cache_service.clear_all()
+        rows.append(('2025-01-02', 'A', 2.0))
+        changed = request(etag)
+        assert changed.status_code == 200 and changed.headers['ETag'] != etag
+        assert request(changed.headers['ETag']).status_code == 304
+
+
+def test_watermark_changes_key():
+    now = [299.0]
+    filters = {'data': '2025-01-01~2025-01-07'}
+    with validator_service(now, {'51': 'SELECT max(updated_at) FROM road.meta_ads_insights'}) as service:
+        etag_before, key_before = validated_key(service, filters)
+        now[0] = 301.0
+        assert validated_key(service, filters) == (etag_before, key_before)
+
+    assert key_before == key(service, filters, 'w2024-01-01') != key(service, filters)
+
+
+def test_rollover_boundaries():
+    parser = QueryParser()
+    wednesday = datetime(2025, 1, 8, 15, 30)
+
+    assert parser.filters_rollover({'data': 'past7days~'}, wednesday) == datetime(2025, 1, 9)
+    assert parser.filters_rollover({'data': '~'}, wednesday) == datetime(2025, 1, 9)
+    assert parser.filters_rollover({'data': 'past3hours'}, wednesday) == datetime(2025, 1, 9)
+    # Semanas de domingo a sábado
+    assert parser.filters_rollover({'data': 'past2weeks'}, wednesday) == datetime(2025, 1, 12)
+    assert parser.filters_rollover({'data': 'thisweek'}, datetime(2025, 1, 12, 1)) == datetime(2025, 1, 19)
+    assert parser.filters_rollover({'data': 'lastmonth'}, wednesday) == datetime(2025, 2, 1)
+    assert parser.filters_rollover({'data': 'thisquarter'}, datetime(2025, 11, 20)) == datetime(2026, 1, 1)
+    assert parser.filters_rollover({'data': 'NextYear'}, wednesday) == datetime(2026, 1, 1)
+
+    assert parser.filters_rollover({'data': '2025-01-01~2025-01-07'}, wednesday) is None
+    assert parser.filters_rollover({'conta': 'A'}, wednesday) is None
+
+
+def test_ttl_stops_at_rollover():
+    service = make_service()
+    assert service._cache_ttl({'data': '2025-01-01~2025-01-07'}) is None
+
+    ttl = service._cache_ttl({'data': 'past7days~'})
+    midnight = datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time())
+    assert 1 <= ttl <= min(300, (midnight - datetime.now()).total_seconds() + 1)
+
+
+
+def test_cache_entry_uses_shorter_ttl():
+    with contextlib.redirect_stdout(io.StringIO()):
+        cache = CacheService(use_redis=False)
+        cache.enabled = True
+        fill = lambda: (CachedBody.compress(b'{"v":1}', 0.1, 'etag'), True)
+
+        cache.get_or_fill('k', fill, ttl=0.05)
+        assert cache.remaining_ttl('k') <= 0.05
+        time.sleep(0.06)
+        assert cache.get_or_fill('k', fill)[1] == MISS
+        # TTL maior que o padrão não estende a entrada
+        cache.set('k', fill()[0], ttl=10 * cache.ttl)
+        assert cache.remaining_ttl('k') <= cache.ttl
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
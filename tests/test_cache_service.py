@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Testa o cache em dois níveis (LRU em memória), o single-flight e o lock entre workers
+Não precisa de Redis: roda só com o L1 (o lock usa um cliente Redis simulado)
+Execute com: python tests/test_cache_service.py  (ou pytest tests/test_cache_service.py)
+"""
+
+import sys
+import os
+import io
+import time
+import threading
+import contextlib
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.services.cache_service import (CacheService, LocalLRU, HIT_LOCAL, HIT_WAIT, MISS, BYPASS,
+                                        LOCK_PREFIX, RELEASE_LOCK_SCRIPT)
+from api.utils.gzip_envelope import CachedBody
+
+
+def body(text):
+    return CachedBody.compress(text.encode('utf-8'), 0.5, 'etag')
+
+
+def make_cache():
+    with contextlib.redirect_stdout(io.StringIO()):
+        cache = CacheService(use_redis=False)
+    cache.enabled = True
+    return cache
+
+
+def test_lru_is_bounded_by_bytes():
+    lru = LocalLRU(max_bytes=100, max_entry_bytes=60)
+    lru.set('a', b'x' * 40, 60)
+    lru.set('b', b'x' * 40, 60)
+    lru.get('a')                      # 'a' passa a ser a mais recente
+    lru.set('c', b'x' * 40, 60)       # estoura 100 bytes: sai 'b'
+
+    assert lru.get('b') is None
+    assert lru.get('a') and lru.get('c')
+    assert lru.stats()['bytes'] == 80
+    assert lru.stats()['evictions'] == 1
+    # Maior que max_entry_bytes não entra
+    assert not lru.set('d', b'x' * 61, 60)
+
+
+def test_lru_expires_entries():
+    lru = LocalLRU(max_bytes=100, max_entry_bytes=100)
+    lru.set('a', b'abc', 0.05)
+    time.sleep(0.06)
+
+    assert lru.get('a') is None
+    assert lru.stats()['bytes'] == 0
+
+
+def test_get_or_fill_caches_final_body():
+    cache = make_cache()
+    calls = []
+    filled = body('{"data":{}')
+
+    def fill():
+        calls.append(1)
+        return filled, True
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        first = cache.get_or_fill('k', fill)
+        second = cache.get_or_fill('k', fill)
+
+    assert first == (filled, MISS)
+    # O hit é o mesmo objeto comprimido: nada é refeito
+    assert second[0] is filled and second[1] == HIT_LOCAL
+    assert len(calls) == 1
+
+
+def test_empty_results_are_not_cached():
+    cache = make_cache()
+    with contextlib.redirect_stdout(io.StringIO()):
+        cache.get_or_fill('k', lambda: (body('{"data":{}'), False))
+
+    assert cache.get('k') == (None, None)
+
+
+def test_concurrent_misses_run_fill_once():
+    cache = make_cache()
+    calls = []
+    results = []
+    filled = body('{"data":{}')
+
+    def fill():
+        calls.append(1)
+        time.sleep(0.1)      # query lenta
+        return filled, True
+
+    def request():
+        results.append(cache.get_or_fill('dashboard', fill))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        threads = [threading.Thread(target=request) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(2)
+
+    assert len(calls) == 1
+    assert len(results) == 10
+    assert all(result is filled for result, _ in results)
+    assert sorted(status for _, status in results).count(HIT_WAIT) == 9
+    assert cache.get_stats()['hits_wait'] == 9
+    assert cache._flights == {}
+
+
+def test_disabled_cache_bypasses():
+    cache = make_cache()
+    cache.enabled = False
+
+    filled = body('{"data":{}')
+    assert cache.get_or_fill('k', lambda: (filled, True)) == (filled, BYPASS)
+    assert cache.get('k') == (None, None)
+
+
+class FakeRedis:
+    """SET NX e o script de liberação do lock (compare-and-delete)"""
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def eval(self, script, numkeys, key, token):
+        assert script == RELEASE_LOCK_SCRIPT and numkeys == 1
+        if self.data.get(key) == token:
+            del self.data[key]
+            return 1
+        return 0
+
+
+def test_fill_lock_releases_only_own_token():
+    cache = make_cache()
+    cache.redis_client = FakeRedis()
+    lock_key = LOCK_PREFIX + 'k'
+
+    with cache._redis_fill_lock('k') as owner:
+        token = cache.redis_client.data[lock_key]
+        with cache._redis_fill_lock('k') as other:
+            assert owner and not other
+        # O segundo worker não era dono: o lock continua
+        assert cache.redis_client.data[lock_key] == token
+    assert lock_key not in cache.redis_client.data
+
+    with cache._redis_fill_lock('k') as owner:
+        # Fill passou do fill_lock_timeout: o lock expirou e outro worker pegou
+        cache.redis_client.data[lock_key] = b'outro-worker'
+    assert owner and cache.redis_client.data[lock_key] == b'outro-worker'
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
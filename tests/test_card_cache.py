@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Testa o cache de cards do Metabase: TTL, revisão, LRU e prefetch de dashboards
+Não precisa do Metabase: as respostas da API são simuladas
+Execute com: python tests/test_card_cache.py  (ou pytest tests/test_card_cache.py)
+"""
+
+import sys
+import os
+import io
+import time
+import contextlib
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.services.metabase_service import MetabaseService, dashboard_questions
+from api.utils.card_cache import CardCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def card(question_id, sql, updated_at):
+    return {
+        'id': question_id,
+        'name': f'Pergunta {question_id}',
+        'updated_at': updated_at,
+        'dataset_query': {'type': 'native', 'native': {'query': sql, 'template-tags': {}}}
+    }
+
+
+def make_service(cards):
+    """MetabaseService com clock controlado e get_question_info simulado"""
+    service = MetabaseService()
+    clock = Clock()
+    service._query_cache = CardCache(max_entries=10, ttl=60, clock=clock)
+    service.calls = []
+
+    def get_question_info(question_id):
+        service.calls.append(question_id)
+        return cards[question_id]
+
+    service.get_question_info = get_question_info
+    return service, clock
+
+
+def test_ttl_and_lru():
+    clock = Clock()
+    cache = CardCache(max_entries=2, ttl=60, clock=clock)
+    cache.set(1, {'revision': 'a'})
+    cache.set(2, {'revision': 'b'})
+    cache.get(1)                       # 1 passa a ser a mais recente
+    cache.set(3, {'revision': 'c'})    # sai a 2
+
+    assert cache.get(2) == (None, False)
+    assert cache.get(1) == ({'revision': 'a'}, False)
+
+    clock.now = 60
+    assert cache.get(1) == ({'revision': 'a'}, True)
+    assert sorted(cache.stale_ids()) == [1, 3]
+    cache.touch(1)
+    assert cache.get(1)[1] is False
+
+
+def test_revision_change_is_counted():
+    cache = CardCache(max_entries=10, ttl=60)
+    assert cache.set(1, {'revision': 'a'}) is False
+    assert cache.set(1, {'revision': 'a'}) is False
+    assert cache.set(1, {'revision': 'b'}) is True
+    assert cache.stats()['revision_changes'] == 1
+
+
+def test_stale_card_is_served_then_revalidated():
+    cards = {51: card(51, 'SELECT 1', '2024-01-01')}
+    service, clock = make_service(cards)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert service.get_question_query(51)['query'] == 'SELECT 1'
+        service.get_question_query(51)
+        assert service.calls == [51]            # dentro do TTL não chama o Metabase
+
+        # Pergunta editada no Metabase depois do TTL
+        cards[51] = card(51, 'SELECT 2', '2024-01-02')
+        clock.now = 61
+        # Sem refresher rodando, a revalidação acontece na hora
+        assert service.get_question_query(51)['query'] == 'SELECT 2'
+        assert service.get_question_query(51)['query'] == 'SELECT 2'
+    assert service.calls == [51, 51]
+
+
+def test_refresher_revalidates_in_background():
+    cards = {51: card(51, 'SELECT 1', '2024-01-01')}
+    service, clock = make_service(cards)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        service.get_question_query(51)
+        service.start_refresher()
+        cards[51] = card(51, 'SELECT 2', '2024-01-02')
+        clock.now = 61
+
+        # O request recebe a versão em cache na hora; o refresher busca a nova
+        assert service.get_question_query(51)['query'] == 'SELECT 1'
+        deadline = time.time() + 2
+        while service._query_cache.get(51)[1] and time.time() < deadline:
+            time.sleep(0.01)
+        assert service.get_question_query(51)['query'] == 'SELECT 2'
+
+
+def test_unchanged_updated_at_only_renews_ttl():
+    cards = {51: card(51, 'SELECT 1', '2024-01-01')}
+    service, clock = make_service(cards)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        first = service.get_question_query(51)
+        clock.now = 61
+        assert service.get_question_query(51) is first
+    assert service._query_cache.get(51) == (first, False)
+
+
+def test_revalidation_error_keeps_cached_card():
+    cards = {51: card(51, 'SELECT 1', '2024-01-01')}
+    service, clock = make_service(cards)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        service.get_question_query(51)
+        del cards[51]                           # Metabase fora do ar / card sumiu
+        clock.now = 61
+        assert service.get_question_query(51)['query'] == 'SELECT 1'
+
+
+def test_dashboard_prefetch():
+    dashboard = {'dashcards': [
+        {'card': card(51, 'SELECT 1', '2024-01-01')},
+        {'card': card(52, 'SELECT 2', '2024-01-01')},
+        {'card': {'id': 60, 'dataset_query': {'type': 'query'}}},   # pergunta visual
+        {'card': None}                                               # texto / iframe
+    ]}
+    assert sorted(dashboard_questions(dashboard)) == [51, 52]
+
+    service, _ = make_service({})
+    service.get_dashboard = lambda dashboard_id: dashboard
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert service.refresh_dashboards([3]) == [51, 52]
+        assert service.get_question_query(52)['query'] == 'SELECT 2'
+    assert service.calls == []                  # request não tocou no Metabase
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Testa a negociação de compressão (Accept-Encoding) e a resposta do corpo em cache
+Execute com: python tests/test_compression.py  (ou pytest tests/test_compression.py)
+"""
+
+import sys
+import os
+import gzip
+import json
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.utils import compression, gzip_envelope
+from api.utils.gzip_envelope import CachedBody
+from api.services.query_service import QueryService
+
+TODOS = ['zstd', 'br', 'gzip']
+
+
+def test_negotiate_accept_encoding():
+    assert compression.negotiate(None, available=TODOS) == 'gzip'
+    assert compression.negotiate('gzip, deflate, br', available=TODOS) == 'br'
+    assert compression.negotiate('br;q=0.5, gzip', available=TODOS) == 'gzip'
+    assert compression.negotiate('gzip;q=0, *', available=['gzip']) == 'identity'
+    assert compression.negotiate('deflate', available=TODOS) == 'identity'
+    assert compression.negotiate('*', available=TODOS) == 'zstd'
+    # Abaixo do mínimo não comprime
+    assert compression.negotiate('gzip', size=10, available=TODOS) == 'identity'
+
+
+def test_stream_compressor_gzip():
+    compressor = compression.StreamCompressor('gzip', level=1)
+    data = b''.join(compressor.compress(b'{"rows":[%d]}' % i) for i in range(1000)) + compressor.flush()
+
+    assert gzip.decompress(data) == b''.join(b'{"rows":[%d]}' % i for i in range(1000))
+    assert compressor.elapsed > 0
+
+
+def corpo():
+    response_data = {'data': {'rows': [[i, 'Conta'] for i in range(500)]}, 'row_count': 500}
+    prefix = gzip_envelope.split_response(response_data, QueryService.PER_REQUEST_FIELDS)
+    return CachedBody.compress(prefix, 0.25, 'etag'), response_data
+
+
+def test_cached_body_served_as_gzip():
+    body, esperado = corpo()
+    service = object.__new__(QueryService)
+    response = service._body_response(body, 'HIT-L1', 'br, gzip')
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'X-Compression-Time' in response.headers
+    data = json.loads(gzip.decompress(response.get_data()))
+    assert data['data'] == esperado['data'] and data['from_cache'] is True
+
+
+def test_cached_body_identity_when_gzip_not_accepted():
+    body, esperado = corpo()
+    service = object.__new__(QueryService)
+    response = service._body_response(body, 'MISS', 'identity')
+
+    assert 'Content-Encoding' not in response.headers
+    assert int(response.headers['Content-Length']) == len(response.get_data())
+    assert json.loads(response.get_data())['data'] == esperado['data']
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Testa o pool de conexões (limites, fila de espera, validação e reaping)
+Não precisa de PostgreSQL: as conexões são simuladas
+Execute com: python tests/test_connection_pool.py  (ou pytest tests/test_connection_pool.py)
+"""
+
+import sys
+import os
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import psycopg2.extensions
+from api.services.connection_pool import ConnectionPool, PoolTimeoutError
+
+
+class FakeInfo:
+    transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, sql, params=None):
+        if self.conn.dead:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.dead = False
+        self.autocommit = True
+        self.info = FakeInfo()
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class FakePool(ConnectionPool):
+    def _open(self):
+        return FakeConnection()
+
+
+def make_pool(**kwargs):
+    return FakePool({}, **kwargs)
+
+
+def test_reuses_connections():
+    pool = make_pool(min_size=1, max_size=2)
+    with pool.connection() as conn1:
+        pass
+    with pool.connection() as conn2:
+        pass
+
+    assert conn1 is conn2
+    assert pool.stats()['created'] == 1
+    assert pool.stats()['checkouts'] == 2
+
+
+def test_blocks_at_max_size_and_times_out():
+    pool = make_pool(max_size=1, timeout=0.1)
+    conn = pool.getconn()
+
+    started = time.monotonic()
+    try:
+        pool.getconn()
+        assert False, "deveria ter estourado o timeout"
+    except PoolTimeoutError:
+        pass
+
+    assert time.monotonic() - started >= 0.1
+    stats = pool.stats()
+    assert stats['timeouts'] == 1
+    assert stats['waits'] == 1
+    assert stats['size'] == 1
+
+    pool.putconn(conn)
+
+
+def test_waiter_gets_returned_connection():
+    pool = make_pool(max_size=1, timeout=2)
+    conn = pool.getconn()
+    received = []
+
+    waiter = threading.Thread(target=lambda: received.append(pool.getconn()))
+    waiter.start()
+    time.sleep(0.05)
+    pool.putconn(conn)
+    waiter.join(1)
+
+    assert received == [conn]
+    assert pool.stats()['created'] == 1
+
+
+def test_dead_connection_is_replaced_on_checkout():
+    pool = make_pool(max_size=2, validate_after=0)
+    with pool.connection() as conn:
+        pass
+    conn.dead = True
+
+    with pool.connection() as fresh:
+        assert fresh is not conn
+
+    stats = pool.stats()
+    assert stats['validation_failures'] == 1
+    assert conn.closed
+    assert stats['size'] == 1
+
+
+def test_old_and_idle_connections_are_recycled():
+    pool = make_pool(min_size=0, max_size=2, max_age=0.05, max_idle=0.05)
+    conn = pool.getconn()
+    time.sleep(0.06)
+    pool.putconn(conn)
+
+    assert conn.closed
+    assert pool.stats()['size'] == 0
+
+    pool.max_age = 60
+    a = pool.getconn()
+    b = pool.getconn()
+    pool.putconn(a)
+    time.sleep(0.06)
+    pool.putconn(b)
+
+    assert a.closed and not b.closed
+    assert pool.stats()['idle'] == 1
+
+
+def test_close_all_keeps_pool_usable():
+    pool = make_pool(min_size=2, max_size=3)
+    pool.warm()
+    in_use = pool.getconn()
+    pool.close_all()
+    pool.putconn(in_use)
+
+    assert in_use.closed
+    assert pool.stats()['size'] == 0
+    with pool.connection() as conn:
+        assert not conn.closed
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Testa o ETag das perguntas e o token de frescor dos dados
+Não precisa de PostgreSQL: a query de watermark é simulada
+Execute com: python tests/test_freshness.py  (ou pytest tests/test_freshness.py)
+"""
+
+import sys
+import os
+import io
+import asyncio
+import contextlib
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.utils.freshness import FreshnessTracker, build_etag, etag_matches, normalize_filters
+
+
+def test_filters_are_normalized():
+    a = {'conta': ['B', 'A'], 'data': '2024-01-01~2024-01-31', 'campanha': ''}
+    b = {'data': '2024-01-01~2024-01-31', 'conta': ['A', 'B']}
+
+    assert normalize_filters(a) == normalize_filters(b)
+    assert build_etag(51, a, 'rev', 'w1') == build_etag(51, b, 'rev', 'w1')
+
+
+def test_etag_changes_with_inputs():
+    base = build_etag(51, {'conta': 'A'}, 'rev', 'w1', 'json')
+
+    assert base.startswith('"') and base.endswith('"')
+    assert build_etag(52, {'conta': 'A'}, 'rev', 'w1', 'json') != base
+    assert build_etag(51, {'conta': 'B'}, 'rev', 'w1', 'json') != base
+    assert build_etag(51, {'conta': 'A'}, 'rev2', 'w1', 'json') != base
+    assert build_etag(51, {'conta': 'A'}, 'rev', 'w2', 'json') != base
+    assert build_etag(51, {'conta': 'A'}, 'rev', 'w1', 'arrow') != base
+
+
+def test_if_none_match():
+    etag = build_etag(51, {}, 'rev', 'w1')
+
+    assert etag_matches(etag, etag)
+    assert etag_matches(etag, f'"outro", {etag}')
+    assert etag_matches(etag, 'W/' + etag)     # comparação fraca (RFC 9110)
+    assert etag_matches(etag, '*')
+    assert not etag_matches(etag, '"outro"')
+    assert not etag_matches(etag, None)
+    assert not etag_matches(None, etag)        # ETag desabilitado
+
+
+def test_token_without_watermark_uses_time_bucket():
+    tracker = FreshnessTracker(bucket_seconds=3600, check_interval=30, queries={})
+    calls = []
+
+    token = tracker.token(51, lambda sql: calls.append(sql))
+    assert token.startswith('t')
+    assert calls == []
+
+
+def test_watermark_is_reused_within_interval():
+    tracker = FreshnessTracker(bucket_seconds=300, check_interval=60,
+                               queries={'51': 'SELECT max(updated_at) FROM t'})
+    values = iter(['2024-01-01', '2024-01-02'])
+    calls = []
+
+    def run_scalar(sql):
+        calls.append(sql)
+        return next(values)
+
+    assert tracker.token(51, run_scalar) == 'w2024-01-01'
+    assert tracker.token(51, run_scalar) == 'w2024-01-01'
+    assert calls == ['SELECT max(updated_at) FROM t']
+
+    tracker.invalidate(51)
+    assert tracker.token(51, run_scalar) == 'w2024-01-02'
+    # Pergunta sem watermark própria nem padrão
+    assert tracker.token(52, run_scalar).startswith('t')
+
+
+def test_async_token_shares_interval_cache():
+    tracker = FreshnessTracker(bucket_seconds=300, check_interval=60,
+                               queries={'51': 'SELECT max(updated_at) FROM t'})
+    calls = []
+
+    async def run_scalar(sql):
+        calls.append(sql)
+        return '2024-01-01'
+
+    assert asyncio.run(tracker.token_async(51, run_scalar)) == 'w2024-01-01'
+    # O valor guardado vale também para o caminho síncrono
+    assert tracker.token(51, lambda sql: calls.append(sql)) == 'w2024-01-01'
+    assert len(calls) == 1
+
+
+def test_watermark_error_falls_back_to_bucket():
+    tracker = FreshnessTracker(bucket_seconds=300, check_interval=60, queries={},
+                               default_query='SELECT max(updated_at) FROM t')
+
+    def broken(sql):
+        raise RuntimeError('tabela não existe')
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert tracker.token(51, broken).startswith('t')
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
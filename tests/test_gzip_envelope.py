@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Testa o corpo gzip pré-comprimido + sufixo de metadata por request
+Execute com: python tests/test_gzip_envelope.py  (ou pytest tests/test_gzip_envelope.py)
+"""
+
+import sys
+import os
+import gzip
+import json
+import zlib
+import struct
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.utils.gzip_envelope import CachedBody, split_response, render_suffix
+
+RESPONSE = {
+    'data': {
+        'cols': [{'name': 'conta'}, {'name': 'spend'}],
+        'rows': [[f'CONTA {i}', i * 1.5] for i in range(5000)]
+    },
+    'row_count': 5000,
+    'started_at': 1.0,
+    'from_cache': False
+}
+PER_REQUEST = ['started_at', 'from_cache']
+
+
+def _body():
+    prefix = split_response(RESPONSE, PER_REQUEST)
+    return CachedBody.compress(prefix, 0.25, 'abc123')
+
+
+def test_render_is_valid_single_member_gzip():
+    body = _body()
+    raw = b''.join(body.render(render_suffix({'started_at': 2.0, 'from_cache': True})))
+
+    # Decoder de um único membro (como o do navegador) lê tudo e valida CRC/tamanho
+    decoder = zlib.decompressobj(wbits=31)
+    decoded = decoder.decompress(raw) + decoder.flush()
+    assert decoder.eof and decoder.unused_data == b''
+
+    data = json.loads(decoded)
+    assert data['data']['rows'] == RESPONSE['data']['rows']
+    assert data['from_cache'] is True
+    assert data['started_at'] == 2.0
+    assert json.loads(gzip.decompress(raw)) == data
+
+
+def test_each_request_gets_its_own_metadata():
+    body = _body()
+    first = body.render(render_suffix({'started_at': 1.0, 'from_cache': False}))
+    second = body.render(render_suffix({'started_at': 9.0, 'from_cache': True}))
+
+    # Prefixo comprimido é o mesmo objeto nas duas respostas
+    assert first[0] is second[0] is body.gzip_prefix
+    assert json.loads(gzip.decompress(b''.join(second)))['started_at'] == 9.0
+
+
+def test_serialization_round_trip():
+    body = _body()
+    restored = CachedBody.from_bytes(body.to_bytes())
+
+    assert restored.etag == 'abc123'
+    assert restored.execution_time == 0.25
+    assert (restored.crc, restored.size) == (body.crc, body.size)
+    suffix = render_suffix({'started_at': 3.0, 'from_cache': True})
+    assert b''.join(restored.render(suffix)) == b''.join(body.render(suffix))
+
+    try:
+        CachedBody.from_bytes(gzip.compress(b'{}'))
+        assert False, "formato antigo deveria ser rejeitado"
+    except ValueError:
+        pass
+
+
+def test_row_count_survives_cache_and_previous_format_is_read():
+    prefix = split_response(RESPONSE, PER_REQUEST)
+    body = CachedBody.compress(prefix, 0.25, 'abc123', row_count=5000)
+    assert CachedBody.from_bytes(body.to_bytes()).row_count == 5000
+
+    # Entrada gravada antes do número de linhas (MBZ1): lida com row_count 0
+    etag = b'abc123'.ljust(16, b' ')
+    old = b'MBZ1' + struct.pack('>IId16s', body.crc, body.size, 0.25, etag) + body.gzip_prefix
+    restored = CachedBody.from_bytes(old)
+    assert restored.row_count == 0 and restored.etag == 'abc123'
+    assert restored.decompress(b'}') == body.decompress(b'}')
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Testa o cache incremental por dia (blocos diários + query só dos dias que faltam)
+Não precisa de PostgreSQL: a execução da query é simulada com uma tabela diária em memória
+Execute com: python tests/test_incremental_cache.py  (ou pytest tests/test_incremental_cache.py)
+"""
+
+import sys
+import os
+import io
+import json
+import asyncio
+import contextlib
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.services.async_query_service import AsyncQueryService
+from api.services.cache_service import CacheService
+from api.services.incremental_cache import IncrementalCache, check_decomposable, delta_runs, split_by_day
+from api.services.query_service import QueryService
+from api.utils.query_parser import QueryParser
+
+QUERY = """SELECT date, account_name, sum(spend) AS spend FROM road.meta_ads_insights
+WHERE 1=1
+[[AND {{date}}]]
+[[AND {{conta}}]]
+GROUP BY date, account_name
+ORDER BY date, account_name"""
+
+COLS = [{'name': 'date'}, {'name': 'account_name'}, {'name': 'spend'}]
+
+
+def make_service(query=QUERY):
+    """QueryService sem pool nem Metabase; a query devolve uma linha por conta e dia"""
+    service = QueryService.__new__(QueryService)
+    service.query_parser = QueryParser()
+    service.cache_service = CacheService(use_redis=False)
+    service.cache_service.enabled = True
+    service.incremental = IncrementalCache(service.cache_service, service.query_parser, {
+        'questions': [51], 'date_column': 'date', 'day_ttl': 3600, 'recent_days': 3, 'max_days': 400
+    })
+
+    class Metabase:
+        def get_question_query(self, question_id):
+            return {'query': query, 'revision': 'r1'}
+    service.metabase_service = Metabase()
+
+    service.executed = []
+
+    def execute(query_sql, params, question_id=None, filters=None):
+        start, end = (date.fromisoformat(p) for p in params[:2])
+        service.executed.append((start, end))
+        rows = []
+        day = start
+        while day <= end:
+            for account in ('A', 'B'):
+                rows.append((day.isoformat(), account, float(day.day)))
+            day += timedelta(days=1)
+        return COLS, rows, 0.01
+    service._execute_native_query = execute
+    return service
+
+
+def run(service, filters):
+    with contextlib.redirect_stdout(io.StringIO()):
+        body, cacheable = service._incremental_fill(51, filters, 'w1')()
+    return json.loads(body.decompress(b'}'))['data']['rows']
+
+
+def test_split_and_runs():
+    days = [date(2025, 1, d) for d in (1, 2, 3, 5, 8, 9)]
+    assert delta_runs(days) == [(date(2025, 1, 1), date(2025, 1, 3)), (date(2025, 1, 5), date(2025, 1, 5)),
+                                (date(2025, 1, 8), date(2025, 1, 9))]
+    assert delta_runs(days, max_runs=2) == [(date(2025, 1, 1), date(2025, 1, 9))]
+
+    by_day = split_by_day(COLS, [('2025-01-02', 'A', 1.0)], 'date', [date(2025, 1, 1), date(2025, 1, 2)])
+    assert by_day == {date(2025, 1, 1): [], date(2025, 1, 2): [('2025-01-02', 'A', 1.0)]}
+    # Sem a coluna de data ou com linha fora do intervalo: não decompõe
+    assert split_by_day([{'name': 'spend'}], [(1.0,)], 'date', [date(2025, 1, 1)]) is None
+    assert split_by_day(COLS, [('2025-02-01', 'A', 1.0)], 'date', [date(2025, 1, 1)]) is None
+
+
+def test_non_decomposable_sql_is_excluded():
+    tags = ['date', 'conta']
+    assert check_decomposable(QUERY, tags, 'date') is None
+    assert check_decomposable(QUERY, ['conta'], 'date') == 'sem filtro de data'
+    assert check_decomposable(QUERY + "\nLIMIT 10", tags, 'date')
+    assert check_decomposable("SELECT date, sum(spend) OVER (ORDER BY date) FROM t", tags, 'date')
+    assert check_decomposable("SELECT date, spend FROM t ORDER BY spend DESC", tags, 'date')
+    assert check_decomposable("SELECT date, spend FROM t ORDER BY t.\"date\" DESC", tags, 'date') is None
+
+
+def test_whole_range_aggregates_are_excluded():
+    tags = ['date', 'conta']
+    # Agregam o intervalo inteiro: somar os dias guardados daria outro resultado
+    assert check_decomposable("SELECT max(date) AS date, sum(spend) FROM t WHERE {{date}} "
+                              "GROUP BY account_name", tags, 'date') == 'GROUP BY não inclui a data'
+    assert check_decomposable("SELECT date, sum(spend) FROM t GROUP BY account_name", tags, 'date')
+    assert check_decomposable("SELECT count(*) FROM t WHERE {{date}}", tags, 'date')
+    assert check_decomposable("SELECT DISTINCT account_name, date FROM t", tags, 'date')
+    assert check_decomposable("SELECT date, spend FROM t UNION SELECT max(date), 0 FROM t", tags, 'date')
+    # Agregação só em subquery, ou GROUP BY pela data (nome, posição ou qualificada): decompõe
+    assert check_decomposable("SELECT date, spend FROM (SELECT date, sum(spend) AS spend FROM t "
+                              "GROUP BY date) s WHERE spend > 0", tags, 'date') is None
+    assert check_decomposable("SELECT t.date::date AS date, sum(spend) FROM t GROUP BY 1, account_name",
+                              tags, 'date') is None
+    assert check_decomposable("SELECT date, 'max(x)' AS label FROM t -- count(*)", tags, 'date') is None
+
+
+def test_widening_range_queries_only_missing_days():
+    service = make_service()
+    first = run(service, {'data': '2025-01-01~2025-01-10', 'conta': ['A', 'B']})
+    assert len(first) == 20
+    assert service.executed == [(date(2025, 1, 1), date(2025, 1, 10))]
+
+    wider = run(service, {'data': '2025-01-01~2025-01-20', 'conta': ['B', 'A']})
+    assert service.executed[1:] == [(date(2025, 1, 11), date(2025, 1, 20))]
+    assert [row[0] for row in wider] == sorted(row[0] for row in wider)
+    assert wider[:20] == [list(row) for row in first]
+
+    # Janela andando para os dois lados: dois trechos
+    run(service, {'data': '2024-12-30~2025-01-22', 'conta': ['A', 'B']})
+    assert service.executed[2:] == [(date(2024, 12, 30), date(2024, 12, 31)),
+                                    (date(2025, 1, 21), date(2025, 1, 22))]
+
+    # Tudo em cache: nenhuma query
+    run(service, {'data': '2025-01-05~2025-01-15', 'conta': ['A', 'B']})
+    assert len(service.executed) == 4
+    stats = service.incremental.get_stats()
+    assert stats['queries'] == 4 and stats['days_cached'] == 10 + 20 + 11
+
+
+def test_other_filters_and_recent_days_use_own_blocks():
+    service = make_service()
+    run(service, {'data': '2025-01-01~2025-01-05', 'conta': 'A'})
+    run(service, {'data': '2025-01-01~2025-01-05', 'conta': 'B'})
+    assert len(service.executed) == 2
+
+    today = date.today()
+    filters = {'data': f"{today - timedelta(days=9)}~{today}"}
+    with contextlib.redirect_stdout(io.StringIO()):
+        service._incremental_fill(51, filters, 'w1')()
+        # Token de frescor novo: só os dias recentes voltam ao banco
+        service._incremental_fill(51, filters, 'w2')()
+    assert service.executed[-1] == (today - timedelta(days=2), today)
+
+
+def test_descending_order_and_fallbacks():
+    service = make_service(QUERY.replace('ORDER BY date, account_name', 'ORDER BY date DESC'))
+    rows = run(service, {'data': '2025-01-01~2025-01-03'})
+    assert [row[0] for row in rows[::2]] == ['2025-01-03', '2025-01-02', '2025-01-01']
+
+    # Intervalo aberto ou pergunta fora da lista: pergunta inteira
+    assert service._incremental_fill(51, {'data': '2025-01-01~'}, 'w1') is None
+    assert service._incremental_fill(52, {'data': '2025-01-01~2025-01-03'}, 'w1') is None
+
+    service = make_service(QUERY.replace('ORDER BY date, account_name', 'LIMIT 100'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert service._incremental_fill(51, {'data': '2025-01-01~2025-01-03'}, 'w1') is None
+    assert service.incremental.get_stats()['unsupported'] == {'51@r1': 'LIMIT/OFFSET ou função de janela'}
+
+
+def test_async_path_shares_daily_blocks():
+    sync = make_service()
+    run(sync, {'data': '2025-01-01~2025-01-10'})
+
+    # AsyncQueryService sem pool: mesma tabela simulada, Metabase e execução assíncronos
+    service = AsyncQueryService.__new__(AsyncQueryService)
+    service.query_parser, service.cache_service, service.incremental = \
+        sync.query_parser, sync.cache_service, sync.incremental
+
+    class Metabase:
+        async def get_question_query(self, question_id):
+            return {'query': QUERY, 'revision': 'r1'}
+    service.metabase_service = Metabase()
+
+    async def execute(query_sql, params, question_id=None, filters=None):
+        return sync._execute_native_query(query_sql, params, question_id, filters)
+    service._execute_native_query = execute
+
+    async def fill(filters):
+        incremental = await service._incremental_fill(51, filters, 'w1')
+        return await incremental() if incremental else None
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        body, cacheable = asyncio.run(fill({'data': '2025-01-01~2025-01-20'}))
+        assert asyncio.run(fill({'data': '2025-01-01~'})) is None
+
+    rows = json.loads(body.decompress(b'}'))['data']['rows']
+    assert cacheable and len(rows) == 40
+    assert sync.executed == [(date(2025, 1, 1), date(2025, 1, 10)), (date(2025, 1, 11), date(2025, 1, 20))]
+    assert rows == run(sync, {'data': '2025-01-01~2025-01-20'})
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
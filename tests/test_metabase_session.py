@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Testa a sessão HTTP com o Metabase: keep-alive, retentativas e renovação do token
+Não precisa do Metabase: sobe um servidor HTTP local que imita /api/session e /api/card
+Execute com: python tests/test_metabase_session.py  (ou pytest tests/test_metabase_session.py)
+"""
+
+import sys
+import os
+import io
+import json
+import threading
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import requests
+
+from api.utils.metabase_session import MetabaseSession
+
+
+class FakeMetabase(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # keep-alive
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        state = self.server.state
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path != '/api/session':
+            state['posts'].append(body)
+            if self.headers.get('X-Metabase-Session') != state['token']:
+                return self._reply(401, 'Unauthenticated')
+            return self._reply(200, {'path': self.path, 'body': body.decode()})
+        with state['lock']:
+            state['logins'] += 1
+            state['token'] = f"token-{state['logins']}"
+        self._reply(200, {'id': state['token']})
+
+    def do_GET(self):
+        state = self.server.state
+        state['ports'].add(self.client_address[1])
+        if state['fail_next'] > 0:
+            state['fail_next'] -= 1
+            return self._reply(503, {'error': 'reiniciando'})
+        if self.headers.get('X-Metabase-Session') != state['token']:
+            return self._reply(401, 'Unauthenticated')
+        self._reply(200, {'id': 51, 'path': self.path})
+
+
+@contextlib.contextmanager
+def fake_metabase():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeMetabase)
+    server.daemon_threads = True
+    server.state = {'logins': 0, 'token': None, 'fail_next': 0, 'ports': set(), 'posts': [],
+                    'lock': threading.Lock()}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def make_session(server, **kwargs):
+    host, port = server.server_address
+    return MetabaseSession(f"http://{host}:{port}", 'user', 'senha', backoff=0, timeout=5, **kwargs)
+
+
+def test_keep_alive_reuses_connection():
+    with fake_metabase() as server:
+        session = make_session(server)
+        for _ in range(5):
+            assert session.get('/api/card/51').json()['id'] == 51
+        assert server.state['logins'] == 1
+        assert len(server.state['ports']) == 1   # mesma conexão TCP nas 5 chamadas
+
+
+def test_retries_on_503():
+    with fake_metabase() as server:
+        session = make_session(server, max_retries=3)
+        session.token()
+        server.state['fail_next'] = 2
+        assert session.get('/api/card/51').status_code == 200
+
+        server.state['fail_next'] = 5
+        assert session.get('/api/card/51').status_code == 503   # retentativas esgotadas
+
+
+def test_expired_token_relogins_once():
+    with fake_metabase() as server:
+        session = make_session(server)
+        session.token()
+        server.state['token'] = 'expirado-no-servidor'
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert session.get('/api/card/51').status_code == 200
+        assert server.state['logins'] == 2
+        assert session.logins == 2
+
+
+def test_expired_token_on_post_resends_body_or_raises():
+    with fake_metabase() as server:
+        session = make_session(server)
+        session.token()
+        server.state['token'] = 'expirado-no-servidor'
+
+        # json/dict/bytes: o mesmo corpo vai de novo com o token novo
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = session.post('/api/card/51/query', json={'parameters': []})
+        assert response.status_code == 200
+        assert server.state['posts'] == [b'{"parameters": []}'] * 2
+        assert server.state['logins'] == 2
+
+        # Arquivo já lido no primeiro envio: o 401 volta para quem chamou
+        server.state['token'] = 'expirado-de-novo'
+        server.state['posts'].clear()
+        try:
+            session.post('/api/card/51/query', data=io.BytesIO(b'{"parameters": []}'))
+        except requests.HTTPError as e:
+            assert e.response.status_code == 401
+        else:
+            raise AssertionError('401 com corpo não reenviável deveria subir')
+        assert server.state['posts'] == [b'{"parameters": []}']
+        assert server.state['logins'] == 2
+
+
+def test_concurrent_401_single_login():
+    with fake_metabase() as server:
+        session = make_session(server, pool_size=8)
+        session.token()
+        server.state['token'] = 'expirado-no-servidor'
+        statuses = []
+
+        def worker():
+            statuses.append(session.get('/api/card/51').status_code)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            threads = [threading.Thread(target=worker) for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        assert statuses == [200] * 8
+        assert server.state['logins'] == 2       # login inicial + uma única renovação
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Testa as métricas Prometheus: registry, soma dos snapshots dos workers e /api/debug/metrics
+Não precisa de PostgreSQL nem Redis: pool e cache são lidos dos próprios contadores
+Execute com: python tests/test_metrics.py  (ou pytest tests/test_metrics.py)
+"""
+
+import sys
+import os
+import io
+import json
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.services.query_service import QueryService
+from api.utils import metrics, tracing
+from api.utils.query_parser import QueryParser
+
+
+def make_registry():
+    registry = metrics.Registry()
+    registry.counter('requests_total', 'Requests')
+    registry.histogram('request_duration_seconds', 'Duração', buckets=(0.1, 1.0))
+    registry.gauge('pool_in_use', 'Conexões em uso')
+    return registry
+
+
+def test_render_counters_and_histograms():
+    registry = make_registry()
+    registry.inc('requests_total', {'question_id': 51, 'cache': 'HIT-L1'})
+    registry.inc('requests_total', {'question_id': 51, 'cache': 'HIT-L1'})
+    registry.inc('requests_total', {'question_id': 'a"b\\c', 'cache': 'MISS'})
+    for value in (0.05, 0.5, 0.5, 3.0):
+        registry.observe('request_duration_seconds', {'phase': 'db'}, value)
+
+    text = registry.render([registry.snapshot()])
+    assert '# TYPE metabase_api_requests_total counter' in text
+    assert 'metabase_api_requests_total{cache="HIT-L1",question_id="51"} 2' in text
+    assert 'question_id="a\\"b\\\\c"' in text
+
+    # Buckets cumulativos, +Inf igual ao _count
+    assert 'metabase_api_request_duration_seconds_bucket{phase="db",le="0.1"} 1' in text
+    assert 'metabase_api_request_duration_seconds_bucket{phase="db",le="1"} 3' in text
+    assert 'metabase_api_request_duration_seconds_bucket{phase="db",le="+Inf"} 4' in text
+    assert 'metabase_api_request_duration_seconds_count{phase="db"} 4' in text
+    assert 'metabase_api_request_duration_seconds_sum{phase="db"} 4.05' in text
+    # Métrica sem série não aparece
+    assert 'pool_in_use' not in text
+
+
+def test_worker_snapshots_are_summed():
+    registry = make_registry()
+    registry.register_collector(lambda: [('pool_in_use', {}, 3)])
+    registry.inc('requests_total', {'question_id': 51})
+    registry.observe('request_duration_seconds', {'phase': 'db'}, 0.5)
+
+    other = make_registry()
+    other.register_collector(lambda: [('pool_in_use', {}, 2)])
+    other.inc('requests_total', {'question_id': 51}, 4)
+    other.observe('request_duration_seconds', {'phase': 'db'}, 0.05)
+    live, dead = other.snapshot(), dict(other.snapshot(), live=False)
+
+    text = registry.render([registry.snapshot(), live])
+    assert 'metabase_api_requests_total{question_id="51"} 5' in text
+    assert 'metabase_api_request_duration_seconds_count{phase="db"} 2' in text
+    assert 'metabase_api_pool_in_use 5' in text
+
+    # Worker que morreu: contadores continuam, gauges não
+    text = registry.render([registry.snapshot(), dead])
+    assert 'metabase_api_requests_total{question_id="51"} 5' in text
+    assert 'metabase_api_pool_in_use 3' in text
+
+
+def test_snapshot_store_reads_other_workers():
+    registry = make_registry()
+    registry.inc('requests_total', {'question_id': 51})
+    with tempfile.TemporaryDirectory() as tmp:
+        store = metrics.SnapshotStore(registry, tmp, 5)
+        store.flush()
+        # Snapshot de outro processo (pid inexistente) e lixo no diretório
+        other = make_registry()
+        other.inc('requests_total', {'question_id': 51}, 2)
+        snap = dict(other.snapshot(), pid=2 ** 22 + 1)
+        with open(os.path.join(tmp, f"metrics_{snap['pid']}.json"), 'w') as f:
+            json.dump(snap, f)
+        with open(os.path.join(tmp, 'metrics_9.json'), 'w') as f:
+            f.write('{incompleto')
+
+        snapshots = store.collect()
+        assert len(snapshots) == 2 and snapshots[1]['live'] is False
+        assert 'metabase_api_requests_total{question_id="51"} 3' in registry.render(snapshots)
+
+        store.clear()
+        assert os.listdir(tmp) == []
+
+    assert metrics.SnapshotStore(registry, '', 5).collect()[0]['pid'] == os.getpid()
+    assert not metrics.SnapshotStore(registry, '', 5).start()
+
+
+def test_trace_becomes_request_metrics():
+    registry = metrics.registry
+    before = registry.snapshot()
+    trace, token = tracing.start('/api/query')
+    try:
+        tracing.record('db', 0.2)
+        tracing.annotate(question_id=777, question_loaded=True, status=200, cache='HIT-L2',
+                         rows=10, bytes=100, raw_bytes=400)
+    finally:
+        tracing.finish(token)
+    metrics.observe_trace(trace)
+    metrics.observe_metabase('get', '/api/card/777', 200, 0.03)
+
+    text = registry.render([registry.snapshot()])
+    assert registry.render([before]) != text
+    assert ('metabase_api_requests_total{cache="HIT-L2",question_id="777",route="/api/query",status="200"} 1'
+            in text)
+    assert 'metabase_api_rows_served_total{question_id="777"} 10' in text
+    assert 'metabase_api_response_raw_bytes_total{question_id="777"} 400' in text
+    assert 'metabase_api_request_duration_seconds_count{phase="db",question_id="777"} 1' in text
+    assert 'metabase_api_request_duration_seconds_count{phase="total",question_id="777"} 1' in text
+    assert 'endpoint="/api/card/:id",method="GET",status="200"' in text
+
+
+def test_unknown_question_ids_share_other_label():
+    service = QueryService.__new__(QueryService)
+    service.query_parser = QueryParser()
+
+    class Metabase:
+        def get_question_query(self, question_id):
+            if question_id != 51:
+                raise ValueError(f"Pergunta {question_id} não encontrada")
+            return {'query': 'SELECT 1', 'revision': 'r1'}
+    service.metabase_service = Metabase()
+
+    registry = metrics.registry
+    for question_id in (51, 90001, 90002):
+        trace, token = tracing.start('/api/query')
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                service._render_question(question_id, {})
+        except ValueError:
+            tracing.annotate(status=500)
+        else:
+            tracing.annotate(status=200)
+        finally:
+            tracing.finish(token)
+        metrics.observe_trace(trace)
+
+    text = registry.render([registry.snapshot()])
+    # Ids que não carregaram não abrem séries próprias
+    assert 'question_id="90001"' not in text and 'question_id="90002"' not in text
+    assert 'metabase_api_requests_total{cache="none",question_id="other",route="/api/query",status="500"} 2' in text
+    assert 'metabase_api_requests_total{cache="none",question_id="51",route="/api/query",status="200"} 1' in text
+
+
+def test_metrics_endpoint():
+    with contextlib.redirect_stdout(io.StringIO()):
+        from api.server import create_app
+        app = create_app()
+        response = app.test_client().get('/api/debug/metrics')
+
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == metrics.CONTENT_TYPE
+    text = response.get_data(as_text=True)
+    assert 'metabase_api_pool_max_size{pool="query_service"}' in text
+    assert 'metabase_api_cache_requests_total{result="miss"}' in text
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Testa a paginação por offset e por cursor (keyset) do modo janela
+Não precisa de PostgreSQL: a janela é simulada em Python com a mesma
+semântica do SQL gerado (ORDER BY coluna NULLS LAST, linha::text)
+Execute com: python tests/test_pagination.py  (ou pytest tests/test_pagination.py)
+"""
+
+import sys
+import os
+import random
+from decimal import Decimal
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.utils.pagination import QueryPaginator, CURSOR_COLUMN
+
+COLS = [{'name': 'account_name'}, {'name': 'spend'}, {'name': 'ad_name'}]
+
+random.seed(7)
+# Muitos empates e NULLs na coluna de ordenação
+ROWS = [
+    [f'CONTA {i % 3}', random.choice([None, 1.5, 2.0, 2.0, 3.25]), f'ad {i:03d}']
+    for i in range(157)
+]
+
+
+def _window(page, params):
+    """Executa a janela como o PostgreSQL executaria o SQL gerado"""
+    rows = list(ROWS)
+    limit, skip = params[-2], params[-1]
+
+    if page['sort']:
+        index = [c['name'] for c in COLS].index(page['sort'])
+        desc = page['desc']
+
+        if page['keyset']:
+            if page['value'] is None:
+                rows = [r for r in rows if r[index] is None]
+            else:
+                value = params[-3]
+                rows = [r for r in rows if r[index] is None or
+                        (r[index] <= value if desc else r[index] >= value)]
+
+        present = sorted((r for r in rows if r[index] is not None),
+                         key=lambda r: (r[index], str(r)), reverse=desc)
+        nulls = sorted((r for r in rows if r[index] is None), key=str, reverse=desc)
+        rows = present + nulls
+
+    return rows[skip:skip + limit]
+
+
+def _walk(paginator, sort, limit, scope='q1'):
+    """Percorre todas as páginas seguindo next_cursor"""
+    seen = []
+    cursor = None
+    for _ in range(1000):
+        page = paginator.new_page(limit, 0, cursor, sort, scope=scope)
+        sql, params = paginator.build_page("SELECT * FROM t;", [], page)
+        rows = _window(page, params)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        seen.extend(rows)
+        if not has_more:
+            return seen
+        cursor = paginator.next_cursor(page, COLS, rows)
+    assert False, "paginação não terminou"
+
+
+def test_keyset_walk_returns_every_row_once():
+    paginator = QueryPaginator()
+    for sort in ('spend', '-spend', 'spend:desc', 'account_name'):
+        for limit in (1, 7, 50, 500):
+            seen = _walk(paginator, sort, limit)
+            assert len(seen) == len(ROWS), (sort, limit)
+            assert sorted(map(str, seen)) == sorted(map(str, ROWS)), (sort, limit)
+
+
+def test_offset_walk_without_sort():
+    paginator = QueryPaginator()
+    seen = _walk(paginator, None, 40)
+
+    assert seen == ROWS
+
+
+def test_page_sql_shape():
+    paginator = QueryPaginator()
+    page = paginator.new_page(100, 0, None, '-spend', scope='q1')
+    sql, params = paginator.build_page("SELECT spend FROM t WHERE a = ANY(%s);", [['x']], page)
+
+    assert sql.endswith('ORDER BY "spend" DESC NULLS LAST, pergunta::text DESC\nLIMIT %s OFFSET %s')
+    assert params == [['x'], 101, 0]
+    assert paginator.build_count("SELECT 1;") == "SELECT COUNT(*) FROM (\nSELECT 1\n) AS pergunta"
+
+
+def test_cursor_is_bound_to_filters_and_sort():
+    paginator = QueryPaginator()
+    page = paginator.new_page(10, 0, None, 'spend', scope='q1')
+    cursor = paginator.next_cursor(page, COLS, [r for r in ROWS if r[1] is not None][:10])
+
+    for scope, sort in (('q2', None), ('q1', '-spend')):
+        try:
+            paginator.new_page(10, 0, cursor, sort, scope=scope)
+            assert False, "cursor de outra consulta deveria ser rejeitado"
+        except ValueError:
+            pass
+
+    for bad in ('não-é-base64', 'bnVsbA'):
+        try:
+            paginator.new_page(10, 0, bad, None, scope='q1')
+            assert False, "cursor inválido deveria ser rejeitado"
+        except ValueError:
+            pass
+
+    try:
+        paginator.parse_sort('spend; DROP TABLE t')
+        assert False, "coluna inválida deveria ser rejeitada"
+    except ValueError:
+        pass
+
+
+def test_numeric_cursor_keeps_exact_boundary():
+    # Valores NUMERIC que viram o mesmo float no typecaster do pool
+    values = [Decimal('12345678901234567.01'), Decimal('12345678901234567.02'), Decimal('12345678901234567.03')]
+    assert len({float(v) for v in values}) == 1
+    table = [[f'ad {i:02d}', values[i % 3]] for i in range(12)]
+    cols = [{'name': 'ad_name'}, {'name': 'spend'}, {'name': CURSOR_COLUMN}]
+
+    def window(page, sql, params):
+        """Como o PostgreSQL: compara em NUMERIC, devolve spend como float + texto exato"""
+        assert f'"spend"::text AS "{CURSOR_COLUMN}"' in sql
+        rows = table
+        if page['keyset']:
+            rows = [r for r in rows if r[1] >= Decimal(params[-3])]
+        rows = sorted(rows, key=lambda r: (r[1], str(r)))[params[-1]:params[-1] + params[-2]]
+        return [[name, float(value), str(value)] for name, value in rows]
+
+    paginator = QueryPaginator()
+    seen, cursor = [], None
+    for _ in range(100):
+        page = paginator.new_page(2, 0, cursor, 'spend', scope='q1')
+        sql, params = paginator.build_page("SELECT * FROM t", [], page)
+        rows = window(page, sql, params)
+        has_more = len(rows) > 2
+        rows = rows[:2]
+        if has_more:
+            cursor = paginator.next_cursor(page, cols, rows)
+            assert paginator.decode_cursor(cursor)['v'] == rows[-1][2]
+        page_cols, page_rows = paginator.strip_cursor_column(cols, rows)
+        assert page_cols == cols[:2] and all(len(row) == 2 for row in page_rows)
+        seen.extend(row[0] for row in page_rows)
+        if not has_more:
+            break
+
+    assert sorted(seen) == sorted(row[0] for row in table) and len(seen) == len(table)
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Testa os typecasters das conexões do pool (NUMERIC -> float, datas -> ISO)
+Não precisa de PostgreSQL: os casts recebem o texto como o servidor envia
+Execute com: python tests/test_pg_types.py  (ou pytest tests/test_pg_types.py)
+"""
+
+import sys
+import os
+import json
+import psycopg2.extensions as ext
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.utils import pg_types
+
+
+def antigo(value):
+    """Conversão que o _process_rows_native fazia célula a célula"""
+    return value.isoformat() if hasattr(value, 'isoformat') else float(value)
+
+
+def test_numeric_is_float():
+    assert pg_types.FLOAT_NUMERIC('1234.5600', None) == 1234.56
+    assert pg_types.FLOAT_NUMERIC(None, None) is None
+    assert pg_types.FLOAT_NUMERIC('1234.5600', None) == antigo(ext.DECIMAL('1234.5600', None))
+
+
+def test_dates_match_isoformat():
+    casos = [
+        (pg_types.ISO_DATE, ext.PYDATE, '2024-01-31'),
+        (pg_types.ISO_TIMESTAMP, ext.PYDATETIME, '2024-01-31 10:20:30'),
+    ]
+    for novo, padrao, texto in casos:
+        assert novo(texto, None) == antigo(padrao(texto, None)), texto
+        assert novo(None, None) is None
+
+
+def test_timestamptz_offset_matches_isoformat():
+    # O PYDATETIMETZ precisa de um cursor real: compara com o isoformat esperado
+    assert pg_types.ISO_TIMESTAMPTZ('2024-01-31 10:20:30-03', None) == '2024-01-31T10:20:30-03:00'
+    assert pg_types.ISO_TIMESTAMPTZ('2024-01-31 10:20:30+05:30', None) == '2024-01-31T10:20:30+05:30'
+    assert pg_types.ISO_TIMESTAMPTZ(None, None) is None
+
+
+def test_rows_are_json_ready():
+    linha = (
+        pg_types.FLOAT_NUMERIC('10.5', None),
+        pg_types.ISO_DATE('2024-01-31', None),
+        pg_types.ISO_TIMESTAMP('2024-01-31 10:20:30', None),
+        'texto',
+        42,
+    )
+    assert json.loads(json.dumps([linha])) == [[10.5, '2024-01-31', '2024-01-31T10:20:30', 'texto', 42]]
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
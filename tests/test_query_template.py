@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Testa os templates compilados do QueryParser
+Compara render_query (template compilado) com apply_filters (substituição direta)
+Execute com: python tests/test_query_template.py  (ou pytest tests/test_query_template.py)
+"""
+
+import sys
+import os
+import io
+import re
+import contextlib
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.utils.query_parser import QueryParser
+from api.utils.query_template import QueryTemplate, TEXT, TAG, OPTIONAL
+
+# Query no formato das perguntas do dashboard (template tags + EXISTS de conversões)
+SAMPLE_QUERY = """WITH base AS (
+    SELECT
+        date,
+        account_name,
+        campaign_name,
+        adset_name,
+        ad_name,
+        publisher_platform,
+        platform_position,
+        impression_device,
+        objective,
+        impressions,
+        clicks,
+        spend,
+        conversions as conversions_json
+    FROM road.meta_ads_insights
+    WHERE 1=1
+    [[AND {{date}}]]
+    [[AND {{conta}}]]
+    [[AND {{campanha}}]]
+    [[AND {{adset}}]]
+    [[AND {{ad_name}}]]
+    [[AND {{plataforma}}]]
+    [[AND {{posicao}}]]
+    [[AND {{device}}]]
+    [[AND {{objective}}]]
+    [[AND EXISTS (
+        SELECT 1 FROM road.meta_ads_actions a
+        WHERE a.ad_id = road.meta_ads_insights.ad_id
+          AND {{conversoes_consideradas}}
+    )]]
+),
+acoes AS (
+    SELECT ad_id, action_type, value
+    FROM road.meta_ads_actions
+    WHERE {{action_type_filter}}
+)
+SELECT b.*, 'taxa 100%' AS observacao
+FROM base b
+ORDER BY date DESC"""
+
+FILTER_SETS = [
+    {},
+    {'data': '2025-01-01~2025-01-31'},
+    {'data': 'past7days~', 'conta': 'EMPRESA LTDA'},
+    {'conta': ['CONTA A', "CONTA D'AGUA"], 'campanha': 'Road | Engajamento | 26/05'},
+    {'anuncio': 'Anúncio 1', 'plataforma': ['facebook', 'instagram']},
+    {'conversoes_consideradas': ['purchase', 'lead'], 'device': 'mobile'},
+    {'conversoes_consideradas': 'purchase', 'action_type_filter': 'lead'},
+    {'data': 'formato-invalido', 'objective': 'OUTCOME_SALES', 'filtro_inexistente': 'x'},
+]
+
+
+def _quiet(func, *args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args)
+
+
+def _literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _inline(sql, params):
+    """Substitui os placeholders pelos valores no formato do apply_filters (só para comparar)"""
+    values = iter(params)
+
+    def replace(match):
+        token = match.group(0)
+        if token == '%%':
+            return '%'
+        if token == '= ANY(%s)':
+            return 'IN (' + ', '.join(_literal(v) for v in next(values)) + ')'
+        return _literal(next(values))
+
+    return re.sub(r'%%|= ANY\(%s\)|%s', replace, sql)
+
+
+def test_compile_segments():
+    template = QueryTemplate("SELECT * FROM t WHERE {{a}} [[AND {{b}}]] [[AND x = {{c}} OR {{d}}]]")
+    kinds = [segment[0] for segment in template.segments]
+
+    assert kinds == [TEXT, TAG, TEXT, OPTIONAL, TEXT, OPTIONAL]
+    assert template.tags == ['a', 'b', 'c', 'd']
+    # Tag solta logo após WHERE vira 1=1 quando não tem valor
+    assert template.segments[1][2] == '1=1'
+
+
+def test_optional_block_needs_all_tags():
+    template = QueryTemplate("SELECT 1 [[AND {{a}} AND {{b}}]]")
+    values = {'a': ('x = %s', [1])}
+
+    assert template.render(lambda tag, in_block: values.get(tag)) == ("SELECT 1 ", [])
+    values['b'] = ('y = %s', [2])
+    assert template.render(lambda tag, in_block: values.get(tag)) == \
+        ("SELECT 1 AND x = %s AND y = %s", [1, 2])
+
+
+def test_render_matches_apply_filters():
+    parser = QueryParser()
+    for filters in FILTER_SETS:
+        expected = _quiet(parser.apply_filters, SAMPLE_QUERY, filters)
+        sql, params = _quiet(parser.render_query, 51, SAMPLE_QUERY, filters)
+        assert _inline(sql, params) == expected, f"Divergência para filtros {filters}"
+
+
+def test_values_are_bound_not_inlined():
+    parser = QueryParser()
+    filters = {'conta': ["CONTA D'AGUA", 'CONTA B'], 'data': '2025-01-01~2025-01-31'}
+    sql, params = _quiet(parser.render_query, 51, SAMPLE_QUERY, filters)
+
+    assert "AGUA" not in sql
+    assert "account_name = ANY(%s)" in sql
+    assert "date BETWEEN %s AND %s" in sql
+    assert params == ['2025-01-01', '2025-01-31', ["CONTA D'AGUA", 'CONTA B']]
+    # '%' literal da query fica escapado para o psycopg2
+    assert "'taxa 100%%'" in sql
+
+    # Mesmo formato de filtro com outros valores gera o mesmo SQL (reaproveita o PREPARE)
+    other_sql, _ = _quiet(parser.render_query, 51, SAMPLE_QUERY,
+                          {'conta': ['X', 'Y'], 'data': '2024-06-01~2024-06-30'})
+    assert other_sql == sql
+
+
+def test_dollar_placeholders_for_prepare():
+    from api.services.query_service import QueryService
+
+    converted = QueryService._to_dollar_params(
+        "SELECT '100%%' WHERE a = ANY(%s) AND d BETWEEN %s AND %s AND x LIKE '%%s'"
+    )
+    assert converted == "SELECT '100%' WHERE a = ANY($1) AND d BETWEEN $2 AND $3 AND x LIKE '%s'"
+
+
+def test_template_cache_by_revision():
+    parser = QueryParser()
+    first = _quiet(parser.get_template, 51, SAMPLE_QUERY)
+    again = _quiet(parser.get_template, 51, SAMPLE_QUERY)
+    edited = _quiet(parser.get_template, 51, SAMPLE_QUERY + "\nLIMIT 10")
+
+    assert first is again
+    assert edited is not first
+    assert first.revision != edited.revision
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
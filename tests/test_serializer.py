@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Testa os backends de serialização JSON (orjson e stdlib)
+Execute com: python tests/test_serializer.py  (ou pytest tests/test_serializer.py)
+"""
+
+import sys
+import os
+import json
+from decimal import Decimal
+from datetime import date, datetime, timezone, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.utils import serializer
+
+VALORES = {
+    'data': {'rows': [(1, 'Conta A', 10.5, None, True), (2, 'Ação ç', 0.0, None, False)]},
+    'decimal': Decimal('1234.56'),
+    'dia': date(2024, 1, 31),
+    'momento': datetime(2024, 1, 31, 10, 20, 30),
+    'com_tz': datetime(2024, 1, 31, 10, 20, 30, tzinfo=timezone(timedelta(hours=-3))),
+}
+
+ESPERADO = {
+    'data': {'rows': [[1, 'Conta A', 10.5, None, True], [2, 'Ação ç', 0.0, None, False]]},
+    'decimal': 1234.56,
+    'dia': '2024-01-31',
+    'momento': '2024-01-31T10:20:30',
+    'com_tz': '2024-01-31T10:20:30-03:00',
+}
+
+
+def test_backends_produce_same_json():
+    for name, (dumps, loads) in serializer.BACKENDS.items():
+        data = dumps(VALORES)
+        assert isinstance(data, bytes), name
+        assert b', ' not in data and b': ' not in data, f"{name}: saída não compacta"
+        assert json.loads(data) == ESPERADO, name
+        assert loads(data) == ESPERADO, name
+
+
+def test_default_backend_is_selected():
+    assert serializer.BACKEND in serializer.BACKENDS
+    if serializer.ORJSON_AVAILABLE:
+        assert serializer.BACKEND == 'orjson'
+    assert serializer.dumps is serializer.BACKENDS[serializer.BACKEND][0]
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
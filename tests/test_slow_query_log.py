@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Testa o log de queries lentas: fingerprint, captura do plano em segundo plano, rotação e agrupamento
+Não precisa de PostgreSQL: a conexão do EXPLAIN é simulada
+Execute com: python tests/test_slow_query_log.py  (ou pytest tests/test_slow_query_log.py)
+"""
+
+import sys
+import os
+import io
+import time
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.services.slow_query_log import SlowQueryLog, fingerprint, plan_shape, summarize_plan
+
+SQL = """SELECT date, sum(spend) FROM road.meta_ads_insights
+WHERE date BETWEEN %s AND %s AND account_name = ANY(%s) AND action_type IN ('a', 'b', 'c')
+GROUP BY date"""
+
+
+def explain(node='Hash Join', cost=1000.0, analyze=False):
+    plan = {'Node Type': node, 'Total Cost': cost, 'Plan Rows': 10, 'Plans': [
+        {'Node Type': 'Seq Scan', 'Relation Name': 'meta_ads_insights', 'Total Cost': cost / 2},
+        {'Node Type': 'Hash', 'Plans': [{'Node Type': 'Index Scan', 'Index Name': 'idx_date'}]}
+    ]}
+    root = {'Plan': plan}
+    if analyze:
+        plan.update({'Actual Rows': 12, 'Shared Hit Blocks': 40, 'Shared Read Blocks': 7})
+        root.update({'Execution Time': 5123.4, 'Planning Time': 1.2})
+    return [root]
+
+
+class FakeConnection:
+    """Conexão psycopg2 mínima: guarda os comandos e devolve o EXPLAIN pronto"""
+
+    def __init__(self, result):
+        self.result = result
+        self.executed = []
+        self.closed = False
+        self.rollbacks = 0
+
+    def cursor(self):
+        conn = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql, params=None):
+                conn.executed.append((sql, params))
+
+            def fetchone(self):
+                return (conn.result,)
+        return Cursor()
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def make_log(conn, **config):
+    settings = {'threshold': 1.0, 'explain': True, 'analyze_sample': 0.0, 'plan_interval': 600,
+                'max_entries': 100, 'log_file': '', 'max_bytes': 10 ** 6, 'explain_timeout': 30}
+    settings.update(config)
+    configured = []
+    log = SlowQueryLog(lambda: conn, lambda cursor: configured.append(cursor), settings)
+    return log, configured
+
+
+def wait_plans(log, count):
+    deadline = time.time() + 5
+    while log.get_stats()['plans'] + log.get_stats()['plan_errors'] < count:
+        assert time.time() < deadline, "plano não capturado"
+        time.sleep(0.01)
+
+
+def test_fingerprint_ignores_literals_and_spacing():
+    same = SQL.replace("('a', 'b', 'c')", "('x', 'y')").replace('\n', '\n   ')
+    assert fingerprint(SQL) == fingerprint(same)
+    # Outro bloco opcional do template = outra query
+    assert fingerprint(SQL) != fingerprint(SQL.replace('GROUP BY date', 'AND spend > 0 GROUP BY date'))
+
+
+def test_plan_shape_ignores_costs():
+    assert plan_shape(explain()[0]['Plan']) == plan_shape(explain(cost=99.0)[0]['Plan'])
+    assert plan_shape(explain()[0]['Plan']) != plan_shape(explain('Nested Loop')[0]['Plan'])
+
+    summary = summarize_plan(explain(analyze=True))
+    assert summary['node'] == 'Hash Join' and summary['execution_ms'] == 5123.4
+    assert summary['shared_read'] == 7
+    assert 'execution_ms' not in summarize_plan(explain())
+
+
+def test_slow_query_is_recorded_and_explained_once():
+    conn = FakeConnection(explain())
+    log, configured = make_log(conn)
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert log.record(SQL, ['2025-01-01', '2025-01-31', ['A']], 0.2, 10) is None
+        entry = log.record(SQL, ['2025-01-01', '2025-01-31', ['A']], 2.5, 10, 51, {'data': 'past30days~'})
+        wait_plans(log, 1)
+        # Mesmo fingerprint dentro do plan_interval: registra, mas não repete o EXPLAIN
+        log.record(SQL, ['2025-02-01', '2025-02-28', ['B']], 3.0, 20, 51, {'data': 'past60days~'})
+
+    assert entry['duration_ms'] == 2500.0 and entry['question_id'] == 51
+    sql, params = conn.executed[-1]
+    assert sql.startswith('EXPLAIN (FORMAT JSON) SELECT') and params == ['2025-01-01', '2025-01-31', ['A']]
+    assert conn.executed[0][1] == ('30000ms',)
+    assert len(configured) == 1 and conn.rollbacks == 1
+
+    stats = log.get_stats()
+    assert (stats['recorded'], stats['plans'], stats['pending_plans']) == (2, 1, 0)
+    assert [e['kind'] for e in log.entries()] == ['query', 'plan', 'query']
+
+
+def test_analyze_sample_and_failures():
+    conn = FakeConnection(explain(analyze=True))
+    log, _ = make_log(conn, analyze_sample=1.0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        log.record(SQL, [], 2.0, 1)
+        wait_plans(log, 1)
+    assert conn.executed[-1][0].startswith('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)')
+    assert conn.executed[-1][1] is None
+    assert log.entries()[-1]['execution_ms'] == 5123.4
+
+    # Erro no EXPLAIN não derruba a thread nem o request
+    broken = FakeConnection(None)
+    log, _ = make_log(broken)
+    with contextlib.redirect_stdout(io.StringIO()):
+        log.record(SQL, [], 2.0, 1)
+        wait_plans(log, 1)
+    assert log.get_stats()['plan_errors'] == 1
+
+    log, _ = make_log(conn, threshold=0)
+    assert not log.enabled and log.record(SQL, [], 100.0, 1) is None
+
+
+def test_file_store_rotates_and_groups_plan_changes():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'slow.jsonl')
+        conn = FakeConnection(explain())
+        log, _ = make_log(conn, log_file=path, max_bytes=1500, plan_interval=0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            log.record(SQL, ['2025-01-01'], 2.0, 10, 51, {'data': 'past7days~'})
+            wait_plans(log, 1)
+            conn.result = explain('Nested Loop')
+            log.record(SQL, ['2025-01-02'], 9.0, 30, 52, {'data': 'past90days~'})
+            wait_plans(log, 2)
+            log.record("SELECT 1 FROM road.outra", [], 1.5, 1)
+            wait_plans(log, 3)
+
+        assert os.path.exists(path + '.1')
+        # Outro processo lendo o mesmo arquivo vê tudo (inclusive o .1)
+        reader, _ = make_log(conn, log_file=path)
+        groups = reader.grouped()
+        only = reader.grouped(fingerprint(SQL))
+
+    assert [group['count'] for group in groups] == [2, 1]
+    group = groups[0]
+    assert group['fingerprint'] == fingerprint(SQL)
+    assert (group['max_ms'], group['avg_ms'], group['max_rows']) == (9000.0, 5500.0, 30)
+    assert group['question_ids'] == [51, 52] and group['last_filters'] == {'data': 'past90days~'}
+    assert group['plan_changed'] and [plan['node'] for plan in group['plans']] == ['Hash Join', 'Nested Loop']
+    assert 'plan' not in group['plans'][0]
+
+    assert len(only) == 1 and only[0]['plans'][1]['plan'][0]['Plan']['Node Type'] == 'Nested Loop'
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
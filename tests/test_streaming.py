@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Testa o modo streaming (stream=true): JSON do Metabase gerado lote a lote e comprimido em gzip
+Não precisa de PostgreSQL: o cursor nomeado é simulado
+Execute com: python tests/test_streaming.py  (ou pytest tests/test_streaming.py)
+"""
+
+import sys
+import os
+import io
+import gzip
+import json
+import contextlib
+from decimal import Decimal
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import psycopg2
+from flask import Response
+
+from api.services import query_service
+from api.services.query_service import QueryService
+
+# (name, type_code) como no cursor.description do psycopg2
+DESCRIPTION = [('date', 1082), ('account_name', 25), ('spend', 1700)]
+
+
+class FakeNamedCursor:
+    """Cursor nomeado: devolve os lotes em fetchmany e falha depois de fail_after lotes"""
+
+    def __init__(self, batches, fail_after=None):
+        self.batches = list(batches)
+        self.fail_after = fail_after
+        self.fetches = 0
+        self.description = None
+
+    def fetchmany(self, size):
+        if self.fail_after is not None and self.fetches >= self.fail_after:
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+        self.fetches += 1
+        # Em cursor nomeado a description só aparece após o primeiro fetch
+        self.description = DESCRIPTION
+        return self.batches.pop(0) if self.batches else []
+
+
+def make_service(cursor):
+    """QueryService sem pool: _server_side_cursor entrega o cursor simulado"""
+    service = QueryService.__new__(QueryService)
+    state = {'closed': False}
+
+    @contextlib.contextmanager
+    def server_side_cursor(query_sql, params=None, native_types=False):
+        try:
+            yield cursor
+        finally:
+            state['closed'] = True
+
+    service._server_side_cursor = server_side_cursor
+    return service, state
+
+
+def stream(service, batch_size=2):
+    """Corpo descomprimido de _create_streaming_response com gzip negociado"""
+    original = query_service.PERFORMANCE_CONFIG['stream_batch_size']
+    query_service.PERFORMANCE_CONFIG['stream_batch_size'] = batch_size
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = service._create_streaming_response('SELECT 1', [], 'json', 'gzip')
+            compressed = b''.join(response.response)
+    finally:
+        query_service.PERFORMANCE_CONFIG['stream_batch_size'] = original
+    return response, json.loads(gzip.decompress(compressed))
+
+
+def test_batches_stream_as_metabase_json():
+    cursor = FakeNamedCursor([
+        [('2025-01-01', 'CONTA A', Decimal('1.50')), ('2025-01-02', "CONTA D'AGUA", None)],
+        [('2025-01-03', 'CONTA B', Decimal('0.10'))],
+    ])
+    service, state = make_service(cursor)
+    response, body = stream(service)
+
+    assert response.headers['Content-Encoding'] == 'gzip' and response.headers['X-Streaming'] == 'true'
+    assert [col['name'] for col in body['data']['cols']] == ['date', 'account_name', 'spend']
+    assert body['data']['cols'][2]['base_type'] == 'type/Decimal'
+    assert body['data']['rows'] == [['2025-01-01', 'CONTA A', 1.5], ['2025-01-02', "CONTA D'AGUA", None],
+                                    ['2025-01-03', 'CONTA B', 0.1]]
+    assert body['data']['results_metadata']['columns'] == body['data']['cols']
+    assert body['row_count'] == body['data']['rows_truncated'] == 3
+    assert body['status'] == 'completed' and 'error' not in body
+    assert state['closed']
+
+
+def test_empty_result_keeps_cols():
+    service, state = make_service(FakeNamedCursor([]))
+    _, body = stream(service)
+
+    assert body['data']['rows'] == [] and len(body['data']['cols']) == 3
+    assert body['row_count'] == 0 and body['status'] == 'completed'
+    assert state['closed']
+
+
+def test_error_mid_stream_closes_json_as_failed():
+    cursor = FakeNamedCursor([[('2025-01-01', 'CONTA A', 1)], [('2025-01-02', 'CONTA B', 2)]], fail_after=2)
+    service, state = make_service(cursor)
+    _, body = stream(service, batch_size=1)
+
+    # Os lotes já enviados ficam; o corpo continua JSON válido e avisa a falha
+    assert body['data']['rows'] == [['2025-01-01', 'CONTA A', 1], ['2025-01-02', 'CONTA B', 2]]
+    assert body['status'] == 'failed' and 'server closed' in body['error']
+    assert body['row_count'] == 2
+    assert state['closed']
+
+
+def test_error_before_first_batch_reaches_route():
+    service, state = make_service(FakeNamedCursor([], fail_after=0))
+    try:
+        stream(service)
+    except psycopg2.OperationalError:
+        pass
+    else:
+        raise AssertionError('erro antes do primeiro lote deveria subir (HTTP 500)')
+    assert state['closed']
+
+
+def test_post_stream_flag_is_parsed_like_get():
+    with contextlib.redirect_stdout(io.StringIO()):
+        from api.server import create_app
+        from api.routes import query_routes
+        app = create_app()
+
+    seen = []
+
+    class FakeQueryService:
+        def execute_query(self, question_id, filters, stream=False, **kwargs):
+            seen.append(stream)
+            return Response(b'{}', mimetype='application/json')
+
+    original = query_routes.query_service
+    query_routes.query_service = FakeQueryService()
+    try:
+        client = app.test_client()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for value in [False, 'false', '0', '', None, True, 'true', 'TRUE', '1', 1]:
+                client.post('/api/query', json={'question_id': 51, 'stream': value}).close()
+            client.get('/api/query?question_id=51&stream=false').close()
+    finally:
+        query_routes.query_service = original
+
+    assert seen == [False] * 5 + [True] * 5 + [False]
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Testa o trace por request: spans, header Server-Timing, request id e log em JSON lines
+Não precisa de PostgreSQL: a rota /api/query usa um QueryService simulado
+Execute com: python tests/test_tracing.py  (ou pytest tests/test_tracing.py)
+"""
+
+import sys
+import os
+import io
+import json
+import time
+import tempfile
+import threading
+import contextlib
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Response
+
+from api.utils import tracing
+
+
+def test_spans_accumulate_and_render_server_timing():
+    trace, token = tracing.start('/api/query')
+    try:
+        with tracing.span('db'):
+            time.sleep(0.01)
+        with tracing.span('db'):
+            pass
+        tracing.record('gzip', 0.0025)
+        tracing.annotate(question_id=51)
+    finally:
+        tracing.finish(token)
+
+    assert trace.spans['db'][1] == 2 and trace.spans['db'][0] >= 0.01
+    header = trace.server_timing()
+    parts = [part.split(';')[0] for part in header.split(', ')]
+    assert parts == ['db', 'gzip', 'total']
+    assert 'gzip;dur=2.5' in header
+
+    line = trace.to_dict()
+    assert line['question_id'] == 51 and line['spans']['db']['count'] == 2
+
+
+def test_without_trace_nothing_is_recorded():
+    assert tracing.current() is None
+    with tracing.span('db'):
+        pass
+    tracing.record('gzip', 1.0)
+    assert tracing.application_name() == 'metabase_api'
+
+
+def test_request_id_and_application_name():
+    assert tracing.new_request_id('abc-123.X_y') == 'abc-123.X_y'
+    # Ids com espaço, aspas ou grandes demais não são reaproveitados
+    for bad in ("a b", "x'; DROP", 'a' * 65, ''):
+        generated = tracing.new_request_id(bad)
+        assert generated != bad and len(generated) == 16
+
+    trace, token = tracing.start('/api/query', 'req-1')
+    try:
+        assert tracing.application_name() == 'metabase_api req-1'
+        # Outras threads não herdam o trace do request
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append(tracing.current()))
+        thread.start()
+        thread.join()
+        assert seen == [None]
+    finally:
+        tracing.finish(token)
+
+    # application_name do PostgreSQL tem no máximo 63 bytes
+    trace, token = tracing.start('/api/query', 'r' * 64)
+    try:
+        assert len(tracing.application_name()) == tracing.APPLICATION_NAME_MAX
+    finally:
+        tracing.finish(token)
+
+
+def test_trace_log_writes_json_lines():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'trace.jsonl')
+        log = tracing.TraceLog(path)
+        for request_id in ('a', 'b'):
+            trace, token = tracing.start('/api/query', request_id)
+            tracing.record('db', 0.1)
+            tracing.finish(token)
+            log.write(trace)
+
+        with open(path, encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+    assert [line['request_id'] for line in lines] == ['a', 'b']
+    assert lines[0]['spans']['db']['ms'] == 100.0
+
+    assert not tracing.TraceLog('').enabled
+
+
+def test_query_route_returns_server_timing():
+    with contextlib.redirect_stdout(io.StringIO()):
+        from api.server import create_app
+        from api.routes import query_routes
+        app = create_app()
+
+    class FakeQueryService:
+        def execute_query(self, question_id, filters, **kwargs):
+            with tracing.span('db'):
+                pass
+            tracing.record('compress', 0.001)
+            response = Response(b'{}', mimetype='application/json')
+            response.headers['X-Cache'] = 'MISS'
+            return response
+
+    original, original_log = query_routes.query_service, tracing.trace_log
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'trace.jsonl')
+        query_routes.query_service = FakeQueryService()
+        tracing.trace_log = tracing.TraceLog(path)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                response = app.test_client().get('/api/query?question_id=51',
+                                                 headers={'X-Request-ID': 'dash-7'})
+                body = response.get_data()
+                response.close()
+        finally:
+            query_routes.query_service, tracing.trace_log = original, original_log
+
+        with open(path, encoding='utf-8') as f:
+            line = json.loads(f.readline())
+
+    assert body == b'{}'
+    assert response.headers['X-Request-ID'] == 'dash-7'
+    assert response.headers['Timing-Allow-Origin'] == '*'
+    names = [part.split(';')[0] for part in response.headers['Server-Timing'].split(', ')]
+    assert names == ['db', 'compress', 'total']
+    assert line['request_id'] == 'dash-7' and line['status'] == 200 and line['cache'] == 'MISS'
+    assert tracing.current() is None
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")
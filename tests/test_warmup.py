@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Testa o warm-up do cache: contagem das combinações, limites de concorrência e renovação
+Não precisa de PostgreSQL nem Redis: o QueryService é simulado
+Execute com: python tests/test_warmup.py  (ou pytest tests/test_warmup.py)
+"""
+
+import sys
+import os
+import io
+import time
+import threading
+import contextlib
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.services import query_service, warmup_service
+from api.services.cache_service import CacheService
+from api.services.query_service import QueryService
+from api.services.warmup_service import WarmupService, next_daily_run
+from api.utils import freshness
+from api.utils.freshness import FreshnessTracker
+from api.utils.gzip_envelope import CachedBody
+from api.utils.query_parser import QueryParser
+
+CONFIG = {'enabled': True, 'interval': 60, 'times': [], 'top_n': 10, 'min_hits': 2,
+          'concurrency': 2, 'pool_reserve': 2, 'max_tracked': 100, 'decay': 0.5}
+
+
+class FakePool:
+    def __init__(self, in_use=0):
+        self.in_use = in_use
+
+    def stats(self):
+        return {'max_size': 10, 'in_use': self.in_use}
+
+
+class FakeQueryService:
+    """Só o que o WarmupService usa: cache_service, pool e warm_query"""
+
+    def __init__(self, delay=0.0):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.cache_service = CacheService(use_redis=False)
+        self.pool = FakePool()
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def warm_query(self, question_id, filters, min_remaining=None):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.calls.append((question_id, filters, min_remaining))
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return 'renovado'
+
+
+def test_hot_keys_are_ranked_and_filtered():
+    warmup = WarmupService(FakeQueryService(), CONFIG)
+    for _ in range(5):
+        warmup.record(51, {'data': 'past7days~', 'conta': ['A']})
+    for _ in range(3):
+        warmup.record(52, {})
+    warmup.record(53, {'conta': ['B']})            # acesso único: abaixo de min_hits
+
+    hot = warmup.hot_keys()
+    assert [(qid, filters) for qid, filters, _ in hot] == [
+        (51, {'conta': ['A'], 'data': 'past7days~'}),
+        (52, {})
+    ]
+    assert hot[0][2] == 5
+
+
+def test_run_respects_concurrency_and_decays():
+    query_service = FakeQueryService(delay=0.05)
+    warmup = WarmupService(query_service, CONFIG)
+    for question_id in range(51, 57):
+        for _ in range(4):
+            warmup.record(question_id, {})
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary = warmup.run_once()
+
+    assert summary['renovado'] == 6
+    assert query_service.max_active <= CONFIG['concurrency']
+    # Sem force só renova o que venceria antes da próxima rodada
+    assert all(call[2] == CONFIG['interval'] + warmup_service.POOL_WAIT_SECONDS
+               for call in query_service.calls)
+    # Contagens caem pela metade: 4 -> 2 (ainda quentes), depois 1 (esfria)
+    assert len(warmup.hot_keys()) == 6
+    with contextlib.redirect_stdout(io.StringIO()):
+        warmup.run_once(force=True)
+    assert warmup.hot_keys() == []
+    assert query_service.calls[-1][2] is None
+
+
+def test_busy_pool_postpones_warmup():
+    query_service = FakeQueryService()
+    query_service.pool.in_use = 9                   # só 1 livre, reserva é 2
+    warmup = WarmupService(query_service, CONFIG)
+    warmup.record(51, {})
+    warmup.record(51, {})
+
+    original = warmup_service.POOL_WAIT_SECONDS
+    warmup_service.POOL_WAIT_SECONDS = 0
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            summary = warmup.run_once()
+    finally:
+        warmup_service.POOL_WAIT_SECONDS = original
+
+    assert summary['adiado'] == 1
+    assert query_service.calls == []
+
+
+def test_next_daily_run():
+    now = datetime(2024, 1, 8, 7, 0)
+    assert next_daily_run([], now) is None
+    assert next_daily_run(['06:30', '12:00'], now) == datetime(2024, 1, 8, 12, 0)
+    assert next_daily_run(['06:30'], now) == datetime(2024, 1, 9, 6, 30)
+
+
+def test_cache_refresh_overwrites_entry():
+    with contextlib.redirect_stdout(io.StringIO()):
+        cache = CacheService(use_redis=False)
+    cache.enabled = True
+    cache.ttl = 60
+
+    def fill(text):
+        return lambda: (CachedBody.compress(text.encode('utf-8'), 0.1, 'etag'), True)
+
+    assert cache.remaining_ttl('k') is None
+    with contextlib.redirect_stdout(io.StringIO()):
+        cache.get_or_fill('k', fill('{"v":1}'))
+        assert 59 < cache.remaining_ttl('k') <= 60
+        assert cache.refresh('k', fill('{"v":2}')) is True
+
+    body, _ = cache.get('k')
+    assert body.decompress(b'') == b'{"v":2}'
+
+
+def test_warmed_key_is_read_by_next_request():
+    """warm_query preenche a mesma chave que o request seguinte lê, mesmo em outra janela de frescor"""
+    service = QueryService.__new__(QueryService)
+    service.query_parser = QueryParser()
+    with contextlib.redirect_stdout(io.StringIO()):
+        service.cache_service = CacheService(use_redis=False)
+    service.cache_service.enabled = True
+    service.freshness = FreshnessTracker(300, 30, {})
+    service.warmup = None
+    service._incremental_fill = lambda *args: None
+
+    class Metabase:
+        def get_question_query(self, question_id):
+            return {'query': 'SELECT date, spend FROM road.meta_ads_insights WHERE 1=1 [[AND {{date}}]]',
+                    'revision': 'r1'}
+    service.metabase_service = Metabase()
+
+    executed = []
+
+    def execute(query_sql, params, question_id=None, filters=None):
+        executed.append(params)
+        return [{'name': 'date'}, {'name': 'spend'}], [('2025-01-01', 1.5)], 0.01
+    service._execute_native_query = execute
+
+    now = [299.0]
+    clock, enabled = freshness.time, query_service.FRESHNESS_CONFIG['etag_enabled']
+    freshness.time = type('Clock', (), {'time': staticmethod(lambda: now[0]),
+                                        'monotonic': staticmethod(time.monotonic)})
+    query_service.FRESHNESS_CONFIG['etag_enabled'] = True
+    try:
+        filters = {'data': '2025-01-01~2025-01-07'}
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert service.warm_query(51, filters) == 'renovado'
+            now[0] = 301.0
+            response = service.execute_query(51, filters)
+    finally:
+        freshness.time = clock
+        query_service.FRESHNESS_CONFIG['etag_enabled'] = enabled
+
+    assert response.headers['X-Cache'] == 'HIT-L1'
+    assert len(executed) == 1
+
+
+if __name__ == '__main__':
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f"✅ {name}")